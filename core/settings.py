@@ -146,4 +146,20 @@ AUTH_USER_MODEL = 'authentication.User'
 
 LOGIN_URL = 'authentication:login'
 LOGIN_REDIRECT_URL = 'dashboard'
-LOGOUT_REDIRECT_URL = 'authentication:login'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'authentication:login'
+
+# Payroll
+# Process pool size and employees per chunk for the 'parallel' payroll run mode
+PAYROLL_PARALLEL_WORKERS = os.cpu_count() or 1
+PAYROLL_PARALLEL_CHUNK_SIZE = 500
+
+# Rendering processes for payslip ZIP downloads, started inside the web request;
+# 1 renders in the request itself. Use `manage.py export_payslips` for large periods.
+PAYROLL_DOWNLOAD_WORKERS = 1
+
+# Engine for bulk, parallel and incremental payroll runs: 'decimal', or 'numpy'
+# for very large organizations (requires NumPy, falls back to 'decimal')
+PAYROLL_CALCULATION_BACKEND = 'decimal'
+
+# Generated payslip files (exports); not served like MEDIA_ROOT, payslips are downloaded through views
+PAYROLL_PRIVATE_ROOT = os.path.join(BASE_DIR, "private_media/")
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import *
+from .rollup import refresh_months
 
 
 # -------------------- BRANCH --------------------
@@ -138,9 +139,55 @@ class AttendanceRecordAdmin(admin.ModelAdmin):
 
     @admin.action(description="Restore selected soft-deleted attendance records")
     def restore_attendance(self, request, queryset):
-        restored_count = queryset.filter(deleted_at__isnull=False).update(deleted_at=None)
+        restored = queryset.filter(deleted_at__isnull=False)
+        keys = set(restored.values_list('employee_id', 'date'))
+        restored_count = restored.update(deleted_at=None)
+        refresh_months(keys)
         self.message_user(request, f"{restored_count} attendance record(s) restored successfully.")
 
+    def delete_queryset(self, request, queryset):
+        keys = set(queryset.values_list('employee_id', 'date'))
+        super().delete_queryset(request, queryset)
+        refresh_months(keys)
+
+# -------------------- ATTENDANCE PUNCH --------------------
+@admin.register(AttendancePunch)
+class AttendancePunchAdmin(admin.ModelAdmin):
+    list_display = ('device', 'device_user_id', 'employee', 'timestamp', 'punch', 'created_at')
+    list_filter = ('device', 'punch')
+    search_fields = ('device_user_id', 'employee__first_name', 'employee__last_name', 'employee__employee_id')
+    date_hierarchy = 'timestamp'
+    raw_id_fields = ('employee',)
+
+@admin.register(PushedPunch)
+class PushedPunchAdmin(admin.ModelAdmin):
+    list_display = ('device', 'device_user_id', 'timestamp', 'punch', 'claimed_at', 'attempts', 'failed_at', 'created_at')
+    list_filter = ('device', 'failed_at')
+    search_fields = ('device_user_id', 'last_error')
+
+    actions = ['retry_punches']
+
+    @admin.action(description="Retry selected failed punches")
+    def retry_punches(self, request, queryset):
+        from .iclock import retry_failed_punches
+
+        retried_count = retry_failed_punches(queryset)
+        self.message_user(request, f"{retried_count} punch(es) queued for retry.")
+
+# -------------------- ATTENDANCE MONTH --------------------
+@admin.register(AttendanceMonth)
+class AttendanceMonthAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'month', 'record_days', 'present_days', 'late_days', 'absent_days', 'working_hours', 'overtime_hours', 'updated_at')
+    list_filter = ('organization', 'month')
+    search_fields = ('employee__first_name', 'employee__last_name', 'employee__employee_id')
+    raw_id_fields = ('employee',)
+
+# -------------------- ATTENDANCE JOB --------------------
+@admin.register(AttendanceJob)
+class AttendanceJobAdmin(admin.ModelAdmin):
+    list_display = ('organization', 'start_date', 'end_date', 'status', 'processed_days', 'total_days', 'records_created', 'records_calculated', 'created_at')
+    list_filter = ('status',)
+
 # -------------------- HOLIDAY CALENDAR --------------------
 @admin.register(HolidayCalendar)
 class HolidayCalendarAdmin(admin.ModelAdmin):
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class HrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'hrm'
+
+    def ready(self):
+        # Connects the schedule cache invalidation and attendance rollup signals
+        from . import rollup, schedule  # noqa: F401
@@ -0,0 +1,296 @@
+# hrm/attendance.py - Batched attendance calculation and materialization
+#
+# AttendanceRecord.calculate_hours saves the record it calculates.
+# calculate_attendance does the same for a batch of records: timetables come
+# from the organization's schedule index (hrm.schedule), each record is
+# calculated in memory with AttendanceRecord.apply_timetable and the results
+# are written with bulk updates.
+#
+# materialize_attendance creates the missing records of scheduled working
+# days for an organization and date range with bulk inserts. Each batch
+# calculation stores a hash of the record's inputs, so only records whose
+# punches, timetable or shift changed since are calculated again.
+#
+# save_attendance_sheet writes a manual attendance sheet for one date the
+# same way: one employee and record lookup, bulk writes and one calculation
+# pass.
+#
+# All of them refresh the monthly rollup (hrm.rollup) of the records they write.
+
+import hashlib
+import json
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Employee, AttendanceRecord, Timetable
+from .rollup import refresh_records
+from .schedule import get_schedule_index
+
+BATCH_SIZE = 500
+
+CENT = Decimal('0.01')
+
+# Days materialized per transaction and progress report
+MATERIALIZE_WINDOW_DAYS = 31
+
+# Fields AttendanceRecord.apply_timetable sets
+CALCULATED_FIELDS = [
+    'status', 'is_late', 'late_minutes', 'is_early_departure', 'early_departure_minutes',
+    'total_hours', 'working_hours', 'break_hours', 'overtime_hours',
+]
+
+WRITTEN_FIELDS = CALCULATED_FIELDS + ['calculation_hash']
+
+# Fields a manual attendance entry sets
+MANUAL_FIELDS = ['check_in_time', 'check_out_time', 'status', 'is_late']
+
+SHIFT_HASHED_FIELDS = [
+    'start_time', 'end_time', 'break_start_time', 'break_end_time',
+    'working_hours', 'grace_period_minutes', 'overtime_start_after_hours',
+]
+
+
+def calculation_hash(record, timetable):
+    """Hash of everything apply_timetable reads for the record"""
+    inputs = [
+        str(record.date), str(record.check_in_time), str(record.check_out_time),
+        str(record.break_start_time), str(record.break_end_time),
+    ]
+    if timetable:
+        inputs += [timetable.id, getattr(timetable, record.date.strftime("%A").lower())]
+        inputs += [str(getattr(timetable.shift, field)) for field in SHIFT_HASHED_FIELDS]
+
+    return hashlib.sha1(json.dumps(inputs).encode()).hexdigest()
+
+
+def calculate_attendance(records, batch_size=BATCH_SIZE):
+    """
+    Calculate hours, late/early flags, overtime and status of saved records
+
+    records may be a queryset or a list. Gives the same results as calling
+    calculate_hours on each record, but only writes calculated fields and
+    the calculation hash that changed, and refreshes the monthly rollup of
+    records whose results changed. Returns the number of records calculated.
+    """
+    records = list(records)
+    if not records:
+        return 0
+
+    schedules = {
+        organization_id: get_schedule_index(organization_id)
+        for organization_id in {record.organization_id for record in records}
+    }
+
+    # Bulk updates cost a CASE branch per row and field, so only changed
+    # fields are written; a record whose result didn't change only gets its hash
+    now = timezone.now()
+    changed = defaultdict(list)
+    for record in records:
+        stored = _calculated_values(record)
+        _calculate(record, schedules[record.organization_id].timetable(record.employee_id, record.date))
+
+        fields = tuple(
+            field for field, before, after in zip(WRITTEN_FIELDS, stored, _calculated_values(record))
+            if before != after
+        )
+        if fields:
+            changed[fields].append(record)
+
+    recalculated = []
+    for fields, changed_records in changed.items():
+        if fields != ('calculation_hash',):
+            fields += ('updated_at',)
+            for record in changed_records:
+                record.updated_at = now
+            recalculated += changed_records
+        AttendanceRecord.objects.bulk_update(changed_records, fields, batch_size=batch_size)
+
+    refresh_records(recalculated, batch_size=batch_size)
+    return len(records)
+
+
+def calculate_unsaved(records):
+    """Calculate records about to be inserted, which saves updating them afterwards"""
+    schedules = {}
+    for record in records:
+        if record.organization_id not in schedules:
+            schedules[record.organization_id] = get_schedule_index(record.organization_id)
+        _calculate(record, schedules[record.organization_id].timetable(record.employee_id, record.date))
+
+
+def _calculate(record, timetable):
+    record.apply_timetable(timetable)
+    record.calculation_hash = calculation_hash(record, timetable)
+
+
+def _calculated_values(record):
+    """WRITTEN_FIELDS values as the database stores them"""
+    values = [getattr(record, field) for field in WRITTEN_FIELDS]
+    return [
+        Decimal(str(value)).quantize(CENT) if isinstance(value, (float, Decimal)) else value
+        for value in values
+    ]
+
+
+def default_start_date(organization):
+    """Start of the organization's earliest active timetable, or None"""
+    timetable = Timetable.objects.filter(
+        organization=organization,
+        is_active=True
+    ).order_by('start_date').first()
+    return timetable.start_date if timetable else None
+
+
+def materialize_attendance(organization, start_date, end_date, progress_callback=None,
+                           window_days=MATERIALIZE_WINDOW_DAYS, batch_size=BATCH_SIZE):
+    """
+    Create and calculate the attendance records of scheduled employees
+
+    A record is created for every working day of an employee's applicable
+    timetable that has none; soft-deleted records are left deleted. Existing
+    records of scheduled employees are calculated only when their inputs
+    changed since their last batch calculation. The range is processed in
+    windows of window_days, each in its own transaction, calling
+    progress_callback(processed_days, total_days, counts) after each.
+
+    Returns counts of created, calculated and unchanged records and days.
+    """
+    schedule = get_schedule_index(organization.id)
+    employee_ids = set(Employee.objects.filter(organization=organization).values_list('id', flat=True))
+    scheduled = sorted(employee_id for employee_id in schedule.employee_ids if employee_id in employee_ids)
+
+    total_days = max(0, (end_date - start_date).days + 1)
+    counts = {'created': 0, 'calculated': 0, 'unchanged': 0, 'days': total_days}
+
+    window_start = start_date
+    while window_start <= end_date:
+        window_end = min(end_date, window_start + timedelta(days=window_days - 1))
+
+        with transaction.atomic():
+            _materialize_window(organization, schedule, scheduled, window_start, window_end, counts, batch_size)
+
+        if progress_callback:
+            progress_callback((window_end - start_date).days + 1, total_days, counts)
+        window_start = window_end + timedelta(days=1)
+
+    return counts
+
+
+def _materialize_window(organization, schedule, scheduled, start_date, end_date, counts, batch_size):
+    scheduled_ids = set(scheduled)
+
+    # Soft-deleted records still hold their (employee, date) slot
+    existing = {
+        (record.employee_id, record.date): record
+        for record in AttendanceRecord.objects.all_with_deleted().filter(
+            organization=organization,
+            date__range=(start_date, end_date)
+        ).iterator(chunk_size=batch_size)
+        if record.employee_id in scheduled_ids
+    }
+
+    to_create = []
+    to_calculate = []
+
+    for employee_id in scheduled:
+        for day, interval in schedule.iter_range(employee_id, start_date, end_date):
+            timetable = interval.timetable if interval else None
+            record = existing.get((employee_id, day))
+
+            if record is None:
+                if interval and interval.is_working_day(day):
+                    # Calculated before inserting, which saves updating it afterwards
+                    record = AttendanceRecord(organization=organization, employee_id=employee_id, date=day)
+                    _calculate(record, timetable)
+                    to_create.append(record)
+            elif record.deleted_at is None:
+                if record.calculation_hash == calculation_hash(record, timetable):
+                    counts['unchanged'] += 1
+                else:
+                    to_calculate.append(record)
+
+    AttendanceRecord.objects.bulk_create(to_create, batch_size=batch_size)
+    refresh_records(to_create, batch_size=batch_size)
+    calculate_attendance(to_calculate, batch_size=batch_size)
+
+    counts['created'] += len(to_create)
+    counts['calculated'] += len(to_create) + len(to_calculate)
+
+
+def save_attendance_sheet(organization, day, entries, user=None, batch_size=BATCH_SIZE):
+    """
+    Save a manual attendance sheet for one date in bulk
+
+    entries maps employee ids to {field: value} of MANUAL_FIELDS. Records are
+    created or updated with the entered values; those with both a check-in
+    and a check-out are then calculated from their timetable, which sets
+    their status and late flag like calculate_hours. Soft-deleted records
+    are left alone. Raises ValueError, writing nothing, for an id that is not
+    an employee of the organization. Returns counts of records created,
+    updated and skipped as deleted.
+    """
+    employee_ids = sorted(entries)
+    found = set()
+    existing = {}
+
+    for start in range(0, len(employee_ids), batch_size):
+        batch = employee_ids[start:start + batch_size]
+        found.update(Employee.objects.filter(organization=organization, id__in=batch).values_list('id', flat=True))
+        for record in AttendanceRecord.objects.all_with_deleted().filter(
+            organization=organization,
+            date=day,
+            employee_id__in=batch
+        ):
+            existing[record.employee_id] = record
+
+    missing = [employee_id for employee_id in employee_ids if employee_id not in found]
+    if missing:
+        raise ValueError(f"Employee {missing[0]} not found")
+
+    now = timezone.now()
+    counts = {'created': 0, 'updated': 0, 'deleted': 0}
+    to_create = []
+    to_update = []
+    to_calculate = []
+
+    for employee_id in employee_ids:
+        record = existing.get(employee_id)
+
+        if record is None:
+            record = AttendanceRecord(organization=organization, employee_id=employee_id, date=day, created_by=user)
+            to_create.append(record)
+        elif record.deleted_at is not None:
+            counts['deleted'] += 1
+            continue
+        else:
+            record.updated_at = now
+            to_update.append(record)
+
+        for field, value in entries[employee_id].items():
+            setattr(record, field, value)
+        if record.check_in_time and record.check_out_time:
+            to_calculate.append(record)
+
+    calculate_unsaved(to_calculate)
+
+    # Calculated records also get their hours, flags and calculation hash
+    calculated = {id(record) for record in to_calculate}
+    entered_fields = MANUAL_FIELDS + ['updated_at']
+    calculated_fields = entered_fields + [field for field in WRITTEN_FIELDS if field not in MANUAL_FIELDS]
+
+    with transaction.atomic():
+        AttendanceRecord.objects.bulk_create(to_create, batch_size=batch_size)
+        for fields, records in (
+            (entered_fields, [record for record in to_update if id(record) not in calculated]),
+            (calculated_fields, [record for record in to_update if id(record) in calculated]),
+        ):
+            AttendanceRecord.objects.bulk_update(records, fields, batch_size=batch_size)
+        refresh_records(to_create + to_update, batch_size=batch_size)
+
+    counts['created'] = len(to_create)
+    counts['updated'] = len(to_update)
+    return counts
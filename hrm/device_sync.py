@@ -0,0 +1,209 @@
+# hrm/device_sync.py - Concurrent sync of many attendance devices
+#
+# Device calls are slow and bounded only by socket timeouts, so devices are
+# read concurrently in a bounded thread pool (fetch phase) that never touches
+# the database: device info, users and new punches over one connection per
+# device. The calling thread then writes what was fetched, one device at a
+# time (write phase). A device still fetching after its deadline is reported
+# as timed out and nothing of it is written; its thread ends on its own
+# socket timeout.
+#
+# Devices that clear their log after syncing get a last concurrent pass that
+# clears the log only if the device still holds exactly the records read.
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .zkteco_utils import AttendanceSyncManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+
+# Seconds one device may take to be read
+DEFAULT_DEADLINE_SECONDS = 120
+
+# Seconds between deadline checks while waiting for fetches
+POLL_SECONDS = 0.2
+
+
+class DeviceFetch:
+    """What the fetch phase read from one device"""
+
+    def __init__(self):
+        self.connected = False
+        self.device_info = None
+        self.users = None
+        self.attendance = None
+        self.uploaded = None
+        self.seconds = None
+
+
+class DeviceSyncResult:
+    """Outcome and timings of one device's sync"""
+
+    def __init__(self, device):
+        self.device = device
+        # offline, timeout, failed or synced; skipped when another sync holds the device
+        self.status = None
+        self.error = ''
+        self.fetch_seconds = None
+        self.write_seconds = None
+        self.uploaded = None
+        self.users = None
+        self.attendance = None
+        self.log_cleared = False
+
+
+def sync_devices(devices, start_date=None, end_date=None, workers=DEFAULT_WORKERS,
+                 deadline_seconds=DEFAULT_DEADLINE_SECONDS, sync_users=True, upload_users=False):
+    """
+    Sync devices concurrently, see the module comment
+
+    Without dates each device syncs from its punch watermark, as
+    AttendanceSyncManager.sync_attendance does. Returns a DeviceSyncResult
+    per device, in the order given.
+    """
+    managers = [AttendanceSyncManager(device) for device in devices]
+    results = {manager.device.id: DeviceSyncResult(manager.device) for manager in managers}
+
+    # Users to upload are read before the fetch phase, which has no database access
+    uploads = {}
+    if upload_users:
+        by_organization = {}
+        for manager in managers:
+            organization_id = manager.device.organization_id
+            if organization_id not in by_organization:
+                by_organization[organization_id] = manager.prepare_upload()
+            uploads[manager.device.id] = by_organization[organization_id]
+
+    fetches, failures = _run_concurrently(managers, workers, deadline_seconds, lambda manager: _fetch(
+        manager, start_date, end_date, sync_users, uploads.get(manager.device.id)
+    ))
+    for device_id, (status, error, seconds) in failures.items():
+        results[device_id].status = status
+        results[device_id].error = error
+        results[device_id].fetch_seconds = seconds
+
+    to_clear = []
+    for manager in managers:
+        result = results[manager.device.id]
+        fetch = fetches.get(manager.device.id)
+        if fetch is None:
+            continue
+
+        result.fetch_seconds = fetch.seconds
+        result.uploaded = fetch.uploaded
+        started = time.monotonic()
+        try:
+            _write(manager, fetch, result)
+        except Exception as e:
+            logger.exception(f"Failed to save data of device {manager.device.name}")
+            result.status, result.error = 'failed', str(e)
+        result.write_seconds = time.monotonic() - started
+
+        attendance = fetch.attendance
+        if (result.status == 'synced' and manager.device.clear_log_after_sync
+                and attendance.incremental and attendance.logs and attendance.record_count is not None):
+            to_clear.append(manager)
+
+    if to_clear:
+        # A device that can't be cleared now is read again from its watermark next time
+        cleared, _ = _run_concurrently(to_clear, workers, deadline_seconds, lambda manager: _clear(
+            manager, fetches[manager.device.id].attendance.record_count
+        ))
+        for manager in to_clear:
+            if cleared.get(manager.device.id):
+                manager.log_cleared()
+                results[manager.device.id].log_cleared = True
+
+    return [results[manager.device.id] for manager in managers]
+
+
+def _run_concurrently(managers, workers, deadline_seconds, call):
+    """
+    Run call(manager) for each manager in a thread pool
+
+    Returns {device id: value} of the calls finishing within
+    deadline_seconds of starting, and {device id: (status, error, seconds)}
+    of the others, status being 'timeout' or 'failed'.
+    """
+    started = {}
+
+    def run(manager):
+        started[manager.device.id] = time.monotonic()
+        try:
+            return call(manager)
+        finally:
+            manager.zk_device.disconnect()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='device-sync')
+    futures = {executor.submit(run, manager): manager for manager in managers}
+    pending = set(futures)
+    values = {}
+    failures = {}
+
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=POLL_SECONDS)
+
+            for future in done:
+                device = futures[future].device
+                try:
+                    values[device.id] = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to read device {device.name}: {str(e)}")
+                    failures[device.id] = ('failed', str(e), time.monotonic() - started[device.id])
+
+            # Stop waiting for devices past their deadline; their threads finish on their own
+            now = time.monotonic()
+            for future in list(pending):
+                device = futures[future].device
+                if device.id in started and now - started[device.id] > deadline_seconds:
+                    logger.warning(f"Device {device.name} missed its {deadline_seconds}s deadline")
+                    failures[device.id] = ('timeout', '', now - started[device.id])
+                    pending.discard(future)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return values, failures
+
+
+def _fetch(manager, start_date, end_date, sync_users, upload):
+    """Read one device over a single connection; runs in a pool thread"""
+    fetch = DeviceFetch()
+    started = time.monotonic()
+    zk_device = manager.zk_device
+
+    fetch.connected = zk_device.connect()
+    if fetch.connected:
+        fetch.device_info = zk_device.get_device_info()
+        if upload is not None:
+            fetch.uploaded = manager.push_users(upload)
+        if sync_users:
+            fetch.users = zk_device.get_users()
+        fetch.attendance = manager.fetch_attendance(start_date, end_date)
+
+    fetch.seconds = time.monotonic() - started
+    return fetch
+
+
+def _clear(manager, record_count):
+    if not manager.zk_device.connect():
+        return False
+    return manager.clear_synced_log(record_count)
+
+
+def _write(manager, fetch, result):
+    """Save what was fetched from one device; runs in the calling thread"""
+    if not fetch.connected:
+        manager.mark_offline()
+        result.status = 'offline'
+        return
+
+    manager.save_device_info(fetch.device_info)
+    if fetch.users is not None:
+        result.users = manager.save_users(fetch.users)
+    result.attendance = manager.save_attendance(fetch.attendance)
+    result.status = 'synced'
@@ -0,0 +1,283 @@
+# hrm/device_users.py - Bulk matching and provisioning of device users as employees
+#
+# Device users are matched to the organization's employees held in memory,
+# by enrollment id, then employee id, then first name of active employees,
+# each picking the first employee in the default employee order. Matches are
+# applied to the in-memory index as they are made, so results are those of
+# matching the users one after another against the database.
+#
+# Unmatched users get a user account, an employee and a membership. Their
+# usernames and employee ids are allocated against the taken values read in
+# a few queries, and everything is written with bulk operations in one
+# transaction. Hashing the passwords dominates the cost; it runs in threads,
+# as hashlib releases the GIL while hashing.
+
+import logging
+from bisect import insort
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from itertools import count
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from organization.models import OrganizationMembership
+
+from .models import Employee
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+
+# Threads hashing passwords of created users
+HASH_WORKERS = 8
+
+
+class EmployeeIndex:
+    """Employees by enrollment id, employee id and lowercase first name (active ones)"""
+
+    def __init__(self, employees):
+        self._sequence = count()
+        self._order = {}
+        self._by_enrollment_id = defaultdict(list)
+        self._by_employee_id = defaultdict(list)
+        self._by_first_name = defaultdict(list)
+
+        for employee in employees:
+            self.add(employee)
+
+    def _key(self, employee):
+        # Default employee order; employees not saved yet come after saved ones
+        if id(employee) not in self._order:
+            self._order[id(employee)] = (
+                employee.last_name, employee.first_name, employee.id is None, employee.id or next(self._sequence)
+            )
+        return self._order[id(employee)]
+
+    def _insert(self, entries, employee):
+        insort(entries, (self._key(employee), id(employee), employee), key=lambda entry: entry[:2])
+
+    def add(self, employee):
+        if employee.device_enrollment_id:
+            self._insert(self._by_enrollment_id[employee.device_enrollment_id], employee)
+        self._insert(self._by_employee_id[employee.employee_id], employee)
+        if employee.is_active:
+            self._insert(self._by_first_name[employee.first_name.lower()], employee)
+
+    def set_enrollment_id(self, employee, enrollment_id):
+        if employee.device_enrollment_id == enrollment_id:
+            return
+        if employee.device_enrollment_id:
+            entries = self._by_enrollment_id[employee.device_enrollment_id]
+            entries[:] = [entry for entry in entries if entry[2] is not employee]
+        employee.device_enrollment_id = enrollment_id
+        self._insert(self._by_enrollment_id[enrollment_id], employee)
+
+    def match(self, user_id, name):
+        for entries in (
+            self._by_enrollment_id.get(user_id),
+            self._by_employee_id.get(user_id),
+            self._by_first_name.get(name.split()[0].lower()) if name.split() else None,
+        ):
+            if entries:
+                return entries[0][2]
+        return None
+
+
+def allocate_unique(bases, candidate, taken_among, chunk_size=BATCH_SIZE):
+    """
+    A unique value per base, bases possibly repeating: the requests of a
+    base get, in order, the first values of candidate(base, 0),
+    candidate(base, 1), ... that taken_among(values) doesn't report taken.
+    taken_among is called once per chunk of proposals, in as many rounds as
+    proposals turn out to be taken.
+    """
+    attempts = defaultdict(int)
+    free = defaultdict(list)
+    needed = defaultdict(int)
+    for base in bases:
+        needed[base] += 1
+    # Values proposed so far; different bases may produce the same value
+    proposed = set()
+
+    while any(len(free[base]) < needed[base] for base in needed):
+        proposals = {}
+        for base in needed:
+            missing = needed[base] - len(free[base])
+            while missing:
+                value, attempt = candidate(base, attempts[base]), attempts[base]
+                attempts[base] += 1
+                if value not in proposed:
+                    proposed.add(value)
+                    proposals[value] = (base, attempt)
+                    missing -= 1
+
+        values = list(proposals)
+        taken = set()
+        for start in range(0, len(values), chunk_size):
+            taken.update(taken_among(values[start:start + chunk_size]))
+
+        for value, (base, attempt) in proposals.items():
+            if value not in taken:
+                free[base].append((attempt, value))
+
+    for base in free:
+        free[base].sort(reverse=True)
+    return [free[base].pop()[1] for base in bases]
+
+
+def sync_device_users(organization, device_users, auto_create=True, batch_size=BATCH_SIZE):
+    """
+    Match device users to the organization's employees and record their
+    device ids; with auto_create, unmatched users become employees with a
+    user account (password: username + "123") and a membership. Matched
+    employees' memberships are created or reactivated.
+
+    Returns {'synced': int, 'created': int, 'failed': int}.
+    """
+    index = EmployeeIndex(Employee.objects.filter(organization=organization).order_by('last_name', 'first_name', 'id'))
+    stats = {'synced': 0, 'created': 0, 'failed': 0}
+    changed = {}
+    member_user_ids = set()
+    new_employees = []
+
+    for device_user in device_users:
+        user_id, uid, name = str(device_user['user_id']), str(device_user['uid']), device_user['name']
+        employee = index.match(user_id, name)
+
+        if employee:
+            if (employee.device_user_id, employee.device_enrollment_id) != (uid, user_id):
+                employee.device_user_id = uid
+                index.set_enrollment_id(employee, user_id)
+                if employee.id:
+                    changed[employee.id] = employee
+            if employee.id:
+                member_user_ids.add(employee.user_id)
+            stats['synced'] += 1
+            logger.info(f"✓ Synced user: {name} -> {employee.full_name}")
+
+        elif auto_create:
+            name_parts = name.strip().split()
+            first_name = name_parts[0] if name_parts else name[:50]
+            last_name = ' '.join(name_parts[1:])[:50] if len(name_parts) > 1 else ''
+
+            if not first_name.lower().replace(' ', ''):
+                stats['failed'] += 1
+                logger.error(f"✗ Failed to create employee for '{name}': no name to derive a username from")
+                continue
+
+            employee = Employee(
+                organization=organization,
+                employee_id=user_id,
+                first_name=first_name,
+                last_name=last_name,
+                hire_date=date.today(),
+                employment_status='active',
+                is_active=True,
+                device_user_id=uid,
+                device_enrollment_id=user_id,
+            )
+            # Later device users may match it, as they would once it was saved
+            index.add(employee)
+            new_employees.append(employee)
+
+        else:
+            logger.warning(f"⚠ No match for device user: {name} (ID: {user_id}, UID: {uid})")
+
+    with transaction.atomic():
+        if new_employees:
+            users = _create_users(organization, new_employees, batch_size)
+            for employee, user in zip(new_employees, users):
+                employee.user = user
+                member_user_ids.add(user.id)
+            Employee.objects.bulk_create(new_employees, batch_size=batch_size)
+            stats['created'] = len(new_employees)
+
+        if changed:
+            now = timezone.now()
+            for employee in changed.values():
+                employee.updated_at = now
+            Employee.objects.bulk_update(
+                list(changed.values()), ['device_user_id', 'device_enrollment_id', 'updated_at'], batch_size=batch_size
+            )
+
+        _ensure_memberships(organization, member_user_ids, batch_size)
+
+    logger.info(
+        f"User sync completed: {stats['synced']} matched, {stats['created']} created, "
+        f"{stats['failed']} failed out of {len(device_users)} total"
+    )
+    return stats
+
+
+def _create_users(organization, employees, batch_size):
+    """Bulk create a user account per new employee, allocating unique usernames and employee ids"""
+    usernames = allocate_unique(
+        [User.normalize_username(employee.first_name.lower().replace(' ', '')) for employee in employees],
+        lambda base, attempt: f"{base}{attempt}" if attempt else base,
+        lambda values: User.objects.filter(username__in=values).values_list('username', flat=True),
+        batch_size,
+    )
+    # employee_id is unique across organizations
+    employee_ids = allocate_unique(
+        [employee.employee_id for employee in employees],
+        lambda base, attempt: f"{base}_{attempt}" if attempt else base,
+        lambda values: Employee.objects.all_with_deleted().filter(employee_id__in=values).values_list('employee_id', flat=True),
+        batch_size,
+    )
+
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+        passwords = list(executor.map(make_password, [f"{username}123" for username in usernames]))
+
+    domain = organization.name.lower().replace(' ', '')
+    users = []
+    for employee, username, employee_id, password in zip(employees, usernames, employee_ids, passwords):
+        employee.employee_id = employee_id
+        users.append(User(
+            username=username,
+            password=password,
+            first_name=employee.first_name,
+            last_name=employee.last_name,
+            email=User.objects.normalize_email(f"{username}@{domain}.local"),
+        ))
+        logger.info(f"✓ Created employee: {employee.full_name} (ID: {employee_id}, Username: {username}, Password: {username}123)")
+
+    User.objects.bulk_create(users, batch_size=batch_size)
+
+    if any(user.pk is None for user in users):
+        # Backends without RETURNING don't set primary keys on bulk insert
+        ids = {}
+        for start in range(0, len(usernames), batch_size):
+            ids.update(User.objects.filter(username__in=usernames[start:start + batch_size]).values_list('username', 'id'))
+        for user in users:
+            user.pk = ids[user.username]
+
+    return users
+
+
+def _ensure_memberships(organization, user_ids, batch_size):
+    """Create the users' missing memberships of the organization and reactivate inactive ones"""
+    user_ids = sorted(user_ids)
+    existing = {}
+    for start in range(0, len(user_ids), batch_size):
+        existing.update(OrganizationMembership.objects.filter(
+            organization=organization,
+            user_id__in=user_ids[start:start + batch_size]
+        ).values_list('user_id', 'is_active'))
+
+    OrganizationMembership.objects.bulk_create([
+        OrganizationMembership(user_id=user_id, organization=organization, is_admin=False, is_active=True)
+        for user_id in user_ids if user_id not in existing
+    ], batch_size=batch_size)
+
+    inactive = [user_id for user_id, is_active in existing.items() if not is_active]
+    for start in range(0, len(inactive), batch_size):
+        OrganizationMembership.objects.filter(
+            organization=organization,
+            user_id__in=inactive[start:start + batch_size]
+        ).update(is_active=True)
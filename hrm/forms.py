@@ -449,7 +449,7 @@ class TimetableForm(forms.ModelForm):
 class AttendanceDeviceForm(forms.ModelForm):
     class Meta:
         model = AttendanceDevice
-        fields = ['name', 'device_type', 'ip_address', 'port', 'device_id', 'serial_number', 'model', 'firmware_version', 'location', 'description', 'auto_sync_enabled', 'sync_interval_minutes']
+        fields = ['name', 'device_type', 'ip_address', 'port', 'device_id', 'serial_number', 'model', 'firmware_version', 'location', 'description', 'auto_sync_enabled', 'sync_interval_minutes', 'clear_log_after_sync']
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control form-control-sm'}),
             'device_type': forms.Select(attrs={'class': 'form-control form-control-sm'}),
@@ -463,6 +463,7 @@ class AttendanceDeviceForm(forms.ModelForm):
             'description': forms.Textarea(attrs={'rows': 3, 'class': 'form-control form-control-sm'}),
             'auto_sync_enabled': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'sync_interval_minutes': forms.NumberInput(attrs={'class': 'form-control form-control-sm'}),
+            'clear_log_after_sync': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
     
     def __init__(self, *args, **kwargs):
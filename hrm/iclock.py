@@ -0,0 +1,231 @@
+# hrm/iclock.py - Push-mode attendance from ZKTeco devices over ADMS ("iclock")
+#
+# Devices configured with this server's address call /iclock/cdata and
+# /iclock/getrequest on their own, so devices behind NAT need no polling.
+# They are identified by their serial number (SN), which must match one
+# active AttendanceDevice. Uploaded ATTLOG lines are appended to the
+# PushedPunch queue with one bulk insert and acknowledged at once;
+# `manage.py attendance_push_worker` claims the queue in micro-batches
+# (conditional UPDATE, like hrm.jobs) and ingests each device's punches with
+# hrm.ingest, which ignores punches already logged. A device's punches that
+# fail to ingest stay claimed until requeued as stale, which delays their
+# retry; after MAX_FLUSH_ATTEMPTS they are set aside as failed (dead-lettered)
+# until retry_failed_punches returns them to the queue.
+
+import datetime
+import logging
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from .ingest import ingest_punches
+from .models import AttendanceDevice, PushedPunch
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+# Punches ingested per flush
+DEFAULT_FLUSH_SIZE = 5000
+
+# Flushes of a punch before it is set aside as failed
+MAX_FLUSH_ATTEMPTS = 5
+
+# Seconds a device waits between heartbeats, and before retrying after an error
+PUSH_DELAY_SECONDS = 10
+PUSH_ERROR_DELAY_SECONDS = 30
+
+ATTLOG_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def push_device(serial_number):
+    """The active device with this serial number, or None if there is none or several"""
+    if not serial_number:
+        return None
+
+    devices = list(AttendanceDevice.objects.filter(
+        serial_number=serial_number,
+        is_active=True
+    ).select_related('organization')[:2])
+
+    if len(devices) != 1:
+        logger.warning(f"Push from {'ambiguous' if devices else 'unknown'} device serial {serial_number}")
+        return None
+    return devices[0]
+
+
+def mark_online(device):
+    if not device.is_online:
+        AttendanceDevice.objects.filter(id=device.id).update(is_online=True)
+
+
+def push_options(device):
+    """Handshake reply: what the device uploads, from which stamp, and how often"""
+    offset = timezone.localtime().utcoffset()
+    return '\n'.join([
+        f"GET OPTION FROM: {device.serial_number}",
+        f"ATTLOGStamp={device.push_attlog_stamp or 'None'}",
+        "OPERLOGStamp=9999",
+        "ATTPHOTOStamp=None",
+        f"ErrorDelay={PUSH_ERROR_DELAY_SECONDS}",
+        f"Delay={PUSH_DELAY_SECONDS}",
+        "TransTimes=00:00;14:05",
+        "TransInterval=1",
+        "TransFlag=TransData AttLog",
+        f"TimeZone={int(offset.total_seconds() // 3600)}",
+        "Realtime=1",
+        "Encrypt=None",
+    ]) + '\n'
+
+
+def parse_attlog(body):
+    """
+    Punch dicts of an ATTLOG upload, one line per punch: user id, time,
+    punch state, verify type and reserved fields, tab separated; returns
+    (punches, lines), malformed lines skipped
+    """
+    punches = []
+    lines = 0
+
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        lines += 1
+        fields = line.split('\t')
+
+        try:
+            user_id = fields[0].strip()
+            timestamp = timezone.make_aware(datetime.datetime.strptime(fields[1].strip(), ATTLOG_TIME_FORMAT))
+            punch = int(fields[2]) if len(fields) > 2 and fields[2].strip() else 0
+            verify_type = int(fields[3]) if len(fields) > 3 and fields[3].strip() else None
+        except (IndexError, ValueError):
+            logger.warning(f"Skipping malformed ATTLOG line: {line!r}")
+            continue
+
+        if user_id:
+            punches.append({'user_id': user_id, 'timestamp': timestamp, 'punch': punch, 'verify_type': verify_type})
+
+    return punches, lines
+
+
+def queue_attlog(device, body, stamp=None):
+    """Queue the punches of an ATTLOG upload; returns the number of lines received"""
+    punches, lines = parse_attlog(body)
+
+    PushedPunch.objects.bulk_create([
+        PushedPunch(
+            organization_id=device.organization_id,
+            device=device,
+            device_user_id=punch['user_id'],
+            timestamp=punch['timestamp'],
+            punch=punch['punch'],
+            verify_type=punch['verify_type'],
+        ) for punch in punches
+    ], batch_size=BATCH_SIZE)
+
+    fields = {'last_push_at': timezone.now(), 'is_online': True}
+    if stamp:
+        fields['push_attlog_stamp'] = stamp[:32]
+    AttendanceDevice.objects.filter(id=device.id).update(**fields)
+
+    logger.info(f"Queued {len(punches)} pushed punches from {device.name}")
+    return lines
+
+
+def claim_pushed_punches(limit=DEFAULT_FLUSH_SIZE):
+    """Claim up to limit of the oldest queued punches; returns the batch token, or None if none were"""
+    ids = list(PushedPunch.objects.filter(
+        claimed_at__isnull=True,
+        failed_at__isnull=True
+    ).order_by('id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return None
+
+    batch = uuid.uuid4().hex
+    claimed = 0
+    for start in range(0, len(ids), BATCH_SIZE):
+        claimed += PushedPunch.objects.filter(id__in=ids[start:start + BATCH_SIZE], claimed_at__isnull=True).update(
+            batch=batch,
+            claimed_at=timezone.now(),
+            attempts=F('attempts') + 1
+        )
+    return batch if claimed else None
+
+
+def requeue_stale_punches(stale_after_seconds):
+    """
+    Put punches claimed by a worker that stopped, or left claimed by a
+    failed flush, back in the queue; those flushed MAX_FLUSH_ATTEMPTS times
+    are set aside as failed instead. Returns the number requeued.
+    """
+    now = timezone.now()
+    stale = PushedPunch.objects.filter(claimed_at__lt=now - timedelta(seconds=stale_after_seconds))
+
+    failed = stale.filter(attempts__gte=MAX_FLUSH_ATTEMPTS).update(batch=None, claimed_at=None, failed_at=now)
+    if failed:
+        logger.error(f"Set aside {failed} pushed punches that failed {MAX_FLUSH_ATTEMPTS} flushes")
+
+    return stale.update(batch=None, claimed_at=None)
+
+
+def retry_failed_punches(punches=None):
+    """Return failed punches (all, or those of a PushedPunch queryset) to the queue; returns how many"""
+    if punches is None:
+        punches = PushedPunch.objects.all()
+    return punches.filter(failed_at__isnull=False).update(
+        failed_at=None, attempts=0, batch=None, claimed_at=None
+    )
+
+
+def flush_pushed_punches(limit=DEFAULT_FLUSH_SIZE):
+    """
+    Ingest a micro-batch of queued punches, device by device, and remove them
+    from the queue. Punches of a device whose ingestion fails keep the error
+    and stay claimed until requeue_stale_punches returns them, or are set
+    aside as failed on their last attempt. Returns the hrm.ingest counts
+    summed over the devices, with the numbers of punches claimed, of devices
+    ingested and failed, and of punches set aside.
+    """
+    totals = {
+        'claimed': 0, 'devices': 0, 'failed': 0, 'set_aside': 0,
+        'punches': 0, 'new': 0, 'created': 0, 'updated': 0, 'unmatched': 0
+    }
+    batch = claim_pushed_punches(limit)
+    if batch is None:
+        return totals
+
+    logs = defaultdict(list)
+    for device_id, user_id, timestamp, punch, verify_type in PushedPunch.objects.filter(batch=batch).values_list(
+        'device_id', 'device_user_id', 'timestamp', 'punch', 'verify_type'
+    ).iterator(chunk_size=BATCH_SIZE):
+        logs[device_id].append({
+            'user_id': user_id, 'uid': None, 'timestamp': timestamp, 'status': verify_type, 'punch': punch
+        })
+        totals['claimed'] += 1
+
+    devices = AttendanceDevice.objects.all_with_deleted().filter(id__in=list(logs)).select_related('organization')
+    for device in devices:
+        try:
+            counts = ingest_punches(device, logs[device.id])
+        except Exception as e:
+            logger.exception(f"Failed to ingest pushed punches of {device.name}")
+            totals['failed'] += 1
+
+            failed = PushedPunch.objects.filter(batch=batch, device=device)
+            totals['set_aside'] += failed.filter(attempts__gte=MAX_FLUSH_ATTEMPTS).update(
+                batch=None, claimed_at=None, failed_at=timezone.now(), last_error=str(e)
+            )
+            failed.update(last_error=str(e))
+            continue
+
+        PushedPunch.objects.filter(batch=batch, device=device).delete()
+        AttendanceDevice.objects.filter(id=device.id).update(last_sync=timezone.now())
+
+        totals['devices'] += 1
+        for key in ('punches', 'new', 'created', 'updated', 'unmatched'):
+            totals[key] += counts[key]
+
+    return totals
@@ -0,0 +1,301 @@
+# hrm/ingest.py - Bulk ingestion of device punches into attendance records
+#
+# Every punch is appended to the AttendancePunch log, whose unique
+# (device, device user, timestamp) index makes re-syncing the same punches a
+# no-op. Punches are matched to employees through maps built once per batch;
+# punches logged before their device user was mapped to an employee are
+# matched when a later batch brings punches of that device user.
+# For each employee and date that received new punches, the day's punches are
+# read back from the log and folded into its AttendanceRecord (earliest
+# check-in, latest check-out) with one bulk insert and one bulk update; the
+# touched records are then calculated together by hrm.attendance, and the
+# monthly rollup (hrm.rollup) of the created and changed ones refreshed.
+
+import datetime
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .attendance import calculate_attendance, calculate_unsaved
+from .models import Employee, AttendancePunch, AttendanceRecord
+from .rollup import refresh_records
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+# Punch: 0 = Check In, 1 = Check Out, 2 = Break Out, 3 = Break In, 4/5 = Overtime In/Out
+CHECK_IN_PUNCHES = (0, 2, 4)
+CHECK_OUT_PUNCHES = (1, 3, 5)
+
+PUNCH_FIELDS = ['check_in_time', 'check_out_time', 'updated_at']
+
+
+class EmployeeResolver:
+    """
+    Device user ids to employees of an organization, loaded in one query
+
+    Matches by enrollment id, then by UID, each resolving to the first
+    employee in the default employee order like the former per-punch lookups.
+    """
+    def __init__(self, organization):
+        self.by_enrollment_id = {}
+        self.by_uid = {}
+
+        for employee in Employee.objects.filter(organization=organization).order_by(
+            'last_name', 'first_name', 'id'
+        ).only('id', 'first_name', 'last_name', 'device_enrollment_id', 'device_user_id'):
+            if employee.device_enrollment_id:
+                self.by_enrollment_id.setdefault(employee.device_enrollment_id, employee)
+            if employee.device_user_id:
+                self.by_uid.setdefault(employee.device_user_id, employee)
+
+    def resolve(self, user_id, uid=None):
+        employee = self.by_enrollment_id.get(str(user_id))
+        if employee is None and uid:
+            employee = self.by_uid.get(str(uid))
+        return employee
+
+
+class PunchGroup:
+    """Punches of one employee on one date"""
+    __slots__ = ('check_in_time', 'check_out_time')
+
+    def __init__(self):
+        self.check_in_time = None
+        self.check_out_time = None
+
+    def add(self, punch, punch_time):
+        if punch in CHECK_IN_PUNCHES:
+            if self.check_in_time is None or punch_time < self.check_in_time:
+                self.check_in_time = punch_time
+        elif punch in CHECK_OUT_PUNCHES:
+            if self.check_out_time is None or punch_time > self.check_out_time:
+                self.check_out_time = punch_time
+
+    def merge_into(self, record):
+        """Apply the punches to a record; returns whether it changed"""
+        changed = False
+
+        if self.check_in_time and (not record.check_in_time or self.check_in_time < record.check_in_time):
+            record.check_in_time = self.check_in_time
+            changed = True
+        if self.check_out_time and (not record.check_out_time or self.check_out_time > record.check_out_time):
+            record.check_out_time = self.check_out_time
+            changed = True
+
+        return changed
+
+
+def build_punches(device, logs, resolver):
+    """
+    AttendancePunch instances of device logs, one per (device user, timestamp)
+
+    logs are dicts with user_id, uid, timestamp (naive device time), status
+    and punch, as returned by ZKTecoDevice.get_attendance.
+    """
+    punches = {}
+
+    for log in logs:
+        timestamp = log['timestamp']
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+
+        punch = AttendancePunch(
+            organization_id=device.organization_id,
+            device=device,
+            device_user_id=str(log['user_id']),
+            device_uid=str(log['uid']) if log.get('uid') is not None else None,
+            timestamp=timestamp,
+            punch=log['punch'],
+            verify_type=log.get('status'),
+            employee=resolver.resolve(log['user_id'], log.get('uid')),
+        )
+        punches.setdefault((punch.device_user_id, punch.timestamp), punch)
+
+    return list(punches.values())
+
+
+def new_punches(device, punches):
+    """The punches not yet in the device's log"""
+    if not punches:
+        return []
+
+    timestamps = [punch.timestamp for punch in punches]
+    logged = set(AttendancePunch.objects.all_with_deleted().filter(
+        device=device,
+        timestamp__range=(min(timestamps), max(timestamps))
+    ).values_list('device_user_id', 'timestamp'))
+
+    return [punch for punch in punches if (punch.device_user_id, punch.timestamp) not in logged]
+
+
+def log_punches(device, punches, batch_size=BATCH_SIZE):
+    """Append punches to the device's log; returns how many were inserted"""
+    if not punches:
+        return 0
+
+    timestamps = [punch.timestamp for punch in punches]
+    logged = AttendancePunch.objects.all_with_deleted().filter(
+        device=device,
+        timestamp__range=(min(timestamps), max(timestamps))
+    )
+
+    before = logged.count()
+    # The unique index drops punches another sync logged in the meantime
+    AttendancePunch.objects.bulk_create(punches, batch_size=batch_size, ignore_conflicts=True)
+    return logged.count() - before
+
+
+def match_logged_punches(device, resolver, device_user_ids, batch_size=BATCH_SIZE):
+    """
+    Assign employees to the device's logged punches of device_user_ids that
+    were logged without one. Returns the number of punches matched and
+    their (employee_id, local date) keys.
+    """
+    keys = set()
+    punch_ids = defaultdict(list)
+    device_user_ids = sorted(device_user_ids)
+
+    for start in range(0, len(device_user_ids), batch_size):
+        for punch_id, user_id, uid, timestamp in AttendancePunch.objects.filter(
+            device=device,
+            employee__isnull=True,
+            device_user_id__in=device_user_ids[start:start + batch_size]
+        ).values_list('id', 'device_user_id', 'device_uid', 'timestamp'):
+            employee = resolver.resolve(user_id, uid)
+            if employee is not None:
+                punch_ids[employee.id].append(punch_id)
+                keys.add((employee.id, timezone.localtime(timestamp).date()))
+
+    for employee_id, ids in punch_ids.items():
+        for start in range(0, len(ids), batch_size):
+            AttendancePunch.objects.filter(id__in=ids[start:start + batch_size]).update(employee_id=employee_id)
+
+    return sum(len(ids) for ids in punch_ids.values()), keys
+
+
+def fold_punches(organization, keys, batch_size=BATCH_SIZE):
+    """
+    {(employee_id, date): PunchGroup} of the logged punches of each
+    (employee_id, date) of keys, in local time
+    """
+    groups = defaultdict(PunchGroup)
+    if not keys:
+        return groups
+
+    employee_ids = sorted({employee_id for employee_id, _ in keys})
+    dates = [day for _, day in keys]
+    start = timezone.make_aware(datetime.datetime.combine(min(dates), datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(max(dates) + datetime.timedelta(days=1), datetime.time.min))
+
+    for position in range(0, len(employee_ids), batch_size):
+        for employee_id, timestamp, punch in AttendancePunch.objects.filter(
+            organization=organization,
+            employee_id__in=employee_ids[position:position + batch_size],
+            timestamp__gte=start,
+            timestamp__lt=end,
+        ).values_list('employee_id', 'timestamp', 'punch').iterator(chunk_size=batch_size):
+            local = timezone.localtime(timestamp)
+            key = (employee_id, local.date())
+            if key in keys:
+                groups[key].add(punch, local.time().replace(tzinfo=None))
+
+    return groups
+
+
+def ingest_punches(device, logs, batch_size=BATCH_SIZE):
+    """
+    Log device punches and roll them up into attendance records
+
+    Punches already logged are skipped. Logged punches of the batch's
+    matched device users that were logged before the device user was mapped
+    to an employee are matched now. Records of the employees and dates with
+    new or newly matched punches are created or get earlier check-ins and
+    later check-outs; soft-deleted records are left alone. Every touched
+    record is then calculated in one batch. Returns counts of punches, new
+    punches, logged punches matched now (rematched), records created,
+    updated and skipped as deleted, and unmatched punches.
+    """
+    organization = device.organization
+    resolver = EmployeeResolver(organization)
+    punches = build_punches(device, logs, resolver) if logs else []
+
+    unmatched = [punch for punch in punches if punch.employee is None]
+    for user_id in sorted({punch.device_user_id for punch in unmatched}):
+        logger.warning(f"No employee found for device user_id: {user_id}")
+
+    counts = {
+        'punches': len(logs),
+        'new': 0,
+        'rematched': 0,
+        'created': 0,
+        'updated': 0,
+        'deleted': 0,
+        'unmatched': len(unmatched),
+    }
+
+    with transaction.atomic():
+        counts['rematched'], rematched = match_logged_punches(
+            device, resolver, {punch.device_user_id for punch in punches if punch.employee is not None}, batch_size
+        )
+
+        punches = new_punches(device, punches)
+        counts['new'] = log_punches(device, punches, batch_size)
+
+        keys = rematched | {
+            (punch.employee.id, timezone.localtime(punch.timestamp).date())
+            for punch in punches if punch.employee is not None
+        }
+        if not keys:
+            return counts
+
+        employee_ids = sorted({employee_id for employee_id, _ in keys})
+        dates = [day for _, day in keys]
+        existing = {}
+
+        for start in range(0, len(employee_ids), batch_size):
+            for record in AttendanceRecord.objects.all_with_deleted().filter(
+                organization=organization,
+                employee_id__in=employee_ids[start:start + batch_size],
+                date__range=(min(dates), max(dates))
+            ):
+                existing[(record.employee_id, record.date)] = record
+
+        now = timezone.now()
+        to_create = []
+        to_update = []
+        touched = []
+
+        for key, group in fold_punches(organization, keys, batch_size).items():
+            record = existing.get(key)
+
+            if record is None:
+                record = AttendanceRecord(
+                    organization=organization, employee_id=key[0], date=key[1],
+                    device=device, status='present', sync_timestamp=now
+                )
+                group.merge_into(record)
+                to_create.append(record)
+            elif record.deleted_at is not None:
+                counts['deleted'] += 1
+                continue
+            elif group.merge_into(record):
+                record.updated_at = now
+                to_update.append(record)
+                touched.append(record)
+            else:
+                touched.append(record)
+
+        calculate_unsaved(to_create)
+
+        AttendanceRecord.objects.bulk_create(to_create, batch_size=batch_size)
+        AttendanceRecord.objects.bulk_update(to_update, PUNCH_FIELDS, batch_size=batch_size)
+        refresh_records(to_create, batch_size=batch_size)
+        calculate_attendance(touched, batch_size=batch_size)
+
+    counts['created'] = len(to_create)
+    counts['updated'] = len(to_update)
+    return counts
@@ -0,0 +1,192 @@
+# hrm/jobs.py - DB-backed queue for attendance materialization, consumed by `manage.py attendance_worker`
+
+import time
+import logging
+import threading
+from datetime import timedelta
+
+from django.db import connections
+from django.utils import timezone
+
+from .attendance import materialize_attendance
+from .models import AttendanceJob
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between progress writes for one job
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+# Seconds between heartbeats of a running job, well below attendance_worker --stale-after
+HEARTBEAT_INTERVAL_SECONDS = 30
+
+
+def enqueue_attendance_job(organization, start_date, end_date, user=None):
+    """
+    Queue attendance materialization for an organization and date range
+    Returns (job, created); an already queued or running job for the organization is reused
+    """
+    active_job = AttendanceJob.objects.filter(
+        organization=organization,
+        status__in=['queued', 'running']
+    ).first()
+
+    if active_job:
+        return active_job, False
+
+    job = AttendanceJob.objects.create(
+        organization=organization,
+        start_date=start_date,
+        end_date=end_date,
+        total_days=(end_date - start_date).days + 1,
+        created_by=user
+    )
+    return job, True
+
+
+def claim_next_job(worker_name):
+    """
+    Atomically move the oldest queued job to running and return it
+    The conditional UPDATE makes claiming safe with several workers on any database.
+    """
+    candidates = AttendanceJob.objects.filter(status='queued').order_by('created_at', 'id')
+
+    for job_id in candidates.values_list('id', flat=True)[:10]:
+        now = timezone.now()
+        claimed = AttendanceJob.objects.filter(id=job_id, status='queued').update(
+            status='running',
+            worker=worker_name,
+            started_at=now,
+            heartbeat_at=now,
+            updated_at=now
+        )
+        if claimed:
+            return AttendanceJob.objects.select_related('organization').get(id=job_id)
+
+    return None
+
+
+def requeue_stale_jobs(stale_after_seconds):
+    """Put running jobs whose worker stopped sending heartbeats back in the queue"""
+    cutoff = timezone.now() - timedelta(seconds=stale_after_seconds)
+    return AttendanceJob.objects.filter(
+        status='running',
+        heartbeat_at__lt=cutoff
+    ).update(status='queued', worker=None, updated_at=timezone.now())
+
+
+def _claimed(job):
+    """The job's row, as long as it is still running on the worker that claimed it"""
+    return AttendanceJob.objects.filter(id=job.id, status='running', worker=job.worker)
+
+
+class JobHeartbeat:
+    """
+    Context manager that keeps a running job's heartbeat_at current from a
+    background thread, independent of progress reports: progress is only
+    reported once a materialization window is done, which can take longer
+    than --stale-after on large organizations.
+    """
+    def __init__(self, job, interval=HEARTBEAT_INTERVAL_SECONDS):
+        self.job = job
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def beat(self):
+        """Touch the heartbeat; False once the job is no longer claimed by this worker"""
+        now = timezone.now()
+        return bool(_claimed(self.job).update(heartbeat_at=now, updated_at=now))
+
+    def _run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    if not self.beat():
+                        logger.warning(f"Attendance job {self.job.id} is no longer claimed by {self.job.worker}")
+                        break
+                except Exception:
+                    logger.exception(f"Heartbeat of attendance job {self.job.id} failed")
+        finally:
+            # Connections are per thread
+            connections.close_all()
+
+    def __enter__(self):
+        self._thread = threading.Thread(
+            target=self._run, name=f'attendance-job-{self.job.id}-heartbeat', daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+
+class JobProgressReporter:
+    """
+    materialize_attendance progress callback that writes throttled progress to an AttendanceJob
+    """
+    def __init__(self, job, interval=PROGRESS_INTERVAL_SECONDS):
+        self.job = job
+        self.interval = interval
+        self._last_write = 0
+
+    def __call__(self, processed, total, counts):
+        now = time.monotonic()
+        if processed < total and now - self._last_write < self.interval:
+            return
+        self._last_write = now
+
+        _claimed(self.job).update(
+            total_days=total,
+            processed_days=processed,
+            records_created=counts['created'],
+            records_calculated=counts['calculated'],
+            heartbeat_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+
+
+def execute_job(job):
+    """
+    Run a claimed job and record its outcome
+
+    The outcome is only written while the job is still claimed by this
+    worker; if it was requeued meanwhile, the result is discarded and the
+    job is returned as it now stands.
+    """
+    with JobHeartbeat(job):
+        try:
+            counts = materialize_attendance(
+                job.organization, job.start_date, job.end_date,
+                progress_callback=JobProgressReporter(job)
+            )
+        except Exception as e:
+            logger.exception(f"Attendance job {job.id} crashed")
+            counts, error = None, f"Error calculating attendance: {str(e)}"
+
+    now = timezone.now()
+    outcome = {'finished_at': now, 'heartbeat_at': now, 'updated_at': now}
+
+    if counts is not None:
+        outcome.update(
+            status='completed',
+            processed_days=counts['days'],
+            total_days=counts['days'],
+            records_created=counts['created'],
+            records_calculated=counts['calculated'],
+            message=(
+                f"Created {counts['created']} records, calculated {counts['calculated']} records; "
+                f"{counts['unchanged']} unchanged records were skipped."
+            )
+        )
+    else:
+        outcome.update(status='failed', message=error)
+
+    if not _claimed(job).update(**outcome):
+        logger.warning(
+            f"Attendance job {job.id} was requeued while {job.worker} ran it; its outcome was discarded"
+        )
+
+    job.refresh_from_db()
+    return job
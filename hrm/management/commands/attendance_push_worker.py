@@ -0,0 +1,87 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from hrm.iclock import (
+    DEFAULT_FLUSH_SIZE, MAX_FLUSH_ATTEMPTS, flush_pushed_punches, requeue_stale_punches, retry_failed_punches
+)
+
+
+class Command(BaseCommand):
+    help = 'Flush punches pushed by devices over ADMS (iclock) into attendance, in micro-batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Flush the punches currently queued, then exit'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=1,
+            help='Seconds to wait when the queue is empty (default: 1)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_FLUSH_SIZE,
+            help=f'Most punches ingested per flush (default: {DEFAULT_FLUSH_SIZE})'
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=300,
+            help=(
+                'Requeue punches claimed by a worker, or left by a failed flush, for this many seconds '
+                f'(default: 300); punches that failed {MAX_FLUSH_ATTEMPTS} flushes are set aside'
+            )
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Queue the punches set aside after failing again before flushing'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        self.stdout.write("Attendance push worker started")
+
+        if options['retry_failed']:
+            retried = retry_failed_punches()
+            self.stdout.write(f'Queued {retried} failed punch(es) for retry')
+
+        try:
+            while True:
+                close_old_connections()
+
+                requeued = requeue_stale_punches(options['stale_after'])
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale punch(es)'))
+
+                started = time.monotonic()
+                totals = flush_pushed_punches(batch_size)
+
+                if totals['devices'] or totals['failed']:
+                    line = (
+                        f"{totals['punches']} punches from {totals['devices']} devices in "
+                        f"{time.monotonic() - started:.2f}s: {totals['new']} new, "
+                        f"{totals['created']} records created, {totals['updated']} updated"
+                    )
+                    self.stdout.write(self.style.SUCCESS(line))
+                    if totals['failed']:
+                        self.stdout.write(self.style.ERROR(f"✗ {totals['failed']} device(s) failed, see the log"))
+                    if totals['set_aside']:
+                        self.stdout.write(self.style.ERROR(
+                            f"✗ {totals['set_aside']} punch(es) set aside after {MAX_FLUSH_ATTEMPTS} failed flushes"
+                        ))
+
+                if totals['claimed'] >= batch_size:
+                    # More punches may be queued
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write('Attendance push worker stopped')
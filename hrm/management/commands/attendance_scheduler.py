@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from hrm.device_sync import DEFAULT_DEADLINE_SECONDS, DEFAULT_WORKERS
+from hrm.scheduler import DEFAULT_STALE_AFTER_SECONDS, run_due_syncs, seconds_until_next_sync
+
+
+class Command(BaseCommand):
+    help = 'Sync auto-synced attendance devices every sync_interval_minutes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Sync the devices currently due, then exit'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=30,
+            help='Longest wait between checks for due devices, in seconds (default: 30)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=DEFAULT_WORKERS,
+            help=f'Devices synced at the same time (default: {DEFAULT_WORKERS})'
+        )
+        parser.add_argument(
+            '--deadline',
+            type=float,
+            default=DEFAULT_DEADLINE_SECONDS,
+            help=f'Seconds a device may take to be read (default: {DEFAULT_DEADLINE_SECONDS})'
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=DEFAULT_STALE_AFTER_SECONDS,
+            help=f'Take over device syncs running for this many seconds (default: {DEFAULT_STALE_AFTER_SECONDS})'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Attendance scheduler started")
+
+        try:
+            while True:
+                close_old_connections()
+
+                results = run_due_syncs(options['workers'], options['deadline'], options['stale_after'])
+                for result in results:
+                    attendance = result.attendance or {}
+                    line = (
+                        f"{result.device.name}: {result.status} in {(result.fetch_seconds or 0) + (result.write_seconds or 0):.1f}s"
+                        + (f", {attendance['new']} new punches" if attendance else '')
+                        + (f" ({result.error})" if result.error else '')
+                    )
+                    style = self.style.SUCCESS if result.status == 'synced' else self.style.WARNING
+                    self.stdout.write(style(line))
+
+                if options['once'] and len(results) < options['workers']:
+                    break
+                if results:
+                    # More devices may be due
+                    continue
+                time.sleep(seconds_until_next_sync(options['sleep']))
+        except KeyboardInterrupt:
+            self.stdout.write('Attendance scheduler stopped')
@@ -0,0 +1,77 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from hrm.jobs import claim_next_job, execute_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Process queued attendance jobs (calculations submitted from the attendance pages)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the jobs currently queued, then exit'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=5,
+            help='Seconds to wait when the queue is empty (default: 5)'
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=600,
+            help='Requeue running jobs with no heartbeat for this many seconds (default: 600)'
+        )
+
+    def handle(self, *args, **options):
+        once = options['once']
+        sleep_seconds = options['sleep']
+        stale_after = options['stale_after']
+        worker_name = f"{socket.gethostname()}:{os.getpid()}"
+
+        self.stdout.write(f"Attendance worker {worker_name} started")
+
+        try:
+            while True:
+                close_old_connections()
+
+                requeued = requeue_stale_jobs(stale_after)
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale job(s)'))
+
+                job = claim_next_job(worker_name)
+
+                if not job:
+                    if once:
+                        break
+                    time.sleep(sleep_seconds)
+                    continue
+
+                self.stdout.write(
+                    f"Job {job.id}: attendance {job.start_date} - {job.end_date} ({job.organization.name})"
+                )
+                started = time.monotonic()
+                job = execute_job(job)
+                elapsed = time.monotonic() - started
+
+                if job.worker != worker_name:
+                    self.stdout.write(self.style.WARNING(
+                        f'Job {job.id} was requeued after {elapsed:.1f}s; its outcome was discarded'
+                    ))
+                elif job.status == 'completed':
+                    self.stdout.write(self.style.SUCCESS(
+                        f'✓ Job {job.id} completed in {elapsed:.1f}s: {job.message}'
+                    ))
+                else:
+                    self.stdout.write(self.style.ERROR(
+                        f'✗ Job {job.id} failed after {elapsed:.1f}s: {job.message}'
+                    ))
+        except KeyboardInterrupt:
+            self.stdout.write('Attendance worker stopped')
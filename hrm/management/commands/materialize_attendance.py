@@ -0,0 +1,69 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from hrm.attendance import default_start_date, materialize_attendance
+from organization.models import Organization
+
+
+class Command(BaseCommand):
+    help = (
+        'Create missing attendance records for scheduled working days of an organization '
+        'and recalculate records whose punches, timetable or shift changed'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('organization_id', type=int, help='Organization ID')
+        parser.add_argument(
+            '--start',
+            help='First date, YYYY-MM-DD (default: start of the earliest active timetable)'
+        )
+        parser.add_argument(
+            '--end',
+            help='Last date, YYYY-MM-DD (default: today)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            organization = Organization.objects.get(id=options['organization_id'])
+        except Organization.DoesNotExist:
+            raise CommandError(f"Organization {options['organization_id']} not found")
+
+        end_date = self.parse_option(options, 'end') or datetime.date.today()
+        start_date = self.parse_option(options, 'start') or default_start_date(organization)
+
+        if not start_date:
+            self.stdout.write(self.style.WARNING(f"No active timetables found for {organization.name}"))
+            return
+        if start_date > end_date:
+            raise CommandError('--start must not be after --end')
+
+        self.stdout.write(f"Calculating attendance of {organization.name} from {start_date} to {end_date}...")
+        started = time.monotonic()
+
+        def report(processed, total, counts):
+            self.stdout.write(
+                f"  {processed}/{total} days: {counts['created']} created, "
+                f"{counts['calculated']} calculated, {counts['unchanged']} unchanged"
+            )
+
+        counts = materialize_attendance(organization, start_date, end_date, progress_callback=report)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Created {counts['created']} records, calculated {counts['calculated']} records "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
+
+    def parse_option(self, options, name):
+        if not options[name]:
+            return None
+        try:
+            value = parse_date(options[name])
+        except ValueError:
+            value = None
+        if not value:
+            raise CommandError(f"--{name} must be a date in YYYY-MM-DD format")
+        return value
+
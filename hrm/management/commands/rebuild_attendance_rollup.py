@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from hrm.rollup import rebuild_months
+from organization.models import Organization
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly attendance rollup read by payroll and the attendance reports from attendance records'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'organization_id',
+            type=int,
+            nargs='?',
+            help='Organization ID (default: all organizations)'
+        )
+        parser.add_argument(
+            '--start',
+            help='Only rebuild months from the one of this date, YYYY-MM-DD'
+        )
+        parser.add_argument(
+            '--end',
+            help='Only rebuild months up to the one of this date, YYYY-MM-DD'
+        )
+
+    def handle(self, *args, **options):
+        organization = None
+        if options['organization_id']:
+            try:
+                organization = Organization.objects.get(id=options['organization_id'])
+            except Organization.DoesNotExist:
+                raise CommandError(f"Organization {options['organization_id']} not found")
+
+        start_date = self.parse_option(options, 'start')
+        end_date = self.parse_option(options, 'end')
+        if start_date and end_date and start_date > end_date:
+            raise CommandError('--start must not be after --end')
+
+        started = time.monotonic()
+        written = rebuild_months(organization, start_date, end_date)
+
+        scope = organization.name if organization else 'all organizations'
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Rebuilt {written} employee months of {scope} in {time.monotonic() - started:.1f}s"
+        ))
+
+    def parse_option(self, options, name):
+        if not options[name]:
+            return None
+        try:
+            value = parse_date(options[name])
+        except ValueError:
+            value = None
+        if not value:
+            raise CommandError(f"--{name} must be a date in YYYY-MM-DD format")
+        return value
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
+from hrm.device_sync import DEFAULT_DEADLINE_SECONDS, DEFAULT_WORKERS, DeviceSyncResult, sync_devices
 from hrm.models import AttendanceDevice
-from hrm.zkteco_utils import AttendanceSyncManager
+from hrm.scheduler import claim_device, release_device
 import datetime
 
 
@@ -16,51 +17,94 @@ class Command(BaseCommand):
         parser.add_argument(
             '--days',
             type=int,
-            default=7,
-            help='Number of days to sync (default: 7)'
+            help='Sync this many past days again instead of the punches since the last sync'
         )
         parser.add_argument(
             '--upload-users',
             action='store_true',
             help='Upload users to device'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=DEFAULT_WORKERS,
+            help=f'Devices read at the same time (default: {DEFAULT_WORKERS})'
+        )
+        parser.add_argument(
+            '--deadline',
+            type=float,
+            default=DEFAULT_DEADLINE_SECONDS,
+            help=f'Seconds a device may take to be read before it is skipped (default: {DEFAULT_DEADLINE_SECONDS})'
+        )
 
     def handle(self, *args, **options):
         device_id = options.get('device_id')
         days = options.get('days')
-        upload_users = options.get('upload_users')
 
         if device_id:
             devices = AttendanceDevice.objects.filter(id=device_id)
         else:
             devices = AttendanceDevice.objects.filter(is_active=True)
+        devices = list(devices.select_related('organization'))
 
-        for device in devices:
-            self.stdout.write(f"\nSyncing device: {device.name} ({device.ip_address})")
-            
-            sync_manager = AttendanceSyncManager(device)
-            
-            # Sync device info
-            if sync_manager.sync_device_info():
-                self.stdout.write(self.style.SUCCESS('✓ Device info synced'))
-            else:
-                self.stdout.write(self.style.ERROR('✗ Failed to sync device info'))
-                continue
-            
-            # Upload users if requested
-            if upload_users:
-                uploaded = sync_manager.upload_users()
-                self.stdout.write(self.style.SUCCESS(f'✓ Uploaded {uploaded} users'))
-            
-            # Sync users
-            users_synced = sync_manager.sync_users()
-            self.stdout.write(self.style.SUCCESS(f'✓ Synced {users_synced} users'))
-            
-            # Sync attendance
+        start_date = end_date = None
+        if days:
             end_date = datetime.date.today()
             start_date = end_date - datetime.timedelta(days=days)
-            
-            attendance_synced = sync_manager.sync_attendance(start_date, end_date)
-            self.stdout.write(self.style.SUCCESS(f'✓ Synced {attendance_synced} attendance records'))
 
-        self.stdout.write(self.style.SUCCESS('\n✓ Sync completed!'))
\ No newline at end of file
+        # Devices being synced by the scheduler or from the device page are skipped
+        claimed = [device for device in devices if claim_device(device.id)]
+        claimed_ids = {device.id for device in claimed}
+
+        self.stdout.write(f"Syncing {len(claimed)} devices with {options['workers']} workers...")
+        try:
+            claimed_results = sync_devices(
+                claimed, start_date, end_date,
+                workers=options['workers'],
+                deadline_seconds=options['deadline'],
+                upload_users=options['upload_users']
+            )
+        finally:
+            for device in claimed:
+                release_device(device.id)
+
+        claimed_results = iter(claimed_results)
+        results = []
+        for device in devices:
+            if device.id in claimed_ids:
+                results.append(next(claimed_results))
+            else:
+                result = DeviceSyncResult(device)
+                result.status, result.error = 'skipped', 'already being synced'
+                results.append(result)
+
+        self.stdout.write(
+            f"\n{'Device':<24} {'Status':<8} {'Fetch s':>8} {'Write s':>8} "
+            f"{'Users':>6} {'Punches':>8} {'New':>6} {'Created':>8} {'Updated':>8}  Note"
+        )
+        for result in results:
+            users = result.users['synced'] + result.users['created'] if result.users else '-'
+            attendance = result.attendance or {}
+            note = result.error or ('log cleared' if result.log_cleared else '')
+            if result.uploaded is not None:
+                note = f"{result.uploaded} uploaded" + (f", {note}" if note else '')
+
+            line = (
+                f"{result.device.name[:24]:<24} {result.status:<8} {self._seconds(result.fetch_seconds):>8} "
+                f"{self._seconds(result.write_seconds):>8} {users:>6} {attendance.get('punches', '-'):>8} "
+                f"{attendance.get('new', '-'):>6} {attendance.get('created', '-'):>8} "
+                f"{attendance.get('updated', '-'):>8}  {note}"
+            )
+            if result.status == 'synced':
+                style = self.style.SUCCESS
+            elif result.status == 'skipped':
+                style = self.style.WARNING
+            else:
+                style = self.style.ERROR
+            self.stdout.write(style(line))
+
+        synced = sum(1 for result in results if result.status == 'synced')
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Sync completed: {synced} of {len(results)} devices synced'))
+
+    def _seconds(self, seconds):
+        return f"{seconds:.1f}" if seconds is not None else '-'
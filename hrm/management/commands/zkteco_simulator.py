@@ -0,0 +1,148 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hrm.models import AttendanceDevice
+from hrm.zk_simulator import DeviceData, SimulatedDevice
+from organization.models import Organization
+
+
+class Command(BaseCommand):
+    help = (
+        'Run simulated ZKTeco devices with generated users and punches, to load-test '
+        'device syncs without hardware'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--devices',
+            type=int,
+            default=1,
+            help='Devices to simulate, on consecutive ports (default: 1)'
+        )
+        parser.add_argument(
+            '--host',
+            default='127.0.0.1',
+            help='Address to listen on (default: 127.0.0.1)'
+        )
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=4370,
+            help='TCP and UDP port of the first device (default: 4370)'
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=100,
+            help='Users on each device, the same on all devices (default: 100)'
+        )
+        parser.add_argument(
+            '--punches',
+            type=int,
+            default=1000,
+            help='Punches in each device\'s attendance log (default: 1000)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Days up to today the punches are spread over (default: 30)'
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0,
+            help='Seconds each reply is delayed (default: 0)'
+        )
+        parser.add_argument(
+            '--drop-rate',
+            type=float,
+            default=0,
+            help='Fraction of commands left unanswered; TCP connections are closed instead (default: 0)'
+        )
+        parser.add_argument(
+            '--password',
+            type=int,
+            default=0,
+            help='Device comm key (default: 0, none)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed; the same seed and scale generate the same punches (default: 42)'
+        )
+        parser.add_argument(
+            '--register',
+            type=int,
+            metavar='ORGANIZATION_ID',
+            help='Create or update an attendance device of this organization for each simulated device'
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['drop_rate'] < 1:
+            raise CommandError('--drop-rate must be at least 0 and below 1')
+
+        organization = None
+        if options['register']:
+            organization = Organization.objects.filter(id=options['register']).first()
+            if organization is None:
+                raise CommandError(f"Organization {options['register']} not found")
+
+        devices = []
+        try:
+            for index in range(options['devices']):
+                started = time.monotonic()
+                data = DeviceData.generate(
+                    users=options['users'],
+                    punches=options['punches'],
+                    days=options['days'],
+                    seed=options['seed'] + index,
+                    serial_number=f"SIM{index + 1:07d}",
+                    device_name=f"ZK Simulator {index + 1}",
+                    mac=f"00:17:61:00:{(index + 1) // 256:02x}:{(index + 1) % 256:02x}",
+                )
+                device = SimulatedDevice(
+                    data,
+                    host=options['host'],
+                    port=options['port'] + index,
+                    password=options['password'],
+                    latency=options['latency'],
+                    drop_rate=options['drop_rate'],
+                    seed=options['seed'] + index,
+                )
+                device.start()
+                devices.append(device)
+
+                if organization:
+                    AttendanceDevice.objects.update_or_create(
+                        organization=organization,
+                        ip_address=options['host'],
+                        port=device.port,
+                        defaults={
+                            'name': f"Simulator {device.port}",
+                            'device_type': 'zkteco',
+                            'password': options['password'],
+                            'is_active': True,
+                        }
+                    )
+
+                self.stdout.write(
+                    f"{data.options['~SerialNumber']} on {options['host']}:{device.port}: "
+                    f"{len(data.users)} users, {len(data.punches)} punches "
+                    f"(generated in {time.monotonic() - started:.1f}s)"
+                )
+
+            self.stdout.write(self.style.SUCCESS(f"{len(devices)} simulated devices running, Ctrl-C to stop"))
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            self.stdout.write('Simulated devices stopped')
+        finally:
+            for device in devices:
+                if device.commands:
+                    self.stdout.write(
+                        f"{device.data.options['~SerialNumber']}: {device.commands} commands, {device.dropped} dropped"
+                    )
+                device.stop()
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hrm', '0011_attendancejob_attendancerecord_calculation_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancedevice',
+            name='clear_log_after_sync',
+            field=models.BooleanField(default=False, help_text='Clear the attendance log on the device once its punches are saved'),
+        ),
+        migrations.AddField(
+            model_name='attendancedevice',
+            name='last_punch_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendancedevice',
+            name='last_punch_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hrm', '0012_attendancedevice_sync_watermark'),
+        ('organization', '0003_dynamictable_tablecolumn_roletablepermission_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendancePunch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('deleted_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('device_user_id', models.CharField(help_text='User ID (enrollment ID) on the device', max_length=50)),
+                ('device_uid', models.CharField(blank=True, help_text='User UID on the device', max_length=50, null=True)),
+                ('timestamp', models.DateTimeField()),
+                ('punch', models.PositiveSmallIntegerField(default=0)),
+                ('verify_type', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='punches', to='hrm.attendancedevice')),
+                ('employee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='punches', to='hrm.employee')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='organization.organization')),
+            ],
+            options={
+                'ordering': ['timestamp'],
+                'indexes': [models.Index(fields=['employee', 'timestamp'], name='hrm_attenda_employe_d5d337_idx')],
+                'constraints': [models.UniqueConstraint(fields=('device', 'device_user_id', 'timestamp'), name='unique_device_punch')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hrm', '0013_attendancepunch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancedevice',
+            name='last_sync_seconds',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendancedevice',
+            name='next_sync_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendancedevice',
+            name='sync_failures',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='attendancedevice',
+            name='sync_started_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hrm', '0014_attendancedevice_scheduling'),
+        ('organization', '0003_dynamictable_tablecolumn_roletablepermission_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancedevice',
+            name='last_push_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendancedevice',
+            name='push_attlog_stamp',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.CreateModel(
+            name='PushedPunch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('deleted_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('device_user_id', models.CharField(max_length=50)),
+                ('timestamp', models.DateTimeField()),
+                ('punch', models.PositiveSmallIntegerField(default=0)),
+                ('verify_type', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('batch', models.CharField(blank=True, max_length=32, null=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pushed_punches', to='hrm.attendancedevice')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='organization.organization')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['claimed_at', 'id'], name='hrm_pushedp_claimed_ce970c_idx'), models.Index(fields=['batch'], name='hrm_pushedp_batch_fa21cb_idx')],
+            },
+        ),
+    ]
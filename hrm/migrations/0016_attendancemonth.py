@@ -0,0 +1,86 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+
+def build_attendance_months(apps, schema_editor):
+    # Roll up existing records, as hrm.rollup.rebuild_months does
+    AttendanceRecord = apps.get_model('hrm', 'AttendanceRecord')
+    AttendanceMonth = apps.get_model('hrm', 'AttendanceMonth')
+
+    attended = Q(status__in=['present', 'late', 'half_day'])
+    rows = AttendanceRecord.objects.filter(deleted_at__isnull=True).annotate(
+        month=TruncMonth('date')
+    ).values('organization_id', 'employee_id', 'month').annotate(
+        total_record_days=Count('id'),
+        total_present_days=Count('id', filter=Q(status='present')),
+        total_late_days=Count('id', filter=Q(status='late')),
+        total_half_days=Count('id', filter=Q(status='half_day')),
+        total_absent_days=Count('id', filter=Q(status='absent')),
+        total_leave_days=Count('id', filter=Q(status='on_leave')),
+        total_holiday_days=Count('id', filter=Q(status='holiday')),
+        total_late_arrivals=Count('id', filter=Q(is_late=True)),
+        total_overtime_days=Count('id', filter=Q(overtime_hours__gt=0)),
+        total_working_hours=Sum('working_hours'),
+        total_overtime_hours=Sum('overtime_hours'),
+        total_attended_working_hours=Sum('working_hours', filter=attended),
+        total_attended_overtime_hours=Sum('overtime_hours', filter=attended),
+    ).order_by()
+
+    batch = []
+    for row in rows.iterator(chunk_size=500):
+        batch.append(AttendanceMonth(**{
+            field.removeprefix('total_'): value if value is not None else 0 for field, value in row.items()
+        }))
+        if len(batch) >= 500:
+            AttendanceMonth.objects.bulk_create(batch)
+            batch = []
+    AttendanceMonth.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hrm', '0015_attendancedevice_push'),
+        ('organization', '0003_dynamictable_tablecolumn_roletablepermission_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('deleted_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('month', models.DateField()),
+                ('record_days', models.PositiveIntegerField(default=0)),
+                ('present_days', models.PositiveIntegerField(default=0)),
+                ('late_days', models.PositiveIntegerField(default=0)),
+                ('half_days', models.PositiveIntegerField(default=0)),
+                ('absent_days', models.PositiveIntegerField(default=0)),
+                ('leave_days', models.PositiveIntegerField(default=0)),
+                ('holiday_days', models.PositiveIntegerField(default=0)),
+                ('late_arrivals', models.PositiveIntegerField(default=0)),
+                ('overtime_days', models.PositiveIntegerField(default=0)),
+                ('working_hours', models.DecimalField(decimal_places=2, default=0.0, max_digits=9)),
+                ('overtime_hours', models.DecimalField(decimal_places=2, default=0.0, max_digits=9)),
+                ('attended_working_hours', models.DecimalField(decimal_places=2, default=0.0, max_digits=9)),
+                ('attended_overtime_hours', models.DecimalField(decimal_places=2, default=0.0, max_digits=9)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_months', to='hrm.employee')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='organization.organization')),
+            ],
+            options={
+                'ordering': ['-month', 'employee'],
+                'indexes': [models.Index(fields=['organization', 'month'], name='hrm_attenda_organiz_0f8adf_idx')],
+                'unique_together': {('employee', 'month')},
+            },
+        ),
+        migrations.RunPython(build_attendance_months, migrations.RunPython.noop),
+    ]
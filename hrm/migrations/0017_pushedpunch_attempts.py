@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hrm', '0016_attendancemonth'),
+        ('organization', '0003_dynamictable_tablecolumn_roletablepermission_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pushedpunch',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pushedpunch',
+            name='failed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pushedpunch',
+            name='last_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='pushedpunch',
+            index=models.Index(fields=['failed_at'], name='hrm_pushedp_failed__62aabe_idx'),
+        ),
+    ]
@@ -438,6 +438,25 @@ class AttendanceDevice(BaseOrganizationModel):
     # Sync settings
     auto_sync_enabled = models.BooleanField(default=True)
     sync_interval_minutes = models.PositiveIntegerField(default=30)
+    clear_log_after_sync = models.BooleanField(
+        default=False,
+        help_text='Clear the attendance log on the device once its punches are saved'
+    )
+
+    # Sync watermark: newest punch ingested and the device's log size at that sync
+    last_punch_at = models.DateTimeField(blank=True, null=True, editable=False)
+    last_punch_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Scheduling state of `manage.py attendance_scheduler`
+    next_sync_at = models.DateTimeField(blank=True, null=True, editable=False)
+    sync_started_at = models.DateTimeField(blank=True, null=True, editable=False)
+    sync_failures = models.PositiveIntegerField(default=0, editable=False)
+    last_sync_seconds = models.FloatField(blank=True, null=True, editable=False)
+
+    # ADMS (iclock) push: when the device last uploaded punches, and the stamp it sent
+    # with them, returned on its handshake so it resumes after that upload
+    last_push_at = models.DateTimeField(blank=True, null=True, editable=False)
+    push_attlog_stamp = models.CharField(max_length=32, blank=True, default='', editable=False)
     objects = SoftDeleteManager()
     
     class Meta:
@@ -446,6 +465,20 @@ class AttendanceDevice(BaseOrganizationModel):
     def __str__(self):
         return f"{self.name} ({self.ip_address})"
 
+    @property
+    def is_syncing(self):
+        return self.sync_started_at is not None
+
+    @property
+    def sync_lag_seconds(self):
+        """Seconds the device's data is behind its sync interval, 0 when on time"""
+        from datetime import timedelta
+
+        if not self.auto_sync_enabled or not self.last_sync:
+            return None
+        due = self.last_sync + timedelta(minutes=self.sync_interval_minutes)
+        return max(0, int((timezone.now() - due).total_seconds()))
+
 
 class AttendanceRecord(BaseOrganizationModel):
     """
@@ -495,6 +528,9 @@ class AttendanceRecord(BaseOrganizationModel):
     # Device sync info
     device_user_id = models.CharField(max_length=50, blank=True, null=True, help_text="User ID from device")
     sync_timestamp = models.DateTimeField(blank=True, null=True)
+    
+    # Hash of the punches, timetable and shift of the last batch calculation
+    calculation_hash = models.CharField(max_length=40, blank=True, null=True, editable=False)
     objects = SoftDeleteManager()
     
     class Meta:
@@ -504,25 +540,33 @@ class AttendanceRecord(BaseOrganizationModel):
     def __str__(self):
         return f"{self.employee.full_name} - {self.date} ({self.status})"
     
+    def hard_delete(self):
+        """Permanently delete the record and refresh its month's rollup"""
+        from .rollup import refresh_months
+
+        super().hard_delete()
+        refresh_months({(self.employee_id, self.date)})
+    
     def calculate_hours(self):
         """Calculate working hours, late/early flags, overtime, and status from shift + timetable"""
-        from datetime import datetime, timedelta
+        from .schedule import get_schedule_index
 
         # Step 1: Find applicable timetable
-        timetable = (
-            Timetable.objects.filter(
-                employees=self.employee,
-                start_date__lte=self.date,
-                is_active=True
-            )
-            .filter(models.Q(end_date__gte=self.date) | models.Q(end_date__isnull=True))
-            .order_by('-start_date')
-            .first()
-        )
+        timetable = get_schedule_index(self.organization_id).timetable(self.employee_id, self.date)
+
+        self.apply_timetable(timetable)
+        self.save()
+
+    def apply_timetable(self, timetable):
+        """
+        Set calculated fields from the timetable applying on this record's date
+        (None when there is none), without saving. Batch calculation in
+        hrm.attendance uses this with timetables it resolved in bulk.
+        """
+        from datetime import datetime, timedelta
 
         if not timetable:
             self.status = 'absent'
-            self.save()
             return
 
         shift = timetable.shift
@@ -531,13 +575,11 @@ class AttendanceRecord(BaseOrganizationModel):
         weekday = self.date.strftime("%A").lower()
         if not getattr(timetable, weekday):
             self.status = 'holiday'
-            self.save()
             return
 
         # Step 3: UPDATED - Handle cases with only check-in OR check-out
         if not self.check_in_time and not self.check_out_time:
             self.status = 'absent'
-            self.save()
             return
         
         # Initialize variables for partial attendance
@@ -583,8 +625,6 @@ class AttendanceRecord(BaseOrganizationModel):
             self.overtime_hours = 0.00
             self.is_early_departure = False
             self.early_departure_minutes = 0
-            
-            self.save()
             return
 
         # Step 4: Continue with full calculation if both times exist
@@ -659,7 +699,159 @@ class AttendanceRecord(BaseOrganizationModel):
         else:
             self.status = 'present'
 
-        self.save()
+
+class AttendancePunch(BaseOrganizationModel):
+    """
+    Raw punch read from an attendance device; append-only
+    AttendanceRecord check-in and check-out times are derived from these.
+    """
+    device = models.ForeignKey(AttendanceDevice, on_delete=models.CASCADE, related_name='punches')
+    device_user_id = models.CharField(max_length=50, help_text="User ID (enrollment ID) on the device")
+    device_uid = models.CharField(max_length=50, blank=True, null=True, help_text="User UID on the device")
+    timestamp = models.DateTimeField()
+    # 0 = Check In, 1 = Check Out, 2 = Break Out, 3 = Break In, 4/5 = Overtime In/Out
+    punch = models.PositiveSmallIntegerField(default=0)
+    verify_type = models.PositiveSmallIntegerField(blank=True, null=True)
+
+    # Matched when ingested; null for device users without an employee until
+    # a later batch brings punches of the device user once it is mapped
+    employee = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True, blank=True, related_name='punches')
+    objects = SoftDeleteManager()
+
+    class Meta:
+        ordering = ['timestamp']
+        constraints = [
+            UniqueConstraint(fields=['device', 'device_user_id', 'timestamp'], name='unique_device_punch'),
+        ]
+        indexes = [
+            models.Index(fields=['employee', 'timestamp']),
+        ]
+
+    def __str__(self):
+        return f"{self.device_user_id} @ {self.timestamp} ({self.device.name})"
+
+
+class PushedPunch(BaseOrganizationModel):
+    """
+    Punch pushed by a device over ADMS (iclock), queued until the
+    attendance_push_worker command flushes it into attendance
+    """
+    device = models.ForeignKey(AttendanceDevice, on_delete=models.CASCADE, related_name='pushed_punches')
+    device_user_id = models.CharField(max_length=50)
+    timestamp = models.DateTimeField()
+    punch = models.PositiveSmallIntegerField(default=0)
+    verify_type = models.PositiveSmallIntegerField(blank=True, null=True)
+
+    # Set while a worker flushes the punch
+    batch = models.CharField(max_length=32, blank=True, null=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+
+    # Flushes attempted; a punch that keeps failing is set aside (failed_at) until retried
+    attempts = models.PositiveSmallIntegerField(default=0)
+    failed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    objects = SoftDeleteManager()
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['claimed_at', 'id']),
+            models.Index(fields=['batch']),
+            models.Index(fields=['failed_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.device_user_id} @ {self.timestamp} ({self.device.name}, pushed)"
+
+
+class AttendanceMonth(BaseOrganizationModel):
+    """
+    One employee's attendance records of one month rolled up, kept current by
+    hrm.rollup whenever records are written or calculated; soft-deleted
+    records are left out
+    """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='attendance_months')
+    # First day of the month
+    month = models.DateField()
+
+    # Records by status
+    record_days = models.PositiveIntegerField(default=0)
+    present_days = models.PositiveIntegerField(default=0)
+    late_days = models.PositiveIntegerField(default=0)
+    half_days = models.PositiveIntegerField(default=0)
+    absent_days = models.PositiveIntegerField(default=0)
+    leave_days = models.PositiveIntegerField(default=0)
+    holiday_days = models.PositiveIntegerField(default=0)
+
+    # Records flagged late, whatever their status, and records with overtime
+    late_arrivals = models.PositiveIntegerField(default=0)
+    overtime_days = models.PositiveIntegerField(default=0)
+
+    # Hours of all records, and of present, late and half day records only
+    working_hours = models.DecimalField(max_digits=9, decimal_places=2, default=0.00)
+    overtime_hours = models.DecimalField(max_digits=9, decimal_places=2, default=0.00)
+    attended_working_hours = models.DecimalField(max_digits=9, decimal_places=2, default=0.00)
+    attended_overtime_hours = models.DecimalField(max_digits=9, decimal_places=2, default=0.00)
+    objects = SoftDeleteManager()
+
+    class Meta:
+        ordering = ['-month', 'employee']
+        unique_together = ['employee', 'month']
+        indexes = [
+            models.Index(fields=['organization', 'month']),
+        ]
+
+    def __str__(self):
+        return f"{self.employee.full_name} - {self.month:%B %Y}"
+
+
+class AttendanceJob(BaseOrganizationModel):
+    """
+    Queued attendance materialization for a date range, executed by the attendance_worker command
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    start_date = models.DateField()
+    end_date = models.DateField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    
+    # Progress
+    total_days = models.PositiveIntegerField(default=0)
+    processed_days = models.PositiveIntegerField(default=0)
+    records_created = models.PositiveIntegerField(default=0)
+    records_calculated = models.PositiveIntegerField(default=0)
+    message = models.TextField(blank=True, null=True)
+    
+    # Execution
+    worker = models.CharField(max_length=100, blank=True, null=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    objects = SoftDeleteManager()
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Attendance {self.start_date} - {self.end_date} ({self.status})"
+    
+    @property
+    def is_active(self):
+        return self.status in ['queued', 'running']
+    
+    @property
+    def progress_percent(self):
+        if not self.total_days:
+            return 100 if self.status == 'completed' else 0
+        return min(100, int(self.processed_days * 100 / self.total_days))
 
 
 class Payhead(BaseOrganizationModel):
@@ -0,0 +1,282 @@
+# hrm/rollup.py - Per-employee, per-month attendance totals
+#
+# AttendanceMonth holds the counts and hour sums of one employee's
+# attendance records in one month, so payroll, the attendance reports and
+# the dashboards read a month as one indexed row instead of aggregating its
+# records each time.
+#
+# Months are refreshed from their records with one grouped query per month
+# and batch of employees, and written with one upsert. Saving a single
+# record (soft deletes included) refreshes its month through the signals
+# below, and AttendanceRecord.hard_delete refreshes it too; there is no
+# delete signal, which would stop cascades from deleting records in bulk.
+# The batch writers (hrm.attendance, hrm.ingest, restores) refresh the
+# months they touched themselves, since bulk queries send no signals.
+# `manage.py rebuild_attendance_rollup` rebuilds the table from scratch.
+#
+# attendance_totals answers any date range: whole months come from the
+# rollup and the days of partial months at either end from the records.
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from .models import AttendanceMonth, AttendanceRecord
+
+BATCH_SIZE = 500
+
+# Statuses whose hours count as attended, as payroll pays them
+ATTENDED_STATUSES = ('present', 'late', 'half_day')
+
+COUNT_FIELDS = [
+    'record_days', 'present_days', 'late_days', 'half_days', 'absent_days', 'leave_days',
+    'holiday_days', 'late_arrivals', 'overtime_days',
+]
+
+HOUR_FIELDS = ['working_hours', 'overtime_hours', 'attended_working_hours', 'attended_overtime_hours']
+
+TOTAL_FIELDS = COUNT_FIELDS + HOUR_FIELDS
+
+ZERO_HOURS = Decimal('0.00')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def month_end(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+
+def split_months(start_date, end_date):
+    """
+    (first, last) of the whole months within start..end (None when there
+    are none) and the (start, end) ranges of the partial months, each
+    within one month
+    """
+    first = start_date if start_date.day == 1 else month_end(start_date) + timedelta(days=1)
+    if end_date == month_end(end_date):
+        last = month_start(end_date)
+    else:
+        last = month_start(month_start(end_date) - timedelta(days=1))
+
+    if first > last:
+        # No whole month: the range lies within one month or straddles two
+        if month_start(start_date) == month_start(end_date):
+            return None, [(start_date, end_date)]
+        return None, [(start_date, month_end(start_date)), (month_start(end_date), end_date)]
+
+    partial = []
+    if start_date < first:
+        partial.append((start_date, first - timedelta(days=1)))
+    if end_date > month_end(last):
+        partial.append((month_start(end_date), end_date))
+    return (first, last), partial
+
+
+def _aggregates():
+    """TOTAL_FIELDS as aggregates over attendance records, named total_<field>"""
+    attended = Q(status__in=ATTENDED_STATUSES)
+    aggregates = {
+        'record_days': Count('id'),
+        'present_days': Count('id', filter=Q(status='present')),
+        'late_days': Count('id', filter=Q(status='late')),
+        'half_days': Count('id', filter=Q(status='half_day')),
+        'absent_days': Count('id', filter=Q(status='absent')),
+        'leave_days': Count('id', filter=Q(status='on_leave')),
+        'holiday_days': Count('id', filter=Q(status='holiday')),
+        'late_arrivals': Count('id', filter=Q(is_late=True)),
+        'overtime_days': Count('id', filter=Q(overtime_hours__gt=0)),
+        'working_hours': Sum('working_hours'),
+        'overtime_hours': Sum('overtime_hours'),
+        'attended_working_hours': Sum('working_hours', filter=attended),
+        'attended_overtime_hours': Sum('overtime_hours', filter=attended),
+    }
+    # Annotations can't share a name with the record fields they sum
+    return {f'total_{field}': aggregate for field, aggregate in aggregates.items()}
+
+
+def _totals(row):
+    """TOTAL_FIELDS of a row annotated with _aggregates, empty sums as zero hours"""
+    totals = empty_totals()
+    for field in TOTAL_FIELDS:
+        value = row[f'total_{field}']
+        if value is not None:
+            # Some backends return sums with extra decimal places
+            totals[field] = value.quantize(ZERO_HOURS) if field in HOUR_FIELDS else value
+    return totals
+
+
+def empty_totals():
+    return {field: ZERO_HOURS if field in HOUR_FIELDS else 0 for field in TOTAL_FIELDS}
+
+
+def add_totals(totals, other):
+    for field in TOTAL_FIELDS:
+        totals[field] += other[field]
+    return totals
+
+
+def refresh_months(keys, batch_size=BATCH_SIZE):
+    """
+    Recalculate the AttendanceMonth rows of (employee_id, day) keys from
+    their records; any day of the month may be given. Months left without
+    records are removed. Returns the number of months refreshed.
+    """
+    employees_by_month = defaultdict(set)
+    for employee_id, day in keys:
+        employees_by_month[month_start(day)].add(employee_id)
+
+    refreshed = 0
+    for month, employee_ids in sorted(employees_by_month.items()):
+        employee_ids = sorted(employee_ids)
+
+        for start in range(0, len(employee_ids), batch_size):
+            batch = employee_ids[start:start + batch_size]
+            rows = AttendanceRecord.objects.filter(
+                employee_id__in=batch,
+                date__range=(month, month_end(month))
+            ).values('organization_id', 'employee_id').annotate(**_aggregates()).order_by()
+
+            months = [
+                AttendanceMonth(
+                    organization_id=row['organization_id'],
+                    employee_id=row['employee_id'],
+                    month=month,
+                    **_totals(row)
+                )
+                for row in rows
+            ]
+
+            with transaction.atomic():
+                AttendanceMonth.objects.bulk_create(
+                    months,
+                    update_conflicts=True,
+                    unique_fields=['employee', 'month'],
+                    update_fields=TOTAL_FIELDS + ['updated_at'],
+                )
+                AttendanceMonth.objects.filter(employee_id__in=batch, month=month).exclude(
+                    employee_id__in=[row.employee_id for row in months]
+                ).delete()
+
+            refreshed += len(batch)
+
+    return refreshed
+
+
+def refresh_records(records, batch_size=BATCH_SIZE):
+    """Refresh the months of attendance records"""
+    return refresh_months({(record.employee_id, record.date) for record in records}, batch_size)
+
+
+def refresh_record_ids(record_ids, batch_size=BATCH_SIZE):
+    """Refresh the months of the attendance records with these ids, deleted or not"""
+    return refresh_months(
+        set(AttendanceRecord.objects.all_with_deleted().filter(id__in=record_ids).values_list('employee_id', 'date')),
+        batch_size
+    )
+
+
+def rebuild_months(organization=None, start_date=None, end_date=None, batch_size=BATCH_SIZE):
+    """
+    Rebuild the AttendanceMonth rows of an organization (all when None),
+    optionally only of the months overlapping start..end, in one grouped
+    query over the records. Returns the number of rows written.
+    """
+    records = AttendanceRecord.objects.all()
+    months = AttendanceMonth.objects.all()
+    if organization is not None:
+        records = records.filter(organization=organization)
+        months = months.filter(organization=organization)
+    if start_date is not None:
+        records = records.filter(date__gte=month_start(start_date))
+        months = months.filter(month__gte=month_start(start_date))
+    if end_date is not None:
+        records = records.filter(date__lte=month_end(end_date))
+        months = months.filter(month__lte=month_start(end_date))
+
+    rows = records.annotate(month=TruncMonth('date')).values(
+        'organization_id', 'employee_id', 'month'
+    ).annotate(**_aggregates()).order_by()
+
+    written = 0
+    with transaction.atomic():
+        months.delete()
+
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(AttendanceMonth(
+                organization_id=row['organization_id'],
+                employee_id=row['employee_id'],
+                month=row['month'],
+                **_totals(row)
+            ))
+            if len(batch) >= batch_size:
+                AttendanceMonth.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+
+        AttendanceMonth.objects.bulk_create(batch)
+        written += len(batch)
+
+    return written
+
+
+def attendance_totals(organization, start_date, end_date, employee_ids=None, by_month=False):
+    """
+    TOTAL_FIELDS of the records dated start..end, by employee id, or by
+    (employee id, first day of the month) when by_month. Employees without
+    records are left out. employee_ids (a list or queryset) restricts the
+    employees.
+    """
+    totals = defaultdict(empty_totals)
+    whole, partial = split_months(start_date, end_date)
+
+    if whole is not None:
+        months = AttendanceMonth.objects.filter(organization=organization, month__range=whole)
+        if employee_ids is not None:
+            months = months.filter(employee_id__in=employee_ids)
+
+        for row in months.values('employee_id', 'month', *TOTAL_FIELDS):
+            key = (row['employee_id'], row['month']) if by_month else row['employee_id']
+            add_totals(totals[key], row)
+
+    for partial_start, partial_end in partial:
+        records = AttendanceRecord.objects.filter(
+            organization=organization,
+            date__range=(partial_start, partial_end)
+        )
+        if employee_ids is not None:
+            records = records.filter(employee_id__in=employee_ids)
+
+        for row in records.values('employee_id').annotate(**_aggregates()).order_by():
+            key = (row['employee_id'], month_start(partial_start)) if by_month else row['employee_id']
+            add_totals(totals[key], _totals(row))
+
+    return dict(totals)
+
+
+@receiver(pre_save, sender=AttendanceRecord)
+def _record_saving(sender, instance, raw=False, **kwargs):
+    # A record moved to another employee or month leaves its old month stale
+    if instance.pk and not raw:
+        instance._rollup_previous = AttendanceRecord.objects.all_with_deleted().filter(
+            pk=instance.pk
+        ).values_list('employee_id', 'date').first()
+
+
+@receiver(post_save, sender=AttendanceRecord)
+def _record_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    keys = {(instance.employee_id, instance.date)}
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous:
+        keys.add(previous)
+    refresh_months(keys)
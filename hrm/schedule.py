@@ -0,0 +1,227 @@
+# hrm/schedule.py - Per-organization index of the timetable applying to each employee and date
+#
+# An employee's timetables may overlap; on any date the active one with the
+# latest start date applies (the lowest id on ties). The index resolves that
+# once per organization into sorted, non-overlapping intervals per employee,
+# so a lookup is a binary search instead of a timetable query.
+#
+# Indexes are cached per process. Each lookup of the cache checks a version
+# read from the database in one query (timetable count and latest
+# timetable/shift change), so changes made in other processes are picked up
+# too. Saving or deleting a timetable or shift drops this process's entry;
+# changing a timetable's employees also touches the timetable so other
+# processes see the change.
+
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+
+from django.db.models import Count, Max, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Shift, Timetable
+
+# Order of date.weekday()
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# organization id -> ScheduleIndex
+_indexes = {}
+
+
+class ScheduleInterval(namedtuple('ScheduleInterval', ['start_date', 'end_date', 'timetable', 'weekdays'])):
+    """
+    Dates start_date..end_date (None for open-ended) governed by one timetable
+    weekdays is a bit mask of working days, bit 0 being Monday.
+    """
+    __slots__ = ()
+
+    @property
+    def shift(self):
+        return self.timetable.shift
+
+    def is_working_day(self, day):
+        return bool(self.weekdays >> day.weekday() & 1)
+
+
+class ScheduleIndex:
+    """Resolved timetable intervals of one organization's employees"""
+
+    def __init__(self, organization_id, intervals, version=None):
+        self.organization_id = organization_id
+        self.version = version
+        self._intervals = intervals
+        self._starts = {
+            employee_id: [interval.start_date for interval in employee_intervals]
+            for employee_id, employee_intervals in intervals.items()
+        }
+
+    @classmethod
+    def build(cls, organization_id, version=None):
+        """Load the organization's active timetables in one query and resolve them"""
+        Assignment = Timetable.employees.through
+        timetables = {}
+        assigned = defaultdict(list)
+
+        for assignment in Assignment.objects.filter(
+            timetable__organization_id=organization_id,
+            timetable__is_active=True,
+            timetable__deleted_at__isnull=True,
+        ).select_related('timetable', 'timetable__shift'):
+            # Employees sharing a timetable share its instance
+            timetable = timetables.setdefault(assignment.timetable_id, assignment.timetable)
+            assigned[assignment.employee_id].append(timetable)
+
+        intervals = {
+            employee_id: resolve_intervals(employee_timetables)
+            for employee_id, employee_timetables in assigned.items()
+        }
+        return cls(organization_id, intervals, version)
+
+    @property
+    def employee_ids(self):
+        """Employees with at least one timetable"""
+        return self._intervals.keys()
+
+    def intervals(self, employee_id):
+        return self._intervals.get(employee_id, [])
+
+    def resolve(self, employee_id, day):
+        """The interval covering day, or None when no timetable applies"""
+        starts = self._starts.get(employee_id)
+        if not starts:
+            return None
+
+        position = bisect_right(starts, day) - 1
+        if position < 0:
+            return None
+
+        interval = self._intervals[employee_id][position]
+        if interval.end_date is not None and interval.end_date < day:
+            return None
+        return interval
+
+    def timetable(self, employee_id, day):
+        """The timetable applying on day, or None"""
+        interval = self.resolve(employee_id, day)
+        return interval.timetable if interval else None
+
+    def iter_range(self, employee_id, start_date, end_date):
+        """Yield (date, interval or None) for every date of start_date..end_date"""
+        intervals = self.intervals(employee_id)
+        position = max(0, bisect_right(self._starts.get(employee_id, []), start_date) - 1)
+        day = start_date
+
+        while day <= end_date:
+            while position < len(intervals) - 1 and intervals[position + 1].start_date <= day:
+                position += 1
+
+            interval = intervals[position] if intervals else None
+            if interval and (interval.start_date > day or (interval.end_date is not None and interval.end_date < day)):
+                interval = None
+
+            yield day, interval
+            day += timedelta(days=1)
+
+    def working_days(self, employee_id, start_date, end_date):
+        """Scheduled working days of start_date..end_date"""
+        return sum(
+            1 for day, interval in self.iter_range(employee_id, start_date, end_date)
+            if interval and interval.is_working_day(day)
+        )
+
+
+def resolve_intervals(timetables):
+    """
+    Non-overlapping intervals of the timetables applying on each date
+
+    Dates change hands only where a timetable starts or ends, so the winner
+    is decided once per stretch between consecutive boundaries.
+    """
+    boundaries = set()
+    for timetable in timetables:
+        boundaries.add(timetable.start_date.toordinal())
+        if timetable.end_date is not None:
+            boundaries.add(timetable.end_date.toordinal() + 1)
+    boundaries = sorted(boundaries)
+
+    intervals = []
+    for position, start in enumerate(boundaries):
+        stretch_end = boundaries[position + 1] - 1 if position + 1 < len(boundaries) else None
+
+        covering = [
+            timetable for timetable in timetables
+            if timetable.start_date.toordinal() <= start
+            and (timetable.end_date is None or timetable.end_date.toordinal() >= start)
+        ]
+        if not covering:
+            continue
+        winner = min(covering, key=lambda timetable: (-timetable.start_date.toordinal(), timetable.id))
+
+        end_date = date.fromordinal(stretch_end) if stretch_end is not None else None
+        previous = intervals[-1] if intervals else None
+        if previous and previous.timetable is winner and previous.end_date == date.fromordinal(start - 1):
+            intervals[-1] = previous._replace(end_date=end_date)
+        else:
+            intervals.append(ScheduleInterval(
+                date.fromordinal(start), end_date, winner, weekday_mask(winner)
+            ))
+
+    return intervals
+
+
+def weekday_mask(timetable):
+    return sum(1 << number for number, weekday in enumerate(WEEKDAYS) if getattr(timetable, weekday))
+
+
+def schedule_version(organization_id):
+    """Changes whenever a timetable, its employees or its shift change"""
+    version = Timetable.objects.all_with_deleted().filter(organization_id=organization_id).aggregate(
+        live=Count('id', filter=Q(deleted_at__isnull=True)),
+        changed=Max('updated_at'),
+        shift_changed=Max('shift__updated_at'),
+    )
+    return tuple(version[key] for key in ('live', 'changed', 'shift_changed'))
+
+
+def get_schedule_index(organization_id):
+    """The organization's cached ScheduleIndex, rebuilt when its version changed"""
+    version = schedule_version(organization_id)
+    index = _indexes.get(organization_id)
+
+    if index is None or index.version != version:
+        index = ScheduleIndex.build(organization_id, version)
+        _indexes[organization_id] = index
+    return index
+
+
+def invalidate_schedule(organization_id):
+    _indexes.pop(organization_id, None)
+
+
+@receiver([post_save, post_delete], sender=Timetable)
+@receiver([post_save, post_delete], sender=Shift)
+def _schedule_changed(sender, instance, **kwargs):
+    invalidate_schedule(instance.organization_id)
+
+
+@receiver(m2m_changed, sender=Timetable.employees.through)
+def _schedule_employees_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # The employee's timetables are unknown once cleared
+        instance._cleared_timetable_ids = list(instance.timetables.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        timetable_ids = [instance.id]
+    elif action == 'post_clear':
+        timetable_ids = getattr(instance, '_cleared_timetable_ids', [])
+    else:
+        timetable_ids = list(pk_set or [])
+
+    # Employee changes don't save the timetable; touch it for other processes
+    Timetable.objects.all_with_deleted().filter(id__in=timetable_ids).update(updated_at=timezone.now())
+    invalidate_schedule(instance.organization_id)
@@ -0,0 +1,156 @@
+# hrm/scheduler.py - Interval scheduling of device syncs, run by `manage.py attendance_scheduler`
+#
+# Each auto-synced device is due every sync_interval_minutes, give or take a
+# jitter that keeps devices added together from being polled together. A
+# device that is offline or fails is retried after exponentially longer
+# delays. A sync holds a lease on its device (sync_started_at), taken with a
+# conditional UPDATE, so a device still being synced by another scheduler or
+# from the device page is skipped.
+
+import random
+import logging
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .device_sync import DEFAULT_DEADLINE_SECONDS, DEFAULT_WORKERS, sync_devices
+from .models import AttendanceDevice
+
+logger = logging.getLogger(__name__)
+
+# Fraction of the interval a sync may move either way
+JITTER = 0.1
+
+# Longest delay between retries of a failing device
+MAX_BACKOFF_SECONDS = 6 * 60 * 60
+
+# Leases older than this are taken to belong to a crashed sync
+DEFAULT_STALE_AFTER_SECONDS = 600
+
+
+def scheduled_devices():
+    return AttendanceDevice.objects.filter(is_active=True, auto_sync_enabled=True, device_type='zkteco')
+
+
+def next_sync_delay(device, succeeded):
+    """Seconds until the device's next sync, with jitter"""
+    interval = max(1, device.sync_interval_minutes) * 60
+    if not succeeded:
+        # device.sync_failures already counts this failure
+        interval = min(interval * 2 ** device.sync_failures, max(interval, MAX_BACKOFF_SECONDS))
+    return interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def schedule_new_devices(now=None):
+    """
+    Give devices that were never scheduled a first sync time: an interval
+    after their last sync, or a random point of their first interval
+    """
+    now = now or timezone.now()
+    scheduled = 0
+
+    for device in scheduled_devices().filter(next_sync_at__isnull=True):
+        interval = timedelta(minutes=device.sync_interval_minutes)
+        if device.last_sync and device.last_sync + interval > now:
+            next_sync_at = device.last_sync + interval
+        else:
+            next_sync_at = now + interval * random.uniform(0, JITTER)
+
+        scheduled += AttendanceDevice.objects.filter(id=device.id, next_sync_at__isnull=True).update(
+            next_sync_at=next_sync_at
+        )
+
+    return scheduled
+
+
+def claim_device(device_id, stale_after_seconds=DEFAULT_STALE_AFTER_SECONDS):
+    """Take the device's sync lease; False when another sync holds it"""
+    now = timezone.now()
+    return bool(AttendanceDevice.objects.filter(id=device_id).filter(
+        Q(sync_started_at__isnull=True) | Q(sync_started_at__lt=now - timedelta(seconds=stale_after_seconds))
+    ).update(sync_started_at=now))
+
+
+def release_device(device_id):
+    AttendanceDevice.objects.filter(id=device_id).update(sync_started_at=None)
+
+
+def claim_due_devices(limit, stale_after_seconds=DEFAULT_STALE_AFTER_SECONDS, now=None):
+    """Claim up to limit devices whose sync is due, most overdue first"""
+    now = now or timezone.now()
+    due = scheduled_devices().filter(next_sync_at__lte=now).order_by('next_sync_at', 'id')
+
+    claimed = []
+    for device_id in due.values_list('id', flat=True)[:limit * 2]:
+        if len(claimed) == limit:
+            break
+        if claim_device(device_id, stale_after_seconds):
+            claimed.append(device_id)
+
+    return list(AttendanceDevice.objects.filter(id__in=claimed).select_related('organization'))
+
+
+def finish_sync(device, succeeded, seconds=None):
+    """Release the device's lease and schedule its next sync"""
+    device.sync_failures = 0 if succeeded else device.sync_failures + 1
+    device.next_sync_at = timezone.now() + timedelta(seconds=next_sync_delay(device, succeeded))
+
+    AttendanceDevice.objects.filter(id=device.id).update(
+        sync_started_at=None,
+        sync_failures=device.sync_failures,
+        next_sync_at=device.next_sync_at,
+        last_sync_seconds=seconds
+    )
+
+
+def run_due_syncs(workers=DEFAULT_WORKERS, deadline_seconds=DEFAULT_DEADLINE_SECONDS,
+                  stale_after_seconds=DEFAULT_STALE_AFTER_SECONDS):
+    """Sync the devices that are due, at most workers at a time; returns their DeviceSyncResults"""
+    schedule_new_devices()
+    devices = claim_due_devices(workers, stale_after_seconds)
+    if not devices:
+        return []
+
+    try:
+        results = sync_devices(devices, workers=workers, deadline_seconds=deadline_seconds, sync_users=False)
+    except Exception:
+        logger.exception("Scheduled device sync crashed")
+        for device in devices:
+            finish_sync(device, succeeded=False)
+        raise
+
+    for result in results:
+        seconds = sum(part or 0 for part in (result.fetch_seconds, result.write_seconds))
+        finish_sync(result.device, result.status == 'synced', seconds)
+
+    return results
+
+
+def seconds_until_next_sync(default):
+    """Seconds until the next device not being synced is due, between 1 and default"""
+    next_sync_at = scheduled_devices().filter(
+        next_sync_at__isnull=False,
+        sync_started_at__isnull=True
+    ).order_by('next_sync_at').values_list('next_sync_at', flat=True).first()
+
+    if next_sync_at is None:
+        return default
+    return min(default, max(1, (next_sync_at - timezone.now()).total_seconds()))
+
+
+def sync_status(devices):
+    """Per-device scheduling state and lag, for monitoring"""
+    return [{
+        'id': device.id,
+        'name': device.name,
+        'auto_sync_enabled': device.auto_sync_enabled,
+        'is_online': device.is_online,
+        'is_syncing': device.is_syncing,
+        'last_sync': device.last_sync.isoformat() if device.last_sync else None,
+        'next_sync_at': device.next_sync_at.isoformat() if device.next_sync_at else None,
+        'lag_seconds': device.sync_lag_seconds,
+        'failures': device.sync_failures,
+        'last_sync_seconds': device.last_sync_seconds,
+        'last_push_at': device.last_push_at.isoformat() if device.last_push_at else None,
+    } for device in devices]
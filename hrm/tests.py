@@ -1,3 +1,1204 @@
-from django.test import TestCase
+import io
+import threading
+from types import SimpleNamespace
+from unittest import mock
+from zk import ZK
+from zk.exception import ZKErrorResponse
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from organization.models import Organization, OrganizationMembership
+
+from .attendance import CALCULATED_FIELDS, calculate_attendance, materialize_attendance
+from .device_sync import sync_devices
+from .device_users import sync_device_users
+from .iclock import (
+    MAX_FLUSH_ATTEMPTS, claim_pushed_punches, flush_pushed_punches, requeue_stale_punches, retry_failed_punches
+)
+from .ingest import ingest_punches
+from .jobs import JobHeartbeat, claim_next_job, enqueue_attendance_job, execute_job, requeue_stale_jobs
+from .models import (
+    Employee, Shift, Timetable, AttendanceDevice, AttendancePunch, AttendanceRecord, AttendanceMonth, AttendanceJob,
+    PushedPunch
+)
+from .rollup import TOTAL_FIELDS, attendance_totals, empty_totals, month_end, rebuild_months, refresh_record_ids
+from .schedule import _indexes, get_schedule_index
+from .scheduler import run_due_syncs
+from .zk_simulator import DeviceData, SimulatedDevice
+from .zkteco_utils import AttendanceSyncManager, ZKTecoDevice
+
+User = get_user_model()
+
+
+class BatchAttendanceCalculationTests(TestCase):
+    """calculate_attendance must store exactly what calculate_hours stores"""
+
+    # (check in, check out, break start, break end)
+    PUNCHES = [
+        (None, None, None, None),
+        (time(9, 0), time(17, 0), None, None),
+        (time(9, 20), time(17, 30), None, None),
+        (time(9, 5), time(12, 0), None, None),
+        (time(8, 30), time(20, 15), time(13, 0), time(13, 45)),
+        (time(9, 40), None, None, None),
+        (time(8, 55), None, None, None),
+        (None, time(17, 5), None, None),
+        # Overnight punches against a day shift
+        (time(22, 0), time(6, 30), None, None),
+        (time(21, 45), time(7, 10), time(23, 50), time(0, 20)),
+        (time(2, 0), time(5, 0), None, None),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user(username='attendance_admin')
+        cls.organization = Organization.objects.create(
+            name='Attendance', slug='attendance', email='attendance@example.com', created_by=admin
+        )
+
+        day = Shift.objects.create(
+            organization=cls.organization, name='Day', code='DAY',
+            start_time=time(9, 0), end_time=time(17, 0),
+            break_start_time=time(12, 30), break_end_time=time(13, 0),
+            working_hours=Decimal('8.00'), grace_period_minutes=10
+        )
+        night = Shift.objects.create(
+            organization=cls.organization, name='Night', code='NIGHT',
+            start_time=time(22, 0), end_time=time(6, 0),
+            working_hours=Decimal('8.00'), grace_period_minutes=5,
+            overtime_start_after_hours=Decimal('7.50')
+        )
+
+        employees = []
+        for index in range(5):
+            user = User.objects.create_user(username=f'attendance_{index}')
+            employees.append(Employee.objects.create(
+                organization=cls.organization, user=user, employee_id=f'A{index:03d}',
+                first_name=f'Employee{index}', last_name='Attendance', hire_date=date(2024, 1, 1)
+            ))
+
+        def timetable(shift, start_date, end_date=None, assigned=(), **options):
+            created = Timetable.objects.create(
+                organization=cls.organization, shift=shift,
+                start_date=start_date, end_date=end_date, **options
+            )
+            created.employees.set(assigned)
+            return created
+
+        # Day shift, switched to nights mid-month
+        timetable(day, date(2025, 1, 1), assigned=employees[:3])
+        timetable(night, date(2025, 1, 15), date(2025, 1, 25), assigned=employees[1:2], saturday=True)
+        # Same start date: the lower id wins
+        timetable(night, date(2025, 1, 1), assigned=employees[2:3])
+        # Inactive and deleted timetables are ignored
+        timetable(night, date(2025, 1, 10), assigned=employees[0:1], is_active=False)
+        deleted = timetable(night, date(2025, 1, 10), assigned=employees[3:4])
+        deleted.delete()
+        # Starts after the first records
+        timetable(night, date(2025, 1, 12), assigned=employees[3:4], sunday=True)
+        # employees[4] has no timetable
+
+        cls.record_ids = []
+        for employee in employees:
+            for offset in range(0, 31, 2):
+                check_in, check_out, break_start, break_end = cls.PUNCHES[
+                    (offset + employee.id) % len(cls.PUNCHES)
+                ]
+                cls.record_ids.append(AttendanceRecord.objects.create(
+                    organization=cls.organization, employee=employee,
+                    date=date(2025, 1, 1) + timedelta(days=offset),
+                    check_in_time=check_in, check_out_time=check_out,
+                    break_start_time=break_start, break_end_time=break_end,
+                    # Left over from an earlier calculation
+                    is_late=True, late_minutes=3, status='present'
+                ).id)
+
+    def stored_results(self):
+        return list(AttendanceRecord.objects.filter(id__in=self.record_ids).order_by('id').values_list(
+            'id', *CALCULATED_FIELDS
+        ))
+
+    def test_matches_per_record_calculation(self):
+        records = AttendanceRecord.objects.filter(id__in=self.record_ids)
+
+        for record in records:
+            record.calculate_hours()
+        expected = self.stored_results()
+
+        # Reset what calculate_hours stored
+        records.update(
+            status='present', is_late=True, late_minutes=3, is_early_departure=False,
+            early_departure_minutes=0, total_hours=0, working_hours=0, break_hours=0, overtime_hours=0
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            calculated = calculate_attendance(records)
+
+        # Records, the schedule version and the month's rollup totals; updates
+        # are batched by the database's parameter limit
+        selects = [query for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 3)
+
+        self.assertEqual(calculated, len(self.record_ids))
+        self.assertEqual(self.stored_results(), expected)
+        self.assertEqual(
+            {status for _, status, *_ in expected},
+            {'present', 'late', 'half_day', 'absent', 'holiday'}
+        )
+
+    def test_schedule_index_matches_timetable_query(self):
+        schedule = get_schedule_index(self.organization.id)
+        employees = Employee.objects.filter(organization=self.organization)
+        start_date, end_date = date(2024, 12, 25), date(2025, 2, 5)
+
+        for employee in employees:
+            intervals = schedule.intervals(employee.id)
+            for previous, following in zip(intervals, intervals[1:]):
+                self.assertLess(previous.end_date, following.start_date)
+
+            for day, interval in schedule.iter_range(employee.id, start_date, end_date):
+                expected = (
+                    Timetable.objects.filter(employees=employee, start_date__lte=day, is_active=True)
+                    .filter(Q(end_date__gte=day) | Q(end_date__isnull=True))
+                    .order_by('-start_date', 'id')
+                    .first()
+                )
+                self.assertEqual(schedule.timetable(employee.id, day), expected)
+                self.assertEqual(interval.timetable if interval else None, expected)
+
+        self.assertEqual(schedule.working_days(employees[0].id, date(2025, 1, 1), date(2025, 1, 31)), 23)
+
+    def test_schedule_index_follows_changes(self):
+        employee = Employee.objects.get(organization=self.organization, employee_id='A004')
+        shift = Shift.objects.get(organization=self.organization, code='NIGHT')
+        day = date(2025, 1, 20)
+
+        _indexes.clear()
+        with self.assertNumQueries(2):
+            schedule = get_schedule_index(self.organization.id)
+        self.assertIsNone(schedule.timetable(employee.id, day))
+        with self.assertNumQueries(1):
+            self.assertIs(get_schedule_index(self.organization.id), schedule)
+
+        timetable = Timetable.objects.create(
+            organization=self.organization, shift=shift, start_date=date(2025, 1, 15)
+        )
+        timetable.employees.add(employee)
+        self.assertEqual(get_schedule_index(self.organization.id).timetable(employee.id, day), timetable)
+
+        # Changes made by another process only show in the schedule version
+        _indexes.clear()
+        schedule = get_schedule_index(self.organization.id)
+        Shift.objects.filter(id=shift.id).update(start_time=time(23, 0), updated_at=timezone.now())
+        self.assertEqual(
+            get_schedule_index(self.organization.id).timetable(employee.id, day).shift.start_time, time(23, 0)
+        )
+
+        employee.timetables.clear()
+        self.assertIsNone(get_schedule_index(self.organization.id).timetable(employee.id, day))
+
+        timetable.employees.add(employee)
+        timetable.delete()
+        self.assertIsNone(get_schedule_index(self.organization.id).timetable(employee.id, day))
+
+    def test_accepts_lists_and_empty_input(self):
+        self.assertEqual(calculate_attendance([]), 0)
+        records = list(AttendanceRecord.objects.filter(id__in=self.record_ids[:3]))
+        self.assertEqual(calculate_attendance(records), 3)
+
+
+class AttendanceMaterializationTests(TestCase):
+    """Missing records are created in bulk and only changed records are calculated again"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='materialize_admin', role='organization_admin')
+        cls.organization = Organization.objects.create(
+            name='Materialize', slug='materialize', email='materialize@example.com', created_by=cls.admin
+        )
+        OrganizationMembership.objects.create(user=cls.admin, organization=cls.organization, is_admin=True)
+
+        cls.shift = Shift.objects.create(
+            organization=cls.organization, name='Day', code='DAY',
+            start_time=time(9, 0), end_time=time(17, 0), working_hours=Decimal('8.00')
+        )
+
+        cls.employees = []
+        for index in range(3):
+            user = User.objects.create_user(username=f'materialize_{index}')
+            cls.employees.append(Employee.objects.create(
+                organization=cls.organization, user=user, employee_id=f'M{index:03d}',
+                first_name=f'Employee{index}', last_name='Materialize', hire_date=date(2024, 1, 1)
+            ))
+
+        # Monday to Friday from Wednesday 1 January 2025; the third employee is unscheduled
+        cls.timetable = Timetable.objects.create(
+            organization=cls.organization, shift=cls.shift, start_date=date(2025, 1, 1)
+        )
+        cls.timetable.employees.set(cls.employees[:2])
+
+        cls.punched = AttendanceRecord.objects.create(
+            organization=cls.organization, employee=cls.employees[0], date=date(2025, 1, 2),
+            check_in_time=time(9, 30), check_out_time=time(17, 0)
+        )
+        deleted = AttendanceRecord.objects.create(
+            organization=cls.organization, employee=cls.employees[1], date=date(2025, 1, 3)
+        )
+        deleted.delete()
+
+    def materialize(self):
+        return materialize_attendance(self.organization, date(2025, 1, 1), date(2025, 1, 14), window_days=5)
+
+    def test_creates_working_days_and_skips_unchanged_records(self):
+        progress = []
+        counts = materialize_attendance(
+            self.organization, date(2025, 1, 1), date(2025, 1, 14), window_days=5,
+            progress_callback=lambda processed, total, counts: progress.append((processed, total))
+        )
+
+        # 10 working days for two employees, less the existing and the deleted record
+        self.assertEqual(counts, {'created': 18, 'calculated': 19, 'unchanged': 0, 'days': 14})
+        self.assertEqual(progress, [(5, 14), (10, 14), (14, 14)])
+
+        records = AttendanceRecord.objects.filter(organization=self.organization)
+        self.assertEqual(records.count(), 19)
+        self.assertFalse(records.filter(employee=self.employees[2]).exists())
+        self.assertFalse(records.filter(date__week_day__in=[1, 7]).exists())
+        self.assertFalse(AttendanceRecord.objects.filter(employee=self.employees[1], date=date(2025, 1, 3)).exists())
+
+        self.punched.refresh_from_db()
+        self.assertEqual(self.punched.status, 'late')
+        self.assertEqual(self.punched.late_minutes, 15)
+        self.assertEqual(records.filter(status='absent').count(), 18)
+
+        self.assertEqual(self.materialize(), {'created': 0, 'calculated': 0, 'unchanged': 19, 'days': 14})
+
+        AttendanceRecord.objects.filter(id=self.punched.id).update(check_in_time=time(9, 0))
+        self.assertEqual(self.materialize()['calculated'], 1)
+        self.punched.refresh_from_db()
+        self.assertEqual(self.punched.status, 'present')
+
+        self.shift.start_time = time(8, 0)
+        self.shift.save()
+        self.assertEqual(self.materialize()['calculated'], 19)
+
+    def test_view_enqueues_and_worker_materializes(self):
+        self.client.force_login(self.admin)
+        url = reverse('hrm:calculate_attendance')
+
+        response = self.client.post(url, {'start_date': '2025-01-01', 'end_date': '2025-01-14'})
+        self.assertRedirects(response, reverse('hrm:attendance_list'), fetch_redirect_response=False)
+        job = AttendanceJob.objects.get(organization=self.organization)
+        self.assertEqual((job.status, job.total_days), ('queued', 14))
+        self.assertEqual(AttendanceRecord.objects.filter(organization=self.organization).count(), 1)
+
+        # A second request reuses the queued job
+        self.client.post(url)
+        self.assertEqual(AttendanceJob.objects.filter(organization=self.organization).count(), 1)
+
+        call_command('attendance_worker', '--once', stdout=io.StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.processed_days, job.records_created), (14, 18))
+        self.assertEqual(AttendanceRecord.objects.filter(organization=self.organization).count(), 19)
+
+        progress = self.client.get(reverse('hrm:attendance_job_progress', args=[job.id])).json()
+        self.assertEqual((progress['status'], progress['progress_percent']), ('completed', 100))
+
+    def test_heartbeat_is_independent_of_progress(self):
+        enqueue_attendance_job(self.organization, date(2025, 1, 1), date(2025, 1, 14))
+        job = claim_next_job('worker-1')
+        AttendanceJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(seconds=61))
+
+        self.assertTrue(JobHeartbeat(job).beat())
+        self.assertEqual(requeue_stale_jobs(60), 0)
+
+        # Beats stop counting once the job was requeued and claimed elsewhere
+        AttendanceJob.objects.filter(id=job.id).update(status='queued', worker=None)
+        claim_next_job('worker-2')
+        self.assertFalse(JobHeartbeat(job).beat())
+
+    def test_outcome_of_requeued_job_is_discarded(self):
+        enqueue_attendance_job(self.organization, date(2025, 1, 1), date(2025, 1, 14))
+        job = claim_next_job('worker-1')
+
+        def requeued_materialize(*args, **kwargs):
+            # Another worker takes the job over while this one still runs it
+            requeue_stale_jobs(-1)
+            claim_next_job('worker-2')
+            return materialize_attendance(*args, **kwargs)
+
+        with mock.patch('hrm.jobs.materialize_attendance', side_effect=requeued_materialize):
+            with self.assertLogs('hrm.jobs', 'WARNING'):
+                job = execute_job(job)
+
+        self.assertEqual((job.status, job.worker), ('running', 'worker-2'))
+        self.assertIsNone(job.finished_at)
+        self.assertEqual((job.processed_days, job.records_created), (0, 0))
+
+
+class FakeZK:
+    """The parts of a pyzk connection attendance syncing uses"""
+
+    def __init__(self):
+        self.punches = []
+        self.records = 0
+        self.downloads = 0
+        self.users = {}
+        self.writes = []
+
+    def read_sizes(self):
+        self.records = len(self.punches)
+
+    def get_users(self):
+        return [SimpleNamespace(**user) for user in self.users.values()]
+
+    def set_user(self, uid, name, privilege, password, group_id, user_id, card):
+        self.writes.append(uid)
+        self.users[uid] = {
+            'uid': uid, 'name': name, 'privilege': privilege, 'password': password,
+            'group_id': group_id, 'user_id': user_id, 'card': card,
+        }
+
+    def delete_user(self, uid):
+        self.writes.append(uid)
+        del self.users[uid]
+
+    def get_attendance(self):
+        self.downloads += 1
+        return [
+            SimpleNamespace(user_id=user_id, uid=None, timestamp=timestamp, status=1, punch=punch)
+            for user_id, timestamp, punch in self.punches
+        ]
+
+    def clear_attendance(self):
+        self.punches = []
+
+    def disable_device(self):
+        pass
+
+    def enable_device(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+
+class PunchIngestionTests(TestCase):
+    """Device punches are matched, folded and written in bulk"""
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user(username='ingest_admin', role='organization_admin')
+        cls.organization = Organization.objects.create(
+            name='Ingest', slug='ingest', email='ingest@example.com', created_by=admin
+        )
+        cls.device = AttendanceDevice.objects.create(
+            organization=cls.organization, name='Gate', ip_address='10.0.0.1'
+        )
+        shift = Shift.objects.create(
+            organization=cls.organization, name='Day', code='DAY',
+            start_time=time(9, 0), end_time=time(17, 0), working_hours=Decimal('8.00')
+        )
+
+        cls.employees = []
+        for index in range(3):
+            user = User.objects.create_user(username=f'ingest_{index}')
+            cls.employees.append(Employee.objects.create(
+                organization=cls.organization, user=user, employee_id=f'I{index:03d}',
+                first_name=f'Employee{index}', last_name='Ingest', hire_date=date(2024, 1, 1),
+                device_enrollment_id=str(100 + index), device_user_id=str(index + 1)
+            ))
+        timetable = Timetable.objects.create(
+            organization=cls.organization, shift=shift, start_date=date(2025, 1, 1)
+        )
+        timetable.employees.set(cls.employees)
+
+    def punch(self, user_id, day, hour, minute, punch, uid=None):
+        return {'user_id': user_id, 'uid': uid, 'timestamp': datetime(2025, 1, day, hour, minute), 'punch': punch}
+
+    def test_folds_punches_per_employee_and_date(self):
+        existing = AttendanceRecord.objects.create(
+            organization=self.organization, employee=self.employees[1], date=date(2025, 1, 6),
+            check_in_time=time(9, 5)
+        )
+        deleted = AttendanceRecord.objects.create(
+            organization=self.organization, employee=self.employees[2], date=date(2025, 1, 6)
+        )
+        deleted.delete()
+
+        logs = [
+            self.punch('100', 6, 9, 20, 0), self.punch('100', 6, 9, 10, 0),
+            self.punch('100', 6, 17, 0, 1), self.punch('100', 6, 16, 30, 1),
+            # Matched by UID when the enrollment id is unknown
+            self.punch('999', 6, 17, 30, 1, uid='2'),
+            self.punch('102', 6, 9, 0, 0),
+            self.punch('404', 6, 9, 0, 0),
+        ]
+        counts = ingest_punches(self.device, logs)
+        self.assertEqual(counts, {
+            'punches': 7, 'new': 7, 'rematched': 0, 'created': 1, 'updated': 1, 'deleted': 1, 'unmatched': 1
+        })
+
+        created = AttendanceRecord.objects.get(employee=self.employees[0], date=date(2025, 1, 6))
+        self.assertEqual((created.check_in_time, created.check_out_time), (time(9, 10), time(17, 0)))
+        self.assertEqual((created.device, created.status, created.is_late), (self.device, 'present', False))
+        self.assertTrue(created.calculation_hash)
+
+        existing.refresh_from_db()
+        self.assertEqual((existing.check_in_time, existing.check_out_time), (time(9, 5), time(17, 30)))
+        self.assertEqual(existing.status, 'present')
+        self.assertTrue(existing.calculation_hash)
+
+        self.assertFalse(AttendanceRecord.objects.filter(employee=self.employees[2]).exists())
+
+        # Every punch is logged, unmatched ones included
+        self.assertEqual(AttendancePunch.objects.filter(device=self.device).count(), 7)
+        self.assertEqual(
+            list(self.employees[0].punches.filter(
+                timestamp__date=date(2025, 1, 6)
+            ).values_list('timestamp__hour', 'timestamp__minute')),
+            [(9, 10), (9, 20), (16, 30), (17, 0)]
+        )
+
+        # Ingesting the same punches again changes nothing
+        counts = ingest_punches(self.device, logs)
+        self.assertEqual((counts['new'], counts['created'], counts['updated']), (0, 0, 0))
+        self.assertEqual(AttendancePunch.objects.count(), 7)
+
+        # Later punches of another device extend the day
+        gate = AttendanceDevice.objects.create(organization=self.organization, name='Back', ip_address='10.0.0.9')
+        self.assertEqual(ingest_punches(gate, [self.punch('100', 6, 18, 0, 1)])['updated'], 1)
+        created.refresh_from_db()
+        self.assertEqual((created.check_in_time, created.check_out_time), (time(9, 10), time(18, 0)))
+
+    def test_punches_are_matched_once_the_device_user_is_mapped(self):
+        logs = [self.punch('555', 7, 9, 0, 0), self.punch('555', 7, 17, 0, 1), self.punch('555', 8, 9, 0, 0)]
+        self.assertEqual(ingest_punches(self.device, logs)['unmatched'], 3)
+        self.assertFalse(AttendanceRecord.objects.filter(date__in=[date(2025, 1, 7), date(2025, 1, 8)]).exists())
+
+        Employee.objects.filter(id=self.employees[0].id).update(device_enrollment_id='555')
+
+        # A re-sync of the same punches (e.g. --days) matches the logged ones
+        counts = ingest_punches(self.device, logs)
+        self.assertEqual((counts['new'], counts['rematched'], counts['created']), (0, 3, 2))
+        record = AttendanceRecord.objects.get(employee=self.employees[0], date=date(2025, 1, 7))
+        self.assertEqual((record.check_in_time, record.check_out_time), (time(9, 0), time(17, 0)))
+        self.assertEqual(self.employees[0].punches.filter(device_user_id='555').count(), 3)
+
+        # So does any later punch of the device user
+        ingest_punches(self.device, [self.punch('556', 9, 9, 0, 0)])
+        Employee.objects.filter(id=self.employees[1].id).update(device_enrollment_id='556')
+        counts = ingest_punches(self.device, [self.punch('556', 9, 17, 0, 1)])
+        self.assertEqual((counts['new'], counts['rematched'], counts['created']), (1, 1, 1))
+        record = AttendanceRecord.objects.get(employee=self.employees[1], date=date(2025, 1, 9))
+        self.assertEqual((record.check_in_time, record.check_out_time), (time(9, 0), time(17, 0)))
+
+    def test_counts_only_inserted_punches(self):
+        logs = [self.punch('100', 6, 9, 0, 0), self.punch('100', 6, 17, 0, 1)]
+        ingest_punches(self.device, logs)
+
+        # Another sync logged the punches after they were checked
+        with mock.patch('hrm.ingest.new_punches', side_effect=lambda device, punches: punches):
+            counts = ingest_punches(self.device, logs + [self.punch('100', 6, 18, 0, 1)])
+        self.assertEqual(counts['new'], 1)
+        self.assertEqual(AttendancePunch.objects.filter(device=self.device).count(), 3)
+
+    def test_query_count_does_not_grow_with_punches(self):
+        def query_count(days):
+            logs = [
+                self.punch(str(100 + index), day, hour, 0, punch)
+                for index in range(3) for day in days for hour, punch in ((9, 0), (17, 1))
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                ingest_punches(self.device, logs)
+            return len(queries)
+
+        self.assertEqual(query_count([6]), query_count(range(7, 18)))
+
+    def sync(self, fake):
+        manager = AttendanceSyncManager(self.device)
+        manager.zk_device.connect = lambda: True
+        manager.zk_device.zk, manager.zk_device.is_connected = fake, True
+        return manager.sync_attendance()
+
+    def test_sync_ingests_punches_after_the_watermark(self):
+        today = timezone.localdate()
+        punched_at = lambda hour: datetime.combine(today, time(hour, 0))
+
+        fake = FakeZK()
+        fake.punches = [('100', punched_at(9), 0), ('100', punched_at(17), 1)]
+        self.assertEqual(self.sync(fake), 1)
+        self.assertEqual(timezone.make_naive(self.device.last_punch_at), punched_at(17))
+        self.assertEqual(self.device.last_punch_count, 2)
+
+        # An unchanged log isn't downloaded
+        self.assertEqual(self.sync(fake), 0)
+        self.assertEqual(fake.downloads, 1)
+
+        # Punches older than the watermark aren't ingested again
+        AttendanceRecord.objects.filter(employee=self.employees[0]).update(check_in_time=time(10, 0))
+        fake.punches.append(('101', punched_at(18), 1))
+        self.assertEqual(self.sync(fake), 1)
+        self.assertEqual(AttendanceRecord.objects.get(employee=self.employees[0]).check_in_time, time(10, 0))
+
+        self.device.clear_log_after_sync = True
+        fake.punches.append(('102', punched_at(19), 1))
+        self.assertEqual(self.sync(fake), 1)
+        self.assertEqual((fake.punches, self.device.last_punch_count), ([], 0))
+        self.assertEqual(AttendanceRecord.objects.filter(organization=self.organization).count(), 3)
+
+    def test_sync_devices_reads_devices_concurrently(self):
+        devices = [self.device] + [
+            AttendanceDevice.objects.create(organization=self.organization, name=f'Gate {n}', ip_address=f'10.0.0.{n}')
+            for n in (2, 3, 4)
+        ]
+        fake = FakeZK()
+        fake.punches = [('100', datetime.combine(timezone.localdate(), time(9, 0)), 0)]
+        # Passes only when the three reachable devices are read at the same time
+        barrier = threading.Barrier(3, timeout=5)
+        unreachable = threading.Event()
+
+        def connect(zk_device):
+            if zk_device.ip_address == '10.0.0.4':
+                unreachable.wait(5)
+                return False
+            barrier.wait()
+            zk_device.zk = fake if zk_device.ip_address == '10.0.0.1' else FakeZK()
+            zk_device.is_connected = True
+            return True
+
+        try:
+            with mock.patch.object(ZKTecoDevice, 'connect', autospec=True, side_effect=connect):
+                results = sync_devices(devices, workers=4, deadline_seconds=0.5)
+        finally:
+            unreachable.set()
+
+        self.assertEqual([result.status for result in results], ['synced', 'synced', 'synced', 'timeout'])
+        self.assertEqual(results[0].attendance['created'], 1)
+        self.assertEqual(AttendanceDevice.objects.get(id=self.device.id).last_punch_count, 1)
+        self.assertIsNone(AttendanceDevice.objects.get(id=devices[3].id).last_sync)
+
+
+class DeviceSchedulerTests(TestCase):
+    """Devices are synced on their interval, backing off while offline"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='scheduler_admin', role='organization_admin')
+        cls.organization = Organization.objects.create(
+            name='Scheduler', slug='scheduler', email='scheduler@example.com', created_by=cls.admin
+        )
+        OrganizationMembership.objects.create(user=cls.admin, organization=cls.organization, is_admin=True)
+
+        due = timezone.now() - timedelta(minutes=1)
+        cls.online, cls.offline, cls.busy = [
+            AttendanceDevice.objects.create(
+                organization=cls.organization, name=name, ip_address=ip, next_sync_at=due, sync_interval_minutes=30
+            )
+            for name, ip in (('Online', '10.1.0.1'), ('Offline', '10.1.0.2'), ('Busy', '10.1.0.3'))
+        ]
+        AttendanceDevice.objects.filter(id=cls.busy.id).update(sync_started_at=timezone.now())
+        AttendanceDevice.objects.create(
+            organization=cls.organization, name='Manual', ip_address='10.1.0.4', next_sync_at=due,
+            auto_sync_enabled=False
+        )
+
+    def test_syncs_due_devices_and_backs_off_offline_ones(self):
+        def connect(zk_device):
+            if zk_device.ip_address != '10.1.0.1':
+                return False
+            zk_device.zk, zk_device.is_connected = FakeZK(), True
+            return True
+
+        with mock.patch.object(ZKTecoDevice, 'connect', autospec=True, side_effect=connect):
+            results = run_due_syncs(workers=4)
+            self.assertEqual(sorted((result.device.name, result.status) for result in results), [
+                ('Offline', 'offline'), ('Online', 'synced')
+            ])
+            # Nothing is due until the next interval
+            self.assertEqual(run_due_syncs(workers=4), [])
+
+        def minutes_until_next_sync(device):
+            device.refresh_from_db()
+            return (device.next_sync_at - timezone.now()).total_seconds() / 60
+
+        self.assertTrue(27 <= minutes_until_next_sync(self.online) <= 33)
+        self.assertEqual((self.online.sync_failures, self.online.sync_started_at), (0, None))
+        self.assertTrue(54 <= minutes_until_next_sync(self.offline) <= 66)
+        self.assertEqual(self.offline.sync_failures, 1)
+        self.assertTrue(minutes_until_next_sync(self.busy) < 0)
+
+        self.client.force_login(self.admin)
+        status = {
+            device['name']: device
+            for device in self.client.get(reverse('hrm:device_sync_status')).json()['devices']
+        }
+        self.assertEqual(status['Online']['lag_seconds'], 0)
+        self.assertTrue(status['Busy']['is_syncing'])
+        self.assertIsNone(status['Manual']['lag_seconds'])
+
+    def test_manual_sync_skips_devices_being_synced(self):
+        def connect(zk_device):
+            if zk_device.ip_address != '10.1.0.1':
+                return False
+            zk_device.zk, zk_device.is_connected = FakeZK(), True
+            return True
+
+        def leased_sync(devices, *args, **kwargs):
+            # Devices are synced under their lease
+            leased.extend(AttendanceDevice.objects.filter(
+                id__in=[device.id for device in devices], sync_started_at__isnull=False
+            ).values_list('name', flat=True))
+            return sync_devices(devices, *args, **kwargs)
+
+        leased = []
+        output = io.StringIO()
+        with mock.patch.object(ZKTecoDevice, 'connect', autospec=True, side_effect=connect), \
+                mock.patch('hrm.management.commands.sync_attendance_device.sync_devices', side_effect=leased_sync):
+            call_command('sync_attendance_device', workers=1, stdout=output)
+
+        lines = [line.split() for line in output.getvalue().splitlines()]
+        rows = {fields[0]: fields[1] for fields in lines if fields and fields[0] in ('Online', 'Offline', 'Busy', 'Manual')}
+        self.assertEqual(rows, {'Online': 'synced', 'Offline': 'offline', 'Busy': 'skipped', 'Manual': 'offline'})
+        self.assertIn('already being synced', output.getvalue())
+        self.assertEqual(sorted(leased), ['Manual', 'Offline', 'Online'])
+        # The leases were released; the busy device's lease is another sync's
+        self.assertEqual(
+            list(AttendanceDevice.objects.filter(sync_started_at__isnull=False).values_list('id', flat=True)),
+            [self.busy.id]
+        )
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class DeviceUserSyncTests(TestCase):
+    """Device users are matched and provisioned in bulk"""
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user(username='users_admin', role='organization_admin')
+        cls.organization = Organization.objects.create(
+            name='Device Users', slug='device-users', email='users@example.com', created_by=admin
+        )
+        other = Organization.objects.create(name='Other', slug='other', email='other@example.com', created_by=admin)
+
+        def employee(organization, username, employee_id, first_name, **fields):
+            return Employee.objects.create(
+                organization=organization, user=User.objects.create_user(username=username),
+                employee_id=employee_id, first_name=first_name, last_name='Staff', hire_date=date(2024, 1, 1), **fields
+            )
+
+        cls.enrolled = employee(cls.organization, 'enrolled', 'E1', 'Enrolled', device_enrollment_id='100')
+        cls.numbered = employee(cls.organization, 'numbered', '200', 'Numbered')
+        cls.named = employee(cls.organization, 'named', 'E3', 'Karim')
+        OrganizationMembership.objects.create(user=cls.named.user, organization=cls.organization, is_active=False)
+        # Taken username and employee id
+        employee(other, 'nadia', '500', 'Nadia')
+
+    def test_matches_and_creates_users(self):
+        device_users = [
+            {'uid': 1, 'user_id': '100', 'name': 'Someone Else'},
+            {'uid': 2, 'user_id': '200', 'name': 'Numbered'},
+            {'uid': 3, 'user_id': '300', 'name': 'karim rahman'},
+            {'uid': 4, 'user_id': '500', 'name': 'Nadia Islam'},
+            {'uid': 5, 'user_id': '501', 'name': 'Tanvir'},
+            {'uid': 6, 'user_id': '502', 'name': '  '},
+        ]
+        stats = sync_device_users(self.organization, device_users)
+        self.assertEqual(stats, {'synced': 3, 'created': 2, 'failed': 1})
+
+        self.named.refresh_from_db()
+        self.assertEqual((self.named.device_user_id, self.named.device_enrollment_id), ('3', '300'))
+        self.numbered.refresh_from_db()
+        self.assertEqual(self.numbered.device_enrollment_id, '200')
+
+        nadia = Employee.objects.get(organization=self.organization, device_enrollment_id='500')
+        self.assertEqual((nadia.employee_id, nadia.user.username, nadia.last_name), ('500_1', 'nadia1', 'Islam'))
+        self.assertTrue(nadia.user.check_password('nadia1123'))
+        tanvir = Employee.objects.get(organization=self.organization, device_enrollment_id='501')
+        self.assertEqual((tanvir.employee_id, tanvir.user.username, tanvir.device_user_id), ('501', 'tanvir', '5'))
+
+        memberships = OrganizationMembership.objects.filter(organization=self.organization, is_active=True)
+        self.assertEqual(
+            set(memberships.values_list('user__username', flat=True)),
+            {'enrolled', 'numbered', 'named', 'nadia1', 'tanvir'}
+        )
+
+        # A second sync matches everyone by enrollment id and creates nothing
+        stats = sync_device_users(self.organization, device_users)
+        self.assertEqual(stats, {'synced': 5, 'created': 0, 'failed': 1})
+
+    def test_query_count_does_not_grow_with_users(self):
+        def query_count(first, last):
+            device_users = [
+                {'uid': n, 'user_id': str(n), 'name': f'Person{n} Staff'} for n in range(first, last)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(sync_device_users(self.organization, device_users)['created'], last - first)
+            return len(queries)
+
+        # Only insert batches grow, where SQLite caps parameters per statement
+        self.assertLessEqual(query_count(1000, 1005), 10)
+        self.assertLessEqual(query_count(2000, 2100), 20)
+
+    def test_upload_writes_only_differences(self):
+        device = AttendanceDevice.objects.create(organization=self.organization, name='Door', ip_address='10.2.0.1')
+        Employee.objects.filter(id=self.numbered.id).update(device_user_id='20', device_enrollment_id='200')
+        Employee.objects.filter(id=self.named.id).update(device_user_id='30', device_enrollment_id='300')
+        retired = Employee.objects.create(
+            organization=self.organization, user=User.objects.create_user(username='retired'), employee_id='E9',
+            first_name='Retired', last_name='Staff', hire_date=date(2024, 1, 1), is_active=False, device_user_id='77'
+        )
+
+        def user(uid, user_id, name, card=0):
+            return {'uid': uid, 'user_id': user_id, 'name': name, 'privilege': 0, 'password': '', 'group_id': '', 'card': card}
+
+        fake = FakeZK()
+        fake.users = {
+            9001: user(9001, '9001', 'Device Admin'),
+            20: user(20, '200', 'Numbered Staff'),
+            30: user(30, '300', 'Karim Old', card=4242),
+            77: user(77, 'E9', 'Retired Staff'),
+        }
+
+        def upload():
+            manager = AttendanceSyncManager(device)
+            manager.zk_device.connect = lambda: True
+            manager.zk_device.zk, manager.zk_device.is_connected = fake, True
+            return manager.upload_users()
+
+        self.assertEqual(upload(), 2)
+
+        self.enrolled.refresh_from_db()
+        enrolled_uid = int(self.enrolled.device_user_id)
+        self.assertEqual(sorted(fake.writes), sorted([enrolled_uid, 30, 77]))
+        self.assertEqual(fake.users[enrolled_uid]['user_id'], '100')
+        self.assertEqual((fake.users[30]['name'], fake.users[30]['card']), ('Karim Staff', 4242))
+        self.assertEqual(sorted(fake.users), sorted([9001, 20, 30, enrolled_uid]))
+        self.assertTrue(Employee.objects.filter(id=retired.id, device_user_id='77').exists())
+
+        fake.writes = []
+        self.assertEqual(upload(), 0)
+        self.assertEqual(fake.writes, [])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ZKSimulatorTests(TestCase):
+    """pyzk and the sync pipeline work against the simulated device"""
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user(username='simulator_admin', role='organization_admin')
+        cls.organization = Organization.objects.create(
+            name='Simulated', slug='simulated', email='simulated@example.com', created_by=admin
+        )
+
+    def test_pyzk_reads_and_writes_over_tcp_and_udp(self):
+        # More punches than pyzk reads in one TCP chunk
+        data = DeviceData.generate(users=5, punches=1700, days=5, seed=1)
+        expected = [(punch[0], punch[2], punch[4]) for punch in data.punches]
+        generated_users = dict(data.users)
+
+        with SimulatedDevice(data, port=0, password=1234) as device:
+            for force_udp in (False, True):
+                data.users = dict(generated_users)
+                zk = ZK('127.0.0.1', port=device.port, timeout=5, password=1234, force_udp=force_udp, ommit_ping=True)
+                zk.connect()
+                self.assertEqual(zk.get_serialnumber(), 'SIM0000001')
+                self.assertEqual([user.user_id for user in zk.get_users()], ['1', '2', '3', '4', '5'])
+                self.assertEqual([(record.uid, record.timestamp, record.punch) for record in zk.get_attendance()], expected)
+
+                zk.set_user(uid=9, name='New Staff', privilege=0, password='', group_id='', user_id='E9', card=77)
+                zk.delete_user(uid=1)
+                users = {user.uid: user for user in zk.get_users()}
+                self.assertEqual((users[9].name, users[9].user_id, users[9].card), ('New Staff', 'E9', 77))
+                self.assertNotIn(1, users)
+                zk.disconnect()
+
+            with self.assertRaises(ZKErrorResponse):
+                ZK('127.0.0.1', port=device.port, timeout=5, password=1, ommit_ping=True).connect()
+
+    def test_sync_devices_against_simulated_devices(self):
+        data = DeviceData.generate(users=4, punches=40, days=5, seed=2)
+
+        with SimulatedDevice(data, port=0) as simulated, SimulatedDevice(DeviceData(), port=0, drop_rate=1) as dropping:
+            devices = [
+                AttendanceDevice.objects.create(
+                    organization=self.organization, name=name, ip_address='127.0.0.1', port=port, timeout=1
+                ) for name, port in (('Simulated', simulated.port), ('Dropping', dropping.port))
+            ]
+            results = sync_devices(devices, deadline_seconds=30)
+
+        self.assertEqual([result.status for result in results], ['synced', 'offline'])
+        self.assertEqual(results[0].users['created'], 4)
+        self.assertEqual(results[0].attendance['new'], 40)
+        self.assertEqual(results[0].attendance['unmatched'], 0)
+        self.assertEqual(
+            AttendancePunch.objects.filter(device=devices[0], employee__employee_id__in=['1', '2', '3', '4']).count(), 40
+        )
+        self.assertEqual(
+            AttendanceRecord.objects.filter(organization=self.organization).count(),
+            len({(punch[1], punch[2].date()) for punch in data.punches})
+        )
+
+
+class IclockPushTests(TestCase):
+    """Punches pushed over ADMS are queued, then flushed into attendance in micro-batches"""
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user(username='push_admin', role='organization_admin')
+        cls.organization = Organization.objects.create(
+            name='Push', slug='push', email='push@example.com', created_by=admin
+        )
+        cls.device = AttendanceDevice.objects.create(
+            organization=cls.organization, name='Branch Gate', ip_address='10.3.0.1', serial_number='PUSH001',
+            auto_sync_enabled=False
+        )
+        cls.employee = Employee.objects.create(
+            organization=cls.organization, user=User.objects.create_user(username='pushed'), employee_id='P1',
+            first_name='Pushed', last_name='Staff', hire_date=date(2024, 1, 1), device_enrollment_id='41'
+        )
+
+    def push(self, body, stamp='100'):
+        return self.client.post(
+            f'/iclock/cdata?SN=PUSH001&table=ATTLOG&Stamp={stamp}', data=body, content_type='text/plain'
+        )
+
+    def test_handshake_and_heartbeat_authenticate_by_serial(self):
+        AttendanceDevice.objects.filter(id=self.device.id).update(push_attlog_stamp='77')
+
+        response = self.client.get('/iclock/cdata?SN=PUSH001&options=all&pushver=2.4.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('GET OPTION FROM: PUSH001', response.content.decode())
+        self.assertIn('ATTLOGStamp=77', response.content.decode())
+        self.assertEqual(self.client.get('/iclock/getrequest?SN=PUSH001').content, b'OK')
+        self.assertTrue(AttendanceDevice.objects.get(id=self.device.id).is_online)
+
+        self.assertEqual(self.client.get('/iclock/cdata?SN=UNKNOWN&options=all').status_code, 403)
+        self.assertEqual(self.client.get('/iclock/getrequest').status_code, 403)
+        self.assertEqual(self.client.post('/iclock/cdata?SN=UNKNOWN&table=ATTLOG', data='41\t2025-03-03 09:00:00\t0\t1',
+                                          content_type='text/plain').status_code, 403)
+        self.assertFalse(PushedPunch.objects.exists())
+
+    def test_pushed_punches_are_queued_then_flushed(self):
+        body = '\n'.join([
+            '41\t2025-03-03 09:02:00\t0\t1\t0\t0\t0',
+            '41\t2025-03-03 17:31:00\t1\t1\t0\t0\t0',
+            '99\t2025-03-03 09:00:00\t0\t15\t0\t0\t0',
+            'garbage line',
+        ]) + '\n'
+
+        with self.assertNumQueries(3):
+            response = self.push(body)
+        self.assertEqual(response.content, b'OK: 4')
+        self.assertEqual(PushedPunch.objects.count(), 3)
+        self.assertFalse(AttendancePunch.objects.exists())
+        device = AttendanceDevice.objects.get(id=self.device.id)
+        self.assertEqual(device.push_attlog_stamp, '100')
+        self.assertIsNotNone(device.last_push_at)
+
+        totals = flush_pushed_punches()
+        self.assertEqual((totals['claimed'], totals['devices'], totals['new'], totals['created']), (3, 1, 3, 1))
+        self.assertEqual(totals['unmatched'], 1)
+        self.assertFalse(PushedPunch.objects.exists())
+        record = AttendanceRecord.objects.get(employee=self.employee, date=date(2025, 3, 3))
+        self.assertEqual((record.check_in_time, record.check_out_time), (time(9, 2), time(17, 31)))
+
+        # A device resending an upload adds nothing
+        self.push(body)
+        totals = flush_pushed_punches()
+        self.assertEqual((totals['claimed'], totals['new']), (3, 0))
+        self.assertEqual(AttendancePunch.objects.count(), 3)
+
+    def test_flushes_in_micro_batches_and_requeues_stale_claims(self):
+        self.push('\n'.join(f'41\t2025-03-{day:02d} 09:00:00\t0\t1' for day in range(1, 11)))
+
+        batch = claim_pushed_punches(limit=4)
+        self.assertEqual(PushedPunch.objects.filter(batch=batch).count(), 4)
+        self.assertEqual(requeue_stale_punches(stale_after_seconds=60), 0)
+        self.assertEqual(requeue_stale_punches(stale_after_seconds=-1), 4)
+
+        self.assertEqual(flush_pushed_punches(limit=4)['claimed'], 4)
+        self.assertEqual(flush_pushed_punches(limit=4)['claimed'], 4)
+        self.assertEqual(flush_pushed_punches(limit=4)['claimed'], 2)
+        self.assertEqual(flush_pushed_punches(limit=4)['claimed'], 0)
+        self.assertEqual(AttendanceRecord.objects.filter(employee=self.employee).count(), 10)
+
+    def test_failing_punches_are_retried_then_set_aside(self):
+        self.push('41\t2025-03-03 09:00:00\t0\t1\n41\t2025-03-03 17:00:00\t1\t1')
+
+        with mock.patch('hrm.iclock.ingest_punches', side_effect=RuntimeError('device offline')):
+            totals = flush_pushed_punches()
+            self.assertEqual((totals['claimed'], totals['failed'], totals['set_aside']), (2, 1, 0))
+            # Failed punches wait for the stale requeue instead of being retried at once
+            self.assertEqual(flush_pushed_punches()['claimed'], 0)
+            punch = PushedPunch.objects.first()
+            self.assertEqual((punch.attempts, punch.last_error), (1, 'device offline'))
+            self.assertIsNotNone(punch.claimed_at)
+
+            for _ in range(2, MAX_FLUSH_ATTEMPTS + 1):
+                self.assertEqual(requeue_stale_punches(stale_after_seconds=-1), 2)
+                totals = flush_pushed_punches()
+            self.assertEqual(totals['set_aside'], 2)
+
+        self.assertEqual(requeue_stale_punches(stale_after_seconds=-1), 0)
+        self.assertEqual(flush_pushed_punches()['claimed'], 0)
+        self.assertEqual(PushedPunch.objects.filter(failed_at__isnull=False, claimed_at__isnull=True).count(), 2)
+        self.assertFalse(AttendancePunch.objects.exists())
+
+        self.assertEqual(retry_failed_punches(), 2)
+        totals = flush_pushed_punches()
+        self.assertEqual((totals['claimed'], totals['new'], totals['created']), (2, 2, 1))
+        self.assertFalse(PushedPunch.objects.exists())
+
+    def test_stale_punches_out_of_attempts_are_set_aside(self):
+        self.push('41\t2025-03-03 09:00:00\t0\t1')
+        PushedPunch.objects.update(attempts=MAX_FLUSH_ATTEMPTS - 1)
+
+        claim_pushed_punches()
+        self.assertEqual(requeue_stale_punches(stale_after_seconds=-1), 0)
+        punch = PushedPunch.objects.get()
+        self.assertIsNone(punch.claimed_at)
+        self.assertIsNotNone(punch.failed_at)
+
+        self.assertEqual(retry_failed_punches(PushedPunch.objects.filter(id=punch.id)), 1)
+        self.assertEqual(PushedPunch.objects.get().attempts, 0)
+
+
+class AttendanceRollupTests(TestCase):
+    """The monthly rollup follows record writes and answers any date range like the records"""
+
+    STATUS_FIELDS = {
+        'present': 'present_days', 'late': 'late_days', 'half_day': 'half_days',
+        'absent': 'absent_days', 'on_leave': 'leave_days', 'holiday': 'holiday_days',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='rollup_admin', role='organization_admin')
+        cls.organization = Organization.objects.create(
+            name='Rollup', slug='rollup', email='rollup@example.com', created_by=cls.admin
+        )
+        OrganizationMembership.objects.create(user=cls.admin, organization=cls.organization, is_admin=True)
+        cls.employees = [
+            Employee.objects.create(
+                organization=cls.organization, user=User.objects.create_user(username=f'rollup_{index}'),
+                employee_id=f'R{index}', first_name=f'Rollup{index}', last_name='Staff', hire_date=date(2024, 1, 1)
+            )
+            for index in range(2)
+        ]
+
+        statuses = ['present', 'late', 'half_day', 'absent', 'on_leave', 'holiday', 'present']
+        day = date(2025, 1, 27)
+        while day <= date(2025, 3, 4):
+            for index, employee in enumerate(cls.employees):
+                status = statuses[(day.toordinal() + index) % len(statuses)]
+                worked = status in ('present', 'late', 'half_day')
+                AttendanceRecord.objects.create(
+                    organization=cls.organization, employee=employee, date=day, status=status,
+                    is_late=status == 'late' or day.day % 5 == 0,
+                    working_hours=Decimal(day.day * 13 % 900) / 100 if worked else Decimal('0.00'),
+                    overtime_hours=Decimal(day.day * 7 % 300) / 100 if day.day % 3 else Decimal('0.00'),
+                )
+            day += timedelta(days=1)
+
+    def months(self):
+        return list(AttendanceMonth.objects.order_by('employee_id', 'month').values_list(
+            'organization_id', 'employee_id', 'month', *TOTAL_FIELDS
+        ))
+
+    def assertRollupCurrent(self):
+        maintained = self.months()
+        rebuild_months(self.organization)
+        self.assertEqual(self.months(), maintained)
+
+    def expected_totals(self, start_date, end_date):
+        totals = {}
+        for record in AttendanceRecord.objects.filter(date__range=(start_date, end_date)):
+            employee_totals = totals.setdefault(record.employee_id, empty_totals())
+            employee_totals['record_days'] += 1
+            employee_totals[self.STATUS_FIELDS[record.status]] += 1
+            employee_totals['late_arrivals'] += record.is_late
+            employee_totals['overtime_days'] += record.overtime_hours > 0
+            employee_totals['working_hours'] += record.working_hours
+            employee_totals['overtime_hours'] += record.overtime_hours
+            if record.status in ('present', 'late', 'half_day'):
+                employee_totals['attended_working_hours'] += record.working_hours
+                employee_totals['attended_overtime_hours'] += record.overtime_hours
+        return totals
+
+    def test_record_writes_keep_months_current(self):
+        self.assertEqual(len(self.months()), 6)
+        self.assertRollupCurrent()
+
+        record = AttendanceRecord.objects.get(employee=self.employees[0], date=date(2025, 2, 10))
+        record.status = 'absent'
+        record.working_hours = Decimal('0.00')
+        record.save()
+        self.assertRollupCurrent()
+
+        # Moved to another employee and month
+        record.employee = self.employees[1]
+        record.date = date(2025, 4, 1)
+        record.save()
+        self.assertRollupCurrent()
+        self.assertTrue(AttendanceMonth.objects.filter(employee=self.employees[1], month=date(2025, 4, 1)).exists())
+
+        # Soft deleted, restored in bulk, then deleted for good
+        record.delete()
+        self.assertFalse(AttendanceMonth.objects.filter(employee=self.employees[1], month=date(2025, 4, 1)).exists())
+        AttendanceRecord.objects.only_deleted().filter(id=record.id).update(deleted_at=None)
+        refresh_record_ids([record.id])
+        self.assertRollupCurrent()
+        record.hard_delete()
+        self.assertRollupCurrent()
+        self.assertFalse(AttendanceMonth.objects.filter(month=date(2025, 4, 1)).exists())
+
+        expected = self.months()
+        AttendanceMonth.objects.all().delete()
+        call_command('rebuild_attendance_rollup', str(self.organization.id), stdout=io.StringIO())
+        self.assertEqual(self.months(), expected)
+
+    def test_totals_match_records_over_any_range(self):
+        for start_date, end_date in [
+            (date(2025, 2, 1), date(2025, 2, 28)),
+            (date(2025, 1, 29), date(2025, 3, 2)),
+            (date(2025, 1, 1), date(2025, 3, 31)),
+            (date(2025, 2, 10), date(2025, 2, 20)),
+            (date(2025, 1, 30), date(2025, 2, 2)),
+        ]:
+            with self.subTest(start_date=start_date, end_date=end_date):
+                totals = attendance_totals(self.organization, start_date, end_date)
+                self.assertEqual(totals, self.expected_totals(start_date, end_date))
+
+                for (employee_id, month), month_totals in attendance_totals(
+                    self.organization, start_date, end_date, by_month=True
+                ).items():
+                    self.assertEqual(month_totals, self.expected_totals(
+                        max(start_date, month), min(end_date, month_end(month))
+                    )[employee_id])
+
+        # Whole months are one rollup query, without reading records
+        with CaptureQueriesContext(connection) as queries:
+            totals = attendance_totals(self.organization, date(2025, 2, 1), date(2025, 2, 28), [self.employees[0].id])
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertNotIn('hrm_attendancerecord', queries.captured_queries[0]['sql'])
+        self.assertEqual(list(totals), [self.employees[0].id])
+
+    def test_dashboard_counts_the_month_to_date(self):
+        self.client.force_login(self.admin)
+        expected = self.expected_totals(date(2025, 2, 1), date(2025, 2, 10)).values()
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.make_aware(datetime(2025, 2, 10, 12))):
+            response = self.client.get(reverse('organization:organization_dashboard'))
+        for field, key in [('present_days', 'present_count'), ('late_days', 'late_count'),
+                           ('absent_days', 'absent_count')]:
+            self.assertEqual(response.context[key], sum(totals[field] for totals in expected))
+
+
+
+class ManualAttendanceTests(TestCase):
+    """A manual attendance sheet is saved in bulk with the results of per-record calculation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='manual_admin', role='organization_admin')
+        cls.organization = Organization.objects.create(
+            name='Manual', slug='manual', email='manual@example.com', created_by=cls.admin
+        )
+        OrganizationMembership.objects.create(user=cls.admin, organization=cls.organization, is_admin=True)
+
+        shift = Shift.objects.create(
+            organization=cls.organization, name='Day', code='DAY',
+            start_time=time(9, 0), end_time=time(17, 0), working_hours=Decimal('8.00')
+        )
+        cls.employees = [
+            Employee.objects.create(
+                organization=cls.organization, user=User.objects.create_user(username=f'manual_{index}'),
+                employee_id=f'MA{index:03d}', first_name=f'Employee{index}', last_name='Manual',
+                hire_date=date(2024, 1, 1)
+            )
+            for index in range(30)
+        ]
+        # The last employee has no timetable
+        timetable = Timetable.objects.create(organization=cls.organization, shift=shift, start_date=date(2025, 1, 1))
+        timetable.employees.set(cls.employees[:-1])
+
+        AttendanceRecord.objects.create(
+            organization=cls.organization, employee=cls.employees[0], date=date(2025, 3, 3), status='absent'
+        )
+        AttendanceRecord.objects.create(
+            organization=cls.organization, employee=cls.employees[1], date=date(2025, 3, 3)
+        ).delete()
+
+    def post(self, employees, **fields):
+        data = {'selected_date': '2025-03-03', 'employee_ids[]': [str(employee.id) for employee in employees]}
+        data.update(fields)
+        return self.client.post(
+            reverse('hrm:save_manual_attendance'), data, headers={'x-requested-with': 'XMLHttpRequest'}
+        ).json()
+
+    def test_saves_sheet_in_bulk(self):
+        self.client.force_login(self.admin)
+        fields = {}
+        for index, employee in enumerate(self.employees):
+            if index % 3 == 0 or employee == self.employees[-1]:
+                fields[f'check_in_{employee.id}'] = f'09:{index:02d}'
+                fields[f'check_out_{employee.id}'] = '17:00' if index % 2 else '11:30'
+            elif index % 3 == 1:
+                fields[f'check_in_{employee.id}'] = '09:05'
+                fields[f'is_late_{employee.id}'] = 'on'
+            else:
+                fields[f'on_leave_{employee.id}'] = 'on'
+
+        with CaptureQueriesContext(connection) as queries:
+            result = self.post(self.employees, **fields)
+        self.assertTrue(result['success'], result['message'])
+        self.assertIn('28 new records, 1 updated records', result['message'])
+        self.assertLess(len(queries.captured_queries), 20)
+
+        records = {
+            record.employee_id: record
+            for record in AttendanceRecord.objects.filter(organization=self.organization, date=date(2025, 3, 3))
+        }
+        self.assertNotIn(self.employees[1].id, records)
+        self.assertEqual(records[self.employees[2].id].status, 'on_leave')
+        self.assertEqual((records[self.employees[4].id].status, records[self.employees[4].id].is_late), ('late', True))
+        self.assertEqual(records[self.employees[4].id].created_by, self.admin)
+
+        # Records with both times match calculate_hours
+        for employee in self.employees[::3] + self.employees[-1:]:
+            record = records[employee.id]
+            calculated = [getattr(record, field) for field in CALCULATED_FIELDS]
+            record.calculate_hours()
+            record.refresh_from_db()
+            self.assertEqual([getattr(record, field) for field in CALCULATED_FIELDS], calculated)
+        self.assertEqual(records[self.employees[0].id].status, 'half_day')
+
+        rollup = AttendanceMonth.objects.get(employee=self.employees[4], month=date(2025, 3, 1))
+        self.assertEqual((rollup.record_days, rollup.late_days), (1, 1))
+
+    def test_unknown_employee_saves_nothing(self):
+        self.client.force_login(self.admin)
+        other = Employee.objects.create(
+            organization=Organization.objects.create(name='Other', slug='other-manual', email='o@example.com'),
+            user=User.objects.create_user(username='manual_other'), employee_id='MO1',
+            first_name='Other', last_name='Manual', hire_date=date(2024, 1, 1)
+        )
+        result = self.post([self.employees[5], other], **{f'is_present_{self.employees[5].id}': 'on'})
+        self.assertFalse(result['success'])
+        self.assertFalse(AttendanceRecord.objects.filter(employee=self.employees[5]).exists())
+
+        result = self.post([self.employees[5]], **{f'check_in_{self.employees[5].id}': '9 o\'clock'})
+        self.assertFalse(result['success'])
@@ -67,10 +67,16 @@ urlpatterns = [
     # Attendance Device Management URLs
     path('devices/', views.attendance_device_list, name='attendance_device_list'),
     path('devices/create/', views.create_attendance_device, name='create_attendance_device'),
+    path('devices/sync-status/', views.device_sync_status, name='device_sync_status'),
     path('devices/<int:device_id>/update/', views.update_attendance_device, name='update_attendance_device'),
     path('devices/<int:device_id>/test/', views.test_device_connection_view, name='test_device_connection'),
     path('devices/<int:device_id>/diagnose/', views.diagnose_device_view, name='diagnose_device'),
     path('devices/<int:device_id>/sync/', views.sync_device_data, name='sync_device_data'),
+
+    # ZKTeco ADMS push (the devices' fixed paths)
+    path('iclock/cdata', views.iclock_cdata, name='iclock_cdata'),
+    path('iclock/getrequest', views.iclock_getrequest, name='iclock_getrequest'),
+    path('iclock/devicecmd', views.iclock_devicecmd, name='iclock_devicecmd'),
     
     # Attendance Records URLs
     path('attendance-records/', views.attendance_record_list, name='attendance_record_list'),
@@ -101,6 +107,7 @@ urlpatterns = [
 
 
     path('calculate/', views.calculate_attendance_records, name='calculate_attendance'),
+    path('calculate/jobs/<int:job_id>/progress/', views.attendance_job_progress, name='attendance_job_progress'),
 
     # Leave Management
     path('leaves/', views.leave_list, name='leave_list'),
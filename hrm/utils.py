@@ -59,8 +59,8 @@ def trash_list_view(request, model, template_name, context_name):
 
 @login_required
 @organization_member_required
-def restore_objects_view(request, model, model_name):
-    """Generic restore view"""
+def restore_objects_view(request, model, model_name, on_restore=None):
+    """Generic restore view; on_restore, if given, is called with the restored ids"""
     if request.method != 'POST':
         return JsonResponse({'success': False, 'message': 'Invalid request method.'})
 
@@ -70,9 +70,11 @@ def restore_objects_view(request, model, model_name):
         if not ids:
             return JsonResponse({'success': False, 'message': f'No {model_name}s selected.'})
 
-        restored_count = model.objects.only_deleted().filter(
-            id__in=ids, organization=request.organization
-        ).update(deleted_at=None)
+        restored = model.objects.only_deleted().filter(id__in=ids, organization=request.organization)
+        restored_ids = list(restored.values_list('id', flat=True))
+        restored_count = restored.update(deleted_at=None)
+        if on_restore:
+            on_restore(restored_ids)
 
         return JsonResponse({
             'success': True,
@@ -4,20 +4,26 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db import transaction
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import get_user_model
 from hrm.utils import handle_bulk_delete, restore_objects_view, trash_list_view
 from organization.decorators import organization_member_required, organization_admin_required
 from organization.utils import DynamicTableManager
 from payroll.models import Payslip, SalaryStructure
-from .models import Branch, Department, Designation, EmployeeRole, Employee, AttendanceRecord, HolidayCalendar, LeaveRequest, Shift, Timetable, AttendanceDevice, Payhead, EmployeePayhead, AttendanceHoliday
+from .attendance import default_start_date, save_attendance_sheet
+from .iclock import mark_online, push_device, push_options, queue_attlog
+from .jobs import enqueue_attendance_job
+from .rollup import refresh_record_ids
+from .scheduler import claim_device, release_device, sync_status
+from .models import Branch, Department, Designation, EmployeeRole, Employee, AttendanceRecord, AttendanceMonth, AttendanceJob, HolidayCalendar, LeaveRequest, Shift, Timetable, AttendanceDevice, Payhead, EmployeePayhead, AttendanceHoliday
 from .forms import EmployeeForm, BranchForm, DepartmentForm, DesignationForm, EmployeeRoleForm, EmployeeUpdateForm, ShiftForm, TimetableForm, AttendanceDeviceForm, PayheadForm, EmployeePayheadForm, AttendanceHolidayForm, AttendanceFilterForm
 from .zkteco_utils import *
 from datetime import date, datetime
 from django.utils import timezone
 from django.urls import reverse
 from datetime import timedelta
-from django.utils.dateparse import parse_date
+from django.utils.dateparse import parse_date, parse_time
 import json
 from django.views.decorators.http import require_http_methods
 
@@ -693,8 +699,6 @@ def employee_dashboard(request):
     
     # Get current date and time
     today = timezone.now().date()
-    current_month = today.month
-    current_year = today.year
     
     # Get recent attendance (last 7 days)
     recent_attendance = AttendanceRecord.objects.filter(
@@ -711,17 +715,18 @@ def employee_dashboard(request):
     # Get recent leave requests
     recent_leaves = LeaveRequest.objects.filter(employee=employee).order_by('-created_at')[:5]
     
-    # Get monthly attendance summary
-    monthly_attendance = AttendanceRecord.objects.filter(
+    # Get monthly attendance summary from the rollup
+    monthly_attendance = AttendanceMonth.objects.filter(
         employee=employee,
-        date__year=current_year,
-        date__month=current_month
-    )
+        month=today.replace(day=1)
+    ).first()
     
     # Calculate stats
-    present_days = monthly_attendance.filter(status__in=['present', 'late']).count()
-    absent_days = monthly_attendance.filter(status='absent').count()
-    late_days = monthly_attendance.filter(status='late').count()
+    present_days = absent_days = late_days = 0
+    if monthly_attendance:
+        present_days = monthly_attendance.present_days + monthly_attendance.late_days
+        absent_days = monthly_attendance.absent_days
+        late_days = monthly_attendance.late_days
     total_working_days = present_days + absent_days
     
     # Get upcoming holidays
@@ -850,6 +855,9 @@ def attendance_list(request):
         'search_query': search_query,
         'start_date': start_date,
         'end_date': end_date,
+        'latest_job': AttendanceJob.objects.filter(
+            organization=organization
+        ).order_by('-created_at', '-id').first(),
     }
 
     return render(request, 'hrm/attendance_list.html', context)
@@ -1396,9 +1404,14 @@ def diagnose_device_view(request, device_id):
 @organization_admin_required
 def sync_device_data(request, device_id):
     """Sync data with attendance device"""
+    device = get_object_or_404(AttendanceDevice, id=device_id, organization=request.organization)
+
+    # Scheduled syncs skip the device meanwhile
+    if not claim_device(device.id):
+        messages.warning(request, f'Device "{device.name}" is already being synced. Try again shortly.')
+        return redirect('hrm:attendance_device_list')
+
     try:
-        device = get_object_or_404(AttendanceDevice, id=device_id, organization=request.organization)
-        
         sync_manager = AttendanceSyncManager(device)
         
         # Sync device info
@@ -1420,21 +1433,71 @@ def sync_device_data(request, device_id):
         if msg_parts:
             messages.success(request, f"✓ Users: {', '.join(msg_parts)}")
         
-        # Sync attendance (last 30 days)
-        from datetime import date, timedelta
-        end_date = date.today()
-        start_date = end_date - timedelta(days=30)
-        attendance_synced = sync_manager.sync_attendance(start_date, end_date)
+        # Sync attendance punched since the last sync
+        attendance_synced = sync_manager.sync_attendance()
         
         messages.success(request, f'✓ Attendance: {attendance_synced} records synced')
         
     except Exception as e:
         messages.error(request, f'✗ Error syncing device: {str(e)}')
         logger.exception("Device sync error")
+    finally:
+        release_device(device.id)
     
     return redirect('hrm:attendance_device_list')
 
 
+@login_required
+@organization_admin_required
+def device_sync_status(request):
+    """JSON scheduling state and sync lag of the organization's devices"""
+    devices = AttendanceDevice.objects.filter(organization=request.organization)
+    return JsonResponse({'devices': sync_status(devices)})
+
+
+# ZKTeco ADMS (iclock) push endpoints, called by the devices themselves
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def iclock_cdata(request):
+    """Device handshake (GET) and data uploads (POST); ATTLOG punches are queued"""
+    device = push_device(request.GET.get('SN'))
+    if device is None:
+        return HttpResponse('Unknown device', status=403, content_type='text/plain')
+
+    if request.method == 'GET':
+        mark_online(device)
+        return HttpResponse(push_options(device), content_type='text/plain')
+
+    body = request.body.decode('utf-8', errors='ignore')
+    if request.GET.get('table') == 'ATTLOG':
+        received = queue_attlog(device, body, request.GET.get('Stamp'))
+    else:
+        # Operation logs, photos and user data are acknowledged and ignored
+        received = sum(1 for line in body.splitlines() if line.strip())
+    return HttpResponse(f'OK: {received}', content_type='text/plain')
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def iclock_getrequest(request):
+    """Device heartbeat asking for commands; there are none"""
+    device = push_device(request.GET.get('SN'))
+    if device is None:
+        return HttpResponse('Unknown device', status=403, content_type='text/plain')
+
+    mark_online(device)
+    return HttpResponse('OK', content_type='text/plain')
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def iclock_devicecmd(request):
+    """Results of device commands, acknowledged"""
+    if push_device(request.GET.get('SN')) is None:
+        return HttpResponse('Unknown device', status=403, content_type='text/plain')
+    return HttpResponse('OK', content_type='text/plain')
+
+
 # Attendance Records Views
 @login_required
 @organization_member_required
@@ -1497,48 +1560,57 @@ def attendance_record_list(request):
 
 
 @login_required
+@organization_admin_required
+@require_http_methods(["POST"])
 def calculate_attendance_records(request):
-    """Auto-calculate attendance for all employees from timetable & shift"""
-    timetables = Timetable.objects.filter(is_active=True)
-    print("timetables:", timetables)
+    """Queue attendance calculation for the organization from timetable & shift"""
+    organization = request.organization
 
-    if not timetables.exists():
+    # Attendance is materialized by the attendance_worker command, not in the request
+    today = date.today()
+    try:
+        end_date = min(parse_date(request.POST.get('end_date') or '') or today, today)
+        start_date = parse_date(request.POST.get('start_date') or '') or default_start_date(organization)
+    except ValueError:
+        messages.error(request, "Invalid date range.")
+        return redirect('hrm:attendance_list')
+
+    if not start_date:
         messages.warning(request, "No active timetables found.")
-        return redirect(request.META.get('HTTP_REFERER', '/'))
-
-    count_created, count_updated = 0, 0
-
-    for timetable in timetables:
-        shift = timetable.shift
-        employees = timetable.employees.all()
-
-        start_date = timetable.start_date
-        print("start_date:", start_date)
-        end_date = timetable.end_date or date.today()  # if no end date, calculate up to today
-        print("end_date:", end_date)
-
-        current_date = start_date
-        while current_date <= end_date:
-            weekday = current_date.strftime("%A").lower()
-            if getattr(timetable, weekday):  # Only process working days
-                for emp in employees:
-                    record, created = AttendanceRecord.objects.get_or_create(
-                        organization=timetable.organization,
-                        employee=emp,
-                        date=current_date
-                    )
-                    record.calculate_hours()
-                    if created:
-                        count_created += 1
-                    else:
-                        count_updated += 1
-            current_date += timedelta(days=1)
-
-    messages.success(
-        request,
-        f"✅ Attendance calculated successfully — Created: {count_created}, Updated: {count_updated}"
-    )
-    return redirect(request.META.get('HTTP_REFERER', '/'))
+        return redirect('hrm:attendance_list')
+    if start_date > end_date:
+        messages.error(request, "Start date must not be after the end date.")
+        return redirect('hrm:attendance_list')
+
+    job, created = enqueue_attendance_job(organization, start_date, end_date, user=request.user)
+
+    if created:
+        messages.success(request, f"Attendance calculation from {start_date} to {end_date} queued. Progress is shown below.")
+    else:
+        messages.info(request, "An attendance calculation for this organization is already in progress.")
+    return redirect('hrm:attendance_list')
+
+
+@login_required
+@organization_member_required
+def attendance_job_progress(request, job_id):
+    """JSON progress of a queued attendance job, polled by the attendance page"""
+    job = get_object_or_404(AttendanceJob, id=job_id, organization=request.organization)
+
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'start_date': job.start_date.isoformat(),
+        'end_date': job.end_date.isoformat(),
+        'total_days': job.total_days,
+        'processed_days': job.processed_days,
+        'records_created': job.records_created,
+        'records_calculated': job.records_calculated,
+        'progress_percent': job.progress_percent,
+        'message': job.message,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    })
 
 
 # Payhead Management Views
@@ -1842,6 +1914,15 @@ def manual_attendance_entry(request):
     
     return render(request, 'hrm/manual_attendance.html', context)
 
+def _manual_time(value):
+    """Check-in/out time entered on the manual attendance sheet, or None"""
+    if not value:
+        return None
+    parsed = parse_time(value)
+    if parsed is None:
+        raise ValueError(f"Invalid time: {value}")
+    return parsed
+
 @require_http_methods(["POST"])
 @transaction.atomic
 def save_manual_attendance(request):
@@ -1860,15 +1941,16 @@ def save_manual_attendance(request):
         selected_date = datetime.strptime(selected_date, '%Y-%m-%d').date()
         organization = request.organization
         
-        saved_count = 0
-        updated_count = 0
-        
+        entries = {}
         for employee_id in employee_ids:
-            employee = get_object_or_404(Employee, id=employee_id, organization=organization)
+            try:
+                employee_id = int(employee_id)
+            except ValueError:
+                raise ValueError(f"Invalid employee: {employee_id}")
             
             # Get form data for this employee
-            check_in = data.get(f'check_in_{employee_id}')
-            check_out = data.get(f'check_out_{employee_id}')
+            check_in = _manual_time(data.get(f'check_in_{employee_id}'))
+            check_out = _manual_time(data.get(f'check_out_{employee_id}'))
             is_present = data.get(f'is_present_{employee_id}') == 'on'
             is_absent = data.get(f'is_absent_{employee_id}') == 'on'
             is_late = data.get(f'is_late_{employee_id}') == 'on'
@@ -1887,38 +1969,21 @@ def save_manual_attendance(request):
                 # Default to present if check-in/out times exist
                 status = 'present' if (check_in or check_out) else 'absent'
             
-            # Get or create attendance record
-            record, created = AttendanceRecord.objects.get_or_create(
-                organization=organization,
-                employee=employee,
-                date=selected_date,
-                defaults={
-                    'check_in_time': check_in if check_in else None,
-                    'check_out_time': check_out if check_out else None,
-                    'status': status,
-                    'is_late': is_late,
-                    'created_by': request.user,
-                }
-            )
-            
-            if not created:
-                # Update existing record
-                record.check_in_time = check_in if check_in else None
-                record.check_out_time = check_out if check_out else None
-                record.status = status
-                record.is_late = is_late
-                record.updated_at = timezone.now()
-                updated_count += 1
-            else:
-                saved_count += 1
-            
-            # Calculate hours if both check-in and check-out are provided
-            if check_in and check_out:
-                record.calculate_hours()
-            else:
-                record.save()
+            entries[employee_id] = {
+                'check_in_time': check_in,
+                'check_out_time': check_out,
+                'status': status,
+                'is_late': is_late,
+            }
+        
+        # Records with both times are calculated from their timetable
+        counts = save_attendance_sheet(organization, selected_date, entries, user=request.user)
+        saved_count = counts['created']
+        updated_count = counts['updated']
         
         message = f"Attendance saved successfully! {saved_count} new records, {updated_count} updated records."
+        if counts['deleted']:
+            message += f" {counts['deleted']} records in the trash were left unchanged."
         
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({
@@ -2150,7 +2215,7 @@ def restore_leave_request(request):
 @login_required
 @organization_member_required
 def restore_attendance_record(request):
-    return restore_objects_view(request, AttendanceRecord, 'attendance record')
+    return restore_objects_view(request, AttendanceRecord, 'attendance record', on_restore=refresh_record_ids)
 
 @login_required
 @organization_member_required
@@ -0,0 +1,428 @@
+# hrm/zk_simulator.py - A simulated ZKTeco device for load-testing device syncs
+#
+# SimulatedDevice serves the part of the ZK protocol pyzk uses over TCP and
+# UDP on one port: connecting (with an optional comm key), device info and
+# options, memory sizes, buffered reads of the user list and attendance log,
+# writing and deleting users, clearing the log and enabling/disabling the
+# device. Its users and punches are generated and held in memory by
+# DeviceData. Replies can be delayed and commands dropped at random, to
+# exercise deadlines and failures of the sync pipeline without hardware.
+# Run devices with `manage.py zkteco_simulator`.
+
+import datetime
+import logging
+import random
+import socketserver
+import threading
+import time
+from struct import pack, unpack
+
+from zk import const
+from zk.base import make_commkey
+
+logger = logging.getLogger(__name__)
+
+# pyzk's buffered read commands: prepare a buffer, then read it in chunks
+CMD_PREPARE_BUFFER = 1503
+CMD_READ_BUFFER = 1504
+
+# Largest data payload in a UDP datagram, as pyzk expects it
+UDP_DATA_SIZE = 1024
+
+USER_PACKET = '<HB8s24sIx7sx24s'        # 72 bytes, the "zk8" user format
+USER_WRITE_PACKET = '<HB8s24s4sx7sx24s'  # the same, as pyzk writes it
+USER_PACKET_ZK6 = '<HB5s8sIxBHI'        # 28 bytes, written by pyzk before it has read users over UDP
+ATTENDANCE_PACKET = '<H24sB4sB8s'       # 40 bytes
+
+USERS_CAPACITY = 10000
+RECORDS_CAPACITY = 200000
+
+
+def encode_time(timestamp):
+    """Device time of a naive datetime (zkemsdk.c EncodeTime)"""
+    return (
+        ((timestamp.year % 100) * 12 * 31 + (timestamp.month - 1) * 31 + timestamp.day - 1) * 24 * 60 * 60
+        + (timestamp.hour * 60 + timestamp.minute) * 60 + timestamp.second
+    )
+
+
+def checksum(data):
+    """Packet checksum as pyzk computes it, with the 16-bit words summed at once"""
+    total = sum(unpack(f'<{len(data) // 2}H', data[:len(data) // 2 * 2]))
+    # Repeatedly subtracting USHRT_MAX keeps the sum in 1..USHRT_MAX
+    total = (total - 1) % const.USHRT_MAX + 1 if total else 0
+    if len(data) % 2:
+        total += data[-1]
+        if total > const.USHRT_MAX:
+            total -= const.USHRT_MAX
+    return ~total % const.USHRT_MAX
+
+
+def packet(command, session_id, reply_id, payload=b''):
+    header = pack('<4H', command, 0, session_id, reply_id)
+    return pack('<4H', command, checksum(header + payload), session_id, reply_id) + payload
+
+
+def tcp_packet(data):
+    return pack('<HHI', const.MACHINE_PREPARE_DATA_1, const.MACHINE_PREPARE_DATA_2, len(data)) + data
+
+
+class DeviceData:
+    """Users and attendance log of a simulated device"""
+
+    def __init__(self, serial_number='SIM0000001', device_name='ZK Simulator',
+                 firmware_version='Ver 6.60 Apr 28 2017', platform='ZMM220_TFT', mac='00:17:61:00:00:01'):
+        self.options = {
+            '~SerialNumber': serial_number,
+            '~DeviceName': device_name,
+            '~Platform': platform,
+            'MAC': mac,
+            '~ZKFPVersion': '10',
+            'ZKFaceVersion': '0',
+            '~ExtendFmt': '0',
+            '~UserExtFmt': '0',
+            'FaceFunOn': '0',
+            'CompatOldFirmware': '0',
+            'IPAddress': '127.0.0.1',
+            'NetMask': '255.255.255.0',
+            'GATEIPAddress': '0.0.0.0',
+        }
+        self.firmware_version = firmware_version
+        self.lock = threading.Lock()
+        self.enabled = True
+        # uid -> {'user_id', 'name', 'privilege', 'password', 'group_id', 'card'}
+        self.users = {}
+        # (uid, user_id, timestamp, status, punch), oldest first
+        self.punches = []
+        self._attendance_buffer = None
+
+    @classmethod
+    def generate(cls, users=100, punches=1000, days=30, seed=None, end=None, **info):
+        """
+        A device holding users uid 1..users (user id str(uid), a distinct first
+        name each) and about punches punches over the days before end (default
+        today): check-ins in the morning and check-outs in the evening
+        """
+        data = cls(**info)
+        rng = random.Random(seed)
+        end = end or datetime.date.today()
+
+        for uid in range(1, users + 1):
+            data.users[uid] = {
+                'user_id': str(uid), 'name': f"Emp{uid} Sim", 'privilege': const.USER_DEFAULT,
+                'password': '', 'group_id': '', 'card': 0,
+            }
+
+        if users:
+            for _ in range(punches // 2 + punches % 2):
+                uid = rng.randint(1, users)
+                day = datetime.datetime.combine(end - datetime.timedelta(days=rng.randrange(days)), datetime.time.min)
+                check_in = day + datetime.timedelta(seconds=rng.randrange(8 * 3600, 10 * 3600))
+                check_out = day + datetime.timedelta(seconds=rng.randrange(16 * 3600, 19 * 3600))
+                data.punches.append((uid, str(uid), check_in, 1, 0))
+                data.punches.append((uid, str(uid), check_out, 1, 1))
+            del data.punches[punches:]
+            data.punches.sort(key=lambda punch: punch[2])
+
+        return data
+
+    def add_punch(self, uid, timestamp, punch=0, status=1):
+        with self.lock:
+            user = self.users.get(uid)
+            self.punches.append((uid, user['user_id'] if user else str(uid), timestamp, status, punch))
+            self._attendance_buffer = None
+
+    def sizes(self):
+        fields = [0] * 20
+        with self.lock:
+            fields[4] = len(self.users)
+            fields[8] = len(self.punches)
+        fields[14], fields[15], fields[16] = 3000, max(USERS_CAPACITY, fields[4]), max(RECORDS_CAPACITY, fields[8])
+        fields[17], fields[18], fields[19] = 3000, fields[15] - fields[4], fields[16] - fields[8]
+        return pack('20i', *fields) + pack('3i', 0, 0, 0)
+
+    def user_buffer(self):
+        with self.lock:
+            records = b''.join(
+                pack(
+                    USER_PACKET, uid, user['privilege'], user['password'].encode()[:8], user['name'].encode()[:24],
+                    user['card'], user['group_id'].encode()[:7], user['user_id'].encode()[:24]
+                )
+                for uid, user in sorted(self.users.items())
+            )
+        return pack('<I', len(records)) + records
+
+    def attendance_buffer(self):
+        with self.lock:
+            if self._attendance_buffer is None:
+                records = b''.join(
+                    pack(ATTENDANCE_PACKET, uid, user_id.encode()[:24], status, pack('<I', encode_time(timestamp)), punch, b'')
+                    for uid, user_id, timestamp, status, punch in self.punches
+                )
+                self._attendance_buffer = pack('<I', len(records)) + records
+            return self._attendance_buffer
+
+    def set_user(self, payload):
+        if len(payload) >= 72:
+            uid, privilege, password, name, card, group_id, user_id = unpack(USER_WRITE_PACKET, payload[:72])
+            card = unpack('<I', card)[0]
+            group_id = group_id.split(b'\x00')[0].decode(errors='ignore')
+            user_id = user_id.split(b'\x00')[0].decode(errors='ignore')
+        else:
+            uid, privilege, password, name, card, group_id, _timezone, user_id = unpack(
+                USER_PACKET_ZK6, payload[:28].ljust(28, b'\x00')
+            )
+            group_id, user_id = str(group_id), str(user_id)
+
+        with self.lock:
+            self.users[uid] = {
+                'user_id': user_id,
+                'name': name.split(b'\x00')[0].decode(errors='ignore'),
+                'privilege': privilege,
+                'password': password.split(b'\x00')[0].decode(errors='ignore'),
+                'group_id': group_id,
+                'card': card,
+            }
+
+    def delete_user(self, uid):
+        with self.lock:
+            self.users.pop(uid, None)
+
+    def clear_attendance(self):
+        with self.lock:
+            self.punches = []
+            self._attendance_buffer = None
+
+
+class ZKSession:
+    """A client's connection to a simulated device: authentication and the prepared read buffer"""
+
+    def __init__(self, data, session_id, password=0):
+        self.data = data
+        self.session_id = session_id
+        self.password = password
+        self.authenticated = not password
+        self.buffer = b''
+        self.closed = False
+
+    def handle(self, command, payload):
+        """Replies to a command, as (command, payload) pairs"""
+        data = self.data
+
+        if command == const.CMD_CONNECT:
+            return [(const.CMD_ACK_OK if self.authenticated else const.CMD_ACK_UNAUTH, b'')]
+        if command == const.CMD_AUTH:
+            self.authenticated = payload == make_commkey(self.password, self.session_id)
+            return [(const.CMD_ACK_OK if self.authenticated else const.CMD_ACK_UNAUTH, b'')]
+        if not self.authenticated:
+            return [(const.CMD_ACK_UNAUTH, b'')]
+
+        if command == const.CMD_EXIT:
+            self.closed = True
+            return [(const.CMD_ACK_OK, b'')]
+        if command == const.CMD_GET_VERSION:
+            return [(const.CMD_ACK_OK, data.firmware_version.encode() + b'\x00')]
+        if command == const.CMD_OPTIONS_RRQ:
+            key = payload.split(b'\x00')[0].decode(errors='ignore')
+            if key not in data.options:
+                return [(const.CMD_ACK_ERROR, b'')]
+            return [(const.CMD_ACK_OK, f"{key}={data.options[key]}".encode() + b'\x00')]
+        if command == const.CMD_GET_FREE_SIZES:
+            return [(const.CMD_ACK_OK, data.sizes())]
+        if command == const.CMD_GET_TIME:
+            return [(const.CMD_ACK_OK, pack('<I', encode_time(datetime.datetime.now())))]
+
+        if command == CMD_PREPARE_BUFFER:
+            _, read_command, fct, _ = unpack('<bhii', payload[:11])
+            if read_command == const.CMD_USERTEMP_RRQ and fct == const.FCT_USER:
+                self.buffer = data.user_buffer()
+            elif read_command == const.CMD_ATTLOG_RRQ:
+                self.buffer = data.attendance_buffer()
+            else:
+                return [(const.CMD_ACK_ERROR, b'')]
+            return [(const.CMD_ACK_OK, pack('<BII', 0, len(self.buffer), len(self.buffer)))]
+        if command == CMD_READ_BUFFER:
+            start, size = unpack('<ii', payload[:8])
+            chunk = self.buffer[start:start + size]
+            return [
+                (const.CMD_PREPARE_DATA, pack('<II', len(chunk), 0)),
+                (const.CMD_DATA, chunk),
+                (const.CMD_ACK_OK, b''),
+            ]
+        if command == const.CMD_FREE_DATA:
+            self.buffer = b''
+            return [(const.CMD_ACK_OK, b'')]
+
+        if command == const.CMD_USER_WRQ:
+            data.set_user(payload)
+            return [(const.CMD_ACK_OK, b'')]
+        if command == const.CMD_DELETE_USER:
+            data.delete_user(unpack('<h', payload[:2])[0])
+            return [(const.CMD_ACK_OK, b'')]
+        if command == const.CMD_CLEAR_ATTLOG:
+            data.clear_attendance()
+            return [(const.CMD_ACK_OK, b'')]
+        if command in (const.CMD_ENABLEDEVICE, const.CMD_DISABLEDEVICE):
+            data.enabled = command == const.CMD_ENABLEDEVICE
+            return [(const.CMD_ACK_OK, b'')]
+        if command in (const.CMD_REFRESHDATA, const.CMD_SET_TIME):
+            return [(const.CMD_ACK_OK, b'')]
+
+        return [(const.CMD_ACK_UNKNOWN, b'')]
+
+
+class _TCPHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        device = self.server.device
+        session = device.new_session()
+
+        while not session.closed:
+            top = self._receive(8)
+            if top is None:
+                return
+            first, second, length = unpack('<HHI', top)
+            if (first, second) != (const.MACHINE_PREPARE_DATA_1, const.MACHINE_PREPARE_DATA_2):
+                return
+            request = self._receive(length)
+            if request is None:
+                return
+
+            replies = device.respond(session, request)
+            if replies is None:
+                # Dropped: the device hangs up
+                return
+            self.request.sendall(b''.join(tcp_packet(reply) for reply in replies))
+
+    def _receive(self, size):
+        data = b''
+        while len(data) < size:
+            received = self.request.recv(size - len(data))
+            if not received:
+                return None
+            data += received
+        return data
+
+
+class _UDPHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        request, sock = self.request
+        device = self.server.device
+        # A connect starts a new session, also for a client that never said goodbye
+        session = device.udp_session(self.client_address, new=request[:2] == pack('<H', const.CMD_CONNECT))
+
+        replies = device.respond(session, request, UDP_DATA_SIZE)
+        for reply in replies or ():
+            sock.sendto(reply, self.client_address)
+        if session.closed:
+            device.end_udp_session(self.client_address)
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _UDPServer(socketserver.ThreadingUDPServer):
+    daemon_threads = True
+    # Buffered reads answer with many datagrams in a row
+    max_packet_size = 64 * 1024
+
+
+class SimulatedDevice:
+    """
+    Serves DeviceData over TCP and UDP on host:port until stopped; port 0
+    picks a free port. Each reply is delayed by latency seconds, and
+    drop_rate of the commands get no reply (over TCP, the connection is
+    closed).
+    """
+
+    def __init__(self, data, host='127.0.0.1', port=4370, password=0, latency=0.0, drop_rate=0.0, seed=None):
+        self.data = data
+        self.host = host
+        self.port = port
+        self.password = password
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.commands = 0
+        self.dropped = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._session_ids = iter(range(1, const.USHRT_MAX))
+        self._udp_sessions = {}
+        self._servers = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        for _attempt in range(10):
+            tcp = _TCPServer((self.host, self.port), _TCPHandler)
+            port = tcp.server_address[1]
+            try:
+                udp = _UDPServer((self.host, port), _UDPHandler)
+                break
+            except OSError:
+                tcp.server_close()
+                if self.port:
+                    raise
+        else:
+            raise OSError(f"No port free for both TCP and UDP on {self.host}")
+
+        self.port = port
+        self._servers = [tcp, udp]
+        for server in self._servers:
+            server.device = self
+            threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.1}, daemon=True).start()
+        logger.info(f"Simulated device {self.data.options['~SerialNumber']} listening on {self.host}:{self.port}")
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+    def new_session(self):
+        with self._lock:
+            return ZKSession(self.data, next(self._session_ids), self.password)
+
+    def udp_session(self, address, new=False):
+        with self._lock:
+            if new or address not in self._udp_sessions:
+                self._udp_sessions[address] = ZKSession(self.data, next(self._session_ids), self.password)
+            return self._udp_sessions[address]
+
+    def end_udp_session(self, address):
+        with self._lock:
+            self._udp_sessions.pop(address, None)
+
+    def respond(self, session, request, max_data=None):
+        """
+        Reply packets to a request, DATA payloads split to max_data bytes;
+        None when the request is dropped
+        """
+        if len(request) < 8:
+            return None
+        command, _checksum, _session_id, reply_id = unpack('<4H', request[:8])
+
+        with self._lock:
+            self.commands += 1
+            dropped = self.drop_rate and self._random.random() < self.drop_rate
+            if dropped:
+                self.dropped += 1
+        if dropped:
+            return None
+        if self.latency:
+            time.sleep(self.latency)
+
+        replies = []
+        for reply_command, payload in session.handle(command, request[8:]):
+            if reply_command == const.CMD_DATA and max_data:
+                pieces = [payload[start:start + max_data] for start in range(0, len(payload), max_data)] or [b'']
+            else:
+                pieces = [payload]
+            replies.extend(packet(reply_command, session.session_id, reply_id, piece) for piece in pieces)
+        return replies
@@ -9,16 +9,31 @@ Requirements:
 """
 
 from zk import ZK, const
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, NamedTuple, Optional, Tuple
 from django.utils import timezone
 from django.conf import settings
 import logging
 import datetime
 
-from organization.models import OrganizationMembership
-
 logger = logging.getLogger(__name__)
 
+# Days of punches ingested on a device's first sync, unless its log is cleared after syncing
+INITIAL_SYNC_DAYS = 30
+
+
+class UserUpload(NamedTuple):
+    """Users wanted on a device, for AttendanceSyncManager.push_users"""
+    # uid -> {'user_id', 'name', 'privilege'}
+    users: Dict[int, Dict]
+    retired_uids: set
+
+
+class AttendanceFetch(NamedTuple):
+    """Punches read from a device for AttendanceSyncManager.save_attendance"""
+    logs: Optional[List[Dict]]
+    record_count: Optional[int]
+    incremental: bool
+
 
 class ZKTecoDevice:
     """
@@ -33,6 +48,7 @@ class ZKTecoDevice:
         self.conn = None
         self.zk = None
         self.is_connected = False
+        self.attendance_error = None
 
     def connect(self) -> bool:
         """Connect to the ZKTeco device"""
@@ -146,12 +162,27 @@ class ZKTecoDevice:
             logger.error(f"Failed to get users: {str(e)}")
             return []
 
-    def get_attendance(self, start_date: datetime.date = None, end_date: datetime.date = None) -> List[Dict]:
+    def get_attendance_count(self) -> Optional[int]:
+        """Number of attendance records stored on the device, or None if unknown"""
+        if not self.is_connected:
+            return None
+
+        try:
+            self.zk.read_sizes()
+            return self.zk.records
+        except Exception as e:
+            logger.error(f"Failed to read attendance count: {str(e)}")
+            return None
+
+    def get_attendance(self, start_date: datetime.date = None, end_date: datetime.date = None,
+                       since: datetime.datetime = None) -> List[Dict]:
         """
         Get attendance records from the device
         
         Note: PyZK gets ALL attendance records. Filter by date in your application.
+        since (naive, device time) skips records older than it.
         """
+        self.attendance_error = None
         if not self.is_connected:
             return []
 
@@ -165,6 +196,8 @@ class ZKTecoDevice:
                     continue
                 if end_date and record.timestamp.date() > end_date:
                     continue
+                if since and record.timestamp < since:
+                    continue
                 
                 attendance_list.append({
                     'user_id': record.user_id,
@@ -179,6 +212,7 @@ class ZKTecoDevice:
             
         except Exception as e:
             logger.error(f"Failed to get attendance: {str(e)}")
+            self.attendance_error = e
             return []
 
     def set_user(self, uid: int, name: str, privilege: int = 0, 
@@ -317,35 +351,39 @@ class AttendanceSyncManager:
         """Sync device information to database"""
         try:
             if not self.zk_device.connect():
-                self.device.is_online = False
-                self.device.save()
+                self.mark_offline()
                 return False
 
-            device_info = self.zk_device.get_device_info()
-            
-            if device_info:
-                self.device.serial_number = device_info.get('serialnumber', '')
-                self.device.model = device_info.get('device_name', '')
-                self.device.firmware_version = device_info.get('firmware_version', '')
-                self.device.mac_address = device_info.get('mac', '')
-                self.device.platform = device_info.get('platform', '')
-                self.device.is_online = True
-                self.device.last_sync = timezone.now()
-                self.device.save()
-                
-                logger.info(f"Device info synced for {self.device.name}")
-                return True
-
-            return False
+            return self.save_device_info(self.zk_device.get_device_info())
 
         except Exception as e:
             logger.error(f"Failed to sync device info: {str(e)}")
-            self.device.is_online = False
-            self.device.save()
+            self.mark_offline()
             return False
         finally:
             self.zk_device.disconnect()
 
+    def save_device_info(self, device_info: Dict) -> bool:
+        """Save information read from the device"""
+        if not device_info:
+            return False
+
+        self.device.serial_number = device_info.get('serialnumber', '')
+        self.device.model = device_info.get('device_name', '')
+        self.device.firmware_version = device_info.get('firmware_version', '')
+        self.device.mac_address = device_info.get('mac', '')
+        self.device.platform = device_info.get('platform', '')
+        self.device.is_online = True
+        self.device.last_sync = timezone.now()
+        self.device.save()
+
+        logger.info(f"Device info synced for {self.device.name}")
+        return True
+
+    def mark_offline(self):
+        self.device.is_online = False
+        self.device.save()
+
     def sync_users(self, auto_create: bool = True) -> Dict[str, int]:
         """
         Sync users from device to database
@@ -360,130 +398,7 @@ class AttendanceSyncManager:
             if not self.zk_device.connect():
                 return {'synced': 0, 'created': 0, 'failed': 0}
 
-            device_users = self.zk_device.get_users()
-            synced_count = 0
-            created_count = 0
-            failed_count = 0
-
-            from .models import Employee
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-
-            for device_user in device_users:
-                try:
-                    employee = None
-                    
-                    # Strategy 1: Find by device_enrollment_id
-                    employee = Employee.objects.filter(
-                        organization=self.device.organization,
-                        device_enrollment_id=str(device_user['user_id'])
-                    ).first()
-                    
-                    # Strategy 2: Find by employee_id matching device user_id
-                    if not employee:
-                        employee = Employee.objects.filter(
-                            organization=self.device.organization,
-                            employee_id=str(device_user['user_id'])
-                        ).first()
-                    
-                    # Strategy 3: Try to match by name
-                    if not employee and device_user['name'].strip():
-                        name_parts = device_user['name'].strip().split()
-                        if name_parts:
-                            employee = Employee.objects.filter(
-                                organization=self.device.organization,
-                                first_name__iexact=name_parts[0],
-                                is_active=True
-                            ).first()
-
-                    if employee:
-                        # Update existing employee with device IDs
-                        employee.device_user_id = str(device_user['uid'])
-                        employee.device_enrollment_id = str(device_user['user_id'])
-                        employee.save()
-
-                        # Ensure OrganizationMembership exists for existing employee
-                        self._ensure_organization_membership(employee.user, self.device.organization)
-
-                        synced_count += 1
-                        logger.info(f"✓ Synced user: {device_user['name']} -> {employee.full_name}")
-                    
-                    elif auto_create:
-                        # Create new employee from device user
-                        try:
-                            # Parse name
-                            name_parts = device_user['name'].strip().split()
-                            first_name = name_parts[0] if name_parts else device_user['name'][:50]
-                            last_name = ' '.join(name_parts[1:])[:50] if len(name_parts) > 1 else ''
-                            
-                            # Generate unique username
-                            base_username = first_name.lower().replace(' ', '')
-                            username = base_username
-                            counter = 1
-                            while User.objects.filter(username=username).exists():
-                                username = f"{base_username}{counter}"
-                                counter += 1
-                            
-                            # Generate unique employee_id for organization
-                            employee_id = str(device_user['user_id'])
-                            original_employee_id = employee_id
-                            counter = 1
-                            while Employee.objects.filter(
-                                organization=self.device.organization,
-                                employee_id=employee_id
-                            ).exists():
-                                employee_id = f"{original_employee_id}_{counter}"
-                                counter += 1
-                            
-                            # Create user account with password
-                            password = f"{username}123"  # username + 123
-                            user = User.objects.create_user(
-                                username=username,
-                                password=password,
-                                first_name=first_name,
-                                last_name=last_name,
-                                email=f"{username}@{self.device.organization.name.lower().replace(' ', '')}.local"
-                            )
-                            
-                            # Create employee
-                            from datetime import date
-                            employee = Employee.objects.create(
-                                organization=self.device.organization,
-                                user=user,
-                                employee_id=employee_id,
-                                first_name=first_name,
-                                last_name=last_name,
-                                hire_date=date.today(),
-                                employment_status='active',
-                                is_active=True,
-                                device_user_id=str(device_user['uid']),
-                                device_enrollment_id=str(device_user['user_id']),
-                            )
-
-                            # ✅ Create OrganizationMembership for the new employee
-                            self._create_organization_membership(user, self.device.organization)
-                            
-                            created_count += 1
-                            logger.info(f"✓ Created employee: {employee.full_name} (ID: {employee_id}, Username: {username}, Password: {password})")
-                        
-                        except Exception as e:
-                            failed_count += 1
-                            logger.error(f"✗ Failed to create employee for '{device_user['name']}': {str(e)}")
-                    else:
-                        logger.warning(f"⚠ No match for device user: {device_user['name']} (ID: {device_user['user_id']}, UID: {device_user['uid']})")
-
-                except Exception as e:
-                    failed_count += 1
-                    logger.error(f"✗ Error syncing user {device_user.get('name', 'unknown')}: {str(e)}")
-                    continue
-
-            logger.info(f"User sync completed: {synced_count} matched, {created_count} created, {failed_count} failed out of {len(device_users)} total")
-            
-            return {
-                'synced': synced_count,
-                'created': created_count,
-                'failed': failed_count
-            }
+            return self.save_users(self.zk_device.get_users(), auto_create)
 
         except Exception as e:
             logger.error(f"Failed to sync users: {str(e)}")
@@ -491,164 +406,50 @@ class AttendanceSyncManager:
         finally:
             self.zk_device.disconnect()
 
+    def save_users(self, device_users: List[Dict], auto_create: bool = True) -> Dict[str, int]:
+        """Match users read from the device to employees, creating unmatched ones if auto_create"""
+        from .device_users import sync_device_users
 
-    def _create_organization_membership(self, user, organization, is_admin=False):
-        """
-        Create organization membership for user
-        """
         try:
-            
-            
-            membership, created = OrganizationMembership.objects.get_or_create(
-                user=user,
-                organization=organization,
-                defaults={
-                    'is_admin': is_admin,
-                    'is_active': True
-                }
-            )
-            
-            if created:
-                logger.info(f"✓ Created OrganizationMembership: {user.username} -> {organization.name}")
-            else:
-                # Update existing membership if needed
-                if not membership.is_active:
-                    membership.is_active = True
-                    membership.save()
-                    logger.info(f"✓ Reactivated OrganizationMembership: {user.username} -> {organization.name}")
-            
-            return membership
-            
+            return sync_device_users(self.device.organization, device_users, auto_create)
         except Exception as e:
-            logger.error(f"✗ Failed to create OrganizationMembership for {user.username}: {str(e)}")
-            return None
-
-    def _ensure_organization_membership(self, user, organization, is_admin=False):
-        """
-        Ensure organization membership exists for user (for existing employees)
-        """
-        try:
-            
-            membership, created = OrganizationMembership.objects.get_or_create(
-                user=user,
-                organization=organization,
-                defaults={
-                    'is_admin': is_admin,
-                    'is_active': True
-                }
-            )
-            
-            if created:
-                logger.info(f"✓ Created OrganizationMembership for existing employee: {user.username} -> {organization.name}")
-            elif not membership.is_active:
-                membership.is_active = True
-                membership.save()
-                logger.info(f"✓ Reactivated OrganizationMembership for existing employee: {user.username} -> {organization.name}")
-            
-            return membership
-            
-        except Exception as e:
-            logger.error(f"✗ Failed to ensure OrganizationMembership for {user.username}: {str(e)}")
-            return None
-
-
+            logger.error(f"Failed to sync users: {str(e)}")
+            return {'synced': 0, 'created': 0, 'failed': len(device_users)}
 
     def sync_attendance(self, start_date: datetime.date = None, end_date: datetime.date = None) -> int:
         """
         Sync attendance records from device
-        Returns number of records synced
+        Returns number of records created
+
+        Without dates only punches from the device's watermark on are
+        ingested, and a device whose log size hasn't changed since the last
+        sync is skipped. With dates the range is ingested again and the
+        watermark is left alone.
         """
         try:
             if not self.zk_device.connect():
                 return 0
 
-            if not start_date:
-                start_date = datetime.date.today() - datetime.timedelta(days=7)
-            if not end_date:
-                end_date = datetime.date.today()
+            # The device takes no punches between reading and clearing its log
+            clear_log = start_date is None and end_date is None and self.device.clear_log_after_sync
+            if clear_log:
+                self.zk_device.disable_device()
 
-            attendance_logs = self.zk_device.get_attendance(start_date, end_date)
-            synced_count = 0
-
-            from .models import Employee, AttendanceRecord
-
-            for log in attendance_logs:
-                try:
-                    # Find employee by device user_id
-                    employee = Employee.objects.filter(
-                        organization=self.device.organization,
-                        device_enrollment_id=str(log['user_id'])
-                    ).first()
-
-                    if not employee:
-                        # Try by device_user_id (UID)
-                        if log.get('uid'):
-                            employee = Employee.objects.filter(
-                                organization=self.device.organization,
-                                device_user_id=str(log['uid'])
-                            ).first()
-
-                    if not employee:
-                        logger.warning(f"No employee found for device user_id: {log['user_id']}")
-                        continue
-
-                    # Get or create attendance record for the day
-                    attendance_date = log['timestamp'].date()
-                    
-                    attendance_record, created = AttendanceRecord.objects.get_or_create(
-                        organization=self.device.organization,
-                        employee=employee,
-                        date=attendance_date,
-                        defaults={
-                            'device': self.device,
-                            'status': 'present',
-                            'sync_timestamp': timezone.now(),
-                        }
-                    )
-
-                    # Determine if this is check-in or check-out
-                    # Punch: 0 = Check In, 1 = Check Out, 2 = Break Out, 3 = Break In, etc.
-                    punch_time = log['timestamp'].time()
-                    
-
-                    # ✅ Append all punch times to notes field
-                    current_notes = attendance_record.notes or ""
-                    all_times = [t.strip() for t in current_notes.split(",") if t.strip()]
-                    time_str = punch_time.strftime("%H:%M:%S")
-                    if time_str not in all_times:
-                        all_times.append(time_str)
-                        attendance_record.notes = ",".join(sorted(all_times))
-
-
-                    if log['punch'] in [0, 2, 4]:  # Check-in types
-                        if not attendance_record.check_in_time or punch_time < attendance_record.check_in_time:
-                            attendance_record.check_in_time = punch_time
-                            logger.info(f"Updated check-in for {employee.full_name} at {punch_time}")
-                    
-                    elif log['punch'] in [1, 3, 5]:  # Check-out types
-                        if not attendance_record.check_out_time or punch_time > attendance_record.check_out_time:
-                            attendance_record.check_out_time = punch_time
-                            logger.info(f"Updated check-out for {employee.full_name} at {punch_time}")
-
-                    attendance_record.save()
-
-                    # Calculate working hours
-                    if hasattr(attendance_record, 'calculate_hours'):
-                        attendance_record.calculate_hours()
-
-                    if created:
-                        synced_count += 1
-
-                except Exception as e:
-                    logger.error(f"Error processing attendance log: {str(e)}")
-                    continue
+            try:
+                fetch = self.fetch_attendance(start_date, end_date)
+                counts = self.save_attendance(fetch)
 
-            # Update device sync timestamp
-            self.device.last_sync = timezone.now()
-            self.device.save()
+                if clear_log and fetch.logs and self.zk_device.clear_attendance():
+                    self.log_cleared()
+            finally:
+                if clear_log:
+                    self.zk_device.enable_device()
 
-            logger.info(f"Synced {synced_count} attendance records")
-            return synced_count
+            logger.info(
+                f"Synced {counts['punches']} punches: {counts['created']} records created, "
+                f"{counts['updated']} updated, {counts['unmatched']} punches unmatched"
+            )
+            return counts['created']
 
         except Exception as e:
             logger.error(f"Failed to sync attendance: {str(e)}")
@@ -656,61 +457,194 @@ class AttendanceSyncManager:
         finally:
             self.zk_device.disconnect()
 
+    def fetch_attendance(self, start_date: datetime.date = None, end_date: datetime.date = None) -> AttendanceFetch:
+        """
+        Read the punches to ingest from the connected device, without touching the database
+
+        See sync_attendance for the date handling. logs is None when the
+        device log is unchanged since the last incremental sync.
+        """
+        incremental = start_date is None and end_date is None
+        since = None
+        record_count = self.zk_device.get_attendance_count()
+
+        if incremental:
+            if record_count is not None and record_count == self.device.last_punch_count:
+                logger.info(f"No new punches on {self.device.name}")
+                return AttendanceFetch(None, record_count, incremental)
+
+            if self.device.last_punch_at:
+                # Punches of the watermark's second are ingested again, which changes nothing
+                since = timezone.make_naive(self.device.last_punch_at)
+            elif not self.device.clear_log_after_sync:
+                start_date = datetime.date.today() - datetime.timedelta(days=INITIAL_SYNC_DAYS)
+        else:
+            if not start_date:
+                start_date = datetime.date.today() - datetime.timedelta(days=7)
+            if not end_date:
+                end_date = datetime.date.today()
+
+        logs = self.zk_device.get_attendance(start_date, end_date, since=since)
+        if self.zk_device.attendance_error:
+            # An empty result must not move the watermark past punches never read
+            raise self.zk_device.attendance_error
+        return AttendanceFetch(logs, record_count, incremental)
+
+    def save_attendance(self, fetch: AttendanceFetch) -> Dict[str, int]:
+        """Ingest fetched punches and advance the watermark of incremental fetches"""
+        from .ingest import ingest_punches
+
+        # Saved in one transaction; raises before the watermark moves
+        counts = ingest_punches(self.device, fetch.logs or [])
+
+        update_fields = ['last_sync']
+        self.device.last_sync = timezone.now()
+
+        if fetch.incremental:
+            if fetch.logs:
+                newest = timezone.make_aware(max(log['timestamp'] for log in fetch.logs))
+                if not self.device.last_punch_at or newest > self.device.last_punch_at:
+                    self.device.last_punch_at = newest
+                    update_fields.append('last_punch_at')
+            if fetch.record_count is not None:
+                self.device.last_punch_count = fetch.record_count
+                update_fields.append('last_punch_count')
+
+        self.device.save(update_fields=update_fields)
+        return counts
+
+    def clear_synced_log(self, record_count: int) -> bool:
+        """
+        Clear the connected device's log if it still holds exactly the
+        record_count records read, i.e. nothing was punched since
+        """
+        self.zk_device.disable_device()
+        try:
+            if self.zk_device.get_attendance_count() != record_count:
+                return False
+            return self.zk_device.clear_attendance()
+        finally:
+            self.zk_device.enable_device()
+
+    def log_cleared(self):
+        self.device.last_punch_count = 0
+        self.device.save(update_fields=['last_punch_count'])
+
     def upload_users(self) -> int:
         """
         Upload users from database to device
-        Returns number of users uploaded
+        Returns number of users added or changed on the device
         """
         try:
+            upload = self.prepare_upload()
+
             if not self.zk_device.connect():
                 return 0
 
-            from .models import Employee
+            return self.push_users(upload)
+
+        except Exception as e:
+            logger.error(f"Failed to upload users: {str(e)}")
+            return 0
+        finally:
+            self.zk_device.disconnect()
+
+    def prepare_upload(self) -> UserUpload:
+        """
+        Device users wanted for the organization's active employees, and UIDs
+        of inactive or deleted employees to remove; employees without device
+        ids get them, saved in one bulk update
+        """
+        from .models import Employee
+
+        employees = Employee.objects.all_with_deleted().filter(organization=self.device.organization).only(
+            'id', 'employee_id', 'first_name', 'last_name', 'is_active', 'deleted_at',
+            'device_user_id', 'device_enrollment_id'
+        )
+
+        users = {}
+        retired_uids = set()
+        assigned = []
+
+        for employee in employees:
+            if not employee.is_active or employee.deleted_at:
+                if employee.device_user_id and employee.device_user_id.isdigit():
+                    retired_uids.add(int(employee.device_user_id))
+                continue
+
+            # Generate UID if not exists
+            if not employee.device_user_id or not employee.device_enrollment_id:
+                employee.device_user_id = employee.device_user_id or str(employee.id)
+                employee.device_enrollment_id = employee.device_enrollment_id or str(employee.employee_id or employee.id)
+                assigned.append(employee)
+
+            if not employee.device_user_id.isdigit():
+                logger.error(f"Error uploading user {employee.full_name}: UID {employee.device_user_id} is not a number")
+                continue
+
+            users[int(employee.device_user_id)] = {
+                'user_id': str(employee.device_enrollment_id),
+                'name': employee.full_name[:23],  # Max 24 chars for some devices
+                'privilege': 0,  # 0=User, 14=Admin
+            }
 
-            employees = Employee.objects.filter(
-                organization=self.device.organization,
-                is_active=True
+        if assigned:
+            now = timezone.now()
+            for employee in assigned:
+                employee.updated_at = now
+            Employee.objects.bulk_update(
+                assigned, ['device_user_id', 'device_enrollment_id', 'updated_at'], batch_size=500
             )
 
-            uploaded_count = 0
-
-            for employee in employees:
-                try:
-                    # Generate UID if not exists
-                    if not employee.device_user_id:
-                        employee.device_user_id = str(employee.id)
-                    
-                    if not employee.device_enrollment_id:
-                        employee.device_enrollment_id = str(employee.employee_id or employee.id)
-
-                    # Upload user to device
-                    success = self.zk_device.set_user(
-                        uid=int(employee.device_user_id),
-                        name=employee.full_name[:23],  # Max 24 chars for some devices
-                        privilege=0,  # 0=User, 14=Admin
-                        password='',
-                        group_id='',
-                        user_id=str(employee.device_enrollment_id),
-                        card=0
-                    )
-
-                    if success:
-                        uploaded_count += 1
-                        employee.save()
-                        logger.info(f"Uploaded user: {employee.full_name}")
-
-                except Exception as e:
-                    logger.error(f"Error uploading user {employee.full_name}: {str(e)}")
-                    continue
+        return UserUpload(users, retired_uids - set(users))
 
-            logger.info(f"Uploaded {uploaded_count} users to device")
-            return uploaded_count
+    def push_users(self, upload: UserUpload) -> int:
+        """
+        Bring the connected device's users in line with upload, without touching the database
 
-        except Exception as e:
-            logger.error(f"Failed to upload users: {str(e)}")
+        The device's users are read once; only missing or different users are
+        written and retired ones deleted, with the device disabled meanwhile.
+        Device users of no employee are left alone. Returns the number of
+        users added or changed.
+        """
+        device_users = {user['uid']: user for user in self.zk_device.get_users()}
+
+        changes = []
+        for uid, wanted in upload.users.items():
+            current = device_users.get(uid)
+            if current is None or any(current[field] != value for field, value in wanted.items()):
+                changes.append((uid, wanted, current))
+        deletions = [uid for uid in upload.retired_uids if uid in device_users]
+
+        if not changes and not deletions:
+            logger.info("Device users are up to date")
             return 0
+
+        uploaded_count = 0
+        self.zk_device.disable_device()
+        try:
+            for uid, wanted, current in changes:
+                # Keep the password, group and card the device holds
+                if self.zk_device.set_user(
+                    uid=uid,
+                    name=wanted['name'],
+                    privilege=wanted['privilege'],
+                    password=current['password'] if current else '',
+                    group_id=current['group_id'] if current else '',
+                    user_id=wanted['user_id'],
+                    card=current['card'] if current else 0
+                ):
+                    uploaded_count += 1
+
+            deleted_count = sum(1 for uid in deletions if self.zk_device.delete_user(uid))
         finally:
-            self.zk_device.disconnect()
+            self.zk_device.enable_device()
+
+        logger.info(
+            f"Uploaded {uploaded_count} users to device, deleted {deleted_count}; "
+            f"{len(upload.users) - len(changes)} were up to date"
+        )
+        return uploaded_count
 
 
 # def test_device_connection(ip_address: str, port: int = 4370) -> Dict:
@@ -9,6 +9,7 @@ from django.utils.text import slugify
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from hrm.models import AttendanceHoliday, AttendanceRecord, Branch, Department, Employee, LeaveRequest
+from hrm.rollup import attendance_totals
 from .models import (
     Organization, OrganizationMembership, MenuCategory, MenuItem, UserMenuPermission,
     DynamicTable, TableColumn, RoleTablePermission, RoleColumnPermission, UserTablePreference
@@ -254,15 +255,12 @@ def organization_dashboard(request):
     today = timezone.now().date()
     current_month_start = today.replace(day=1)
     
-    current_month_attendance = AttendanceRecord.objects.filter(
-        organization=organization,
-        date__gte=current_month_start,
-        date__lte=today
-    )
+    # Up to today; records already dated later in the month (leave, holidays) are left out
+    current_month_attendance = attendance_totals(organization, current_month_start, today).values()
     
-    present_count = current_month_attendance.filter(status='present').count()
-    late_count = current_month_attendance.filter(status='late').count()
-    absent_count = current_month_attendance.filter(status='absent').count()
+    present_count = sum(totals['present_days'] for totals in current_month_attendance)
+    late_count = sum(totals['late_days'] for totals in current_month_attendance)
+    absent_count = sum(totals['absent_days'] for totals in current_month_attendance)
     
     # Leave statistics
     total_leaves = LeaveRequest.objects.filter(organization=organization).count()
@@ -31,4 +31,11 @@ admin.site.register(SalaryStructure)
 admin.site.register(Allowance)
 admin.site.register(Deduction)
 admin.site.register(PayslipComponent)
+
+
+class PayrollJobAdmin(admin.ModelAdmin):
+    list_display = ['payroll_period', 'action', 'mode', 'status', 'processed_employees', 'total_employees', 'error_count', 'created_at']
+    list_filter = ['status', 'action', 'mode']
+
+admin.site.register(PayrollJob, PayrollJobAdmin)
 # admin.site.register(SoftDeleteManager)
\ No newline at end of file
@@ -0,0 +1,274 @@
+# payroll/benchmark.py - Synthetic tenants and measurements for `manage.py payroll_benchmark`
+
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from hrm.models import Employee, Payhead, EmployeePayhead, AttendanceRecord
+from hrm.rollup import rebuild_months
+from organization.models import Organization
+
+from .models import PayrollPeriod, SalaryStructure, Payslip, PayslipComponent
+from .services import PayrollProcessor
+
+User = get_user_model()
+
+BULK_BATCH_SIZE = 1000
+
+PERIOD_START = date(2025, 1, 1)
+
+# Payhead templates cycled through to build an organization's payhead catalogue
+PAYHEAD_TEMPLATES = [
+    ('earning', 'percentage', {'percentage': Decimal('40.00')}),
+    ('earning', 'fixed', {'amount': Decimal('2000.00')}),
+    ('earning', 'overtime', {'overtime_rate_per_hour': Decimal('150.00')}),
+    ('earning', 'attendance', {'attendance_rate_per_hour': Decimal('12.50'), 'max_amount': Decimal('1500.00')}),
+    ('deduction', 'percentage', {'percentage': Decimal('10.00'), 'min_amount': Decimal('100.00')}),
+    ('deduction', 'fixed', {'amount': Decimal('300.00')}),
+    ('earning', 'production', {'production_rate_per_unit': Decimal('5.00'), 'min_amount': Decimal('10.00')}),
+    ('deduction', 'custom', {'min_amount': Decimal('50.00')}),
+]
+
+# Employee payhead values overriding the organization defaults, by calculation type
+OVERRIDE_FIELDS = {
+    'fixed': ('amount', 500, 5000),
+    'percentage': ('percentage', 1, 50),
+    'attendance': ('attendance_rate_per_hour', 5, 50),
+    'overtime': ('overtime_rate_per_hour', 50, 300),
+    'production': ('production_rate_per_unit', 1, 20),
+    'custom': ('min_amount', 10, 500),
+}
+
+ATTENDANCE_STATUSES = ['present', 'present', 'present', 'present', 'late', 'half_day', 'absent', 'on_leave']
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries of the wrapped block"""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class SyntheticTenant:
+    """An organization, its payroll inputs and a payroll period, created in bulk"""
+
+    def __init__(self, organization, period, employee_count):
+        self.organization = organization
+        self.period = period
+        self.employee_count = employee_count
+
+    @classmethod
+    def generate(cls, prefix, index, employees, payheads_per_employee, org_payheads,
+                 attendance_days, seed):
+        """Create one tenant; the same arguments always create the same data"""
+        rnd = random.Random(f"{seed}-{index}")
+        slug = f"{prefix}-{index}"
+        password = make_password(None)
+
+        with transaction.atomic():
+            admin = User.objects.create(
+                username=f"{slug}-admin", password=password, role='organization_admin'
+            )
+            organization = Organization.objects.create(
+                name=f"Benchmark {slug}", slug=slug, email=f"{slug}@example.com", created_by=admin
+            )
+            period = PayrollPeriod.objects.create(
+                organization=organization,
+                name=f"Benchmark {slug}",
+                start_date=PERIOD_START,
+                end_date=PERIOD_START + timedelta(days=attendance_days - 1),
+                pay_date=PERIOD_START + timedelta(days=attendance_days),
+                created_by=admin
+            )
+
+            catalogue = cls._create_payheads(organization, org_payheads)
+            basic, optional = catalogue[0], catalogue[1:]
+
+            users = User.objects.bulk_create(
+                [
+                    User(username=f"{slug}-{number}", password=password)
+                    for number in range(employees)
+                ],
+                batch_size=BULK_BATCH_SIZE
+            )
+            staff = Employee.objects.bulk_create(
+                [
+                    Employee(
+                        organization=organization, user=user, employee_id=f"{slug}-{number:06d}",
+                        first_name=f"Employee{number}", last_name='Benchmark',
+                        hire_date=date(2024, 1, 1)
+                    )
+                    for number, user in enumerate(users)
+                ],
+                batch_size=BULK_BATCH_SIZE
+            )
+
+            structures = []
+            assignments = []
+            attendance = []
+            days = [PERIOD_START + timedelta(days=offset) for offset in range(attendance_days)]
+
+            for employee in staff:
+                if rnd.random() < 0.3:
+                    structures.append(SalaryStructure(
+                        organization=organization, employee=employee,
+                        basic_salary=Decimal(rnd.randint(1000000, 9000000)) / 100,
+                        effective_date=date(2024, 6, 1)
+                    ))
+
+                assignments.append(EmployeePayhead(
+                    organization=organization, employee=employee, payhead=basic,
+                    amount=Decimal(rnd.randint(1000000, 9000000)) / 100,
+                    effective_from=date(2024, 1, 1)
+                ))
+                for payhead in rnd.sample(optional, min(payheads_per_employee - 1, len(optional))):
+                    field, low, high = OVERRIDE_FIELDS[payhead.calculation_type]
+                    assignments.append(EmployeePayhead(
+                        organization=organization, employee=employee, payhead=payhead,
+                        effective_from=date(2024, 1, 1),
+                        **{field: Decimal(rnd.randint(low * 100, high * 100)) / 100}
+                    ))
+
+                for day in days:
+                    status = rnd.choice(ATTENDANCE_STATUSES)
+                    worked = status not in ('absent', 'on_leave')
+                    attendance.append(AttendanceRecord(
+                        organization=organization, employee=employee, date=day,
+                        status=status, is_late=status == 'late',
+                        working_hours=Decimal(rnd.randint(400, 900)) / 100 if worked else Decimal('0.00'),
+                        overtime_hours=Decimal(rnd.randint(0, 200)) / 100 if worked else Decimal('0.00'),
+                    ))
+
+                if len(attendance) >= BULK_BATCH_SIZE * 10:
+                    AttendanceRecord.objects.bulk_create(attendance, batch_size=BULK_BATCH_SIZE)
+                    attendance = []
+
+            SalaryStructure.objects.bulk_create(structures, batch_size=BULK_BATCH_SIZE)
+            EmployeePayhead.objects.bulk_create(assignments, batch_size=BULK_BATCH_SIZE)
+            AttendanceRecord.objects.bulk_create(attendance, batch_size=BULK_BATCH_SIZE)
+            # Bulk inserts skip the monthly attendance rollup payroll reads
+            rebuild_months(organization)
+
+        return cls(organization, period, len(staff))
+
+    @staticmethod
+    def _create_payheads(organization, count):
+        """BASIC plus count - 1 payheads cycling through PAYHEAD_TEMPLATES"""
+        payheads = [Payhead(
+            organization=organization, name='Basic Salary', code='BASIC',
+            payhead_type='earning', calculation_type='fixed', amount=Decimal('30000.00'),
+            display_order=0, effective_from=date(2020, 1, 1)
+        )]
+        for number in range(1, count):
+            payhead_type, calculation_type, values = PAYHEAD_TEMPLATES[(number - 1) % len(PAYHEAD_TEMPLATES)]
+            payheads.append(Payhead(
+                organization=organization, name=f"Benchmark {number}", code=f"BM{number:03d}",
+                payhead_type=payhead_type, calculation_type=calculation_type,
+                display_order=number, effective_from=date(2020, 1, 1), **values
+            ))
+        return Payhead.objects.bulk_create(payheads)
+
+    def reset(self):
+        """Remove payslips so the next run starts from an empty draft period"""
+        payslips = Payslip.objects.filter(payroll_period=self.period)
+        PayslipComponent.objects.filter(payslip__in=payslips).delete()
+        payslips.delete()
+        PayrollPeriod.objects.filter(id=self.period.id).update(status='draft')
+
+
+def delete_tenants(prefix):
+    """Delete every organization and user created under prefix"""
+    with transaction.atomic():
+        Organization.objects.filter(slug__startswith=f"{prefix}-").delete()
+        User.objects.filter(username__startswith=f"{prefix}-").delete()
+
+
+def measure(action, tenants, mode, backend=None, trace_memory=True):
+    """
+    Run or rerun payroll for every tenant and measure it
+    Returns a dict of wall time, queries, peak traced memory and throughput.
+    Queries issued by parallel mode worker processes are not counted.
+    """
+    counter = QueryCounter()
+    totals = {'payslips_created': 0, 'payslips_updated': 0, 'total_employees': 0}
+    errors = []
+
+    if trace_memory:
+        tracemalloc.start()
+
+    started = time.perf_counter()
+    with connection.execute_wrapper(counter):
+        for tenant in tenants:
+            processor = PayrollProcessor(tenant.organization, backend=backend)
+            if action == 'rerun':
+                success, result = processor.rerun_payroll(tenant.period.id, force_recalculate=True, mode=mode)
+            else:
+                success, result = processor.run_payroll(tenant.period.id, mode=mode)
+
+            if not success:
+                errors.append(result)
+                continue
+            for key in totals:
+                totals[key] += result[key]
+            errors.extend(result['errors'])
+    seconds = time.perf_counter() - started
+
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    payslips = totals['payslips_created'] + totals['payslips_updated']
+    return {
+        'action': action,
+        'mode': mode,
+        'seconds': round(seconds, 4),
+        'queries': counter.count,
+        'peak_memory_mb': round(peak_memory / (1024 * 1024), 2) if peak_memory is not None else None,
+        'employees': totals['total_employees'],
+        'payslips_created': totals['payslips_created'],
+        'payslips_updated': totals['payslips_updated'],
+        'payslips_per_second': round(payslips / seconds, 2) if seconds else None,
+        'employees_per_second': round(totals['total_employees'] / seconds, 2) if seconds else None,
+        'error_count': len(errors),
+        'errors': errors[:10],
+    }
+
+
+def environment():
+    """Versions and configuration the results depend on"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'calculation_backend': settings.PAYROLL_CALCULATION_BACKEND,
+        'created_at': timezone.now().isoformat(),
+    }
+
+
+def new_prefix():
+    return f"payroll-benchmark-{uuid.uuid4().hex[:8]}"
@@ -0,0 +1,91 @@
+# payroll/components.py - Diff-based persistence of payslip components
+#
+# Recalculating a payslip usually changes few of its components. Instead of
+# deleting and re-inserting every row, computed components are matched with
+# stored ones by component type and payhead: equal rows are left alone,
+# changed ones updated, new ones inserted and missing ones deleted, each with
+# batched statements.
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.utils import timezone
+
+from .models import PayslipComponent
+
+BATCH_SIZE = 500
+
+CENT = Decimal('0.01')
+
+# Compared on matched components; differences are written with one bulk update
+DIFF_FIELDS = ['component_name', 'component_code', 'calculation_type', 'amount', 'display_order']
+
+
+def _component_key(component):
+    return component.component_type, component.payhead_id
+
+
+def sync_payslip_components(computed, batch_size=BATCH_SIZE):
+    """
+    Make the stored components of saved payslips match computed ones
+
+    computed maps payslip ids to unsaved PayslipComponent lists, as built by
+    PayrollProcessor._build_payslip_components. Returns counts of created,
+    updated, deleted and unchanged components.
+    """
+    payslip_ids = list(computed)
+    stored = defaultdict(lambda: defaultdict(list))
+
+    for start in range(0, len(payslip_ids), batch_size):
+        for component in PayslipComponent.objects.filter(
+            payslip_id__in=payslip_ids[start:start + batch_size]
+        ).order_by('id'):
+            stored[component.payslip_id][_component_key(component)].append(component)
+
+    now = timezone.now()
+    to_create = []
+    to_update = []
+    to_delete = []
+    unchanged = 0
+
+    for payslip_id, components in computed.items():
+        existing = stored.pop(payslip_id, {})
+
+        for component in components:
+            # Compare what the database would store
+            component.amount = Decimal(component.amount).quantize(CENT)
+
+            # Payheads assigned twice produce several components with one key
+            matches = existing.get(_component_key(component))
+            if not matches:
+                to_create.append(component)
+                continue
+
+            current = matches.pop(0)
+            changed = False
+            for field in DIFF_FIELDS:
+                value = getattr(component, field)
+                if getattr(current, field) != value:
+                    setattr(current, field, value)
+                    changed = True
+
+            if changed:
+                current.updated_at = now
+                to_update.append(current)
+            else:
+                unchanged += 1
+
+        for matches in existing.values():
+            to_delete.extend(component.id for component in matches)
+
+    PayslipComponent.objects.bulk_create(to_create, batch_size=batch_size)
+    PayslipComponent.objects.bulk_update(to_update, DIFF_FIELDS + ['updated_at'], batch_size=batch_size)
+    for start in range(0, len(to_delete), batch_size):
+        PayslipComponent.objects.filter(id__in=to_delete[start:start + batch_size]).delete()
+
+    return {
+        'created': len(to_create),
+        'updated': len(to_update),
+        'deleted': len(to_delete),
+        'unchanged': unchanged,
+    }
@@ -0,0 +1,210 @@
+# payroll/jobs.py - DB-backed queue for payroll runs, consumed by `manage.py payroll_worker`
+
+import time
+import logging
+import threading
+from datetime import timedelta
+
+from django.db import connections
+from django.utils import timezone
+
+from .models import PayrollJob
+from .services import PayrollProcessor
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between progress writes for one job
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+# Errors kept on the job row while it runs; the full list is stored on completion
+MAX_PROGRESS_ERRORS = 50
+
+# Seconds between heartbeats of a running job, well below payroll_worker --stale-after
+HEARTBEAT_INTERVAL_SECONDS = 30
+
+
+def enqueue_payroll_job(organization, period, action='run', mode='standard',
+                        force_recalculate=False, user=None):
+    """
+    Queue a payroll run/rerun for a period
+    Returns (job, created); an already queued or running job for the period is reused
+    """
+    active_job = PayrollJob.objects.filter(
+        organization=organization,
+        payroll_period=period,
+        status__in=['queued', 'running']
+    ).first()
+
+    if active_job:
+        return active_job, False
+
+    job = PayrollJob.objects.create(
+        organization=organization,
+        payroll_period=period,
+        action=action,
+        mode=mode,
+        force_recalculate=bool(force_recalculate),
+        created_by=user
+    )
+    return job, True
+
+
+def claim_next_job(worker_name):
+    """
+    Atomically move the oldest queued job to running and return it
+    The conditional UPDATE makes claiming safe with several workers on any database.
+    """
+    candidates = PayrollJob.objects.filter(status='queued').order_by('created_at', 'id')
+
+    for job_id in candidates.values_list('id', flat=True)[:10]:
+        now = timezone.now()
+        claimed = PayrollJob.objects.filter(id=job_id, status='queued').update(
+            status='running',
+            worker=worker_name,
+            started_at=now,
+            heartbeat_at=now,
+            updated_at=now
+        )
+        if claimed:
+            return PayrollJob.objects.select_related('organization', 'payroll_period').get(id=job_id)
+
+    return None
+
+
+def requeue_stale_jobs(stale_after_seconds):
+    """Put running jobs whose worker stopped sending heartbeats back in the queue"""
+    cutoff = timezone.now() - timedelta(seconds=stale_after_seconds)
+    return PayrollJob.objects.filter(
+        status='running',
+        heartbeat_at__lt=cutoff
+    ).update(status='queued', worker=None, updated_at=timezone.now())
+
+
+def _claimed(job):
+    """The job's row, as long as it is still running on the worker that claimed it"""
+    return PayrollJob.objects.filter(id=job.id, status='running', worker=job.worker)
+
+
+class JobHeartbeat:
+    """
+    Context manager that keeps a running job's heartbeat_at current from a
+    background thread, independent of progress reports: loading inputs,
+    saving payslips and vectorized runs report no progress for minutes on
+    large organizations, and would otherwise look stale and be requeued.
+    """
+    def __init__(self, job, interval=HEARTBEAT_INTERVAL_SECONDS):
+        self.job = job
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def beat(self):
+        """Touch the heartbeat; False once the job is no longer claimed by this worker"""
+        now = timezone.now()
+        return bool(_claimed(self.job).update(heartbeat_at=now, updated_at=now))
+
+    def _run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    if not self.beat():
+                        logger.warning(f"Payroll job {self.job.id} is no longer claimed by {self.job.worker}")
+                        break
+                except Exception:
+                    logger.exception(f"Heartbeat of payroll job {self.job.id} failed")
+        finally:
+            # Connections are per thread
+            connections.close_all()
+
+    def __enter__(self):
+        self._thread = threading.Thread(
+            target=self._run, name=f'payroll-job-{self.job.id}-heartbeat', daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+
+class JobProgressReporter:
+    """
+    PayrollProcessor progress callback that writes throttled progress to a PayrollJob
+    """
+    def __init__(self, job, interval=PROGRESS_INTERVAL_SECONDS):
+        self.job = job
+        self.interval = interval
+        self._last_write = 0
+
+    def __call__(self, processed, total, errors):
+        now = time.monotonic()
+        if processed < total and now - self._last_write < self.interval:
+            return
+        self._last_write = now
+
+        _claimed(self.job).update(
+            total_employees=total,
+            processed_employees=processed,
+            error_count=len(errors),
+            errors=errors[:MAX_PROGRESS_ERRORS],
+            heartbeat_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+
+
+def execute_job(job):
+    """
+    Run a claimed job and record its outcome
+
+    The outcome is only written while the job is still claimed by this
+    worker; if it was requeued meanwhile, the result is discarded and the
+    job is returned as it now stands.
+    """
+    processor = PayrollProcessor(job.organization, progress_callback=JobProgressReporter(job))
+
+    with JobHeartbeat(job):
+        try:
+            if job.action == 'rerun':
+                success, result = processor.rerun_payroll(
+                    job.payroll_period_id, job.force_recalculate, mode=job.mode
+                )
+            else:
+                success, result = processor.run_payroll(
+                    job.payroll_period_id, job.force_recalculate, mode=job.mode
+                )
+        except Exception as e:
+            logger.exception(f"Payroll job {job.id} crashed")
+            success, result = False, f"Error running payroll: {str(e)}"
+
+    now = timezone.now()
+    outcome = {'finished_at': now, 'heartbeat_at': now, 'updated_at': now}
+
+    if success:
+        errors = result.get('errors', [])
+        message = (
+            f"Created {result.get('payslips_created', 0)} payslips, "
+            f"updated {result.get('payslips_updated', 0)} payslips "
+            f"for {result.get('total_employees', 0)} employees."
+        )
+        if 'changes' in result:
+            message += f" {result['changes']['unchanged']} unchanged payslips were skipped."
+        outcome.update(
+            status='completed',
+            result=result,
+            errors=errors,
+            error_count=len(errors),
+            message=message
+        )
+        if 'total_employees' in result:
+            outcome['processed_employees'] = outcome['total_employees'] = result['total_employees']
+    else:
+        outcome.update(status='failed', message=result)
+
+    if not _claimed(job).update(**outcome):
+        logger.warning(
+            f"Payroll job {job.id} was requeued while {job.worker} ran it; its outcome was discarded"
+        )
+
+    job.refresh_from_db()
+    return job
@@ -0,0 +1,58 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payroll.models import PayrollPeriod, Payslip
+from payroll.pdf import default_export_path, export_payslips_zip
+
+
+class Command(BaseCommand):
+    help = 'Render all payslip PDFs of a payroll period into a ZIP file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('period_id', type=int, help='Payroll period ID')
+        parser.add_argument(
+            '--output',
+            help='ZIP file to write (default: PAYROLL_PRIVATE_ROOT/payslip_exports/<organization>/payslips_<period>.zip)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Rendering processes (default: PAYROLL_PARALLEL_WORKERS)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Payslips rendered per worker task (default: 25)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            period = PayrollPeriod.objects.select_related('organization').get(id=options['period_id'])
+        except PayrollPeriod.DoesNotExist:
+            raise CommandError(f"Payroll period {options['period_id']} not found")
+
+        payslip_ids = list(Payslip.objects.filter(
+            organization=period.organization,
+            payroll_period=period
+        ).order_by('employee__employee_id').values_list('id', flat=True))
+
+        if not payslip_ids:
+            raise CommandError(f"No payslips found for {period.name}")
+
+        path = options['output'] or default_export_path(period)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.stdout.write(f"Rendering {len(payslip_ids)} payslips for {period.name}...")
+        started = time.monotonic()
+
+        size = export_payslips_zip(
+            period.organization, payslip_ids, path,
+            workers=options['workers'], chunk_size=options['chunk_size']
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Wrote {path} ({size / (1024 * 1024):.1f} MB) in {time.monotonic() - started:.1f}s"
+        ))
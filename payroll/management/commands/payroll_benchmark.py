@@ -0,0 +1,155 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payroll.benchmark import SyntheticTenant, delete_tenants, environment, measure, new_prefix
+from payroll.services import RUN_MODES, CALCULATION_BACKENDS
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark payroll runs and reruns on synthetic organizations and write the '
+        'results to a JSON file (wall time, queries, peak memory, payslips per second)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--organizations',
+            type=int,
+            default=1,
+            help='Synthetic organizations to generate (default: 1)'
+        )
+        parser.add_argument(
+            '--employees',
+            type=int,
+            default=1000,
+            help='Employees per organization (default: 1000)'
+        )
+        parser.add_argument(
+            '--payheads',
+            type=int,
+            default=5,
+            help='Payheads assigned to each employee, including BASIC (default: 5)'
+        )
+        parser.add_argument(
+            '--org-payheads',
+            type=int,
+            default=12,
+            help='Payheads defined per organization (default: 12)'
+        )
+        parser.add_argument(
+            '--attendance-days',
+            type=int,
+            default=30,
+            help='Days in the payroll period, each with an attendance record (default: 30)'
+        )
+        parser.add_argument(
+            '--modes',
+            default='standard,bulk,incremental',
+            help=f"Comma-separated run modes to measure, from {', '.join(RUN_MODES)} "
+                 f"(default: standard,bulk,incremental)"
+        )
+        parser.add_argument(
+            '--backend',
+            choices=CALCULATION_BACKENDS,
+            help='Calculation backend (default: PAYROLL_CALCULATION_BACKEND)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed; the same seed and scale generate the same data (default: 42)'
+        )
+        parser.add_argument(
+            '--output',
+            default='payroll_benchmark.json',
+            help='JSON file to write the results to (default: payroll_benchmark.json)'
+        )
+        parser.add_argument(
+            '--no-memory',
+            action='store_true',
+            help='Skip peak memory tracing, which slows down the measured runs'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the synthetic organizations instead of deleting them afterwards'
+        )
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        unknown = [mode for mode in modes if mode not in RUN_MODES]
+        if unknown:
+            raise CommandError(f"Unknown run mode(s): {', '.join(unknown)}")
+
+        for option in ('organizations', 'employees', 'payheads', 'org_payheads', 'attendance_days'):
+            if options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be at least 1")
+        if options['payheads'] > options['org_payheads']:
+            raise CommandError('--payheads cannot exceed --org-payheads')
+
+        scale = {
+            option: options[option]
+            for option in ('organizations', 'employees', 'payheads', 'org_payheads', 'attendance_days', 'seed')
+        }
+        prefix = new_prefix()
+
+        self.stdout.write(
+            f"Generating {scale['organizations']} organization(s) with {scale['employees']} employees, "
+            f"{scale['payheads']} payheads per employee and {scale['attendance_days']} attendance days..."
+        )
+
+        try:
+            started = time.perf_counter()
+            tenants = [
+                SyntheticTenant.generate(
+                    prefix, index, scale['employees'], scale['payheads'], scale['org_payheads'],
+                    scale['attendance_days'], scale['seed']
+                )
+                for index in range(scale['organizations'])
+            ]
+            generation = round(time.perf_counter() - started, 4)
+            self.stdout.write(f"Generated in {generation:.1f}s")
+
+            results = []
+            for mode in modes:
+                for tenant in tenants:
+                    tenant.reset()
+
+                for action in ('run', 'rerun'):
+                    result = measure(
+                        action, tenants, mode,
+                        backend=options['backend'],
+                        trace_memory=not options['no_memory']
+                    )
+                    results.append(result)
+                    self.write_result(result)
+        finally:
+            if not options['keep']:
+                delete_tenants(prefix)
+
+        report = {
+            'environment': environment(),
+            'scale': scale,
+            'generation_seconds': generation,
+            'results': results,
+        }
+        if options['backend']:
+            report['environment']['calculation_backend'] = options['backend']
+
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def write_result(self, result):
+        memory = f", peak {result['peak_memory_mb']} MB" if result['peak_memory_mb'] is not None else ''
+        line = (
+            f"{result['action']:<5} {result['mode']:<11} {result['seconds']:>9.2f}s "
+            f"{result['queries']:>8} queries, {result['payslips_per_second']} payslips/s{memory}"
+        )
+        if result['error_count']:
+            self.stdout.write(self.style.WARNING(f"{line} ({result['error_count']} errors)"))
+        else:
+            self.stdout.write(line)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0004_payrolljob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payslip',
+            name='input_hashes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
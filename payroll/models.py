@@ -158,6 +158,9 @@ class Payslip(BaseOrganizationModel):
     total_deductions = models.DecimalField(max_digits=12, decimal_places=2)
     net_salary = models.DecimalField(max_digits=12, decimal_places=2)
     
+    # Fingerprints of the inputs the amounts were calculated from, used by incremental runs
+    input_hashes = models.JSONField(default=dict, blank=True)
+    
     # Status
     is_generated = models.BooleanField(default=False)
     generated_at = models.DateTimeField(blank=True, null=True)
@@ -215,6 +218,73 @@ class PayslipComponent(BaseOrganizationModel):
 
 
 
+class PayrollJob(BaseOrganizationModel):
+    """
+    Queued payroll run or rerun, executed by the payroll_worker command
+    """
+    ACTION_CHOICES = [
+        ('run', 'Run'),
+        ('rerun', 'Rerun'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    payroll_period = models.ForeignKey(PayrollPeriod, on_delete=models.CASCADE, related_name='jobs')
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES, default='run')
+    mode = models.CharField(max_length=20, default='standard')
+    force_recalculate = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    
+    # Progress
+    total_employees = models.PositiveIntegerField(default=0)
+    processed_employees = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    message = models.TextField(blank=True, null=True)
+    
+    # Execution
+    worker = models.CharField(max_length=100, blank=True, null=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    objects = SoftDeleteManager()
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['payroll_period', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_action_display()} {self.payroll_period.name} ({self.status})"
+    
+    @property
+    def is_active(self):
+        return self.status in ['queued', 'running']
+    
+    @property
+    def progress_percent(self):
+        if not self.total_employees:
+            return 100 if self.status == 'completed' else 0
+        return min(100, int(self.processed_employees * 100 / self.total_employees))
+    
+    @property
+    def eta_seconds(self):
+        """Estimated seconds left, from the average rate so far"""
+        if self.status != 'running' or not self.started_at or not self.processed_employees:
+            return None
+        elapsed = (timezone.now() - self.started_at).total_seconds()
+        remaining = max(0, self.total_employees - self.processed_employees)
+        return int(elapsed / self.processed_employees * remaining)
+
+
 class Allowance(BaseOrganizationModel):
     """
     Allowance types for organization
@@ -0,0 +1,107 @@
+# payroll/parallel.py - Process pool execution for PayrollProcessor 'parallel' mode
+#
+# Models are imported inside the functions: with the 'spawn' start method a
+# worker imports this module before Django is set up.
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+
+
+def get_parallel_settings(workers=None, chunk_size=None):
+    """Resolve worker count and chunk size from arguments or settings"""
+    workers = workers or getattr(settings, 'PAYROLL_PARALLEL_WORKERS', None) or os.cpu_count() or 1
+    chunk_size = chunk_size or getattr(settings, 'PAYROLL_PARALLEL_CHUNK_SIZE', 500)
+    return max(1, int(workers)), max(1, int(chunk_size))
+
+
+def partition(items, chunk_size):
+    """Split a list into consecutive chunks of at most chunk_size items"""
+    return [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+
+
+def init_worker():
+    """Prepare a worker process: set up Django and drop inherited DB connections"""
+    import django
+    from django.apps import apps
+    from django.db import connections
+
+    if not apps.ready:
+        django.setup()
+
+    # Each worker opens its own connection on first query
+    connections.close_all()
+
+
+def calculate_chunk(organization_id, period_id, employee_ids, backend=None):
+    """
+    Calculate payslips for one chunk of employees inside a worker process
+
+    Returns (employee_ids, results, errors) where results are plain dicts
+    from PayrollProcessor._payslip_to_result. Nothing is written here.
+    """
+    from organization.models import Organization
+    from hrm.models import Employee
+    from .models import PayrollPeriod
+    from .services import PayrollInputs, PayrollProcessor
+
+    organization = Organization.objects.get(id=organization_id)
+    period = PayrollPeriod.objects.get(id=period_id, organization=organization)
+
+    processor = PayrollProcessor(organization, backend=backend)
+    inputs = PayrollInputs(organization, period, employee_ids=employee_ids)
+    employees = Employee.objects.in_bulk(employee_ids)
+
+    payslips, errors = processor.calculate_from_inputs(
+        period,
+        [employees[employee_id] for employee_id in employee_ids if employee_id in employees],
+        inputs
+    )
+    results = [processor._payslip_to_result(payslip) for payslip in payslips]
+
+    return employee_ids, results, errors
+
+
+def _chunk_error(chunk, error):
+    return f"Error calculating {len(chunk)} employees in worker: {str(error)}"
+
+
+def calculate_in_process_pool(organization_id, period_id, employee_ids, workers=None, chunk_size=None,
+                              backend=None):
+    """
+    Calculate all employees in a process pool
+
+    Yields (employee_ids, results, errors) per chunk as chunks finish, so the
+    caller can commit each one in its own transaction. With one worker or a
+    single chunk, chunks are calculated in this process. A chunk that fails
+    is yielded without results and with one error for the whole chunk.
+    """
+    from django.db import connections
+
+    workers, chunk_size = get_parallel_settings(workers, chunk_size)
+    chunks = partition(list(employee_ids), chunk_size)
+
+    if workers == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            try:
+                yield calculate_chunk(organization_id, period_id, chunk, backend)
+            except Exception as e:
+                yield chunk, [], [_chunk_error(chunk, e)]
+        return
+
+    # Forked workers must not share the parent's connection
+    connections.close_all()
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=init_worker) as pool:
+        futures = {
+            pool.submit(calculate_chunk, organization_id, period_id, chunk, backend): chunk
+            for chunk in chunks
+        }
+
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                yield future.result()
+            except Exception as e:
+                yield chunk, [], [_chunk_error(chunk, e)]
@@ -0,0 +1,323 @@
+# payroll/pdf.py - Payslip PDF rendering, single and in batches
+#
+# Batches are rendered in a process pool like 'parallel' payroll runs. Each
+# worker compiles the payslip template once and renders chunks of payslips;
+# the parent writes finished PDFs into a ZIP as they arrive, so only the
+# chunks in flight are held in memory.
+#
+# Rendered PDFs are cached on disk under a hash of everything they show, so a
+# recalculated payslip, renamed employee or rebranded organization gets a
+# new entry and stale ones are never served.
+
+import hashlib
+import os
+import re
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from io import BytesIO
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .parallel import get_parallel_settings, init_worker, partition
+
+PAYSLIP_PDF_TEMPLATE = 'payroll/payslip_pdf.html'
+
+# Bump when rendering changes in a way the template source doesn't show
+PDF_CACHE_VERSION = 1
+
+# Payslip fields that don't change the rendered PDF
+UNRENDERED_PAYSLIP_FIELDS = {
+    'created_at', 'updated_at', 'created_by_id', 'deleted_at',
+    'is_generated', 'generated_at', 'input_hashes',
+}
+
+# Organization fields shown on, or likely to be shown on, payslips
+BRANDING_FIELDS = [
+    'name', 'email', 'phone', 'website', 'address_line1', 'address_line2',
+    'city', 'state', 'postal_code', 'country', 'logo',
+]
+
+# Payslips rendered per worker task
+PDF_CHUNK_SIZE = 25
+
+MARK_GENERATED_BATCH_SIZE = 500
+
+# Template compiled once per process, and the hash of its source
+_template = None
+_template_version = None
+
+
+def _payslip_template():
+    global _template
+    if _template is None:
+        _template = get_template(PAYSLIP_PDF_TEMPLATE)
+    return _template
+
+
+def _payslip_template_version():
+    global _template_version
+    if _template_version is None:
+        with open(_payslip_template().origin.name, 'rb') as source:
+            _template_version = f"{PDF_CACHE_VERSION}-{hashlib.sha1(source.read()).hexdigest()}"
+    return _template_version
+
+
+def render_payslip_pdf(payslip, organization):
+    """Render one payslip; returns (pdf_bytes, error)"""
+    from xhtml2pdf import pisa
+
+    html = _payslip_template().render({'payslip': payslip, 'organization': organization})
+
+    output = BytesIO()
+    pisa_status = pisa.CreatePDF(html, dest=output)
+
+    if pisa_status.err:
+        return None, f"Error generating PDF for {payslip.employee.full_name}"
+    return output.getvalue(), None
+
+
+def payslip_pdf_key(payslip, organization):
+    """
+    Hash of everything a payslip PDF is rendered from: amounts, components,
+    employee and period details, organization branding and template version
+    """
+    from .services import fingerprint
+
+    employee = payslip.employee
+    period = payslip.payroll_period
+
+    return fingerprint({
+        'template': _payslip_template_version(),
+        'payslip': [
+            getattr(payslip, field.attname)
+            for field in payslip._meta.concrete_fields
+            if field.attname not in UNRENDERED_PAYSLIP_FIELDS
+        ],
+        'components': sorted(
+            [
+                component.component_type, component.display_order, component.component_code,
+                component.component_name, component.calculation_type, component.amount,
+            ]
+            for component in payslip.components.all()
+        ),
+        'employee': [
+            employee.employee_id, employee.first_name, employee.last_name,
+            str(employee.designation or ''), str(employee.department or ''),
+        ],
+        'period': [period.name, period.start_date, period.end_date, period.pay_date],
+        'organization': [getattr(organization, field) for field in BRANDING_FIELDS],
+    })
+
+
+def _cache_directory(organization, payslip):
+    return os.path.join(
+        settings.PAYROLL_PRIVATE_ROOT, 'payslip_pdf_cache', str(organization.id), str(payslip.id)
+    )
+
+
+def cached_payslip_pdf(payslip, organization):
+    """
+    Path of a payslip's PDF in the cache, rendering it on a miss
+
+    Returns (path, key, error). The key doubles as the PDF's ETag. Writing a
+    new entry removes the payslip's older ones.
+    """
+    key = payslip_pdf_key(payslip, organization)
+    directory = _cache_directory(organization, payslip)
+    path = os.path.join(directory, f"{key}.pdf")
+
+    if os.path.exists(path):
+        return path, key, None
+
+    pdf, error = render_payslip_pdf(payslip, organization)
+    if error:
+        return None, key, error
+
+    os.makedirs(directory, exist_ok=True)
+
+    # Concurrent renders of one payslip each write a complete file
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'wb') as output:
+        output.write(pdf)
+    os.replace(temp_path, path)
+
+    for name in os.listdir(directory):
+        if name.endswith('.pdf') and name != f"{key}.pdf":
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+    return path, key, None
+
+
+def payslip_pdf_filename(payslip):
+    """Unique, filesystem-safe file name of a payslip inside an archive"""
+    name = re.sub(r'[^\w.-]+', '_', f"{payslip.employee.employee_id}_{payslip.employee.full_name}")
+    return f"Payslip_{name}.pdf"
+
+
+def render_chunk(organization_id, payslip_ids):
+    """
+    Render one chunk of payslips, inside a worker process or inline
+
+    Returns [(payslip_id, filename, pdf_bytes, error)] in payslip_ids order.
+    """
+    from organization.models import Organization
+    from .models import Payslip
+
+    organization = Organization.objects.get(id=organization_id)
+    payslips = Payslip.objects.filter(
+        organization=organization,
+        id__in=payslip_ids
+    ).select_related(
+        'employee', 'employee__designation', 'employee__department', 'payroll_period'
+    ).prefetch_related('components').in_bulk()
+
+    rendered = []
+    for payslip_id in payslip_ids:
+        payslip = payslips.get(payslip_id)
+        if payslip is None:
+            rendered.append((payslip_id, None, None, f"Payslip {payslip_id} not found"))
+            continue
+
+        try:
+            pdf = None
+            path, _, error = cached_payslip_pdf(payslip, organization)
+            if path:
+                with open(path, 'rb') as cached:
+                    pdf = cached.read()
+        except Exception as e:
+            pdf, error = None, f"Error generating PDF for {payslip.employee.full_name}: {str(e)}"
+        rendered.append((payslip_id, payslip_pdf_filename(payslip), pdf, error))
+
+    return rendered
+
+
+def render_payslip_pdfs(organization, payslip_ids, workers=None, chunk_size=None):
+    """
+    Render payslips, yielding (payslip_id, filename, pdf_bytes, error) as chunks finish
+
+    workers defaults to PAYROLL_PARALLEL_WORKERS. With one worker or a single
+    chunk, payslips are rendered in this process. At most two chunks per
+    worker are in flight.
+    """
+    from django.db import connections
+
+    workers, _ = get_parallel_settings(workers)
+    chunks = partition(list(payslip_ids), chunk_size or PDF_CHUNK_SIZE)
+
+    if workers == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from render_chunk(organization.id, chunk)
+        return
+
+    # Forked workers must not share the parent's connection
+    connections.close_all()
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=init_worker) as pool:
+        pending_chunks = iter(chunks)
+        futures = {}
+
+        def submit_next():
+            chunk = next(pending_chunks, None)
+            if chunk is not None:
+                futures[pool.submit(render_chunk, organization.id, chunk)] = chunk
+
+        for _ in range(workers * 2):
+            submit_next()
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = futures.pop(future)
+                submit_next()
+                try:
+                    yield from future.result()
+                except Exception as e:
+                    for payslip_id in chunk:
+                        yield payslip_id, None, None, f"Error rendering payslip {payslip_id} in worker: {str(e)}"
+
+
+def mark_generated(organization, payslip_ids):
+    """Flag rendered payslips as generated"""
+    from .models import Payslip
+
+    now = timezone.now()
+    payslip_ids = list(payslip_ids)
+    for start in range(0, len(payslip_ids), MARK_GENERATED_BATCH_SIZE):
+        Payslip.objects.filter(
+            organization=organization,
+            id__in=payslip_ids[start:start + MARK_GENERATED_BATCH_SIZE]
+        ).update(is_generated=True, generated_at=now)
+
+
+class _StreamBuffer:
+    """Write-only file object collecting what ZipFile writes between reads"""
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read_written(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_payslips_zip(organization, payslip_ids, workers=None, chunk_size=None):
+    """
+    Render payslips into a ZIP archive, yielding the archive in pieces
+
+    Usable as a StreamingHttpResponse body or written to a file. PDFs that
+    fail to render are listed in errors.txt inside the archive. Rendered
+    payslips are marked generated once the archive is complete.
+    """
+    buffer = _StreamBuffer()
+    rendered_ids = []
+    errors = []
+
+    # PDF streams are already compressed
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for payslip_id, filename, pdf, error in render_payslip_pdfs(
+            organization, payslip_ids, workers=workers, chunk_size=chunk_size
+        ):
+            if error:
+                errors.append(error)
+                continue
+
+            archive.writestr(filename, pdf)
+            rendered_ids.append(payslip_id)
+            yield buffer.read_written()
+
+        if errors:
+            archive.writestr('errors.txt', '\n'.join(errors) + '\n')
+
+    yield buffer.read_written()
+
+    mark_generated(organization, rendered_ids)
+
+
+def export_payslips_zip(organization, payslip_ids, path, workers=None, chunk_size=None):
+    """Write the payslip ZIP archive to path; returns its size in bytes"""
+    size = 0
+    with open(path, 'wb') as output:
+        for data in stream_payslips_zip(organization, payslip_ids, workers=workers, chunk_size=chunk_size):
+            output.write(data)
+            size += len(data)
+    return size
+
+
+def default_export_path(period):
+    """PAYROLL_PRIVATE_ROOT/payslip_exports/<organization slug>/payslips_<period id>.zip"""
+    return os.path.join(
+        settings.PAYROLL_PRIVATE_ROOT, 'payslip_exports', period.organization.slug, f"payslips_{period.id}.zip"
+    )
@@ -0,0 +1,248 @@
+# payroll/plans.py - Payhead rules compiled once per organization and period
+#
+# A PayheadPlan turns payheads into PayheadRule objects: override resolution,
+# limits and the formula for the calculation type are decided at compile time,
+# so evaluating an employee is a loop over rules with no string branching.
+# Amounts are identical to PayrollProcessor's org payhead calculation and to
+# EmployeePayhead.get_effective_amount.
+
+from decimal import Decimal
+
+from django.utils import timezone
+
+from hrm.models import Payhead
+
+PAYHEAD_TYPES = ['earning', 'deduction']
+
+HUNDRED = Decimal('100')
+ZERO_AMOUNT = Decimal('0.00')
+
+# Production units are not tracked yet; payroll always evaluates with none
+NO_PRODUCTION_UNITS = Decimal('0')
+
+
+def _fixed(value, basic_salary, working_hours, overtime_hours):
+    return value
+
+
+def _percentage_of_basic(value, basic_salary, working_hours, overtime_hours):
+    return (basic_salary * value) / HUNDRED
+
+
+def _per_working_hour(value, basic_salary, working_hours, overtime_hours):
+    return value * working_hours
+
+
+def _per_overtime_hour(value, basic_salary, working_hours, overtime_hours):
+    return value * overtime_hours
+
+
+def _per_production_unit(value, basic_salary, working_hours, overtime_hours):
+    return value * NO_PRODUCTION_UNITS
+
+
+def _zero(value, basic_salary, working_hours, overtime_hours):
+    return ZERO_AMOUNT
+
+
+# Formula of each rule by name, for backends that evaluate rules themselves
+FORMULA_KINDS = {
+    _fixed: 'fixed',
+    _percentage_of_basic: 'percentage_of_basic',
+    _per_working_hour: 'per_working_hour',
+    _per_overtime_hour: 'per_overtime_hour',
+    _per_production_unit: 'per_production_unit',
+    _zero: 'zero',
+}
+
+
+def _limit(value):
+    """Limits of 0 mean 'no limit'"""
+    return value if value > 0 else None
+
+
+def _override(employee_value, payhead_value):
+    """Employee payhead values of 0 fall back to the payhead default"""
+    return employee_value if employee_value > 0 else payhead_value
+
+
+class PayheadRule:
+    """One compiled payhead: formula, resolved value and limits"""
+    __slots__ = (
+        'payhead_id', 'code', 'name', 'calculation_type',
+        'formula', 'value', 'min_amount', 'max_amount', 'rounded',
+    )
+
+    def __init__(self, payhead, formula, value=None, min_amount=None, max_amount=None, rounded=False):
+        self.payhead_id = payhead.id
+        self.code = payhead.code
+        self.name = payhead.name
+        self.calculation_type = payhead.calculation_type
+        self.formula = formula
+        self.value = value
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.rounded = rounded
+
+    @property
+    def kind(self):
+        return FORMULA_KINDS[self.formula]
+
+    def evaluate(self, basic_salary, working_hours, overtime_hours):
+        amount = self.formula(self.value, basic_salary, working_hours, overtime_hours)
+
+        if self.min_amount is not None:
+            amount = max(amount, self.min_amount)
+        if self.max_amount is not None:
+            amount = min(amount, self.max_amount)
+
+        if self.rounded:
+            amount = round(amount, 2)
+
+        return amount
+
+
+def compile_payhead(payhead):
+    """Compile an organization payhead, applied to employees without an override"""
+    calculation_type = payhead.calculation_type
+
+    if calculation_type == 'fixed':
+        formula, value = _fixed, payhead.amount
+    elif calculation_type == 'percentage':
+        formula, value = _percentage_of_basic, payhead.percentage
+    elif calculation_type == 'attendance':
+        formula, value = _per_working_hour, payhead.attendance_rate_per_hour
+    elif calculation_type == 'overtime':
+        formula, value = _per_overtime_hour, payhead.overtime_rate_per_hour
+    else:
+        formula, value = _zero, None
+
+    return PayheadRule(
+        payhead, formula, value,
+        min_amount=_limit(payhead.min_amount),
+        max_amount=_limit(payhead.max_amount),
+        rounded=True
+    )
+
+
+def compile_employee_payhead(employee_payhead):
+    """Compile an employee payhead, resolving each value against its payhead's default"""
+    payhead = employee_payhead.payhead
+
+    if not employee_payhead.is_effective:
+        return PayheadRule(payhead, _zero)
+
+    calculation_type = payhead.calculation_type
+
+    if calculation_type == 'fixed':
+        formula = _fixed
+        value = _override(employee_payhead.amount, payhead.amount)
+    elif calculation_type == 'percentage':
+        formula = _percentage_of_basic
+        value = _override(employee_payhead.percentage, payhead.percentage)
+    elif calculation_type == 'attendance':
+        formula = _per_working_hour
+        value = _override(employee_payhead.attendance_rate_per_hour, payhead.attendance_rate_per_hour)
+    elif calculation_type == 'overtime':
+        formula = _per_overtime_hour
+        value = _override(employee_payhead.overtime_rate_per_hour, payhead.overtime_rate_per_hour)
+    elif calculation_type == 'production':
+        formula = _per_production_unit
+        value = _override(employee_payhead.production_rate_per_unit, payhead.production_rate_per_unit)
+    else:
+        formula, value = _zero, None
+
+    return PayheadRule(
+        payhead, formula, value,
+        min_amount=_limit(_override(employee_payhead.min_amount, payhead.min_amount)),
+        max_amount=_limit(_override(employee_payhead.max_amount, payhead.max_amount))
+    )
+
+
+class PayheadPlan:
+    """
+    Compiled payheads of one organization for one payroll period
+
+    Organization payheads are compiled up front; employee payheads are
+    compiled on first use and cached by id, so a plan can be shared by a
+    whole payroll run, single-employee recalculations and what-if
+    simulations. Build a new plan after payheads change.
+
+    Whether an employee payhead is effective depends on today's date, so
+    the cached employee rules are dropped when the date changes.
+    """
+    def __init__(self, organization, period, org_payheads):
+        """org_payheads: {'earning': [...], 'deduction': [...]} active payheads in display order"""
+        self.organization = organization
+        self.period = period
+        self.compiled_on = timezone.now().date()
+
+        self.org_rules = {
+            payhead_type: [compile_payhead(payhead) for payhead in org_payheads.get(payhead_type, [])]
+            for payhead_type in PAYHEAD_TYPES
+        }
+        self.basic_payhead = next(
+            (
+                payhead
+                for payhead_type in PAYHEAD_TYPES
+                for payhead in org_payheads.get(payhead_type, [])
+                if payhead.code == 'BASIC'
+            ),
+            None
+        )
+        self._employee_rules = {}
+
+    @classmethod
+    def for_period(cls, organization, period):
+        """Load active organization payheads and compile them"""
+        org_payheads = {payhead_type: [] for payhead_type in PAYHEAD_TYPES}
+
+        for payhead in Payhead.objects.filter(
+            organization=organization,
+            is_active=True
+        ).order_by('display_order', 'id'):
+            if payhead.payhead_type in org_payheads:
+                org_payheads[payhead.payhead_type].append(payhead)
+
+        return cls(organization, period, org_payheads)
+
+    def employee_rule(self, employee_payhead):
+        """Compiled rule for an employee payhead; unsaved ones are not cached"""
+        if employee_payhead.pk is None:
+            return compile_employee_payhead(employee_payhead)
+
+        today = timezone.now().date()
+        if today != self.compiled_on:
+            self._employee_rules = {}
+            self.compiled_on = today
+
+        rule = self._employee_rules.get(employee_payhead.pk)
+        if rule is None:
+            rule = self._employee_rules[employee_payhead.pk] = compile_employee_payhead(employee_payhead)
+        return rule
+
+    def rules_for(self, payhead_type, employee_payheads):
+        """Employee payhead rules, then organization rules they don't override"""
+        employee_rules = [self.employee_rule(employee_payhead) for employee_payhead in employee_payheads]
+        overridden_codes = {rule.code for rule in employee_rules}
+
+        return employee_rules + [
+            rule for rule in self.org_rules[payhead_type]
+            if rule.code not in overridden_codes
+        ]
+
+    def evaluate(self, payhead_type, employee_payheads, basic_salary, attendance_data):
+        """Payhead breakdown of one type for one employee"""
+        working_hours = Decimal(str(attendance_data.get('total_working_hours', 0)))
+        overtime_hours = Decimal(str(attendance_data.get('total_overtime_hours', 0)))
+
+        return [
+            {
+                'payhead_id': rule.payhead_id,
+                'payhead_code': rule.code,
+                'payhead_name': rule.name,
+                'calculation_type': rule.calculation_type,
+                'amount': rule.evaluate(basic_salary, working_hours, overtime_hours),
+            }
+            for rule in self.rules_for(payhead_type, employee_payheads)
+        ]
@@ -1,116 +1,403 @@
 # payroll/services.py - Updated to work with your existing Payslip model
 
+import hashlib
+import json
+from django.conf import settings
 from django.utils import timezone
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 from django.db import transaction
-from hrm.models import Employee, AttendanceRecord, EmployeePayhead
+from hrm.models import Employee, EmployeePayhead
+from hrm.rollup import attendance_totals, empty_totals
 from .models import (
     PayrollPeriod, Payslip, SalaryStructure, 
     Payhead,  PayslipComponent
 )
 from django.db.models import Sum, Count, Q
+from collections import defaultdict
+from .components import sync_payslip_components
+from .plans import PayheadPlan
+
+
+RUN_MODES = ['standard', 'bulk', 'parallel', 'incremental']
+
+# Engines for calculating payslips from PayrollInputs
+CALCULATION_BACKENDS = ['decimal', 'numpy']
+
+# hrm.rollup day counts of the statuses that count as a worked day
+PRESENT_DAY_FIELDS = ['present_days', 'late_days', 'half_days']
+
+# Payslip fields written by a payroll run
+PAYSLIP_CALCULATED_FIELDS = [
+    'salary_structure', 'basic_salary', 'allowances', 'overtime_pay', 'bonus',
+    'other_earnings', 'provident_fund', 'tax_deduction', 'late_attendance_deduction',
+    'other_deductions', 'gross_salary', 'total_deductions', 'net_salary', 'input_hashes',
+]
+
+BULK_BATCH_SIZE = 500
+
+# Input groups fingerprinted on each payslip, compared by incremental runs
+INPUT_HASH_GROUPS = ['employee_payheads', 'org_payheads', 'attendance', 'salary_structure']
+
+# Payhead / employee payhead fields a what-if simulation may override
+SIMULATION_FIELDS = [
+    'amount', 'percentage', 'attendance_rate_per_hour', 'overtime_rate_per_hour',
+    'production_rate_per_unit', 'min_amount', 'max_amount', 'is_active',
+]
+
+# Payslip totals compared by simulations
+SIMULATION_TOTAL_FIELDS = ['gross_salary', 'total_deductions', 'net_salary']
+
+# Bookkeeping fields that never affect a calculation
+UNHASHED_FIELDS = {'created_at', 'updated_at', 'created_by_id', 'modified_by_id'}
+
+
+def _hash_default(value):
+    if isinstance(value, Decimal):
+        # 50000, 50000.0 and 50000.00 hash the same
+        return str(value.normalize())
+    return str(value)
+
+
+def fingerprint(value):
+    """Stable hash of plain values, Decimals and dates"""
+    encoded = json.dumps(value, default=_hash_default, sort_keys=True)
+    return hashlib.sha1(encoded.encode()).hexdigest()
+
+
+def _field_values(instance):
+    return [
+        getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+        if field.attname not in UNHASHED_FIELDS
+    ]
+
+
+class PayrollInputs:
+    """
+    Everything a payroll run reads for one organization and period,
+    loaded in a constant number of queries regardless of employee count
+    
+    track_changes=False skips input hashes, for calculations that are never saved.
+    """
+    def __init__(self, organization, period, employee_ids=None, track_changes=True):
+        self.organization = organization
+        self.period = period
+        self.employee_ids = list(employee_ids) if employee_ids is not None else None
+        self.track_changes = track_changes
+        
+        self.employee_payheads = defaultdict(list)
+        self.basic_employee_payheads = {}
+        self.org_payheads = {'earning': [], 'deduction': []}
+        self.basic_payhead = None
+        self.salary_structures = {}
+        self.attendance_totals = {}
+        self._org_payheads_hash = None
+        self._payhead_hashes = {}
+        
+        self._load()
+    
+    def _for_employees(self, queryset):
+        """Restrict a queryset to the requested employees, if any"""
+        if self.employee_ids is None:
+            return queryset
+        return queryset.filter(employee_id__in=self.employee_ids)
+    
+    def _load(self):
+        organization = self.organization
+        period = self.period
+        
+        # Effective employee payheads of every type, in per-employee display order
+        employee_payheads = self._for_employees(EmployeePayhead.objects).filter(
+            organization=organization,
+            payhead__is_active=True,
+            is_active=True,
+            effective_from__lte=period.end_date
+        ).filter(
+            Q(effective_to__isnull=True) | Q(effective_to__gte=period.start_date)
+        ).select_related('payhead').order_by('employee_id', 'payhead__display_order', 'id')
+        
+        for employee_payhead in employee_payheads:
+            employee_id = employee_payhead.employee_id
+            self.employee_payheads[employee_id].append(employee_payhead)
+            
+            # Latest BASIC assignment wins
+            if employee_payhead.payhead.code == 'BASIC':
+                current = self.basic_employee_payheads.get(employee_id)
+                if current is None or employee_payhead.effective_from > current.effective_from:
+                    self.basic_employee_payheads[employee_id] = employee_payhead
+        
+        # Organization payheads
+        for payhead in Payhead.objects.filter(
+            organization=organization,
+            is_active=True
+        ).order_by('display_order', 'id'):
+            if payhead.payhead_type in self.org_payheads:
+                self.org_payheads[payhead.payhead_type].append(payhead)
+            if payhead.code == 'BASIC' and self.basic_payhead is None:
+                self.basic_payhead = payhead
+        
+        self.plan = PayheadPlan(organization, period, self.org_payheads)
+        
+        # Latest active salary structure per employee
+        salary_structures = self._for_employees(SalaryStructure.objects).filter(
+            employee__organization=organization,
+            effective_date__lte=period.end_date,
+            is_active=True
+        ).order_by('employee_id', '-effective_date', '-id')
+        
+        for salary_structure in salary_structures:
+            self.salary_structures.setdefault(salary_structure.employee_id, salary_structure)
+        
+        # Attendance totals for the period per employee, from the monthly rollup
+        self.attendance_totals = attendance_totals(
+            organization, period.start_date, period.end_date, self.employee_ids
+        )
+    
+    def apply_overrides(self, payhead_overrides=None, employee_payhead_overrides=None):
+        """
+        Apply hypothetical values to the loaded payheads and employee payheads
+        in memory and recompile the plan. Nothing is saved.
+        
+        Overrides map ids to {field: value} for SIMULATION_FIELDS; amounts are
+        rounded to cents as saving them would. is_active=False drops a payhead
+        or assignment. Raises ValueError for unknown ids, fields or values.
+        """
+        payheads = defaultdict(list)
+        for payhead in self.org_payheads['earning'] + self.org_payheads['deduction']:
+            payheads[payhead.id].append(payhead)
+        
+        employee_payheads = {}
+        for employee_payhead_list in self.employee_payheads.values():
+            for employee_payhead in employee_payhead_list:
+                employee_payheads[employee_payhead.id] = employee_payhead
+                # select_related gives every assignment its own Payhead instance
+                payheads[employee_payhead.payhead_id].append(employee_payhead.payhead)
+        
+        for payhead_id, values in (payhead_overrides or {}).items():
+            instances = payheads.get(self._override_id(payhead_id))
+            if not instances:
+                raise ValueError(f"Payhead {payhead_id} is not an active payhead of this organization")
+            for instance in instances:
+                self._apply_values(instance, values)
+        
+        for employee_payhead_id, values in (employee_payhead_overrides or {}).items():
+            employee_payhead = employee_payheads.get(self._override_id(employee_payhead_id))
+            if employee_payhead is None:
+                raise ValueError(
+                    f"Employee payhead {employee_payhead_id} is not assigned for this payroll period"
+                )
+            self._apply_values(employee_payhead, values)
+        
+        # Re-derive everything computed from the payheads
+        for payhead_type, payhead_list in self.org_payheads.items():
+            self.org_payheads[payhead_type] = [payhead for payhead in payhead_list if payhead.is_active]
+        
+        self.basic_payhead = next(
+            (
+                payhead for payhead in self.org_payheads['earning'] + self.org_payheads['deduction']
+                if payhead.code == 'BASIC'
+            ),
+            None
+        )
+        
+        self.basic_employee_payheads = {}
+        for employee_id, employee_payhead_list in self.employee_payheads.items():
+            employee_payhead_list[:] = [
+                employee_payhead for employee_payhead in employee_payhead_list
+                if employee_payhead.is_active and employee_payhead.payhead.is_active
+            ]
+            for employee_payhead in employee_payhead_list:
+                if employee_payhead.payhead.code == 'BASIC':
+                    current = self.basic_employee_payheads.get(employee_id)
+                    if current is None or employee_payhead.effective_from > current.effective_from:
+                        self.basic_employee_payheads[employee_id] = employee_payhead
+        
+        self.plan = PayheadPlan(self.organization, self.period, self.org_payheads)
+        self._org_payheads_hash = None
+        self._payhead_hashes = {}
+    
+    @staticmethod
+    def _override_id(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid id: {value}")
+    
+    @staticmethod
+    def _apply_values(instance, values):
+        for field, value in values.items():
+            if field not in SIMULATION_FIELDS:
+                raise ValueError(f"{field} cannot be simulated")
+            
+            if field == 'is_active':
+                if not isinstance(value, bool):
+                    raise ValueError("is_active must be true or false")
+            else:
+                try:
+                    value = Decimal(str(value)).quantize(Decimal('0.01'))
+                except InvalidOperation:
+                    raise ValueError(f"Invalid value for {field}: {value}")
+                if value < 0:
+                    raise ValueError(f"{field} cannot be negative")
+            
+            setattr(instance, field, value)
+    
+    def employee_payheads_for(self, employee_id, payhead_type):
+        """Effective employee payheads of one type, in display order"""
+        return [
+            employee_payhead for employee_payhead in self.employee_payheads.get(employee_id, [])
+            if employee_payhead.payhead.payhead_type == payhead_type
+        ]
+    
+    def _payhead_hash(self, payhead):
+        payhead_hash = self._payhead_hashes.get(payhead.id)
+        if payhead_hash is None:
+            payhead_hash = self._payhead_hashes[payhead.id] = fingerprint(_field_values(payhead))
+        return payhead_hash
+    
+    @staticmethod
+    def salary_structure_hash(salary_structure):
+        if salary_structure is None:
+            return fingerprint(None)
+        return fingerprint([salary_structure.id, salary_structure.basic_salary])
+    
+    def input_hashes(self, employee_id, attendance_data):
+        """
+        Fingerprints of everything one employee's payslip is calculated from,
+        keyed by INPUT_HASH_GROUPS; empty when changes are not tracked
+        """
+        if not self.track_changes:
+            return {}
+        
+        if self._org_payheads_hash is None:
+            self._org_payheads_hash = fingerprint([
+                _field_values(payhead)
+                for payhead in self.org_payheads['earning'] + self.org_payheads['deduction']
+            ])
+        
+        return {
+            # is_effective depends on today's date, so it is part of the input
+            'employee_payheads': fingerprint([
+                _field_values(employee_payhead)
+                + [self._payhead_hash(employee_payhead.payhead), employee_payhead.is_effective]
+                for employee_payhead in self.employee_payheads.get(employee_id, [])
+            ]),
+            'org_payheads': self._org_payheads_hash,
+            'attendance': fingerprint(attendance_data),
+            'salary_structure': self.salary_structure_hash(self.salary_structures.get(employee_id)),
+        }
 
 
 class PayrollProcessor:
-    def __init__(self, organization):
+    def __init__(self, organization, progress_callback=None, backend=None):
         self.organization = organization
+        # Used by the bulk, parallel and incremental modes; defaults to PAYROLL_CALCULATION_BACKEND
+        self.backend = backend or getattr(settings, 'PAYROLL_CALCULATION_BACKEND', 'decimal')
+        # Called as progress_callback(processed=..., total=..., errors=[...]) during runs
+        self.progress_callback = progress_callback
+        self._progress_total = 0
+        # Per-group change counts of the last incremental run
+        self._change_summary = None
+        # Compiled payhead plans by period id
+        self._plans = {}
+        # Employees whose payslip was saved by the current run
+        self._saved_employee_ids = set()
+    
+    def _report_progress(self, processed, errors):
+        """Forward run progress to the progress callback, if any"""
+        if self.progress_callback:
+            self.progress_callback(processed=processed, total=self._progress_total, errors=errors)
+    
+    def get_payhead_plan(self, period):
+        """Compiled payhead plan for a period, built once per processor"""
+        plan = self._plans.get(period.id)
+        if plan is None:
+            plan = self._plans[period.id] = PayheadPlan.for_period(self.organization, period)
+        return plan
     
-    def calculate_employee_salary(self, employee, period):
-        """Calculate salary for a single employee using Payhead system"""
+    def calculate_employee_salary(self, employee, period, inputs=None, plan=None):
+        """
+        Calculate salary for a single employee using Payhead system
+        
+        When prefetched PayrollInputs are given, nothing is queried and a
+        missing salary structure is left for the caller to create.
+        plan defaults to the inputs' plan or get_payhead_plan(period).
+        """
+        if inputs is not None:
+            return self._calculate_employee_salary_from_inputs(employee, period, inputs, plan)
+        
         try:
+            plan = plan or self.get_payhead_plan(period)
+            
             # Get attendance data
             attendance_data = self._calculate_attendance_data(employee, period)
             
             # Get base salary (basic)
-            basic_salary = self._get_basic_salary(employee, period)
+            basic_salary = self._get_basic_salary(employee, period, plan)
             
             if not basic_salary or basic_salary <= 0:
                 return None, f"No basic salary configured for {employee.full_name}"
             
             # Calculate earnings and deductions using payheads
             earnings_breakdown = self._calculate_earnings(
-                employee, period, basic_salary, attendance_data
+                employee, period, basic_salary, attendance_data, plan
             )
             
             deduction_breakdown = self._calculate_deductions(
-                employee, period, basic_salary, attendance_data
+                employee, period, basic_salary, attendance_data, plan
             )
             
-            # Calculate summary fields for existing Payslip model
-            basic_amount = Decimal('0.00')
-            allowances_amount = Decimal('0.00')
-            overtime_amount = Decimal('0.00')
-            pf_amount = Decimal('0.00')
-            tax_amount = Decimal('0.00')
-            late_deduction_amount = Decimal('0.00')
-            other_earnings_amount = Decimal('0.00')
-            other_deductions_amount = Decimal('0.00')
-            
-            # Categorize earnings
-            for earning in earnings_breakdown:
-                code = earning['payhead_code']
-                amount = earning['amount']
-                
-                if code == 'BASIC':
-                    basic_amount = amount
-                elif code == 'OT':
-                    overtime_amount = amount
-                elif code in ['HRA', 'TA', 'MA', 'SA']:
-                    allowances_amount += amount
-                else:
-                    other_earnings_amount += amount
-            
-            # Categorize deductions
-            for deduction in deduction_breakdown:
-                code = deduction['payhead_code']
-                amount = deduction['amount']
-                
-                if code == 'PF':
-                    pf_amount = amount
-                elif code in ['TDS', 'TAX']:
-                    tax_amount = amount
-                elif code == 'LATE':
-                    late_deduction_amount = amount
-                else:
-                    other_deductions_amount += amount
-            
-            # Calculate totals
-            total_earnings = sum(e['amount'] for e in earnings_breakdown)
-            total_deductions = sum(d['amount'] for d in deduction_breakdown)
-            net_salary = total_earnings - total_deductions
+            summary = self._summarize_breakdown(earnings_breakdown, deduction_breakdown)
             
             # Get or create salary structure
             salary_structure = self._get_or_create_salary_structure(
-                employee, period, basic_amount
+                employee, period, summary['basic_salary']
             )
             
-            # Create payslip with existing model fields
-            payslip = Payslip(
-                organization=self.organization,
-                employee=employee,
-                payroll_period=period,
-                salary_structure=salary_structure,
-                # Earnings
-                basic_salary=basic_amount,
-                allowances=allowances_amount,
-                overtime_pay=overtime_amount,
-                bonus=Decimal('0.00'),
-                other_earnings=other_earnings_amount,
-                # Deductions
-                provident_fund=pf_amount,
-                tax_deduction=tax_amount,
-                late_attendance_deduction=late_deduction_amount,
-                other_deductions=other_deductions_amount,
-                # Totals
-                gross_salary=total_earnings,
-                total_deductions=total_deductions,
-                net_salary=net_salary,
-                created_by=period.created_by
+            payslip = self._build_payslip(
+                employee, period, salary_structure, summary,
+                earnings_breakdown, deduction_breakdown
             )
             
-            # Store detailed breakdown for saving later
-            payslip._earnings_breakdown = earnings_breakdown
-            payslip._deduction_breakdown = deduction_breakdown
+            return payslip, None
+            
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return None, f"Error calculating salary for {employee.full_name}: {str(e)}"
+    
+    def _calculate_employee_salary_from_inputs(self, employee, period, inputs, plan=None):
+        """Calculate salary for a single employee from prefetched PayrollInputs"""
+        try:
+            plan = plan or inputs.plan
+            attendance_data = self._summarize_attendance(inputs.attendance_totals.get(employee.id))
+            
+            basic_salary = self._select_basic_salary(
+                inputs.basic_employee_payheads.get(employee.id),
+                inputs.basic_payhead,
+                inputs.salary_structures.get(employee.id)
+            )
+            
+            if not basic_salary or basic_salary <= 0:
+                return None, f"No basic salary configured for {employee.full_name}"
+            
+            earnings_breakdown = plan.evaluate(
+                'earning', inputs.employee_payheads_for(employee.id, 'earning'),
+                basic_salary, attendance_data
+            )
+            
+            deduction_breakdown = plan.evaluate(
+                'deduction', inputs.employee_payheads_for(employee.id, 'deduction'),
+                basic_salary, attendance_data
+            )
+            
+            summary = self._summarize_breakdown(earnings_breakdown, deduction_breakdown)
+            
+            payslip = self._build_payslip(
+                employee, period, inputs.salary_structures.get(employee.id), summary,
+                earnings_breakdown, deduction_breakdown
+            )
+            payslip.input_hashes = inputs.input_hashes(employee.id, attendance_data)
             
             return payslip, None
             
@@ -119,7 +406,83 @@ class PayrollProcessor:
             traceback.print_exc()
             return None, f"Error calculating salary for {employee.full_name}: {str(e)}"
     
-    def _get_basic_salary(self, employee, period):
+    def _summarize_breakdown(self, earnings_breakdown, deduction_breakdown):
+        """Roll payhead breakdown up into the summary fields of the Payslip model"""
+        basic_amount = Decimal('0.00')
+        allowances_amount = Decimal('0.00')
+        overtime_amount = Decimal('0.00')
+        pf_amount = Decimal('0.00')
+        tax_amount = Decimal('0.00')
+        late_deduction_amount = Decimal('0.00')
+        other_earnings_amount = Decimal('0.00')
+        other_deductions_amount = Decimal('0.00')
+        
+        # Categorize earnings
+        for earning in earnings_breakdown:
+            code = earning['payhead_code']
+            amount = earning['amount']
+            
+            if code == 'BASIC':
+                basic_amount = amount
+            elif code == 'OT':
+                overtime_amount = amount
+            elif code in ['HRA', 'TA', 'MA', 'SA']:
+                allowances_amount += amount
+            else:
+                other_earnings_amount += amount
+        
+        # Categorize deductions
+        for deduction in deduction_breakdown:
+            code = deduction['payhead_code']
+            amount = deduction['amount']
+            
+            if code == 'PF':
+                pf_amount = amount
+            elif code in ['TDS', 'TAX']:
+                tax_amount = amount
+            elif code == 'LATE':
+                late_deduction_amount = amount
+            else:
+                other_deductions_amount += amount
+        
+        # Calculate totals
+        total_earnings = sum(e['amount'] for e in earnings_breakdown)
+        total_deductions = sum(d['amount'] for d in deduction_breakdown)
+        
+        return {
+            'basic_salary': basic_amount,
+            'allowances': allowances_amount,
+            'overtime_pay': overtime_amount,
+            'other_earnings': other_earnings_amount,
+            'provident_fund': pf_amount,
+            'tax_deduction': tax_amount,
+            'late_attendance_deduction': late_deduction_amount,
+            'other_deductions': other_deductions_amount,
+            'gross_salary': total_earnings,
+            'total_deductions': total_deductions,
+            'net_salary': total_earnings - total_deductions,
+        }
+    
+    def _build_payslip(self, employee, period, salary_structure, summary,
+                       earnings_breakdown, deduction_breakdown):
+        """Build an unsaved payslip from summary fields and payhead breakdown"""
+        payslip = Payslip(
+            organization=self.organization,
+            employee=employee,
+            payroll_period=period,
+            salary_structure=salary_structure,
+            bonus=Decimal('0.00'),
+            created_by=period.created_by,
+            **summary
+        )
+        
+        # Store detailed breakdown for saving later
+        payslip._earnings_breakdown = earnings_breakdown
+        payslip._deduction_breakdown = deduction_breakdown
+        
+        return payslip
+    
+    def _get_basic_salary(self, employee, period, plan):
         """Get basic salary from employee payheads or organization default"""
         try:
             # Check employee-specific payhead
@@ -134,203 +497,84 @@ class PayrollProcessor:
                 Q(effective_to__isnull=True) | Q(effective_to__gte=period.start_date)
             ).order_by('-effective_from').first()
             
-            if employee_payhead and employee_payhead.amount > 0:
-                return employee_payhead.amount
-            
             # Check organization payhead
-            basic_payhead = Payhead.objects.filter(
-                organization=self.organization,
-                code='BASIC',
-                is_active=True
-            ).first()
-            
-            if basic_payhead and basic_payhead.amount > 0:
-                return basic_payhead.amount
+            basic_payhead = plan.basic_payhead
             
             # Fallback to salary structure
             salary_structure = SalaryStructure.objects.filter(
                 employee=employee,
                 effective_date__lte=period.end_date,
                 is_active=True
-            ).order_by('-effective_date').first()
+            ).order_by('-effective_date', '-id').first()
             
-            if salary_structure:
-                return salary_structure.basic_salary
-            
-            return Decimal('0.00')
+            return self._select_basic_salary(employee_payhead, basic_payhead, salary_structure)
             
         except Exception as e:
             print(f"Error getting basic salary: {str(e)}")
             return Decimal('0.00')
     
-    def _calculate_earnings(self, employee, period, basic_salary, attendance_data):
+    def _select_basic_salary(self, employee_payhead, basic_payhead, salary_structure):
+        """Pick basic salary: employee payhead, then organization payhead, then salary structure"""
+        if employee_payhead and employee_payhead.amount > 0:
+            return employee_payhead.amount
+        
+        if basic_payhead and basic_payhead.amount > 0:
+            return basic_payhead.amount
+        
+        if salary_structure:
+            return salary_structure.basic_salary
+        
+        return Decimal('0.00')
+    
+    def _calculate_earnings(self, employee, period, basic_salary, attendance_data, plan):
         """Calculate all earning components — merge employee + organization payheads"""
-        earnings = []
-
-        # Employee-specific earning payheads
-        employee_payheads = EmployeePayhead.objects.filter(
-            organization=self.organization,
-            employee=employee,
-            payhead__payhead_type='earning',
-            payhead__is_active=True,
-            is_active=True,
-            effective_from__lte=period.end_date
-        ).filter(
-            Q(effective_to__isnull=True) | Q(effective_to__gte=period.start_date)
-        ).select_related('payhead').order_by('payhead__display_order')
-
-        emp_payhead_codes = [ep.payhead.code for ep in employee_payheads]
-
-        # Always get all org-level earning payheads
-        org_payheads = Payhead.objects.filter(
-            organization=self.organization,
-            payhead_type='earning',
-            is_active=True
-        ).order_by('display_order')
-
-        # 1️⃣ Employee-specific payheads (override)
-        for emp_payhead in employee_payheads:
-            amount = emp_payhead.get_effective_amount(
-                base_amount=basic_salary,
-                attendance_hours=attendance_data.get('total_working_hours', 0),
-                overtime_hours=attendance_data.get('total_overtime_hours', 0),
-                production_units=0
-            )
-            earnings.append({
-                'payhead_id': emp_payhead.payhead.id,
-                'payhead_code': emp_payhead.payhead.code,
-                'payhead_name': emp_payhead.payhead.name,
-                'calculation_type': emp_payhead.payhead.calculation_type,
-                'amount': amount
-            })
-
-        # 2️⃣ Add missing org-level earning payheads (not defined for employee)
-        for payhead in org_payheads:
-            if payhead.code not in emp_payhead_codes:
-                amount = self._calculate_payhead_amount(
-                    payhead, None, basic_salary, attendance_data
-                )
-                earnings.append({
-                    'payhead_id': payhead.id,
-                    'payhead_code': payhead.code,
-                    'payhead_name': payhead.name,
-                    'calculation_type': payhead.calculation_type,
-                    'amount': amount
-                })
-
-        return earnings
+        return self._calculate_payhead_breakdown(
+            'earning', employee, period, basic_salary, attendance_data, plan
+        )
 
     
-    def _calculate_deductions(self, employee, period, basic_salary, attendance_data):
+    def _calculate_deductions(self, employee, period, basic_salary, attendance_data, plan):
         """Calculate all deduction components — merge employee + organization payheads"""
-        deductions = []
+        return self._calculate_payhead_breakdown(
+            'deduction', employee, period, basic_salary, attendance_data, plan
+        )
 
+    def _calculate_payhead_breakdown(self, payhead_type, employee, period, basic_salary, attendance_data, plan):
+        """Load employee payheads of one type and evaluate them with the organization plan"""
         employee_payheads = EmployeePayhead.objects.filter(
             organization=self.organization,
             employee=employee,
-            payhead__payhead_type='deduction',
+            payhead__payhead_type=payhead_type,
             payhead__is_active=True,
             is_active=True,
             effective_from__lte=period.end_date
         ).filter(
             Q(effective_to__isnull=True) | Q(effective_to__gte=period.start_date)
-        ).select_related('payhead').order_by('payhead__display_order')
+        ).select_related('payhead').order_by('payhead__display_order', 'id')
 
-        emp_payhead_codes = [ep.payhead.code for ep in employee_payheads]
-
-        org_payheads = Payhead.objects.filter(
-            organization=self.organization,
-            payhead_type='deduction',
-            is_active=True
-        ).order_by('display_order')
-
-        for emp_payhead in employee_payheads:
-            amount = emp_payhead.get_effective_amount(
-                base_amount=basic_salary,
-                attendance_hours=attendance_data.get('total_working_hours', 0),
-                overtime_hours=attendance_data.get('total_overtime_hours', 0),
-                production_units=0
-            )
-            deductions.append({
-                'payhead_id': emp_payhead.payhead.id,
-                'payhead_code': emp_payhead.payhead.code,
-                'payhead_name': emp_payhead.payhead.name,
-                'calculation_type': emp_payhead.payhead.calculation_type,
-                'amount': amount
-            })
-
-        for payhead in org_payheads:
-            if payhead.code not in emp_payhead_codes:
-                amount = self._calculate_payhead_amount(
-                    payhead, None, basic_salary, attendance_data
-                )
-                deductions.append({
-                    'payhead_id': payhead.id,
-                    'payhead_code': payhead.code,
-                    'payhead_name': payhead.name,
-                    'calculation_type': payhead.calculation_type,
-                    'amount': amount
-                })
-
-        return deductions
-
-    
-    def _calculate_payhead_amount(self, payhead, employee_payhead, basic_salary, attendance_data):
-        """Calculate amount for a payhead"""
-        amount = Decimal('0.00')
-        
-        if payhead.calculation_type == 'fixed':
-            amount = payhead.amount
-        
-        elif payhead.calculation_type == 'percentage':
-            if payhead.percentage_base == 'basic':
-                amount = (basic_salary * payhead.percentage) / Decimal('100')
-            else:
-                amount = (basic_salary * payhead.percentage) / Decimal('100')
-        
-        elif payhead.calculation_type == 'attendance':
-            hours = attendance_data.get('total_working_hours', 0)
-            amount = payhead.attendance_rate_per_hour * Decimal(str(hours))
-        
-        elif payhead.calculation_type == 'overtime':
-            hours = attendance_data.get('total_overtime_hours', 0)
-            amount = payhead.overtime_rate_per_hour * Decimal(str(hours))
-        
-        # Apply limits
-        if payhead.min_amount > 0:
-            amount = max(amount, payhead.min_amount)
-        if payhead.max_amount > 0:
-            amount = min(amount, payhead.max_amount)
-        
-        return round(amount, 2)
+        return plan.evaluate(payhead_type, employee_payheads, basic_salary, attendance_data)
     
     def _calculate_attendance_data(self, employee, period):
         """Calculate attendance summary"""
-        attendance_records = AttendanceRecord.objects.filter(
-            employee=employee,
-            date__range=[period.start_date, period.end_date]
-        )
-        
-        present_records = attendance_records.filter(
-            status__in=['present', 'late', 'half_day']
-        )
+        totals = attendance_totals(self.organization, period.start_date, period.end_date, [employee.id])
         
-        total_working_hours = sum([
-            record.working_hours or Decimal('0.00') 
-            for record in present_records
-        ])
-        
-        total_overtime_hours = sum([
-            record.overtime_hours or Decimal('0.00') 
-            for record in present_records
-        ])
+        return self._summarize_attendance(totals.get(employee.id))
+    
+    def _summarize_attendance(self, totals):
+        """
+        Summarize one employee's hrm.rollup attendance totals (None without
+        records); only present, late and half day records count as worked
+        """
+        totals = totals or empty_totals()
+        working_days = sum(totals[field] for field in PRESENT_DAY_FIELDS)
         
+        # Hours are plain 0 without worked days, as summing no records gives
         return {
-            'total_working_days': present_records.count(),
-            'total_working_hours': total_working_hours,
-            'total_overtime_hours': total_overtime_hours,
-            'late_days': attendance_records.filter(is_late=True).count(),
-            'absent_days': attendance_records.filter(status='absent').count(),
+            'total_working_days': working_days,
+            'total_working_hours': totals['attended_working_hours'] if working_days else 0,
+            'total_overtime_hours': totals['attended_overtime_hours'] if working_days else 0,
+            'late_days': totals['late_arrivals'],
+            'absent_days': totals['absent_days'],
         }
     
     def _get_or_create_salary_structure(self, employee, period, basic_salary):
@@ -339,7 +583,7 @@ class PayrollProcessor:
             employee=employee,
             effective_date__lte=period.end_date,
             is_active=True
-        ).order_by('-effective_date').first()
+        ).order_by('-effective_date', '-id').first()
         
         if not salary_structure:
             salary_structure = SalaryStructure.objects.create(
@@ -352,45 +596,76 @@ class PayrollProcessor:
         
         return salary_structure
     
-    def _save_payslip_components(self, payslip):
-        """Save detailed components"""
-        # Delete old components
-        PayslipComponent.objects.filter(payslip=payslip).delete()
-        
-        # Save earnings
-        if hasattr(payslip, '_earnings_breakdown'):
-            for idx, earning in enumerate(payslip._earnings_breakdown):
-                PayslipComponent.objects.create(
-                    organization=self.organization,
-                    payslip=payslip,
-                    payhead_id=earning['payhead_id'],
-                    component_type='earning',
-                    component_name=earning['payhead_name'],
-                    component_code=earning['payhead_code'],
-                    calculation_type=earning['calculation_type'],
-                    amount=earning['amount'],
-                    display_order=idx
-                )
+    def _build_payslip_components(self, payslip):
+        """Build unsaved PayslipComponent rows from the payslip breakdown"""
+        components = []
         
-        # Save deductions
-        if hasattr(payslip, '_deduction_breakdown'):
-            for idx, deduction in enumerate(payslip._deduction_breakdown):
-                PayslipComponent.objects.create(
+        for component_type, breakdown in (
+            ('earning', getattr(payslip, '_earnings_breakdown', [])),
+            ('deduction', getattr(payslip, '_deduction_breakdown', [])),
+        ):
+            for idx, item in enumerate(breakdown):
+                components.append(PayslipComponent(
                     organization=self.organization,
                     payslip=payslip,
-                    payhead_id=deduction['payhead_id'],
-                    component_type='deduction',
-                    component_name=deduction['payhead_name'],
-                    component_code=deduction['payhead_code'],
-                    calculation_type=deduction['calculation_type'],
-                    amount=deduction['amount'],
+                    payhead_id=item['payhead_id'],
+                    component_type=component_type,
+                    component_name=item['payhead_name'],
+                    component_code=item['payhead_code'],
+                    calculation_type=item['calculation_type'],
+                    amount=item['amount'],
                     display_order=idx
-                )
+                ))
+        
+        return components
+    
+    def _save_payslip_components(self, payslip):
+        """Save detailed components, writing only those that changed"""
+        sync_payslip_components({payslip.id: self._build_payslip_components(payslip)})
+    
+    def _apply_calculated_fields(self, payslip, calculated):
+        """Copy calculated amounts and breakdown onto an existing payslip"""
+        for field in PAYSLIP_CALCULATED_FIELDS:
+            if field == 'salary_structure':
+                # Parallel results carry only the id; don't fetch the structure
+                payslip.salary_structure_id = calculated.salary_structure_id
+                continue
+            setattr(payslip, field, getattr(calculated, field))
+        payslip.updated_at = timezone.now()
+        payslip._earnings_breakdown = calculated._earnings_breakdown
+        payslip._deduction_breakdown = calculated._deduction_breakdown
     
+    @staticmethod
+    def _calculated_fields_changed(payslip, calculated):
+        """Whether saving calculated amounts would change a stored payslip"""
+        cent = Decimal('0.01')
+        
+        for field in PAYSLIP_CALCULATED_FIELDS:
+            if field == 'salary_structure':
+                if payslip.salary_structure_id != calculated.salary_structure_id:
+                    return True
+                continue
+            
+            value = getattr(calculated, field)
+            if isinstance(value, Decimal):
+                # Stored amounts are rounded to cents
+                value = value.quantize(cent)
+            if getattr(payslip, field) != value:
+                return True
+        
+        return False
 
 
-    def rerun_payroll(self, period_id, force_recalculate=False):
-        """Rerun payroll for a period - delete existing payslips and recalculate"""
+    def rerun_payroll(self, period_id, force_recalculate=False, mode='standard',
+                      workers=None, chunk_size=None):
+        """
+        Rerun payroll for a period - recalculate every payslip
+        
+        Existing payslips are updated in place and only changed components are
+        written. Payslips the rerun doesn't save again (inactive employees,
+        calculation errors) are deleted afterwards, so the period ends up as if
+        it had been run from scratch.
+        """
         try:
             period = PayrollPeriod.objects.get(id=period_id, organization=self.organization)
             
@@ -398,41 +673,74 @@ class PayrollProcessor:
             if period.status not in ['completed', 'processing']:
                 return False, "Payroll period must be completed or processing to rerun"
             
-            # Delete existing payslips and components
+            # An incremental rerun keeps existing payslips and recalculates what changed
+            if mode == 'incremental':
+                return self.run_payroll(period_id, mode=mode)
+            
+            payslips = Payslip.objects.filter(
+                payroll_period=period, 
+                organization=self.organization
+            )
+            
             with transaction.atomic():
-                payslips = Payslip.objects.filter(
-                    payroll_period=period, 
-                    organization=self.organization
-                )
-                
-                # Delete related components first
-                for payslip in payslips:
-                    PayslipComponent.objects.filter(payslip=payslip).delete()
-                
-                # Delete payslips
-                payslips_count = payslips.count()
-                payslips.delete()
-                
-                print(f"Deleted {payslips_count} existing payslips for period {period.name}")
+                # Recalculated payslips are no longer generated
+                payslips.update(is_generated=False, generated_at=None)
                 
                 # Reset period status to draft for recalculation
                 period.status = 'draft'
                 period.save()
             
+            self._saved_employee_ids = set()
+            
             # Now run payroll normally
-            return self.run_payroll(period_id)
+            success, result = self.run_payroll(period_id, mode=mode, workers=workers, chunk_size=chunk_size)
+            
+            # This also clears the period when the run failed, as deleting upfront did
+            stale_ids = [
+                payslip_id
+                for payslip_id, employee_id in payslips.values_list('id', 'employee_id')
+                if employee_id not in self._saved_employee_ids
+            ]
+            with transaction.atomic():
+                for start in range(0, len(stale_ids), BULK_BATCH_SIZE):
+                    batch = stale_ids[start:start + BULK_BATCH_SIZE]
+                    PayslipComponent.objects.filter(payslip_id__in=batch).delete()
+                    Payslip.objects.filter(id__in=batch).delete()
+            
+            if stale_ids:
+                print(f"Deleted {len(stale_ids)} payslips not recalculated for period {period.name}")
+            
+            return success, result
             
         except Exception as e:
             import traceback
             traceback.print_exc()
             return False, f"Error rerunning payroll: {str(e)}"
     
-    def run_payroll(self, period_id, force_recalculate=False):
-        """Run payroll for all active employees with optional force recalculate"""
+    def run_payroll(self, period_id, force_recalculate=False, mode='standard',
+                    workers=None, chunk_size=None):
+        """
+        Run payroll for all active employees with optional force recalculate
+        
+        mode='standard' calculates and saves one employee at a time,
+        mode='bulk' prefetches all inputs and writes payslips in batches,
+        mode='parallel' calculates employee chunks in a process pool and
+        commits each chunk in one transaction. workers and chunk_size default
+        to PAYROLL_PARALLEL_WORKERS and PAYROLL_PARALLEL_CHUNK_SIZE.
+        mode='incremental' recalculates only employees whose inputs changed
+        since their payslip was calculated and is allowed on completed periods.
+        """
         try:
+            if mode not in RUN_MODES:
+                return False, f"Unknown payroll run mode: {mode}"
+            
             period = PayrollPeriod.objects.get(id=period_id, organization=self.organization)
             
-            if period.status not in ['draft', 'processing'] and not force_recalculate:
+            allowed_statuses = ['draft', 'processing']
+            if mode == 'incremental':
+                allowed_statuses.append('completed')
+            
+            if period.status not in allowed_statuses and not force_recalculate:
                 return False, "Payroll period is not in draft status"
             
             # Get active employees
@@ -445,59 +753,36 @@ class PayrollProcessor:
             if not active_employees.exists():
                 return False, "No active employees found"
             
-            payslips_created = 0
-            payslips_updated = 0
-            errors = []
-            
             period.status = 'processing'
             period.save()
             
-            for employee in active_employees:
-                # Check if payslip already exists
-                existing_payslip = Payslip.objects.filter(
-                    organization=self.organization,
-                    employee=employee,
-                    payroll_period=period
-                ).first()
-                
-                if existing_payslip and not force_recalculate:
-                    # Update existing payslip
-                    updated_payslip, error = self.calculate_employee_salary(employee, period)
-                    if updated_payslip:
-                        # Update existing payslip fields
-                        existing_payslip.salary_structure = updated_payslip.salary_structure
-                        existing_payslip.basic_salary = updated_payslip.basic_salary
-                        existing_payslip.allowances = updated_payslip.allowances
-                        existing_payslip.overtime_pay = updated_payslip.overtime_pay
-                        existing_payslip.bonus = updated_payslip.bonus
-                        existing_payslip.other_earnings = updated_payslip.other_earnings
-                        existing_payslip.provident_fund = updated_payslip.provident_fund
-                        existing_payslip.tax_deduction = updated_payslip.tax_deduction
-                        existing_payslip.late_attendance_deduction = updated_payslip.late_attendance_deduction
-                        existing_payslip.other_deductions = updated_payslip.other_deductions
-                        existing_payslip.gross_salary = updated_payslip.gross_salary
-                        existing_payslip.total_deductions = updated_payslip.total_deductions
-                        existing_payslip.net_salary = updated_payslip.net_salary
-                        existing_payslip.updated_at = timezone.now()
-                        existing_payslip.save()
-                        
-                        # Update components
-                        self._save_payslip_components(existing_payslip)
-                        payslips_updated += 1
-                    else:
-                        errors.append(error)
-                else:
-                    # Create new payslip
-                    payslip, error = self.calculate_employee_salary(employee, period)
-                    if payslip:
-                        payslip.save()
-                        self._save_payslip_components(payslip)
-                        payslips_created += 1
-                    else:
-                        errors.append(error)
+            self._progress_total = active_employees.count()
+            self._report_progress(0, [])
+            
+            if mode == 'bulk':
+                payslips_created, payslips_updated, errors = self._process_employees_bulk(
+                    period, active_employees
+                )
+            elif mode == 'parallel':
+                payslips_created, payslips_updated, errors = self._process_employees_parallel(
+                    period, active_employees, workers=workers, chunk_size=chunk_size
+                )
+            elif mode == 'incremental':
+                payslips_created, payslips_updated, errors = self._process_employees_incremental(
+                    period, active_employees
+                )
+            else:
+                payslips_created, payslips_updated, errors = self._process_employees(
+                    period, active_employees, force_recalculate
+                )
+            
+            nothing_saved = payslips_created == 0 and payslips_updated == 0
+            if mode == 'incremental':
+                # Unchanged payslips are still valid results
+                nothing_saved = nothing_saved and not self._change_summary['unchanged']
             
             # Update period status
-            if errors and (payslips_created == 0 and payslips_updated == 0):
+            if errors and nothing_saved:
                 period.status = 'draft'
                 period.save()
                 return False, f"Payroll failed completely: {', '.join(errors)}"
@@ -513,6 +798,9 @@ class PayrollProcessor:
                     'status': 'completed'
                 }
                 
+                if mode == 'incremental':
+                    result_message['changes'] = self._change_summary
+                
                 if errors:
                     result_message['status'] = 'completed_with_errors'
                 
@@ -529,6 +817,403 @@ class PayrollProcessor:
                 pass
             return False, f"Error running payroll: {str(e)}"
 
+    def _process_employees(self, period, employees, force_recalculate=False):
+        """Calculate and save payslips one employee at a time"""
+        payslips_created = 0
+        payslips_updated = 0
+        errors = []
+        
+        for processed, employee in enumerate(employees, start=1):
+            # Check if payslip already exists
+            existing_payslip = Payslip.objects.filter(
+                organization=self.organization,
+                employee=employee,
+                payroll_period=period
+            ).first()
+            
+            if existing_payslip and not force_recalculate:
+                # Update existing payslip
+                updated_payslip, error = self.calculate_employee_salary(employee, period)
+                if updated_payslip:
+                    self._apply_calculated_fields(existing_payslip, updated_payslip)
+                    existing_payslip.save()
+                    
+                    # Update components
+                    self._save_payslip_components(existing_payslip)
+                    self._saved_employee_ids.add(employee.id)
+                    payslips_updated += 1
+                else:
+                    errors.append(error)
+            else:
+                # Create new payslip
+                payslip, error = self.calculate_employee_salary(employee, period)
+                if payslip:
+                    payslip.save()
+                    self._save_payslip_components(payslip)
+                    self._saved_employee_ids.add(employee.id)
+                    payslips_created += 1
+                else:
+                    errors.append(error)
+            
+            self._report_progress(processed, errors)
+        
+        return payslips_created, payslips_updated, errors
+
+    def _process_employees_bulk(self, period, employees):
+        """Calculate all payslips from prefetched inputs and save them in batches"""
+        inputs = PayrollInputs(self.organization, period)
+        
+        calculated_payslips, errors = self.calculate_from_inputs(period, employees, inputs)
+        
+        payslips_created, payslips_updated = self._bulk_save_payslips(period, calculated_payslips)
+        return payslips_created, payslips_updated, errors
+
+    def calculate_from_inputs(self, period, employees, inputs, processed_before=0):
+        """
+        Calculate unsaved payslips for employees from PayrollInputs with the
+        configured backend. Returns (payslips, errors).
+        
+        The 'numpy' backend falls back to the decimal one when NumPy is not
+        installed or an input can't be represented exactly in integer units.
+        processed_before offsets progress reports.
+        """
+        employees = list(employees)
+        
+        if self.backend == 'numpy':
+            from . import vectorized
+            
+            try:
+                payslips, errors = vectorized.calculate_payslips(self, period, employees, inputs)
+                self._report_progress(processed_before + len(employees), errors)
+                return payslips, errors
+            except vectorized.VectorizationError as e:
+                print(f"Vectorized payroll calculation unavailable, using decimal backend: {str(e)}")
+        
+        payslips = []
+        errors = []
+        
+        for processed, employee in enumerate(employees, start=processed_before + 1):
+            payslip, error = self.calculate_employee_salary(employee, period, inputs=inputs)
+            if payslip:
+                payslips.append(payslip)
+            else:
+                errors.append(error)
+            
+            self._report_progress(processed, errors)
+        
+        return payslips, errors
+
+    def _process_employees_incremental(self, period, employees):
+        """
+        Recalculate only employees whose inputs changed since their payslip was calculated
+        
+        Payslips written from PayrollInputs (bulk, parallel and incremental runs)
+        store input_hashes. Employees whose current hashes match are skipped;
+        employees without a payslip, or with one written by the standard path,
+        are always recalculated. The change summary is kept in _change_summary.
+        """
+        inputs = PayrollInputs(self.organization, period)
+        stored_hashes = dict(Payslip.objects.filter(
+            organization=self.organization,
+            payroll_period=period
+        ).values_list('employee_id', 'input_hashes'))
+        
+        changes = {group: 0 for group in INPUT_HASH_GROUPS}
+        changes.update({'new': 0, 'unhashed': 0, 'unchanged': 0})
+        
+        changed_employees = []
+        
+        for employee in employees:
+            stored = stored_hashes.get(employee.id)
+            current = inputs.input_hashes(
+                employee.id,
+                self._summarize_attendance(inputs.attendance_totals.get(employee.id))
+            )
+            
+            if stored == current:
+                changes['unchanged'] += 1
+                continue
+            
+            if stored is None:
+                changes['new'] += 1
+            elif not stored:
+                changes['unhashed'] += 1
+            else:
+                for group in INPUT_HASH_GROUPS:
+                    if stored.get(group) != current[group]:
+                        changes[group] += 1
+            
+            changed_employees.append(employee)
+        
+        self._change_summary = changes
+        self._report_progress(changes['unchanged'], [])
+        
+        calculated_payslips, errors = self.calculate_from_inputs(
+            period, changed_employees, inputs, processed_before=changes['unchanged']
+        )
+        
+        payslips_created, payslips_updated = self._bulk_save_payslips(
+            period, calculated_payslips,
+            employee_ids=[employee.id for employee in changed_employees]
+        )
+        return payslips_created, payslips_updated, errors
+
+    def _process_employees_parallel(self, period, employees, workers=None, chunk_size=None):
+        """Calculate employee chunks in worker processes, committing one transaction per chunk"""
+        from .parallel import calculate_in_process_pool
+        
+        employees = list(employees)
+        employees_by_id = {employee.id: employee for employee in employees}
+        
+        payslips_created = 0
+        payslips_updated = 0
+        processed = 0
+        errors = []
+        
+        for employee_ids, results, chunk_errors in calculate_in_process_pool(
+            self.organization.id, period.id, list(employees_by_id),
+            workers=workers, chunk_size=chunk_size, backend=self.backend
+        ):
+            errors.extend(chunk_errors)
+            
+            payslips = [
+                self._payslip_from_result(employees_by_id[result['employee_id']], period, result)
+                for result in results
+            ]
+            created, updated = self._bulk_save_payslips(period, payslips, employee_ids=employee_ids)
+            payslips_created += created
+            payslips_updated += updated
+            
+            processed += len(employee_ids)
+            self._report_progress(processed, errors)
+        
+        return payslips_created, payslips_updated, errors
+
+    def _payslip_to_result(self, payslip):
+        """Plain, picklable form of a calculated payslip"""
+        return {
+            'employee_id': payslip.employee_id,
+            'salary_structure_id': payslip.salary_structure_id,
+            'summary': {
+                field: getattr(payslip, field)
+                for field in PAYSLIP_CALCULATED_FIELDS
+                if field not in ('salary_structure', 'bonus')
+            },
+            'earnings': payslip._earnings_breakdown,
+            'deductions': payslip._deduction_breakdown,
+        }
+
+    def _payslip_from_result(self, employee, period, result):
+        """Rebuild an unsaved payslip from _payslip_to_result output"""
+        payslip = self._build_payslip(
+            employee, period, None, result['summary'],
+            result['earnings'], result['deductions']
+        )
+        payslip.salary_structure_id = result['salary_structure_id']
+        return payslip
+
+    def _bulk_save_payslips(self, period, calculated_payslips, employee_ids=None):
+        """Persist calculated payslips and their components with batched statements"""
+        existing_payslips = Payslip.objects.filter(
+            organization=self.organization,
+            payroll_period=period
+        )
+        if employee_ids is not None:
+            existing_payslips = existing_payslips.filter(employee_id__in=employee_ids)
+        existing_payslips = {payslip.employee_id: payslip for payslip in existing_payslips}
+        
+        with transaction.atomic():
+            # Employees without a salary structure get one, as in the per-employee path
+            missing_structures = [
+                payslip for payslip in calculated_payslips
+                if payslip.salary_structure_id is None
+            ]
+            new_structures = SalaryStructure.objects.bulk_create([
+                SalaryStructure(
+                    organization=self.organization,
+                    employee_id=payslip.employee_id,
+                    basic_salary=payslip.basic_salary,
+                    effective_date=period.start_date,
+                    is_active=True
+                )
+                for payslip in missing_structures
+            ], batch_size=BULK_BATCH_SIZE)
+            for payslip, salary_structure in zip(missing_structures, new_structures):
+                payslip.salary_structure = salary_structure
+                if payslip.input_hashes:
+                    payslip.input_hashes['salary_structure'] = PayrollInputs.salary_structure_hash(
+                        salary_structure
+                    )
+            
+            to_create = []
+            recalculated = []
+            to_update = []
+            for payslip in calculated_payslips:
+                existing_payslip = existing_payslips.get(payslip.employee_id)
+                if existing_payslip:
+                    # Unchanged payslips are not written; their components are still diffed
+                    if self._calculated_fields_changed(existing_payslip, payslip):
+                        to_update.append(existing_payslip)
+                    self._apply_calculated_fields(existing_payslip, payslip)
+                    recalculated.append(existing_payslip)
+                else:
+                    to_create.append(payslip)
+            
+            Payslip.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+            Payslip.objects.bulk_update(
+                to_update,
+                PAYSLIP_CALCULATED_FIELDS + ['updated_at'],
+                batch_size=BULK_BATCH_SIZE
+            )
+            
+            sync_payslip_components(
+                {payslip.id: self._build_payslip_components(payslip) for payslip in recalculated},
+                batch_size=BULK_BATCH_SIZE
+            )
+            
+            components = []
+            for payslip in to_create:
+                components.extend(self._build_payslip_components(payslip))
+            PayslipComponent.objects.bulk_create(components, batch_size=BULK_BATCH_SIZE)
+        
+        self._saved_employee_ids.update(payslip.employee_id for payslip in calculated_payslips)
+        return len(to_create), len(recalculated)
+
+    def simulate_payroll(self, period_id, payhead_overrides=None, employee_payhead_overrides=None):
+        """
+        What-if payroll: calculate every active employee with hypothetical
+        payhead and employee payhead values and compare with the existing
+        payslips. Everything happens in memory; nothing is written.
+        
+        Overrides map ids to {field: value}, see PayrollInputs.apply_overrides.
+        """
+        try:
+            period = PayrollPeriod.objects.get(id=period_id, organization=self.organization)
+            
+            employees = list(Employee.objects.filter(
+                organization=self.organization,
+                employment_status='active',
+                is_active=True
+            ))
+            
+            if not employees:
+                return False, "No active employees found"
+            
+            inputs = PayrollInputs(self.organization, period, track_changes=False)
+            inputs.apply_overrides(payhead_overrides, employee_payhead_overrides)
+            
+            payslips, errors = self.calculate_from_inputs(period, employees, inputs)
+            
+            return True, self._compare_with_payslips(period, payslips, errors)
+            
+        except PayrollPeriod.DoesNotExist:
+            return False, "Payroll period not found"
+        except ValueError as e:
+            return False, str(e)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return False, f"Error simulating payroll: {str(e)}"
+
+    def _compare_with_payslips(self, period, simulated_payslips, errors):
+        """Per-employee, per-payhead and total deltas of simulated payslips against saved ones"""
+        cent = Decimal('0.01')
+        zero = Decimal('0.00')
+        
+        # Saved payslips and components of active employees
+        current_payslips = Payslip.objects.filter(
+            organization=self.organization,
+            payroll_period=period,
+            employee__employment_status='active',
+            employee__is_active=True
+        )
+        current = {
+            row[0]: dict(zip(SIMULATION_TOTAL_FIELDS, row[1:]))
+            for row in current_payslips.values_list('employee_id', *SIMULATION_TOTAL_FIELDS)
+        }
+        current_components = PayslipComponent.objects.filter(
+            payslip__in=current_payslips
+        ).values('component_type', 'component_code', 'component_name').annotate(total=Sum('amount'))
+        
+        totals = {
+            'current': {field: zero for field in SIMULATION_TOTAL_FIELDS},
+            'simulated': {field: zero for field in SIMULATION_TOTAL_FIELDS},
+        }
+        for values in current.values():
+            for field in SIMULATION_TOTAL_FIELDS:
+                totals['current'][field] += values[field]
+        
+        payheads = {}
+        for row in current_components:
+            payheads[(row['component_type'], row['component_code'])] = {
+                'type': row['component_type'],
+                'code': row['component_code'],
+                'name': row['component_name'],
+                'current': row['total'],
+                'simulated': zero,
+            }
+        
+        employees = []
+        for payslip in simulated_payslips:
+            # Rounded to cents, as saving the payslip would
+            simulated = {
+                field: Decimal(getattr(payslip, field)).quantize(cent)
+                for field in SIMULATION_TOTAL_FIELDS
+            }
+            existing = current.get(payslip.employee_id)
+            
+            for field in SIMULATION_TOTAL_FIELDS:
+                totals['simulated'][field] += simulated[field]
+            
+            employees.append({
+                'employee_id': payslip.employee_id,
+                'employee_code': payslip.employee.employee_id,
+                'name': payslip.employee.full_name,
+                'current': existing,
+                'simulated': simulated,
+                'delta': {
+                    field: simulated[field] - (existing[field] if existing else zero)
+                    for field in SIMULATION_TOTAL_FIELDS
+                },
+            })
+            
+            for component_type, breakdown in (
+                ('earning', payslip._earnings_breakdown),
+                ('deduction', payslip._deduction_breakdown),
+            ):
+                for item in breakdown:
+                    row = payheads.setdefault((component_type, item['payhead_code']), {
+                        'type': component_type,
+                        'code': item['payhead_code'],
+                        'name': item['payhead_name'],
+                        'current': zero,
+                        'simulated': zero,
+                    })
+                    row['simulated'] += Decimal(item['amount']).quantize(cent)
+        
+        totals['delta'] = {
+            field: totals['simulated'][field] - totals['current'][field]
+            for field in SIMULATION_TOTAL_FIELDS
+        }
+        
+        for row in payheads.values():
+            row['delta'] = row['simulated'] - row['current']
+        
+        employees.sort(key=lambda employee: abs(employee['delta']['net_salary']), reverse=True)
+        
+        return {
+            'period': {'id': period.id, 'name': period.name},
+            'calculated_employees': len(simulated_payslips),
+            'changed_employees': sum(
+                1 for employee in employees
+                if any(employee['delta'][field] for field in SIMULATION_TOTAL_FIELDS)
+            ),
+            'totals': totals,
+            'payheads': sorted(payheads.values(), key=lambda row: (row['type'] != 'earning', row['code'])),
+            'employees': employees,
+            'errors': errors,
+        }
+
     def get_payroll_summary(self, period_id):
         """Get payroll summary"""
         try:
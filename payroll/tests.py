@@ -1,3 +1,1162 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from hrm.models import Employee, Payhead, EmployeePayhead, AttendanceRecord
+from hrm.rollup import rebuild_months
+from organization.models import Organization, OrganizationMembership
+
+from .jobs import (
+    JobHeartbeat, claim_next_job, enqueue_payroll_job, execute_job, requeue_stale_jobs
+)
+from .models import PayrollJob, PayrollPeriod, SalaryStructure, Payslip, PayslipComponent
+from .parallel import partition
+from .plans import PayheadPlan
+from .services import PayrollProcessor, PayrollInputs, INPUT_HASH_GROUPS, PAYSLIP_CALCULATED_FIELDS
+from . import parallel, vectorized
+
+User = get_user_model()
+
+SUMMARY_FIELDS = [field for field in PAYSLIP_CALCULATED_FIELDS if field != 'salary_structure']
+
+
+class MixedPayheadsFixture:
+    """40 employees with every calculation type, limits, overrides and a month of attendance"""
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user(username='parity_admin')
+        cls.organization = Organization.objects.create(
+            name='Parity', slug='parity', email='parity@example.com', created_by=admin
+        )
+        cls.period = PayrollPeriod.objects.create(
+            organization=cls.organization, name='January 2025',
+            start_date=date(2025, 1, 1), end_date=date(2025, 1, 31), pay_date=date(2025, 2, 1)
+        )
+
+        payheads = {}
+        for order, (code, payhead_type, calculation_type, values) in enumerate([
+            # No organization default, so employees without a basic payhead or structure fail
+            ('BASIC', 'earning', 'fixed', {'amount': Decimal('0.00')}),
+            ('HRA', 'earning', 'percentage', {'percentage': Decimal('40.00')}),
+            ('TA', 'earning', 'fixed', {'amount': Decimal('2000.00'), 'min_amount': Decimal('2100.00')}),
+            ('OT', 'earning', 'overtime', {'overtime_rate_per_hour': Decimal('150.55')}),
+            ('ATT', 'earning', 'attendance', {'attendance_rate_per_hour': Decimal('12.33'),
+                                              'max_amount': Decimal('1500.00')}),
+            ('PROD', 'earning', 'production', {'production_rate_per_unit': Decimal('5.00'),
+                                               'min_amount': Decimal('10.00')}),
+            ('HALF', 'earning', 'percentage', {'percentage': Decimal('50.00')}),
+            ('PF', 'deduction', 'percentage', {'percentage': Decimal('10.00'), 'min_amount': Decimal('100.00')}),
+            ('TAX', 'deduction', 'percentage', {'percentage': Decimal('5.55')}),
+            ('LATE', 'deduction', 'fixed', {'amount': Decimal('300.00')}),
+            ('CUST', 'deduction', 'custom', {'min_amount': Decimal('50.00')}),
+        ]):
+            payheads[code] = Payhead.objects.create(
+                organization=cls.organization, name=code, code=code,
+                payhead_type=payhead_type, calculation_type=calculation_type,
+                display_order=order % 4, effective_from=date(2020, 1, 1), **values
+            )
+
+        rnd = random.Random(7)
+        # Basic salaries of 100.01 and 100.03 put HALF (50%) exactly on a half cent
+        basic_amounts = [Decimal('100.01'), Decimal('100.03'), Decimal('12345.67'), Decimal('0.00')]
+
+        for index in range(40):
+            user = User.objects.create_user(username=f'parity_{index}')
+            employee = Employee.objects.create(
+                organization=cls.organization, user=user, employee_id=f'P{index:03d}',
+                first_name=f'Employee{index}', last_name='Parity', hire_date=date(2024, 1, 1)
+            )
+
+            if index % 3 == 0:
+                SalaryStructure.objects.create(
+                    organization=cls.organization, employee=employee,
+                    basic_salary=Decimal(rnd.randint(1000000, 9000000)) / 100,
+                    effective_date=date(2024, 6, 1)
+                )
+
+            if index < len(basic_amounts):
+                EmployeePayhead.objects.create(
+                    organization=cls.organization, employee=employee, payhead=payheads['BASIC'],
+                    amount=basic_amounts[index], effective_from=date(2024, 1, 1)
+                )
+            elif index % 2:
+                EmployeePayhead.objects.create(
+                    organization=cls.organization, employee=employee, payhead=payheads['BASIC'],
+                    amount=Decimal(rnd.randint(0, 8000000)) / 100, effective_from=date(2024, 1, 1)
+                )
+
+            if index % 4 == 1:
+                EmployeePayhead.objects.create(
+                    organization=cls.organization, employee=employee, payhead=payheads['HRA'],
+                    percentage=Decimal('45.50'), max_amount=Decimal(rnd.choice(['0.00', '9000.00'])),
+                    effective_from=date(2024, 1, 1)
+                )
+            if index % 5 == 2:
+                EmployeePayhead.objects.create(
+                    organization=cls.organization, employee=employee, payhead=payheads['OT'],
+                    overtime_rate_per_hour=Decimal('99.99'), effective_from=date(2024, 1, 1)
+                )
+            if index % 6 == 3:
+                # Expired: evaluates to 0 without limits
+                EmployeePayhead.objects.create(
+                    organization=cls.organization, employee=employee, payhead=payheads['TA'],
+                    amount=Decimal('2500.00'), effective_from=date(2024, 1, 1), effective_to=date(2025, 6, 30)
+                )
+            if index % 7 == 4:
+                EmployeePayhead.objects.create(
+                    organization=cls.organization, employee=employee, payhead=payheads['PROD'],
+                    production_rate_per_unit=Decimal('7.00'), max_amount=Decimal('5.00'),
+                    effective_from=date(2024, 1, 1)
+                )
+                EmployeePayhead.objects.create(
+                    organization=cls.organization, employee=employee, payhead=payheads['CUST'],
+                    min_amount=Decimal('75.50'), effective_from=date(2024, 1, 1)
+                )
+            if index % 8 == 5:
+                EmployeePayhead.objects.create(
+                    organization=cls.organization, employee=employee, payhead=payheads['ATT'],
+                    attendance_rate_per_hour=Decimal('13.37'), effective_from=date(2024, 1, 1)
+                )
+
+            attendance = []
+            for day in range(1, 32):
+                status = rnd.choice(['present', 'present', 'present', 'late', 'half_day', 'absent', 'on_leave'])
+                attendance.append(AttendanceRecord(
+                    organization=cls.organization, employee=employee, date=date(2025, 1, day),
+                    status=status, is_late=status == 'late',
+                    working_hours=Decimal(rnd.randint(0, 1000)) / 100,
+                    overtime_hours=Decimal(rnd.randint(0, 300)) / 100,
+                ))
+            AttendanceRecord.objects.bulk_create(attendance)
+        rebuild_months(cls.organization)
+
+    def setUp(self):
+        self.employees = list(Employee.objects.filter(organization=self.organization).order_by('id'))
+
+    def snapshot(self, fields=SUMMARY_FIELDS):
+        return {
+            payslip.employee_id: (
+                [getattr(payslip, field) for field in fields],
+                (payslip.salary_structure.basic_salary, payslip.salary_structure.effective_date),
+                list(PayslipComponent.objects.filter(payslip=payslip).order_by(
+                    'component_type', 'display_order', 'component_code'
+                ).values_list('component_type', 'component_code', 'component_name', 'amount', 'display_order'))
+            )
+            for payslip in Payslip.objects.filter(payroll_period=self.period).select_related('salary_structure')
+        }
+
+
+class BulkModeParityTests(MixedPayheadsFixture, TestCase):
+    """Bulk runs save exactly the payslips the per-employee path saves"""
+
+    def run_and_snapshot(self, mode):
+        with transaction.atomic():
+            success, result = PayrollProcessor(self.organization, backend='decimal').run_payroll(
+                self.period.id, mode=mode
+            )
+            self.assertTrue(success, result)
+            # Standard runs store no input hashes
+            snapshot = self.snapshot([field for field in SUMMARY_FIELDS if field != 'input_hashes'])
+            transaction.set_rollback(True)
+        return result, snapshot
+
+    def test_bulk_run_matches_standard_run(self):
+        expected_result, expected = self.run_and_snapshot('standard')
+        result, snapshot = self.run_and_snapshot('bulk')
+
+        self.assertTrue(expected_result['errors'], 'fixture should include an employee without basic salary')
+        self.assertEqual(expected_result['errors'], result['errors'])
+        self.assertEqual(expected_result['payslips_created'], result['payslips_created'])
+        self.assertEqual(sorted(expected), sorted(snapshot))
+        for employee_id, payslip in expected.items():
+            self.assertEqual(payslip, snapshot[employee_id], f"payslip differs for employee {employee_id}")
+
+
+class ParallelModeTests(MixedPayheadsFixture, TestCase):
+    """Parallel runs save payslips chunk by chunk, as a standard run would"""
+
+    def run_payroll(self, mode, **options):
+        return PayrollProcessor(self.organization, backend='decimal').run_payroll(
+            self.period.id, mode=mode, **options
+        )
+
+    def test_partition(self):
+        self.assertEqual(partition(list(range(7)), 3), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(partition([], 3), [])
+
+    def test_chunks_match_standard_run(self):
+        with transaction.atomic():
+            success, expected_result = self.run_payroll('standard')
+            self.assertTrue(success)
+            expected = self.snapshot([field for field in SUMMARY_FIELDS if field != 'input_hashes'])
+            transaction.set_rollback(True)
+
+        with mock.patch.object(
+            PayrollProcessor, '_bulk_save_payslips', autospec=True,
+            side_effect=PayrollProcessor._bulk_save_payslips
+        ) as save:
+            success, result = self.run_payroll('parallel', workers=1, chunk_size=7)
+        self.assertTrue(success, result)
+
+        # One save, in its own transaction, per chunk of at most 7 employees
+        chunks = [call.kwargs['employee_ids'] for call in save.call_args_list]
+        self.assertEqual([len(chunk) for chunk in chunks], [7, 7, 7, 7, 7, 5])
+        self.assertEqual(sorted(sum(chunks, [])), [employee.id for employee in self.employees])
+        self.assertEqual(expected_result['errors'], result['errors'])
+        self.assertEqual(expected, self.snapshot([field for field in SUMMARY_FIELDS if field != 'input_hashes']))
+
+    def test_failing_chunk_is_reported(self):
+        calculate = parallel.calculate_chunk
+        chunks = []
+
+        def calculate_chunk(organization_id, period_id, employee_ids, backend=None):
+            chunks.append(employee_ids)
+            if len(chunks) == 2:
+                raise RuntimeError('worker died')
+            return calculate(organization_id, period_id, employee_ids, backend)
+
+        with mock.patch('payroll.parallel.calculate_chunk', side_effect=calculate_chunk):
+            success, result = self.run_payroll('parallel', workers=1, chunk_size=10)
+
+        self.assertTrue(success, result)
+        self.assertEqual(result['status'], 'completed_with_errors')
+        self.assertIn('Error calculating 10 employees in worker: worker died', result['errors'])
+        # The other chunks were still saved
+        saved = set(Payslip.objects.filter(payroll_period=self.period).values_list('employee_id', flat=True))
+        self.assertFalse(saved & set(chunks[1]))
+        self.assertEqual(result['payslips_created'], len(saved))
+        self.assertGreater(len(saved), 20)
+
+
+@skipUnless(vectorized.numpy_available(), 'NumPy is not installed')
+class VectorizedBackendParityTests(MixedPayheadsFixture, TestCase):
+    """The 'numpy' backend must produce exactly what the Decimal engine produces"""
+
+    def calculate(self, backend, inputs=None):
+        inputs = inputs or PayrollInputs(self.organization, self.period)
+        processor = PayrollProcessor(self.organization, backend=backend)
+        return processor.calculate_from_inputs(self.period, self.employees, inputs)
+
+    def assertSamePayslips(self, expected, actual):
+        self.assertEqual(
+            [payslip.employee_id for payslip in expected],
+            [payslip.employee_id for payslip in actual]
+        )
+        for expected_payslip, payslip in zip(expected, actual):
+            for field in SUMMARY_FIELDS:
+                self.assertEqual(
+                    getattr(expected_payslip, field), getattr(payslip, field),
+                    f"{field} differs for employee {payslip.employee_id}"
+                )
+            self.assertEqual(expected_payslip.salary_structure_id, payslip.salary_structure_id)
+            for breakdown in ('_earnings_breakdown', '_deduction_breakdown'):
+                self.assertEqual(getattr(expected_payslip, breakdown), getattr(payslip, breakdown))
+
+    def test_half_even_rounding_matches_decimal_round(self):
+        import numpy as np
+
+        rnd = random.Random(3)
+        micro = [rnd.randint(-10 ** 9, 10 ** 9) for _ in range(2000)]
+        micro += [value * 10000 + 5000 for value in range(-50, 50)]
+
+        rounded = vectorized._round_half_even_to_cents(np.array(micro, dtype=np.int64))
+
+        for value, result in zip(micro, rounded.tolist()):
+            self.assertEqual(
+                Decimal(result).scaleb(-6),
+                round(Decimal(value).scaleb(-6), 2),
+                f"rounding differs for {value} micro-units"
+            )
+
+    def test_payslips_match_decimal_engine(self):
+        expected, expected_errors = self.calculate('decimal')
+        payslips, errors = self.calculate('numpy')
+
+        self.assertEqual(expected_errors, errors)
+        self.assertTrue(errors, 'fixture should include an employee without basic salary')
+        self.assertSamePayslips(expected, payslips)
+
+    def test_half_cent_percentages_round_half_even(self):
+        payslips, _ = self.calculate('numpy')
+        half = {
+            payslip.employee.employee_id: next(
+                item['amount'] for item in payslip._earnings_breakdown if item['payhead_code'] == 'HALF'
+            )
+            for payslip in payslips
+        }
+
+        self.assertEqual(half['P000'], Decimal('50.00'))
+        self.assertEqual(half['P001'], Decimal('50.02'))
+
+    def test_input_hashes_match_decimal_engine(self):
+        expected, _ = self.calculate('decimal')
+        payslips, _ = self.calculate('numpy')
+
+        self.assertEqual(
+            [payslip.input_hashes for payslip in expected],
+            [payslip.input_hashes for payslip in payslips]
+        )
+
+    def test_inexact_inputs_fall_back_to_decimal_engine(self):
+        inputs = PayrollInputs(self.organization, self.period)
+        rule = next(rule for rule in inputs.plan.org_rules['earning'] if rule.code == 'TA')
+        rule.value = Decimal('2000.0000001')
+
+        with self.assertRaises(vectorized.VectorizationError):
+            vectorized.calculate_payslips(
+                PayrollProcessor(self.organization), self.period, self.employees, inputs
+            )
+
+        expected, _ = self.calculate('decimal', inputs)
+        payslips, _ = self.calculate('numpy', inputs)
+        self.assertSamePayslips(expected, payslips)
+
+    def test_bulk_run_saves_same_payslips(self):
+        success, _ = PayrollProcessor(self.organization, backend='decimal').run_payroll(
+            self.period.id, mode='bulk'
+        )
+        self.assertTrue(success)
+        expected = self.snapshot()
+
+        success, result = PayrollProcessor(self.organization, backend='numpy').run_payroll(
+            self.period.id, force_recalculate=True, mode='bulk'
+        )
+        self.assertTrue(success)
+        self.assertEqual(result['payslips_updated'], len(expected))
+        self.assertEqual(expected, self.snapshot())
+
+
+class PayheadPlanTests(TestCase):
+    """Compiled payhead rules give the amounts of the per-payhead calculation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Plan', slug='plan', email='plan@example.com')
+        cls.period = PayrollPeriod.objects.create(
+            organization=cls.organization, name='August 2025',
+            start_date=date(2025, 8, 1), end_date=date(2025, 8, 31), pay_date=date(2025, 9, 1)
+        )
+        cls.employee = Employee.objects.create(
+            organization=cls.organization, user=User.objects.create_user(username='plan_employee'),
+            employee_id='PL001', first_name='Employee', last_name='Plan', hire_date=date(2024, 1, 1)
+        )
+
+        cls.payheads = []
+        for order, (calculation_type, values) in enumerate([
+            ('fixed', {'amount': Decimal('1000.00')}),
+            ('fixed', {'amount': Decimal('1000.00'), 'min_amount': Decimal('1200.00')}),
+            ('percentage', {'percentage': Decimal('33.33'), 'max_amount': Decimal('5000.00')}),
+            ('percentage', {'percentage': Decimal('12.50'), 'min_amount': Decimal('100.00')}),
+            ('attendance', {'attendance_rate_per_hour': Decimal('12.33'), 'max_amount': Decimal('1500.00')}),
+            ('overtime', {'overtime_rate_per_hour': Decimal('150.55')}),
+            ('production', {'production_rate_per_unit': Decimal('5.00'), 'min_amount': Decimal('10.00')}),
+            ('custom', {'min_amount': Decimal('50.00')}),
+        ]):
+            cls.payheads.append(Payhead.objects.create(
+                organization=cls.organization, name=f'Payhead {order}', code=f'P{order}',
+                payhead_type='earning', calculation_type=calculation_type, display_order=order,
+                effective_from=date(2020, 1, 1), **values
+            ))
+
+    def baseline_org_amount(self, payhead, basic_salary, working_hours, overtime_hours):
+        """Organization payhead amount as PayrollProcessor calculated it before plans"""
+        amount = Decimal('0.00')
+        if payhead.calculation_type == 'fixed':
+            amount = payhead.amount
+        elif payhead.calculation_type == 'percentage':
+            amount = (basic_salary * payhead.percentage) / Decimal('100')
+        elif payhead.calculation_type == 'attendance':
+            amount = payhead.attendance_rate_per_hour * working_hours
+        elif payhead.calculation_type == 'overtime':
+            amount = payhead.overtime_rate_per_hour * overtime_hours
+        if payhead.min_amount > 0:
+            amount = max(amount, payhead.min_amount)
+        if payhead.max_amount > 0:
+            amount = min(amount, payhead.max_amount)
+        return round(amount, 2)
+
+    def test_rules_match_per_payhead_calculation(self):
+        plan = PayheadPlan.for_period(self.organization, self.period)
+        employee_values = [
+            # Values of 0 fall back to the payhead's
+            {},
+            {'amount': Decimal('800.00')},
+            {'percentage': Decimal('45.50'), 'max_amount': Decimal('9000.00')},
+            {'min_amount': Decimal('4000.00')},
+            {'attendance_rate_per_hour': Decimal('20.00')},
+            {'overtime_rate_per_hour': Decimal('99.99'), 'max_amount': Decimal('200.00')},
+            {'production_rate_per_unit': Decimal('7.00'), 'max_amount': Decimal('5.00')},
+            {'min_amount': Decimal('75.50')},
+        ]
+        employee_payheads = [
+            EmployeePayhead(
+                organization=self.organization, employee=self.employee, payhead=payhead,
+                effective_from=date(2024, 1, 1), **values
+            )
+            for payhead, values in zip(self.payheads, employee_values)
+        ]
+        # Expired: 0 regardless of limits
+        employee_payheads.append(EmployeePayhead(
+            organization=self.organization, employee=self.employee, payhead=self.payheads[1],
+            amount=Decimal('2500.00'), effective_from=date(2024, 1, 1), effective_to=date(2024, 12, 31)
+        ))
+
+        for basic_salary, working_hours, overtime_hours in [
+            (Decimal('0.01'), Decimal('0'), Decimal('0')),
+            (Decimal('12345.67'), Decimal('160.25'), Decimal('7.5')),
+            (Decimal('90000.00'), Decimal('200'), Decimal('40.33')),
+        ]:
+            attendance_data = {'total_working_hours': working_hours, 'total_overtime_hours': overtime_hours}
+            for payhead in self.payheads:
+                self.assertEqual(
+                    plan.evaluate('earning', [], basic_salary, attendance_data)[payhead.display_order]['amount'],
+                    self.baseline_org_amount(payhead, basic_salary, working_hours, overtime_hours),
+                    f"{payhead.calculation_type} payhead {payhead.code}"
+                )
+            for employee_payhead in employee_payheads:
+                breakdown = plan.evaluate('earning', [employee_payhead], basic_salary, attendance_data)
+                self.assertEqual(
+                    breakdown[0]['amount'],
+                    employee_payhead.get_effective_amount(basic_salary, working_hours, overtime_hours),
+                    f"employee {employee_payhead.payhead.calculation_type} payhead {employee_payhead.payhead.code}"
+                )
+                # The employee payhead replaces the organization payhead of its code
+                self.assertEqual(
+                    [item['payhead_code'] for item in breakdown].count(employee_payhead.payhead.code), 1
+                )
+
+    def test_employee_rules_follow_the_date(self):
+        employee_payhead = EmployeePayhead.objects.create(
+            organization=self.organization, employee=self.employee, payhead=self.payheads[0],
+            amount=Decimal('800.00'), effective_from=date(2024, 1, 1), effective_to=date(2025, 8, 15)
+        )
+        attendance_data = {}
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.make_aware(datetime(2025, 8, 15, 23))):
+            plan = PayheadPlan.for_period(self.organization, self.period)
+            self.assertEqual(
+                plan.evaluate('earning', [employee_payhead], Decimal('1000'), attendance_data)[0]['amount'],
+                Decimal('800.00')
+            )
+        with mock.patch('django.utils.timezone.now', return_value=timezone.make_aware(datetime(2025, 8, 16, 1))):
+            self.assertEqual(
+                plan.evaluate('earning', [employee_payhead], Decimal('1000'), attendance_data)[0]['amount'],
+                Decimal('0.00')
+            )
+
+
+class AttendanceSummaryTests(TestCase):
+    """Payroll reads attendance from the monthly rollup with the same results as from the records"""
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user(username='summary_admin')
+        cls.organization = Organization.objects.create(
+            name='Summary', slug='summary', email='summary@example.com', created_by=admin
+        )
+        # Half of January, all of February and a day of March
+        cls.period = PayrollPeriod.objects.create(
+            organization=cls.organization, name='Mid-January to March 2025',
+            start_date=date(2025, 1, 16), end_date=date(2025, 3, 1), pay_date=date(2025, 3, 5)
+        )
+
+        rnd = random.Random(7)
+        for index in range(4):
+            employee = Employee.objects.create(
+                organization=cls.organization, user=User.objects.create_user(username=f'summary_{index}'),
+                employee_id=f'A{index:03d}', first_name=f'Employee{index}', last_name='Summary',
+                hire_date=date(2024, 1, 1)
+            )
+            for day in range(60):
+                # The last employee is never present
+                statuses = ['absent', 'on_leave'] if index == 3 else ['present', 'late', 'half_day', 'absent', 'holiday']
+                status = rnd.choice(statuses)
+                AttendanceRecord.objects.create(
+                    organization=cls.organization, employee=employee, date=date(2025, 1, 10) + timedelta(days=day),
+                    status=status, is_late=rnd.random() < 0.2,
+                    working_hours=Decimal(rnd.randint(0, 1000)) / 100,
+                    overtime_hours=Decimal(rnd.randint(0, 300)) / 100,
+                )
+
+    def test_summary_matches_records(self):
+        processor = PayrollProcessor(self.organization)
+        inputs = PayrollInputs(self.organization, self.period)
+
+        for employee in Employee.objects.filter(organization=self.organization):
+            rows = AttendanceRecord.objects.filter(
+                employee=employee, date__range=[self.period.start_date, self.period.end_date]
+            )
+            present = [row for row in rows if row.status in ('present', 'late', 'half_day')]
+            expected = {
+                'total_working_days': len(present),
+                'total_working_hours': sum(row.working_hours for row in present),
+                'total_overtime_hours': sum(row.overtime_hours for row in present),
+                'late_days': sum(1 for row in rows if row.is_late),
+                'absent_days': sum(1 for row in rows if row.status == 'absent'),
+            }
+
+            summary = processor._summarize_attendance(inputs.attendance_totals.get(employee.id))
+            self.assertEqual(summary, expected)
+            # Input hashes tell 0 from 0.00
+            self.assertEqual([type(value) for value in summary.values()], [type(value) for value in expected.values()])
+            self.assertEqual(processor._calculate_attendance_data(employee, self.period), expected)
+
+
+class PayrollSimulationTests(TestCase):
+    """What-if simulations predict a real run and never write"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='simulation_admin')
+        cls.organization = Organization.objects.create(
+            name='Simulation', slug='simulation', email='simulation@example.com', created_by=cls.admin
+        )
+        OrganizationMembership.objects.create(user=cls.admin, organization=cls.organization, is_admin=True)
+        cls.period = PayrollPeriod.objects.create(
+            organization=cls.organization, name='March 2025',
+            start_date=date(2025, 3, 1), end_date=date(2025, 3, 31), pay_date=date(2025, 4, 1)
+        )
+
+        basic = Payhead.objects.create(
+            organization=cls.organization, name='Basic', code='BASIC', payhead_type='earning',
+            calculation_type='fixed', amount=Decimal('0.00'), effective_from=date(2020, 1, 1)
+        )
+        cls.hra = Payhead.objects.create(
+            organization=cls.organization, name='HRA', code='HRA', payhead_type='earning',
+            calculation_type='percentage', percentage=Decimal('40.00'), effective_from=date(2020, 1, 1)
+        )
+        cls.tax = Payhead.objects.create(
+            organization=cls.organization, name='Tax', code='TAX', payhead_type='deduction',
+            calculation_type='percentage', percentage=Decimal('5.00'), effective_from=date(2020, 1, 1)
+        )
+
+        for index, amount in enumerate(['30000.00', '45000.50', '52000.25']):
+            user = User.objects.create_user(username=f'simulation_{index}')
+            employee = Employee.objects.create(
+                organization=cls.organization, user=user, employee_id=f'S{index:03d}',
+                first_name=f'Employee{index}', last_name='Simulation', hire_date=date(2024, 1, 1)
+            )
+            assignment = EmployeePayhead.objects.create(
+                organization=cls.organization, employee=employee, payhead=basic,
+                amount=Decimal(amount), effective_from=date(2024, 1, 1)
+            )
+            if index == 0:
+                cls.assignment = assignment
+
+        success, _ = PayrollProcessor(cls.organization).run_payroll(cls.period.id, mode='bulk')
+        assert success
+
+    def simulate(self, **overrides):
+        success, result = PayrollProcessor(self.organization).simulate_payroll(self.period.id, **overrides)
+        self.assertTrue(success, result)
+        return result
+
+    def test_simulation_does_not_write(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.simulate(
+                payhead_overrides={self.hra.id: {'percentage': '50'}},
+                employee_payhead_overrides={self.assignment.id: {'amount': '31000'}}
+            )
+
+        writes = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+        self.assertEqual(writes, [])
+        self.hra.refresh_from_db()
+        self.assertEqual(self.hra.percentage, Decimal('40.00'))
+
+    def test_simulation_matches_applied_change(self):
+        result = self.simulate(
+            payhead_overrides={str(self.hra.id): {'percentage': '45.5'}, str(self.tax.id): {'is_active': False}}
+        )
+        self.assertEqual(result['changed_employees'], 3)
+
+        Payhead.objects.filter(id=self.hra.id).update(percentage=Decimal('45.50'))
+        Payhead.objects.filter(id=self.tax.id).update(is_active=False)
+        success, _ = PayrollProcessor(self.organization).rerun_payroll(
+            self.period.id, force_recalculate=True, mode='bulk'
+        )
+        self.assertTrue(success)
+
+        payslips = Payslip.objects.filter(payroll_period=self.period)
+        for field in ('gross_salary', 'total_deductions', 'net_salary'):
+            self.assertEqual(
+                result['totals']['simulated'][field],
+                sum(getattr(payslip, field) for payslip in payslips)
+            )
+        for employee in result['employees']:
+            self.assertEqual(
+                employee['simulated']['net_salary'],
+                payslips.get(employee_id=employee['employee_id']).net_salary
+            )
+
+        deltas = {(row['type'], row['code']): row for row in result['payheads']}
+        self.assertEqual(deltas[('deduction', 'TAX')]['simulated'], Decimal('0.00'))
+        self.assertEqual(
+            deltas[('deduction', 'TAX')]['delta'], -deltas[('deduction', 'TAX')]['current']
+        )
+
+    def test_invalid_override_is_rejected(self):
+        success, message = PayrollProcessor(self.organization).simulate_payroll(
+            self.period.id, payhead_overrides={self.hra.id: {'percentage': '-1'}}
+        )
+        self.assertFalse(success)
+        self.assertIn('negative', message)
+
+    def test_simulate_view(self):
+        self.client.force_login(self.admin)
+        url = reverse('payroll:simulate_payroll', args=[self.period.id])
+
+        response = self.client.get(url)
+        self.assertContains(response, 'data-payhead-id="%d"' % self.hra.id)
+
+        response = self.client.post(
+            url, json.dumps({'payheads': {str(self.hra.id): {'percentage': '40'}}}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['simulation']['changed_employees'], 0)
+
+        response = self.client.post(url, 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class PayrollBenchmarkTests(TestCase):
+    """The benchmark command measures every mode and cleans up after itself"""
+
+    def test_benchmark_writes_results_and_deletes_tenants(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'benchmark.json')
+            call_command(
+                'payroll_benchmark', employees=5, payheads=3, org_payheads=6, attendance_days=3,
+                modes='standard,incremental', output=output, stdout=io.StringIO()
+            )
+            with open(output) as results_file:
+                report = json.load(results_file)
+
+        self.assertEqual(report['scale']['employees'], 5)
+        self.assertEqual(
+            [(result['action'], result['mode']) for result in report['results']],
+            [('run', 'standard'), ('rerun', 'standard'), ('run', 'incremental'), ('rerun', 'incremental')]
+        )
+        first_run = report['results'][0]
+        self.assertEqual(first_run['payslips_created'], 5)
+        self.assertEqual(first_run['error_count'], 0)
+        self.assertGreater(first_run['queries'], 0)
+        self.assertIsNotNone(first_run['peak_memory_mb'])
+        # Nothing changed between the incremental run and rerun
+        self.assertEqual(report['results'][3]['payslips_updated'], 0)
+
+        self.assertFalse(Organization.objects.filter(slug__startswith='payroll-benchmark').exists())
+        self.assertFalse(User.objects.filter(username__startswith='payroll-benchmark').exists())
+
+
+class PayslipComponentSyncTests(TestCase):
+    """Reruns update payslips in place and end up as a run from scratch would"""
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user(username='sync_admin')
+        cls.organization = Organization.objects.create(
+            name='Sync', slug='sync', email='sync@example.com', created_by=admin
+        )
+        cls.period = PayrollPeriod.objects.create(
+            organization=cls.organization, name='April 2025',
+            start_date=date(2025, 4, 1), end_date=date(2025, 4, 30), pay_date=date(2025, 5, 1)
+        )
+
+        basic = Payhead.objects.create(
+            organization=cls.organization, name='Basic', code='BASIC', payhead_type='earning',
+            calculation_type='fixed', amount=Decimal('0.00'), effective_from=date(2020, 1, 1)
+        )
+        cls.hra = Payhead.objects.create(
+            organization=cls.organization, name='HRA', code='HRA', payhead_type='earning',
+            calculation_type='percentage', percentage=Decimal('40.00'), display_order=1,
+            effective_from=date(2020, 1, 1)
+        )
+        Payhead.objects.create(
+            organization=cls.organization, name='Transport', code='TA', payhead_type='earning',
+            calculation_type='fixed', amount=Decimal('2000.00'), display_order=2,
+            effective_from=date(2020, 1, 1)
+        )
+        Payhead.objects.create(
+            organization=cls.organization, name='Tax', code='TAX', payhead_type='deduction',
+            calculation_type='percentage', percentage=Decimal('5.00'), effective_from=date(2020, 1, 1)
+        )
+
+        cls.employees = []
+        for index in range(4):
+            user = User.objects.create_user(username=f'sync_{index}')
+            employee = Employee.objects.create(
+                organization=cls.organization, user=user, employee_id=f'Y{index:03d}',
+                first_name=f'Employee{index}', last_name='Sync', hire_date=date(2024, 1, 1)
+            )
+            EmployeePayhead.objects.create(
+                organization=cls.organization, employee=employee, payhead=basic,
+                amount=Decimal(20000 + index * 1000), effective_from=date(2024, 1, 1)
+            )
+            cls.employees.append(employee)
+
+        cls.extra_hra = EmployeePayhead.objects.create(
+            organization=cls.organization, employee=cls.employees[0], payhead=cls.hra,
+            percentage=Decimal('50.00'), effective_from=date(2024, 1, 1)
+        )
+
+    def snapshot(self):
+        return {
+            payslip.employee_id: (
+                [getattr(payslip, field) for field in SUMMARY_FIELDS if field != 'input_hashes'],
+                sorted(PayslipComponent.objects.filter(payslip=payslip).values_list(
+                    'component_type', 'component_code', 'component_name', 'amount', 'display_order'
+                ))
+            )
+            for payslip in Payslip.objects.filter(payroll_period=self.period)
+        }
+
+    def change_inputs(self):
+        Payhead.objects.filter(id=self.hra.id).update(percentage=Decimal('42.50'))
+        EmployeePayhead.objects.filter(id=self.extra_hra.id).update(is_active=False)
+        Employee.objects.filter(id=self.employees[3].id).update(employment_status='inactive')
+
+    def fresh_run_snapshot(self, mode):
+        Payslip.objects.filter(payroll_period=self.period).delete()
+        PayrollPeriod.objects.filter(id=self.period.id).update(status='draft')
+        success, _ = PayrollProcessor(self.organization).run_payroll(self.period.id, mode=mode)
+        self.assertTrue(success)
+        return self.snapshot()
+
+    def test_rerun_matches_run_from_scratch(self):
+        for mode in ('standard', 'bulk'):
+            with self.subTest(mode=mode):
+                self.fresh_run_snapshot(mode)
+                with transaction.atomic():
+                    self.change_inputs()
+                    success, _ = PayrollProcessor(self.organization).rerun_payroll(self.period.id, mode=mode)
+                    self.assertTrue(success)
+                    rerun = self.snapshot()
+                    expected = self.fresh_run_snapshot(mode)
+                    transaction.set_rollback(True)
+
+                self.assertEqual(expected, rerun)
+                self.assertNotIn(self.employees[3].id, rerun)
+
+    def test_rerun_keeps_unchanged_components(self):
+        PayrollProcessor(self.organization).run_payroll(self.period.id, mode='bulk')
+        before = dict(PayslipComponent.objects.values_list('id', 'amount'))
+        Payhead.objects.filter(id=self.hra.id).update(percentage=Decimal('42.50'))
+
+        with CaptureQueriesContext(connection) as queries:
+            PayrollProcessor(self.organization).rerun_payroll(self.period.id, mode='bulk')
+
+        after = dict(PayslipComponent.objects.values_list('id', 'amount'))
+        self.assertEqual(set(before), set(after))
+        changed = [component_id for component_id in after if after[component_id] != before[component_id]]
+        # Only the HRA of employees without their own HRA percentage changes
+        self.assertEqual(len(changed), 3)
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('INSERT INTO "payroll_payslipcomponent"')
+        ])
+
+
+class IncrementalRunTests(TestCase):
+    """Incremental runs skip unchanged employees and recalculate exactly the changed ones"""
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user(username='incremental_admin')
+        cls.organization = Organization.objects.create(
+            name='Incremental', slug='incremental', email='incremental@example.com', created_by=admin
+        )
+        cls.period = PayrollPeriod.objects.create(
+            organization=cls.organization, name='July 2025',
+            start_date=date(2025, 7, 1), end_date=date(2025, 7, 31), pay_date=date(2025, 8, 1)
+        )
+
+        basic = Payhead.objects.create(
+            organization=cls.organization, name='Basic', code='BASIC', payhead_type='earning',
+            calculation_type='fixed', amount=Decimal('0.00'), effective_from=date(2020, 1, 1)
+        )
+        cls.hra = Payhead.objects.create(
+            organization=cls.organization, name='HRA', code='HRA', payhead_type='earning',
+            calculation_type='percentage', percentage=Decimal('40.00'), display_order=1,
+            effective_from=date(2020, 1, 1)
+        )
+        Payhead.objects.create(
+            organization=cls.organization, name='Overtime', code='OT', payhead_type='earning',
+            calculation_type='overtime', overtime_rate_per_hour=Decimal('150.00'), display_order=2,
+            effective_from=date(2020, 1, 1)
+        )
+
+        cls.employees = []
+        for index in range(4):
+            employee = Employee.objects.create(
+                organization=cls.organization, user=User.objects.create_user(username=f'incremental_{index}'),
+                employee_id=f'I{index:03d}', first_name=f'Employee{index}', last_name='Incremental',
+                hire_date=date(2024, 1, 1)
+            )
+            cls.employees.append(employee)
+            for day in range(1, 6):
+                AttendanceRecord.objects.create(
+                    organization=cls.organization, employee=employee, date=date(2025, 7, day),
+                    status='present', working_hours=Decimal('8.00'), overtime_hours=Decimal('1.50')
+                )
+
+        cls.basic_payhead = EmployeePayhead.objects.create(
+            organization=cls.organization, employee=cls.employees[0], payhead=basic,
+            amount=Decimal('30000.00'), effective_from=date(2024, 1, 1)
+        )
+        for employee in cls.employees[1:3]:
+            EmployeePayhead.objects.create(
+                organization=cls.organization, employee=employee, payhead=basic,
+                amount=Decimal('35000.00'), effective_from=date(2024, 1, 1)
+            )
+        # The last employee's basic salary comes from their salary structure
+        cls.salary_structure = SalaryStructure.objects.create(
+            organization=cls.organization, employee=cls.employees[3],
+            basic_salary=Decimal('28000.00'), effective_date=date(2024, 1, 1)
+        )
+
+    def setUp(self):
+        self.assertEqual(self.run_incremental()['changes']['new'], 4)
+
+    def run_incremental(self):
+        success, result = PayrollProcessor(self.organization, backend='decimal').run_payroll(
+            self.period.id, mode='incremental'
+        )
+        self.assertTrue(success, result)
+        return result
+
+    def snapshot(self):
+        return {
+            payslip.employee_id: (
+                [getattr(payslip, field) for field in SUMMARY_FIELDS],
+                sorted(PayslipComponent.objects.filter(payslip=payslip).values_list(
+                    'component_type', 'component_code', 'amount'
+                ))
+            )
+            for payslip in Payslip.objects.filter(payroll_period=self.period)
+        }
+
+    def test_unchanged_employees_are_skipped(self):
+        before = dict(Payslip.objects.filter(payroll_period=self.period).values_list('id', 'updated_at'))
+
+        with CaptureQueriesContext(connection) as queries:
+            result = self.run_incremental()
+
+        self.assertEqual(result['changes']['unchanged'], 4)
+        self.assertEqual(sum(result['changes'].values()), 4)
+        self.assertEqual((result['payslips_created'], result['payslips_updated']), (0, 0))
+        self.assertEqual(
+            before, dict(Payslip.objects.filter(payroll_period=self.period).values_list('id', 'updated_at'))
+        )
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(('INSERT INTO "payroll_payslip', 'UPDATE "payroll_payslip'))
+        ])
+
+    def test_changed_inputs_are_recalculated(self):
+        def edit_employee_payhead():
+            self.basic_payhead.amount = Decimal('31000.00')
+            self.basic_payhead.save()
+
+        def edit_org_payhead():
+            self.hra.percentage = Decimal('42.50')
+            self.hra.save()
+
+        def edit_attendance():
+            record = AttendanceRecord.objects.get(employee=self.employees[1], date=date(2025, 7, 2))
+            record.overtime_hours = Decimal('3.00')
+            record.save()
+
+        def edit_salary_structure():
+            self.salary_structure.basic_salary = Decimal('29000.00')
+            self.salary_structure.save()
+
+        for edit, group, changed in [
+            (edit_employee_payhead, 'employee_payheads', [0]),
+            (edit_org_payhead, 'org_payheads', [0, 1, 2, 3]),
+            (edit_attendance, 'attendance', [1]),
+            (edit_salary_structure, 'salary_structure', [3]),
+        ]:
+            with self.subTest(group=group), transaction.atomic():
+                before = self.snapshot()
+                edit()
+                result = self.run_incremental()
+
+                expected_changes = dict.fromkeys(INPUT_HASH_GROUPS + ['new', 'unhashed'], 0)
+                expected_changes.update({group: len(changed), 'unchanged': 4 - len(changed)})
+                self.assertEqual(result['changes'], expected_changes)
+                self.assertEqual(result['payslips_updated'], len(changed))
+
+                incremental = self.snapshot()
+                changed_ids = {self.employees[index].id for index in changed}
+                self.assertEqual(
+                    {employee_id for employee_id in before if before[employee_id] != incremental[employee_id]},
+                    changed_ids
+                )
+
+                # Recalculating everyone gives the same payslips
+                success, _ = PayrollProcessor(self.organization, backend='decimal').rerun_payroll(
+                    self.period.id, mode='bulk'
+                )
+                self.assertTrue(success)
+                self.assertEqual(incremental, self.snapshot())
+                transaction.set_rollback(True)
+
+
+@override_settings(PAYROLL_PARALLEL_WORKERS=1)
+class PayslipPDFTests(TestCase):
+    """Payslip PDFs: period ZIP downloads and the PDF cache"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.private_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(PAYROLL_PRIVATE_ROOT=cls.private_root))
+        cls.addClassCleanup(shutil.rmtree, cls.private_root, ignore_errors=True)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='export_admin')
+        cls.organization = Organization.objects.create(
+            name='Export', slug='export', email='export@example.com', created_by=cls.admin
+        )
+        OrganizationMembership.objects.create(user=cls.admin, organization=cls.organization, is_admin=True)
+        cls.period = PayrollPeriod.objects.create(
+            organization=cls.organization, name='May 2025',
+            start_date=date(2025, 5, 1), end_date=date(2025, 5, 31), pay_date=date(2025, 6, 1)
+        )
+        cls.basic = Payhead.objects.create(
+            organization=cls.organization, name='Basic', code='BASIC', payhead_type='earning',
+            calculation_type='fixed', amount=Decimal('25000.00'), effective_from=date(2020, 1, 1)
+        )
+        for index in range(3):
+            user = User.objects.create_user(username=f'export_{index}')
+            Employee.objects.create(
+                organization=cls.organization, user=user, employee_id=f'X{index:03d}',
+                first_name=f'Employee{index}', last_name='Export', hire_date=date(2024, 1, 1)
+            )
+        PayrollProcessor(cls.organization).run_payroll(cls.period.id, mode='bulk')
+
+    def test_download_period_payslips(self):
+        self.client.force_login(self.admin)
+
+        response = self.client.get(reverse('payroll:download_period_payslips', args=[self.period.id]))
+
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(
+            sorted(archive.namelist()),
+            [f'Payslip_X{index:03d}_Employee{index}_Export.pdf' for index in range(3)]
+        )
+        self.assertTrue(all(archive.read(name).startswith(b'%PDF') for name in archive.namelist()))
+        self.assertEqual(
+            Payslip.objects.filter(payroll_period=self.period, is_generated=True, generated_at__isnull=False).count(),
+            3
+        )
+
+    @override_settings(PAYROLL_PARALLEL_WORKERS=4)
+    def test_download_renders_in_request(self):
+        self.client.force_login(self.admin)
+
+        # One payslip per chunk, which a pool would spread over its workers
+        with mock.patch('payroll.pdf.PDF_CHUNK_SIZE', 1), mock.patch('payroll.pdf.ProcessPoolExecutor') as pool:
+            response = self.client.get(reverse('payroll:download_period_payslips', args=[self.period.id]))
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        pool.assert_not_called()
+        self.assertEqual(len(archive.namelist()), 3)
+
+    def test_payslip_pdf_is_cached_until_recalculated(self):
+        self.client.force_login(self.admin)
+        payslip = Payslip.objects.filter(payroll_period=self.period).order_by('id').first()
+        url = reverse('payroll:generate_payslip_pdf', args=[payslip.id])
+
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        pdf = b''.join(first.streaming_content)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        etag = first['ETag']
+
+        with mock.patch('payroll.pdf.render_payslip_pdf') as render:
+            repeat = self.client.get(url)
+            self.assertEqual(b''.join(repeat.streaming_content), pdf)
+
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(not_modified.status_code, 304)
+
+            not_modified = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+            self.assertEqual(not_modified.status_code, 304)
+            render.assert_not_called()
+
+        Payhead.objects.filter(id=self.basic.id).update(amount=Decimal('26000.00'))
+        PayrollProcessor(self.organization).rerun_payroll(self.period.id, mode='bulk')
+
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        # The entry of the old amounts was replaced
+        cache_directory = os.path.join(
+            self.private_root, 'payslip_pdf_cache', str(self.organization.id), str(payslip.id)
+        )
+        self.assertEqual(os.listdir(cache_directory), [changed['ETag'].strip('"') + '.pdf'])
+
+
+class PayrollJobTests(TestCase):
+    """Queued payroll jobs: enqueue, claim, heartbeat, execute and progress"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='job_admin')
+        cls.organization = Organization.objects.create(
+            name='Jobs', slug='jobs', email='jobs@example.com', created_by=cls.admin
+        )
+        OrganizationMembership.objects.create(user=cls.admin, organization=cls.organization, is_admin=True)
+        cls.period = PayrollPeriod.objects.create(
+            organization=cls.organization, name='June 2025',
+            start_date=date(2025, 6, 1), end_date=date(2025, 6, 30), pay_date=date(2025, 7, 1)
+        )
+        Payhead.objects.create(
+            organization=cls.organization, name='Basic', code='BASIC', payhead_type='earning',
+            calculation_type='fixed', amount=Decimal('30000.00'), effective_from=date(2020, 1, 1)
+        )
+        for index in range(3):
+            Employee.objects.create(
+                organization=cls.organization, user=User.objects.create_user(username=f'job_{index}'),
+                employee_id=f'J{index:03d}', first_name=f'Employee{index}', last_name='Job',
+                hire_date=date(2024, 1, 1)
+            )
+
+    def enqueue(self, **options):
+        return enqueue_payroll_job(self.organization, self.period, user=self.admin, **options)
+
+    def test_enqueue_reuses_active_job(self):
+        job, created = self.enqueue(mode='bulk')
+        self.assertTrue(created)
+        self.assertEqual((job.status, job.mode), ('queued', 'bulk'))
+
+        self.assertEqual(self.enqueue(action='rerun'), (job, False))
+
+        PayrollJob.objects.filter(id=job.id).update(status='completed')
+        rerun, created = self.enqueue(action='rerun')
+        self.assertTrue(created)
+        self.assertNotEqual(rerun.id, job.id)
+
+    def test_claim_next_job(self):
+        job, _ = self.enqueue()
+
+        claimed = claim_next_job('worker-1')
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual((claimed.status, claimed.worker), ('running', 'worker-1'))
+        self.assertIsNotNone(claimed.heartbeat_at)
+        self.assertIsNone(claim_next_job('worker-2'))
+
+    def test_execute_job(self):
+        self.enqueue(mode='bulk')
+        job = execute_job(claim_next_job('worker-1'))
+
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.total_employees, job.processed_employees, job.error_count), (3, 3, 0))
+        self.assertEqual(job.message, 'Created 3 payslips, updated 0 payslips for 3 employees.')
+        self.assertEqual(job.result['payslips_created'], 3)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(Payslip.objects.filter(payroll_period=self.period).count(), 3)
+
+    def test_requeue_stale_jobs(self):
+        self.enqueue()
+        job = claim_next_job('worker-1')
+        self.assertEqual(requeue_stale_jobs(60), 0)
+
+        PayrollJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(requeue_stale_jobs(60), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), ('queued', None))
+
+    def test_heartbeat_is_independent_of_progress(self):
+        self.enqueue()
+        job = claim_next_job('worker-1')
+        PayrollJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(seconds=61))
+
+        self.assertTrue(JobHeartbeat(job).beat())
+        self.assertEqual(requeue_stale_jobs(60), 0)
+
+        # Beats stop counting once the job was requeued and claimed elsewhere
+        PayrollJob.objects.filter(id=job.id).update(status='queued', worker=None)
+        claim_next_job('worker-2')
+        self.assertFalse(JobHeartbeat(job).beat())
+
+    def test_heartbeat_thread_beats_until_stopped(self):
+        self.enqueue()
+        job = claim_next_job('worker-1')
+        beats = threading.Semaphore(0)
+
+        with mock.patch.object(JobHeartbeat, 'beat', side_effect=lambda: beats.release() or True) as beat:
+            with JobHeartbeat(job, interval=0.01):
+                for _ in range(3):
+                    self.assertTrue(beats.acquire(timeout=5))
+            count = beat.call_count
+            time.sleep(0.05)
+            self.assertEqual(beat.call_count, count)
+
+    def test_outcome_of_requeued_job_is_discarded(self):
+        self.enqueue(mode='bulk')
+        job = claim_next_job('worker-1')
+        run_payroll = PayrollProcessor.run_payroll
+
+        def requeued_run(processor, *args, **kwargs):
+            # Another worker takes the job over while this one still runs it
+            requeue_stale_jobs(-1)
+            claim_next_job('worker-2')
+            return run_payroll(processor, *args, **kwargs)
+
+        with mock.patch.object(PayrollProcessor, 'run_payroll', autospec=True, side_effect=requeued_run):
+            with self.assertLogs('payroll.jobs', 'WARNING'):
+                job = execute_job(job)
+
+        self.assertEqual((job.status, job.worker), ('running', 'worker-2'))
+        self.assertIsNone(job.finished_at)
+        self.assertIsNone(job.message)
+
+    def test_progress_endpoint(self):
+        self.enqueue()
+        job = claim_next_job('worker-1')
+        PayrollJob.objects.filter(id=job.id).update(
+            total_employees=3, processed_employees=1, error_count=1, errors=['No basic salary']
+        )
+        self.client.force_login(self.admin)
+
+        data = self.client.get(reverse('payroll:payroll_job_progress', args=[job.id])).json()
+        self.assertEqual(data['status'], 'running')
+        self.assertEqual((data['processed_employees'], data['total_employees']), (1, 3))
+        self.assertEqual(data['progress_percent'], 33)
+        self.assertEqual(data['errors'], ['No basic salary'])
+
+        other = Organization.objects.create(name='Other', slug='other-jobs', email='other@example.com')
+        other_period = PayrollPeriod.objects.create(
+            organization=other, name='June 2025',
+            start_date=date(2025, 6, 1), end_date=date(2025, 6, 30), pay_date=date(2025, 7, 1)
+        )
+        other_job, _ = enqueue_payroll_job(other, other_period)
+        response = self.client.get(reverse('payroll:payroll_job_progress', args=[other_job.id]))
+        self.assertEqual(response.status_code, 404)
@@ -9,12 +9,15 @@ urlpatterns = [
     path('periods/create/', views.create_payroll_period, name='create_payroll_period'),
     path('periods/<int:pk>/update/', views.update_payroll_period, name='update_payroll_period'),
     path('run-payroll/<int:period_id>/', views.run_payroll, name='run_payroll'),
+    path('jobs/<int:job_id>/progress/', views.payroll_job_progress, name='payroll_job_progress'),
+    path('simulate/<int:period_id>/', views.simulate_payroll, name='simulate_payroll'),
 
     path('payslips/', views.payslips, name='payslips'),
     path('payslip/create/', views.payslip_create, name='payslip_create'),
     path('payslip/<int:pk>/update/', views.payslip_update, name='payslip_update'),
     path('payslips/<int:payslip_id>/', views.payslip_detail, name='payslip_detail'),
     path('payslips/<int:payslip_id>/pdf/', views.generate_payslip_pdf, name='generate_payslip_pdf'),
+    path('periods/<int:period_id>/payslips.zip', views.download_period_payslips, name='download_period_payslips'),
     path('payslips/delete-multiple/', views.delete_multiple_payslips, name='delete_multiple_payslips'),
     path('payslips/trash/', views.payslips_trash, name='payslips_trash'),
     path('payslips/restore/', views.restore_payslip, name='restore_payslip'),
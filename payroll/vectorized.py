@@ -0,0 +1,355 @@
+# payroll/vectorized.py - NumPy backend for calculating payslips from PayrollInputs
+#
+# Evaluates compiled PayheadPlan rules for every employee at once. Money is
+# held in integer micro-units (millionths): amounts, limits and rates have two
+# decimal places, percentages two and hours two, so every percentage and
+# per-hour product is exact at six places. Organization payheads are rounded
+# half-even to cents like round(amount, 2); employee payheads stay unrounded,
+# exactly as in the Decimal engine.
+#
+# NumPy is optional. PayrollProcessor falls back to the Decimal engine when it
+# is missing or when an input cannot be represented exactly.
+
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .plans import PAYHEAD_TYPES
+
+MICRO_PLACES = 6
+MICRO_PER_CENT = 10 ** 4
+
+# Inputs above these bounds could overflow int64 products
+MAX_AMOUNT_CENTS = 10 ** 12
+MAX_RATE_UNITS = 10 ** 8
+
+KIND_FIXED = 0
+KIND_PERCENTAGE = 1
+KIND_WORKING_HOUR = 2
+KIND_OVERTIME_HOUR = 3
+KIND_ZERO = 4
+
+# Production units are never supplied, so per-unit rules evaluate to 0 before limits
+KIND_CODES = {
+    'fixed': KIND_FIXED,
+    'percentage_of_basic': KIND_PERCENTAGE,
+    'per_working_hour': KIND_WORKING_HOUR,
+    'per_overtime_hour': KIND_OVERTIME_HOUR,
+    'per_production_unit': KIND_ZERO,
+    'zero': KIND_ZERO,
+}
+
+ALLOWANCE_CODES = ['HRA', 'TA', 'MA', 'SA']
+TAX_CODES = ['TDS', 'TAX']
+
+
+class VectorizationError(ValueError):
+    """An input cannot be evaluated exactly in integer units"""
+
+
+def numpy_available():
+    return np is not None
+
+
+def _units(value, places, limit=None):
+    """Exact integer value * 10**places"""
+    scaled = Decimal(value).scaleb(places)
+    integral = scaled.to_integral_value()
+    if scaled != integral:
+        raise VectorizationError(f"{value} has more than {places} decimal places")
+    if limit is not None and abs(integral) >= limit:
+        raise VectorizationError(f"{value} is too large for the vectorized backend")
+    return int(integral)
+
+
+def _micro_to_decimal(value):
+    return Decimal(int(value)).scaleb(-MICRO_PLACES)
+
+
+def _rule_columns(rule):
+    """(kind, value, has_min, min, has_max, max, rounded) of a rule in integer units"""
+    kind = KIND_CODES[rule.kind]
+
+    if kind == KIND_FIXED:
+        value = _units(rule.value, MICRO_PLACES, MAX_AMOUNT_CENTS * MICRO_PER_CENT)
+    elif kind == KIND_PERCENTAGE:
+        # Hundredths of a percent: basic cents * value is the amount in micro-units
+        value = _units(rule.value, 2, MAX_RATE_UNITS)
+    elif kind in (KIND_WORKING_HOUR, KIND_OVERTIME_HOUR):
+        # Rate in cents: rate cents * hour cents * 100 is the amount in micro-units
+        value = _units(rule.value, 2, MAX_RATE_UNITS)
+    else:
+        value = 0
+
+    has_min = rule.min_amount is not None
+    has_max = rule.max_amount is not None
+
+    return (
+        kind,
+        value,
+        has_min,
+        _units(rule.min_amount, MICRO_PLACES, MAX_AMOUNT_CENTS * MICRO_PER_CENT) if has_min else 0,
+        has_max,
+        _units(rule.max_amount, MICRO_PLACES, MAX_AMOUNT_CENTS * MICRO_PER_CENT) if has_max else 0,
+        rule.rounded,
+    )
+
+
+def _round_half_even_to_cents(micro):
+    """Round micro-units to whole cents with ROUND_HALF_EVEN, like Decimal round(x, 2)"""
+    cents, remainder = np.divmod(micro, MICRO_PER_CENT)
+    half = MICRO_PER_CENT // 2
+    round_up = (remainder > half) | ((remainder == half) & (cents % 2 == 1))
+    return (cents + round_up) * MICRO_PER_CENT
+
+
+def evaluate_rules(kind, value, has_min, min_amount, has_max, max_amount, rounded,
+                   basic_cents, working_hour_cents, overtime_hour_cents):
+    """
+    Amounts in micro-units for rule rows; the employee columns are already
+    gathered per row. All arguments are equal-length arrays.
+    """
+    amount = np.zeros(len(kind), dtype=np.int64)
+
+    fixed = kind == KIND_FIXED
+    amount[fixed] = value[fixed]
+
+    percentage = kind == KIND_PERCENTAGE
+    amount[percentage] = basic_cents[percentage] * value[percentage]
+
+    working = kind == KIND_WORKING_HOUR
+    amount[working] = value[working] * working_hour_cents[working] * 100
+
+    overtime = kind == KIND_OVERTIME_HOUR
+    amount[overtime] = value[overtime] * overtime_hour_cents[overtime] * 100
+
+    amount = np.where(has_min, np.maximum(amount, min_amount), amount)
+    amount = np.where(has_max, np.minimum(amount, max_amount), amount)
+
+    return np.where(rounded, _round_half_even_to_cents(amount), amount)
+
+
+def _sum_per_employee(count, employee_index, amount, mask):
+    total = np.zeros(count, dtype=np.int64)
+    np.add.at(total, employee_index[mask], amount[mask])
+    return total
+
+
+def _last_per_employee(count, employee_index, amount, mask):
+    """Amount of the last matching row per employee; rows are sorted by employee"""
+    last = np.zeros(count, dtype=np.int64)
+    selected_employees = employee_index[mask]
+    selected_amounts = amount[mask]
+    if len(selected_employees):
+        is_last = np.ones(len(selected_employees), dtype=bool)
+        is_last[:-1] = selected_employees[1:] != selected_employees[:-1]
+        last[selected_employees[is_last]] = selected_amounts[is_last]
+    return last
+
+
+def calculate_payslips(processor, period, employees, inputs):
+    """
+    Calculate unsaved payslips for employees from PayrollInputs
+
+    Returns (payslips, errors) like calling calculate_employee_salary with
+    inputs for each employee. Raises VectorizationError when an input has
+    more decimal places than the integer representation allows.
+    """
+    if np is None:
+        raise VectorizationError("NumPy is not installed")
+
+    plan = inputs.plan
+    errors = []
+
+    # Per-employee inputs: attendance summary and basic salary
+    calculated = []
+    attendance = []
+    basic_cents = []
+    working_hour_cents = []
+    overtime_hour_cents = []
+
+    for employee in employees:
+        attendance_data = processor._summarize_attendance(inputs.attendance_totals.get(employee.id))
+        basic_salary = processor._select_basic_salary(
+            inputs.basic_employee_payheads.get(employee.id),
+            inputs.basic_payhead,
+            inputs.salary_structures.get(employee.id)
+        )
+
+        if not basic_salary or basic_salary <= 0:
+            errors.append(f"No basic salary configured for {employee.full_name}")
+            continue
+
+        calculated.append(employee)
+        attendance.append(attendance_data)
+        basic_cents.append(_units(basic_salary, 2, MAX_AMOUNT_CENTS))
+        working_hour_cents.append(_units(attendance_data['total_working_hours'], 2, MAX_AMOUNT_CENTS))
+        overtime_hour_cents.append(_units(attendance_data['total_overtime_hours'], 2, MAX_AMOUNT_CENTS))
+
+    count = len(calculated)
+    if not count:
+        return [], errors
+
+    basic_cents = np.array(basic_cents, dtype=np.int64)
+    working_hour_cents = np.array(working_hour_cents, dtype=np.int64)
+    overtime_hour_cents = np.array(overtime_hour_cents, dtype=np.int64)
+
+    # One row per (employee, applied rule). Employee rules come first in
+    # payhead display order, then organization rules the employee doesn't override.
+    rules = []
+    rule_index = {}
+    columns = []
+
+    def rule_id(rule):
+        key = id(rule)
+        if key not in rule_index:
+            rule_index[key] = len(rules)
+            rules.append(rule)
+            columns.append(_rule_columns(rule))
+        return rule_index[key]
+
+    row_employee = []
+    row_type = []
+    row_group = []
+    row_position = []
+    row_rule = []
+
+    codes = {}
+    overridden = []
+
+    for type_index, payhead_type in enumerate(PAYHEAD_TYPES):
+        for employee_index, employee in enumerate(calculated):
+            for position, employee_payhead in enumerate(inputs.employee_payheads_for(employee.id, payhead_type)):
+                rule = plan.employee_rule(employee_payhead)
+                row_employee.append(employee_index)
+                row_type.append(type_index)
+                row_group.append(0)
+                row_position.append(position)
+                row_rule.append(rule_id(rule))
+                overridden.append((type_index, employee_index, codes.setdefault(rule.code, len(codes))))
+
+    # Organization rules apply wherever the employee has no rule with the same code
+    for org_rules in plan.org_rules.values():
+        for rule in org_rules:
+            codes.setdefault(rule.code, len(codes))
+
+    is_overridden = np.zeros((len(PAYHEAD_TYPES), count, len(codes)), dtype=bool)
+    for type_index, employee_index, code_index in overridden:
+        is_overridden[type_index, employee_index, code_index] = True
+
+    row_employee = [np.array(row_employee, dtype=np.int64)]
+    row_type = [np.array(row_type, dtype=np.int64)]
+    row_group = [np.array(row_group, dtype=np.int64)]
+    row_position = [np.array(row_position, dtype=np.int64)]
+    row_rule = [np.array(row_rule, dtype=np.int64)]
+
+    for type_index, payhead_type in enumerate(PAYHEAD_TYPES):
+        for position, rule in enumerate(plan.org_rules[payhead_type]):
+            applies_to = np.nonzero(~is_overridden[type_index, :, codes[rule.code]])[0]
+            row_employee.append(applies_to)
+            row_type.append(np.full(len(applies_to), type_index, dtype=np.int64))
+            row_group.append(np.ones(len(applies_to), dtype=np.int64))
+            row_position.append(np.full(len(applies_to), position, dtype=np.int64))
+            row_rule.append(np.full(len(applies_to), rule_id(rule), dtype=np.int64))
+
+    row_employee = np.concatenate(row_employee)
+    row_type = np.concatenate(row_type)
+    row_group = np.concatenate(row_group)
+    row_position = np.concatenate(row_position)
+    row_rule = np.concatenate(row_rule)
+
+    # Breakdown order: employee, earnings before deductions, then group and position
+    order = np.lexsort((row_position, row_group, row_type, row_employee))
+    row_employee = row_employee[order]
+    row_type = row_type[order]
+    row_rule = row_rule[order]
+
+    # Payhead parameters as column vectors, gathered per row
+    (kind, value, has_min, min_amount, has_max, max_amount, rounded) = (
+        np.array([rule_columns[position] for rule_columns in columns], dtype=dtype)[row_rule]
+        for position, dtype in enumerate(
+            (np.int64, np.int64, bool, np.int64, bool, np.int64, bool)
+        )
+    )
+
+    amount = evaluate_rules(
+        kind, value, has_min, min_amount, has_max, max_amount, rounded,
+        basic_cents[row_employee],
+        working_hour_cents[row_employee],
+        overtime_hour_cents[row_employee],
+    )
+
+    # Summary fields, categorized by payhead code as in _summarize_breakdown
+    rule_codes = np.array([rule.code for rule in rules], dtype=object)[row_rule]
+    earning = row_type == 0
+    deduction = row_type == 1
+
+    def code_in(code_list):
+        return np.isin(rule_codes, code_list)
+
+    basic = earning & (rule_codes == 'BASIC')
+    overtime = earning & (rule_codes == 'OT')
+    allowance = earning & code_in(ALLOWANCE_CODES)
+    provident_fund = deduction & (rule_codes == 'PF')
+    tax = deduction & code_in(TAX_CODES)
+    late = deduction & (rule_codes == 'LATE')
+
+    total_earnings = _sum_per_employee(count, row_employee, amount, earning)
+    total_deductions = _sum_per_employee(count, row_employee, amount, deduction)
+
+    summary_columns = {
+        'basic_salary': _last_per_employee(count, row_employee, amount, basic),
+        'allowances': _sum_per_employee(count, row_employee, amount, allowance),
+        'overtime_pay': _last_per_employee(count, row_employee, amount, overtime),
+        'other_earnings': _sum_per_employee(
+            count, row_employee, amount, earning & ~(basic | overtime | allowance)
+        ),
+        'provident_fund': _last_per_employee(count, row_employee, amount, provident_fund),
+        'tax_deduction': _last_per_employee(count, row_employee, amount, tax),
+        'late_attendance_deduction': _last_per_employee(count, row_employee, amount, late),
+        'other_deductions': _sum_per_employee(
+            count, row_employee, amount, deduction & ~(provident_fund | tax | late)
+        ),
+        'gross_salary': total_earnings,
+        'total_deductions': total_deductions,
+        'net_salary': total_earnings - total_deductions,
+    }
+
+    # Back to Decimal payslips, walking the sorted rows once
+    breakdowns = [([], []) for _ in range(count)]
+    for employee_index, type_index, rule_position, row_amount, row_rounded in zip(
+        row_employee.tolist(), row_type.tolist(), row_rule.tolist(), amount.tolist(), rounded.tolist()
+    ):
+        rule = rules[rule_position]
+        breakdowns[employee_index][type_index].append({
+            'payhead_id': rule.payhead_id,
+            'payhead_code': rule.code,
+            'payhead_name': rule.name,
+            'calculation_type': rule.calculation_type,
+            'amount': (
+                Decimal(row_amount // MICRO_PER_CENT).scaleb(-2) if row_rounded
+                else _micro_to_decimal(row_amount)
+            ),
+        })
+
+    summary_columns = {field: column.tolist() for field, column in summary_columns.items()}
+
+    payslips = []
+    for employee_index, employee in enumerate(calculated):
+        summary = {
+            field: _micro_to_decimal(column[employee_index])
+            for field, column in summary_columns.items()
+        }
+        earnings_breakdown, deduction_breakdown = breakdowns[employee_index]
+
+        payslip = processor._build_payslip(
+            employee, period, inputs.salary_structures.get(employee.id), summary,
+            earnings_breakdown, deduction_breakdown
+        )
+        payslip.input_hashes = inputs.input_hashes(employee.id, attendance[employee_index])
+        payslips.append(payslip)
+
+    return payslips, errors
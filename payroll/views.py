@@ -1,4 +1,5 @@
 # payroll/views.py
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
@@ -8,16 +9,19 @@ from hrm.utils import handle_bulk_delete, restore_objects_view, trash_list_view
 from organization.decorators import organization_member_required
 from organization.models import OrganizationMembership
 from payroll.forms import PayrollPeriodForm, PayslipForm
-from .models import PayrollPeriod, Payslip, SalaryStructure, Allowance, Deduction
-from hrm.models import Employee
-from .services import PayrollProcessor
+from .models import PayrollPeriod, Payslip, SalaryStructure, Allowance, Deduction, PayrollJob
+from hrm.models import Employee, Payhead
+from .services import PayrollProcessor, RUN_MODES
+from .jobs import enqueue_payroll_job
+from .pdf import cached_payslip_pdf, stream_payslips_zip
 import json
 from django.utils import timezone
 from django.core.paginator import Paginator
 from django.views.decorators.http import require_POST
-from django.template.loader import get_template
-from django.http import HttpResponse
-from xhtml2pdf import pisa
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+import os
 
 @login_required
 @organization_member_required
@@ -165,44 +169,28 @@ def run_payroll(request, period_id):
     if request.method == 'POST':
         action = request.POST.get('action', 'run')  # 'run' or 'rerun'
         force_recalculate = request.POST.get('force_recalculate', False)
+        mode = request.POST.get('mode', 'standard')  # 'standard', 'bulk', 'parallel' or 'incremental'
         
-        processor = PayrollProcessor(organization)
+        if action not in ['run', 'rerun']:
+            action = 'run'
+        if mode not in RUN_MODES:
+            mode = 'standard'
         
-        if action == 'rerun':
-            success, result = processor.rerun_payroll(period_id, force_recalculate)
-            action_text = "rerun"
-        else:
-            success, result = processor.run_payroll(period_id, force_recalculate)
-            action_text = "run"
+        # Payroll runs are executed by the payroll_worker command, not in the request
+        job, created = enqueue_payroll_job(
+            organization, period,
+            action=action,
+            mode=mode,
+            force_recalculate=force_recalculate,
+            user=request.user
+        )
         
-        if success:
-            if result.get('status') == 'completed':
-                messages.success(request, 
-                    f'Payroll {action_text} completed successfully! '
-                    f'Created {result.get("payslips_created", 0)} payslips, '
-                    f'updated {result.get("payslips_updated", 0)} payslips for {result["total_employees"]} employees.'
-                )
-            elif result.get('status') == 'completed_with_errors':
-                messages.warning(request, 
-                    f'Payroll {action_text} completed with some issues. '
-                    f'Created {result.get("payslips_created", 0)} payslips, '
-                    f'updated {result.get("payslips_updated", 0)} out of {result["total_employees"]} employees.'
-                )
-                if result['errors']:
-                    for error in result['errors'][:5]:  # Show first 5 errors
-                        messages.error(request, error)
-                    if len(result['errors']) > 5:
-                        messages.info(request, f'... and {len(result["errors"]) - 5} more errors')
-            else:
-                messages.success(request, 
-                    f'Payroll {action_text} completed! '
-                    f'Created {result.get("payslips_created", 0)} payslips, '
-                    f'updated {result.get("payslips_updated", 0)} payslips.'
-                )
+        if created:
+            messages.success(request, f'Payroll {action} queued. Progress is shown below.')
         else:
-            messages.error(request, result)
+            messages.info(request, 'A payroll job for this period is already in progress.')
         
-        return redirect('payroll:payroll_periods')
+        return redirect('payroll:run_payroll', period_id=period.id)
     
     # Get counts for confirmation page
     employee_count = Employee.objects.filter(
@@ -218,16 +206,82 @@ def run_payroll(request, period_id):
     
     can_rerun = period.status in ['completed', 'processing']
     
+    latest_job = PayrollJob.objects.filter(
+        organization=organization,
+        payroll_period=period
+    ).order_by('-created_at', '-id').first()
+    
     context = {
         'organization': organization,
         'period': period,
         'employee_count': employee_count,
         'existing_payslips': existing_payslips,
         'can_rerun': can_rerun,
+        'latest_job': latest_job,
     }
     return render(request, 'payroll/run_payroll.html', context)
 
 
+@login_required
+@organization_member_required
+def payroll_job_progress(request, job_id):
+    """JSON progress of a queued payroll job, polled by the run payroll page"""
+    job = get_object_or_404(PayrollJob, id=job_id, organization=request.organization)
+    
+    return JsonResponse({
+        'id': job.id,
+        'action': job.action,
+        'mode': job.mode,
+        'status': job.status,
+        'total_employees': job.total_employees,
+        'processed_employees': job.processed_employees,
+        'error_count': job.error_count,
+        'errors': job.errors[:5],
+        'progress_percent': job.progress_percent,
+        'eta_seconds': job.eta_seconds,
+        'message': job.message,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    })
+
+
+@login_required
+@organization_member_required
+def simulate_payroll(request, period_id):
+    """What-if payroll with hypothetical payhead values; nothing is saved"""
+    organization = request.organization
+    period = get_object_or_404(PayrollPeriod, id=period_id, organization=organization)
+    
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Invalid JSON body.'}, status=400)
+        
+        processor = PayrollProcessor(organization)
+        success, result = processor.simulate_payroll(
+            period.id,
+            payhead_overrides=data.get('payheads'),
+            employee_payhead_overrides=data.get('employee_payheads')
+        )
+        
+        if success:
+            return JsonResponse({'success': True, 'simulation': result})
+        return JsonResponse({'success': False, 'message': result})
+    
+    payheads = Payhead.objects.filter(
+        organization=organization,
+        is_active=True
+    ).order_by('payhead_type', 'display_order', 'id')
+    
+    context = {
+        'organization': organization,
+        'period': period,
+        'payheads': payheads,
+    }
+    return render(request, 'payroll/simulate_payroll.html', context)
+
+
 @login_required
 @organization_member_required
 def recalculate_employee_payroll(request, period_id, employee_id):
@@ -456,9 +510,13 @@ def payslip_detail(request, payslip_id):
 @login_required
 @organization_member_required
 def generate_payslip_pdf(request, payslip_id):
-    """Generate PDF for individual payslip"""
+    """Generate PDF for individual payslip, served from the PDF cache when unchanged"""
     organization = request.organization
-    payslip = get_object_or_404(Payslip, id=payslip_id, organization=organization)
+    payslip = get_object_or_404(
+        Payslip.objects.select_related('employee__designation', 'employee__department', 'payroll_period'),
+        id=payslip_id,
+        organization=organization
+    )
 
     # Mark as generated
     if not payslip.is_generated:
@@ -466,22 +524,55 @@ def generate_payslip_pdf(request, payslip_id):
         payslip.generated_at = timezone.now()
         payslip.save()
 
-    # Load template
-    template_path = 'payroll/payslip_pdf.html'
-    context = {'payslip': payslip, 'organization': organization}
-    template = get_template(template_path)
-    html = template.render(context)
+    path, key, error = cached_payslip_pdf(payslip, organization)
 
-    # Create PDF
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'filename="Payslip_{payslip.employee.full_name}.pdf"'
-
-    pisa_status = pisa.CreatePDF(html, dest=response)
-
-    if pisa_status.err:
+    if error:
         messages.error(request, "Error generating PDF.")
         return redirect('payroll:payslip_detail', payslip_id=payslip_id)
 
+    etag = f'"{key}"'
+    last_modified = int(os.path.getmtime(path))
+
+    # Repeat downloads of an unchanged payslip are answered with 304 Not Modified
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = FileResponse(open(path, 'rb'), content_type='application/pdf')
+        response['Content-Disposition'] = f'filename="Payslip_{payslip.employee.full_name}.pdf"'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Payslips are personal; browsers may keep them but must revalidate
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+@organization_member_required
+def download_period_payslips(request, period_id):
+    """
+    Download all payslip PDFs of a period as one ZIP
+
+    Rendered with PAYROLL_DOWNLOAD_WORKERS processes, by default in the
+    request itself, so concurrent downloads don't each fork a process pool
+    in the web worker; cached PDFs are not rendered again.
+    """
+    organization = request.organization
+    period = get_object_or_404(PayrollPeriod, id=period_id, organization=organization)
+
+    payslip_ids = list(Payslip.objects.filter(
+        organization=organization,
+        payroll_period=period
+    ).order_by('employee__employee_id').values_list('id', flat=True))
+
+    if not payslip_ids:
+        messages.error(request, 'No payslips found for this period.')
+        return redirect('payroll:run_payroll', period_id=period.id)
+
+    response = StreamingHttpResponse(
+        stream_payslips_zip(organization, payslip_ids, workers=getattr(settings, 'PAYROLL_DOWNLOAD_WORKERS', 1)),
+        content_type='application/zip'
+    )
+    response['Content-Disposition'] = f'attachment; filename="Payslips_{period.start_date:%Y_%m}_{period.id}.zip"'
     return response
 
 
@@ -1,9 +1,12 @@
 # reports/attendance_reports.py
-from django.db.models import Q, Count, Sum, Avg, Max
+from collections import defaultdict
+from decimal import Decimal
+from django.db.models import Q, Count, Sum, Avg, Max, F
 from django.utils import timezone
 from datetime import datetime, date, timedelta
 from django.db.models.functions import TruncDate, TruncMonth
-from hrm.models import Employee, Department, AttendanceRecord, LeaveRequest
+from hrm.models import Employee, Department, AttendanceMonth, AttendanceRecord, LeaveRequest
+from hrm.rollup import attendance_totals
 
 class DailyAttendanceReport:
     def generate_daily_report(self, organization, filters=None):
@@ -104,15 +107,15 @@ class MonthlyAttendanceSummary:
         else:
             end_date = date(year, month + 1, 1) - timedelta(days=1)
         
-        # Get attendance records for the month
-        attendance_records = AttendanceRecord.objects.filter(
-            employee__organization=organization,
-            date__range=[start_date, end_date]
-        ).select_related('employee', 'employee__department')
+        # Monthly totals per employee, one rollup row each
+        attendance_months = AttendanceMonth.objects.filter(
+            organization=organization,
+            month=start_date
+        )
         
         # Apply department filter
         if filters.get('department'):
-            attendance_records = attendance_records.filter(employee__department_id=filters['department'])
+            attendance_months = attendance_months.filter(employee__department_id=filters['department'])
         
         # Monthly statistics
         total_working_days = (end_date - start_date).days + 1
@@ -126,17 +129,13 @@ class MonthlyAttendanceSummary:
         if filters.get('department'):
             employees = employees.filter(department_id=filters['department'])
         
-        for employee in employees:
-            emp_records = attendance_records.filter(employee=employee)
-            
-            present_days = emp_records.filter(status__in=['present', 'late']).count()
-            absent_days = emp_records.filter(status='absent').count()
-            late_days = emp_records.filter(status='late').count()
-            half_days = emp_records.filter(status='half_day').count()
+        months_by_employee = {month.employee_id: month for month in attendance_months}
+        
+        for employee in employees.select_related('department'):
+            month = months_by_employee.get(employee.id) or AttendanceMonth()
             
-            total_working_hours = emp_records.aggregate(total=Sum('working_hours'))['total'] or 0
-            total_overtime = emp_records.aggregate(total=Sum('overtime_hours'))['total'] or 0
-            avg_working_hours = emp_records.aggregate(avg=Avg('working_hours'))['avg'] or 0
+            present_days = month.present_days + month.late_days
+            avg_working_hours = month.working_hours / month.record_days if month.record_days else 0
             
             attendance_percentage = round((present_days / weekdays * 100), 2) if weekdays > 0 else 0
             
@@ -145,11 +144,11 @@ class MonthlyAttendanceSummary:
                 'full_name': employee.full_name,
                 'department': employee.department.name if employee.department else 'N/A',
                 'present_days': present_days,
-                'absent_days': absent_days,
-                'late_days': late_days,
-                'half_days': half_days,
-                'total_working_hours': round(total_working_hours, 2),
-                'total_overtime': round(total_overtime, 2),
+                'absent_days': month.absent_days,
+                'late_days': month.late_days,
+                'half_days': month.half_days,
+                'total_working_hours': round(month.working_hours, 2),
+                'total_overtime': round(month.overtime_hours, 2),
                 'avg_working_hours': round(avg_working_hours, 2),
                 'attendance_percentage': attendance_percentage
             })
@@ -158,18 +157,27 @@ class MonthlyAttendanceSummary:
         department_summary = []
         departments = Department.objects.filter(organization=organization, is_active=True)
         
+        employee_counts = dict(employees.values('department_id').annotate(
+            count=Count('id')
+        ).values_list('department_id', 'count').order_by())
+        department_months = {
+            row['employee__department_id']: row
+            for row in attendance_months.values('employee__department_id').annotate(
+                present=Sum(F('present_days') + F('late_days')),
+                absent=Sum('absent_days')
+            ).order_by()
+        }
+        
         for dept in departments:
-            dept_employees = employees.filter(department=dept)
-            dept_records = attendance_records.filter(employee__department=dept)
-            
-            if dept_employees.exists():
-                dept_present = dept_records.filter(status__in=['present', 'late']).count()
-                dept_absent = dept_records.filter(status='absent').count()
+            if employee_counts.get(dept.id):
+                dept_months = department_months.get(dept.id, {})
+                dept_present = dept_months.get('present') or 0
+                dept_absent = dept_months.get('absent') or 0
                 dept_attendance_percentage = round((dept_present / (dept_present + dept_absent) * 100), 2) if (dept_present + dept_absent) > 0 else 0
                 
                 department_summary.append({
                     'department': dept.name,
-                    'employee_count': dept_employees.count(),
+                    'employee_count': employee_counts[dept.id],
                     'present_days': dept_present,
                     'absent_days': dept_absent,
                     'attendance_percentage': dept_attendance_percentage
@@ -319,54 +327,65 @@ class OvertimeReport:
         start_date = filters.get('start_date') or (timezone.now() - timedelta(days=30)).date()
         end_date = filters.get('end_date') or timezone.now().date()
         
-        # Get overtime records
-        overtime_records = AttendanceRecord.objects.filter(
-            employee__organization=organization,
-            date__range=[start_date, end_date],
-            overtime_hours__gt=0
-        ).select_related('employee', 'employee__department')
+        if isinstance(start_date, str):
+            start_date = date.fromisoformat(start_date)
+        if isinstance(end_date, str):
+            end_date = date.fromisoformat(end_date)
         
-        # Apply department filter
+        # Overtime totals per employee and month: whole months from the rollup,
+        # partial months from their records
+        employee_ids = None
         if filters.get('department'):
-            overtime_records = overtime_records.filter(employee__department_id=filters['department'])
+            employee_ids = Employee.objects.filter(
+                organization=organization,
+                department_id=filters['department']
+            ).values('id')
+        
+        totals = attendance_totals(organization, start_date, end_date, employee_ids, by_month=True)
+        
+        # [overtime days, overtime hours]
+        overtime_by_employee = defaultdict(lambda: [0, Decimal('0.00')])
+        overtime_by_month = defaultdict(lambda: [0, Decimal('0.00')])
+        for (employee_id, month), month_totals in totals.items():
+            if not month_totals['overtime_days']:
+                continue
+            for overtime in (overtime_by_employee[employee_id], overtime_by_month[month]):
+                overtime[0] += month_totals['overtime_days']
+                overtime[1] += month_totals['overtime_hours']
         
         # Employee-wise overtime summary
-        employee_overtime_summary = overtime_records.values(
-            'employee__id',
-            'employee__employee_id',
-            'employee__first_name',
-            'employee__last_name',
-            'employee__department__name'
-        ).annotate(
-            total_overtime_days=Count('id'),
-            total_overtime_hours=Sum('overtime_hours'),
-            avg_overtime_hours=Avg('overtime_hours')
-        ).order_by('-total_overtime_hours')
+        employees = Employee.objects.all_with_deleted().filter(
+            id__in=list(overtime_by_employee)
+        ).select_related('department')
         
         overtime_employees = []
-        for emp in employee_overtime_summary:
+        department_overtime = defaultdict(lambda: {'total_hours': Decimal('0.00'), 'employee_count': 0})
+        for employee in employees:
+            days, hours = overtime_by_employee[employee.id]
+            department = employee.department.name if employee.department else None
             overtime_employees.append({
-                'employee_id': emp['employee__employee_id'],
-                'full_name': f"{emp['employee__first_name']} {emp['employee__last_name']}",
-                'department': emp['employee__department__name'],
-                'total_overtime_days': emp['total_overtime_days'],
-                'total_overtime_hours': round(emp['total_overtime_hours'] or 0, 2),
-                'avg_overtime_hours': round(emp['avg_overtime_hours'] or 0, 2)
+                'employee_id': employee.employee_id,
+                'full_name': f"{employee.first_name} {employee.last_name}",
+                'department': department,
+                'total_overtime_days': days,
+                'total_overtime_hours': round(hours, 2),
+                'avg_overtime_hours': round(hours / days, 2)
             })
+            department_overtime[department]['total_hours'] += hours
+            department_overtime[department]['employee_count'] += 1
+        overtime_employees.sort(key=lambda employee: -employee['total_overtime_hours'])
         
         # Department-wise overtime summary
-        department_overtime = overtime_records.values('employee__department__name').annotate(
-            total_hours=Sum('overtime_hours'),
-            employee_count=Count('employee', distinct=True)
-        ).order_by('-total_hours')
+        department_overtime = sorted(
+            ({'employee__department__name': name, **values} for name, values in department_overtime.items()),
+            key=lambda department: -department['total_hours']
+        )
         
         # Monthly overtime trend
-        monthly_trend = overtime_records.annotate(
-            month=TruncMonth('date')
-        ).values('month').annotate(
-            total_hours=Sum('overtime_hours'),
-            record_count=Count('id')
-        ).order_by('month')
+        monthly_trend = [
+            {'month': month, 'total_hours': hours, 'record_count': days}
+            for month, (days, hours) in sorted(overtime_by_month.items())
+        ]
         
         return {
             'report_name': 'Overtime Report',
@@ -374,14 +393,14 @@ class OvertimeReport:
             'filters': filters,
             'period': f"{start_date} to {end_date}",
             'summary': {
-                'total_overtime_hours': round(overtime_records.aggregate(total=Sum('overtime_hours'))['total'] or 0, 2),
-                'total_overtime_days': overtime_records.count(),
+                'total_overtime_hours': round(sum(hours for _, hours in overtime_by_month.values()), 2),
+                'total_overtime_days': sum(days for days, _ in overtime_by_month.values()),
                 'employees_with_overtime': len(overtime_employees),
                 'period': f"{start_date} to {end_date}"
             },
             'employee_overtime': overtime_employees,
-            'department_overtime': list(department_overtime),
-            'monthly_trend': list(monthly_trend)
+            'department_overtime': department_overtime,
+            'monthly_trend': monthly_trend
         }
 
 class LeaveBalanceReport:
@@ -1,3 +1,88 @@
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db.models import Avg, Sum
 from django.test import TestCase
 
-# Create your tests here.
+from hrm.models import AttendanceRecord, Department, Employee, Shift, Timetable
+from organization.models import Organization
+
+from .attendance_reports import MonthlyAttendanceSummary
+
+User = get_user_model()
+
+
+class MonthlyAttendanceSummaryTests(TestCase):
+    """The summary read from the attendance rollup matches counting the month's records"""
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user(username='summary_admin', role='organization_admin')
+        cls.organization = Organization.objects.create(
+            name='Summary', slug='summary', email='summary@example.com', created_by=admin
+        )
+        department = Department.objects.create(organization=cls.organization, name='Operations', code='OPS')
+        cls.employees = [
+            Employee.objects.create(
+                organization=cls.organization, user=User.objects.create_user(username=f'summary_{index}'),
+                employee_id=f'S{index}', first_name=f'Summary{index}', last_name='Staff',
+                hire_date=date(2024, 1, 1), department=department if index < 2 else None
+            )
+            for index in range(3)
+        ]
+
+        # A six-day timetable doesn't change the Monday to Friday denominator
+        shift = Shift.objects.create(
+            organization=cls.organization, name='Day', code='DAY',
+            start_time=time(9, 0), end_time=time(17, 0), working_hours=Decimal('8.00')
+        )
+        timetable = Timetable.objects.create(
+            organization=cls.organization, shift=shift, start_date=date(2025, 1, 1), saturday=True
+        )
+        timetable.employees.set(cls.employees[:1])
+
+        statuses = ['present', 'late', 'absent', 'half_day', 'present', 'on_leave']
+        day = date(2025, 1, 28)
+        while day <= date(2025, 3, 3):
+            for index, employee in enumerate(cls.employees[:2]):
+                status = statuses[(day.toordinal() + index) % len(statuses)]
+                AttendanceRecord.objects.create(
+                    organization=cls.organization, employee=employee, date=day, status=status,
+                    working_hours=Decimal(day.day * 17 % 900) / 100 if status != 'absent' else Decimal('0.00'),
+                    overtime_hours=Decimal(day.day * 7 % 300) / 100 if day.day % 4 else Decimal('0.00'),
+                )
+            day += timedelta(days=1)
+
+    def test_matches_record_counts(self):
+        report = MonthlyAttendanceSummary().generate_monthly_summary(
+            self.organization, {'year': 2025, 'month': 2}
+        )
+        self.assertEqual(report['summary']['total_working_days'], 20)
+
+        rows = {row['employee_id']: row for row in report['employee_summary']}
+        self.assertEqual(set(rows), {'S0', 'S1', 'S2'})
+        for employee in self.employees:
+            records = AttendanceRecord.objects.filter(employee=employee, date__range=(date(2025, 2, 1), date(2025, 2, 28)))
+            present_days = records.filter(status__in=['present', 'late']).count()
+            expected = {
+                'present_days': present_days,
+                'absent_days': records.filter(status='absent').count(),
+                'late_days': records.filter(status='late').count(),
+                'half_days': records.filter(status='half_day').count(),
+                'total_working_hours': round(records.aggregate(total=Sum('working_hours'))['total'] or 0, 2),
+                'total_overtime': round(records.aggregate(total=Sum('overtime_hours'))['total'] or 0, 2),
+                'avg_working_hours': round(records.aggregate(avg=Avg('working_hours'))['avg'] or 0, 2),
+                'attendance_percentage': round(present_days / 20 * 100, 2),
+            }
+            with self.subTest(employee=employee.employee_id):
+                self.assertEqual({key: rows[employee.employee_id][key] for key in expected}, expected)
+
+        self.assertEqual(rows['S2']['present_days'], 0)
+        department = report['department_summary'][0]
+        self.assertEqual(department['employee_count'], 2)
+        self.assertEqual(
+            (department['present_days'], department['absent_days']),
+            (rows['S0']['present_days'] + rows['S1']['present_days'],
+             rows['S0']['absent_days'] + rows['S1']['absent_days'])
+        )